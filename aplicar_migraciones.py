@@ -0,0 +1,111 @@
+#!/usr/bin/env python3
+"""
+Aplica en orden las migraciones SQL pendientes (migrations/NNN_*.sql)
+Cada archivo se ejecuta una sola vez, en una transacción, y queda anotado en
+la tabla migraciones_aplicadas. El contenedor lo corre antes de iniciar la
+API (CMD del Dockerfile); un advisory lock evita que dos instancias migren a
+la vez y, si no hay nada pendiente, solo cuesta una consulta.
+
+Una base creada a mano antes de este script no tiene el registro: hay que
+indicar una vez hasta qué migración ya tiene aplicada.
+    python aplicar_migraciones.py
+    python aplicar_migraciones.py --estado
+    python aplicar_migraciones.py --registrar-hasta 002
+"""
+import os
+import re
+import sys
+import argparse
+from pathlib import Path
+
+from dotenv import load_dotenv
+from sqlalchemy import create_engine
+
+load_dotenv()
+
+DATABASE_URL = os.getenv("DB_URL") or os.getenv("DATABASE_URL")
+if not DATABASE_URL:
+    raise ValueError("No se encontró DB_URL o DATABASE_URL en .env")
+
+DIRECTORIO = Path(__file__).resolve().parent / "migrations"
+PATRON = re.compile(r"^(\d{3})_.+\.sql$")
+
+# Clave del advisory lock: una sola instancia migra a la vez
+LOCK_MIGRACIONES = 703505
+
+
+def migraciones():
+    """Archivos de migración numerados, en orden"""
+    return sorted(p for p in DIRECTORIO.iterdir() if PATRON.match(p.name))
+
+
+parser = argparse.ArgumentParser(description="Aplicar migraciones SQL pendientes")
+parser.add_argument("--estado", action="store_true", help="Solo mostrar aplicadas y pendientes")
+parser.add_argument("--registrar-hasta", metavar="NNN",
+                    help="Anotar como aplicadas, sin ejecutarlas, las migraciones hasta NNN")
+args = parser.parse_args()
+
+print("=" * 60)
+print("MIGRACIONES")
+print("=" * 60)
+
+engine = create_engine(DATABASE_URL)
+conexion = engine.raw_connection()
+try:
+    pg = conexion.driver_connection
+    # Sin transacción del driver: cada archivo se envía completo y Postgres
+    # lo ejecuta como una transacción implícita (o con su propio BEGIN/COMMIT)
+    pg.autocommit = True
+    cursor = pg.cursor()
+    cursor.execute("SELECT pg_advisory_lock(%s)", (LOCK_MIGRACIONES,))
+
+    cursor.execute("SELECT to_regclass('migraciones_aplicadas') IS NOT NULL")
+    con_registro = cursor.fetchone()[0]
+    cursor.execute("SELECT to_regclass('incidencias') IS NOT NULL")
+    con_esquema = cursor.fetchone()[0]
+
+    if not con_registro and con_esquema and not args.registrar_hasta:
+        print("\n  ✗ La base ya tiene tablas pero no registro de migraciones.")
+        print("    Indique hasta cuál está aplicada, por ejemplo:")
+        print("    python aplicar_migraciones.py --registrar-hasta 002")
+        sys.exit(1)
+
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS migraciones_aplicadas (
+            nombre      VARCHAR(100) PRIMARY KEY,
+            aplicada_en TIMESTAMP NOT NULL DEFAULT (now() AT TIME ZONE 'UTC')
+        )
+    """)
+    cursor.execute("SELECT nombre FROM migraciones_aplicadas")
+    aplicadas = {fila[0] for fila in cursor.fetchall()}
+
+    if args.registrar_hasta:
+        for archivo in migraciones():
+            if PATRON.match(archivo.name).group(1) <= args.registrar_hasta and archivo.name not in aplicadas:
+                cursor.execute(
+                    "INSERT INTO migraciones_aplicadas (nombre) VALUES (%s)", (archivo.name,)
+                )
+                aplicadas.add(archivo.name)
+                print(f"\n  ✓ {archivo.name} registrada como aplicada")
+
+    pendientes = [a for a in migraciones() if a.name not in aplicadas]
+    if args.estado:
+        print(f"\n  Aplicadas: {len(aplicadas)}")
+        for archivo in pendientes:
+            print(f"  - Pendiente: {archivo.name}")
+    else:
+        for archivo in pendientes:
+            print(f"\n  → {archivo.name}")
+            cursor.execute(archivo.read_text(encoding="utf-8"))
+            cursor.execute(
+                "INSERT INTO migraciones_aplicadas (nombre) VALUES (%s)", (archivo.name,)
+            )
+            print(f"  ✓ {archivo.name} aplicada")
+        if not pendientes:
+            print("\n  ✓ Sin migraciones pendientes")
+
+    cursor.execute("SELECT pg_advisory_unlock(%s)", (LOCK_MIGRACIONES,))
+finally:
+    conexion.close()
+
+print("\n" + "=" * 60)
@@ -0,0 +1,56 @@
+"""
+Medición de las fases de arranque de la API
+El tiempo hasta la primera respuesta tras escalar a cero es la importación
+de los módulos más el lifespan. Cada fase se registra en milisegundos, se
+resume en el log al terminar y se consulta en GET /health/arranque. Para el
+detalle por módulo de la importación: python -X importtime -m app.main
+"""
+import time
+import logging
+from contextlib import contextmanager
+from typing import Dict, Optional
+
+logger = logging.getLogger(__name__)
+
+
+class FasesArranque:
+    """Duración de cada fase del arranque del proceso"""
+
+    def __init__(self):
+        # Se crea al importar este módulo, que main.py importa primero
+        self._inicio = time.perf_counter()
+        self.fases: Dict[str, float] = {}
+        self.total_ms: Optional[float] = None
+
+    @staticmethod
+    def _ms(desde: float) -> float:
+        return round((time.perf_counter() - desde) * 1000, 1)
+
+    def registrar_desde_inicio(self, nombre: str):
+        """Registra una fase que empezó junto con el proceso (importación)"""
+        self.fases[nombre] = self._ms(self._inicio)
+
+    @contextmanager
+    def medir(self, nombre: str):
+        inicio = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.fases[nombre] = self._ms(inicio)
+
+    def finalizar(self):
+        """Marca el fin del arranque y lo resume en el log"""
+        self.total_ms = self._ms(self._inicio)
+        detalle = ", ".join(f"{nombre} {ms:.0f} ms" for nombre, ms in self.fases.items())
+        logger.info(f"Arranque completo en {self.total_ms:.0f} ms ({detalle})")
+
+    def resumen(self) -> Dict:
+        return {
+            "fases_ms": dict(self.fases),
+            "total_ms": self.total_ms,
+            "completo": self.total_ms is not None
+        }
+
+
+# Fases del proceso actual
+fases_arranque = FasesArranque()
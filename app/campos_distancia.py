@@ -0,0 +1,263 @@
+"""
+Campos de tiempo de viaje precalculados para los puntos fijos
+Grillas sobre el área urbana de Latacunga con la duración/distancia
+desde cada depósito y hacia cada botadero, para consultar esos tramos
+sin llamar a OSRM
+"""
+import os
+import logging
+import threading
+from typing import List, Dict, Tuple, Optional
+
+import numpy as np
+
+from app.matriz_osrm import ConstructorMatrizOSRM
+from app.services.incidencia_service import LatacungaConfig
+
+logger = logging.getLogger(__name__)
+
+
+# Resolución de la grilla en grados (~280 m en Latacunga)
+RESOLUCION_GRADOS = float(os.getenv("CAMPOS_RESOLUCION_GRADOS", "0.0025"))
+
+# Archivo donde se guardan los campos precalculados
+RUTA_CAMPOS = os.getenv("CAMPOS_DISTANCIA_PATH", "data/campos_puntos_fijos.npz")
+
+# Tolerancia para considerar que un punto fijo no se ha movido (~10 m)
+TOLERANCIA_GRADOS = 1e-4
+
+
+class CampoDistancia:
+    """
+    Grilla de duración (s) y distancia (m) asociada a un punto fijo
+
+    - Depósito: tiempo DESDE el depósito hasta cada celda
+    - Botadero: tiempo DESDE cada celda HASTA el botadero
+
+    Las consultas interpolan bilinealmente entre las 4 celdas vecinas.
+    """
+
+    def __init__(
+        self,
+        punto_id: int,
+        tipo: str,
+        lon: float,
+        lat: float,
+        lat_min: float,
+        lon_min: float,
+        resolucion: float,
+        duraciones: np.ndarray,
+        distancias: np.ndarray
+    ):
+        self.punto_id = punto_id
+        self.tipo = tipo
+        self.lon = lon
+        self.lat = lat
+        self.lat_min = lat_min
+        self.lon_min = lon_min
+        self.resolucion = resolucion
+        self.duraciones = duraciones.astype(np.float32)
+        self.distancias = distancias.astype(np.float32)
+
+    def vigente_para(self, lon: float, lat: float) -> bool:
+        """True si el campo se calculó para un punto fijo en esta ubicación"""
+        return abs(self.lon - lon) <= TOLERANCIA_GRADOS and abs(self.lat - lat) <= TOLERANCIA_GRADOS
+
+    def consultar_muchos(self, coordenadas: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Consulta vectorizada de varios puntos
+
+        Args:
+            coordenadas: Array (n, 2) de (lon, lat)
+
+        Returns:
+            Tuple[distancias (n,), duraciones (n,)]; NaN fuera de la grilla
+        """
+        coordenadas = np.asarray(coordenadas, dtype=np.float64).reshape(-1, 2)
+        filas_max, columnas_max = self.duraciones.shape
+
+        # Posición continua dentro de la grilla (fila = latitud, columna = longitud)
+        y = (coordenadas[:, 1] - self.lat_min) / self.resolucion
+        x = (coordenadas[:, 0] - self.lon_min) / self.resolucion
+        dentro = (y >= 0) & (y <= filas_max - 1) & (x >= 0) & (x <= columnas_max - 1)
+
+        y = np.clip(y, 0, filas_max - 1)
+        x = np.clip(x, 0, columnas_max - 1)
+        i0 = np.minimum(np.floor(y).astype(np.int32), filas_max - 2)
+        j0 = np.minimum(np.floor(x).astype(np.int32), columnas_max - 2)
+        fy = (y - i0)[:, None]
+        fx = (x - j0)[:, None]
+
+        resultados = []
+        for grilla in (self.distancias, self.duraciones):
+            valor = (
+                grilla[i0, j0][:, None] * (1 - fy) * (1 - fx)
+                + grilla[i0 + 1, j0][:, None] * fy * (1 - fx)
+                + grilla[i0, j0 + 1][:, None] * (1 - fy) * fx
+                + grilla[i0 + 1, j0 + 1][:, None] * fy * fx
+            )[:, 0]
+            resultados.append(np.where(dentro, valor, np.nan))
+
+        return resultados[0], resultados[1]
+
+    def consultar(self, lon: float, lat: float) -> Optional[Tuple[float, float]]:
+        """
+        Distancia (m) y duración (s) del tramo entre el punto fijo y (lon, lat)
+
+        Returns:
+            Tuple[distancia, duracion] o None si el punto está fuera de la grilla
+        """
+        distancias, duraciones = self.consultar_muchos(np.array([[lon, lat]]))
+        if np.isnan(duraciones[0]):
+            return None
+        return float(distancias[0]), float(duraciones[0])
+
+
+class RegistroCampos:
+    """Conjunto de campos precalculados indexados por ID de punto fijo"""
+
+    def __init__(self, campos: Optional[Dict[int, CampoDistancia]] = None):
+        self.campos: Dict[int, CampoDistancia] = campos or {}
+
+    def __len__(self) -> int:
+        return len(self.campos)
+
+    def obtener(self, punto_id: int, lon: float, lat: float) -> Optional[CampoDistancia]:
+        """Campo del punto fijo, solo si sigue en la misma ubicación"""
+        campo = self.campos.get(punto_id)
+        if campo and campo.vigente_para(lon, lat):
+            return campo
+        return None
+
+    def guardar(self, ruta: str = RUTA_CAMPOS):
+        """Guarda los campos en un único archivo .npz comprimido"""
+        directorio = os.path.dirname(ruta)
+        if directorio:
+            os.makedirs(directorio, exist_ok=True)
+
+        arrays = {}
+        meta = []
+        for campo in self.campos.values():
+            arrays[f"dur_{campo.punto_id}"] = campo.duraciones
+            arrays[f"dist_{campo.punto_id}"] = campo.distancias
+            meta.append((
+                campo.punto_id, 0 if campo.tipo == 'deposito' else 1,
+                campo.lon, campo.lat, campo.lat_min, campo.lon_min, campo.resolucion
+            ))
+        arrays["meta"] = np.array(meta, dtype=np.float64).reshape(-1, 7)
+
+        np.savez_compressed(ruta, **arrays)
+        logger.info(f"Campos de distancia guardados en {ruta} ({len(self.campos)} puntos fijos)")
+
+    @classmethod
+    def cargar(cls, ruta: str = RUTA_CAMPOS) -> "RegistroCampos":
+        """Carga los campos desde disco; registro vacío si el archivo no existe"""
+        if not os.path.exists(ruta):
+            logger.warning(f"No existe {ruta}; los tramos fijos se consultarán a OSRM")
+            return cls()
+
+        campos = {}
+        with np.load(ruta) as datos:
+            for punto_id, tipo, lon, lat, lat_min, lon_min, resolucion in datos["meta"]:
+                punto_id = int(punto_id)
+                campos[punto_id] = CampoDistancia(
+                    punto_id=punto_id,
+                    tipo='deposito' if tipo == 0 else 'botadero',
+                    lon=lon,
+                    lat=lat,
+                    lat_min=lat_min,
+                    lon_min=lon_min,
+                    resolucion=resolucion,
+                    duraciones=datos[f"dur_{punto_id}"],
+                    distancias=datos[f"dist_{punto_id}"]
+                )
+
+        logger.info(f"Campos de distancia cargados desde {ruta} ({len(campos)} puntos fijos)")
+        return cls(campos)
+
+
+def generar_grilla(resolucion: float = RESOLUCION_GRADOS) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Centros de celda sobre el área urbana de Latacunga
+
+    Returns:
+        Tuple[latitudes (filas,), longitudes (columnas,)]
+    """
+    latitudes = np.arange(LatacungaConfig.LAT_MIN, LatacungaConfig.LAT_MAX + resolucion / 2, resolucion)
+    longitudes = np.arange(LatacungaConfig.LON_MIN, LatacungaConfig.LON_MAX + resolucion / 2, resolucion)
+    return latitudes, longitudes
+
+
+def generar_campos(
+    puntos_fijos: List,
+    constructor: Optional[ConstructorMatrizOSRM] = None,
+    resolucion: float = RESOLUCION_GRADOS
+) -> RegistroCampos:
+    """
+    Calcula los campos de todos los puntos fijos con OSRM
+
+    Un depósito genera una matriz 1 x celdas y un botadero una matriz
+    celdas x 1; el constructor las divide en bloques automáticamente.
+
+    Args:
+        puntos_fijos: Objetos con id, tipo, lon y lat (ej. PuntoFijo)
+        constructor: Constructor de matrices (por defecto uno nuevo)
+        resolucion: Tamaño de celda en grados
+
+    Returns:
+        RegistroCampos con un campo por punto fijo
+    """
+    constructor = constructor or ConstructorMatrizOSRM()
+    latitudes, longitudes = generar_grilla(resolucion)
+    malla_lon, malla_lat = np.meshgrid(longitudes, latitudes)
+    celdas = list(zip(malla_lon.ravel().tolist(), malla_lat.ravel().tolist()))
+    forma = malla_lat.shape
+
+    campos = {}
+    for punto in puntos_fijos:
+        origen = [(punto.lon, punto.lat)]
+        if punto.tipo == 'deposito':
+            resultado = constructor.construir(origen, celdas)
+        else:
+            resultado = constructor.construir(celdas, origen)
+
+        if resultado["estimada"]:
+            logger.warning(f"Campo de {punto.tipo} {punto.id} contiene valores estimados")
+
+        campos[punto.id] = CampoDistancia(
+            punto_id=punto.id,
+            tipo=punto.tipo,
+            lon=punto.lon,
+            lat=punto.lat,
+            lat_min=float(latitudes[0]),
+            lon_min=float(longitudes[0]),
+            resolucion=resolucion,
+            duraciones=resultado["durations"].reshape(forma),
+            distancias=resultado["distances"].reshape(forma)
+        )
+        logger.info(f"Campo calculado para {punto.tipo} {punto.id}: {forma[0]}x{forma[1]} celdas")
+
+    return RegistroCampos(campos)
+
+
+# Registro cargado al arrancar la aplicación
+_registro: Optional[RegistroCampos] = None
+_registro_lock = threading.Lock()
+
+
+def obtener_campos() -> RegistroCampos:
+    """Registro de campos del proceso (se carga desde disco la primera vez)"""
+    global _registro
+    if _registro is None:
+        with _registro_lock:
+            if _registro is None:
+                _registro = RegistroCampos.cargar()
+    return _registro
+
+
+def recargar_campos(ruta: str = RUTA_CAMPOS) -> RegistroCampos:
+    """Vuelve a leer los campos desde disco (tras ejecutar el precálculo)"""
+    global _registro
+    with _registro_lock:
+        _registro = RegistroCampos.cargar(ruta)
+    return _registro
@@ -0,0 +1,181 @@
+"""
+Middleware de compresión de respuestas (brotli o gzip)
+Elige brotli si el cliente lo acepta y el paquete está instalado; si no,
+gzip. Las respuestas menores a minimo_bytes se envían sin comprimir y las
+respuestas en streaming se comprimen por fragmentos.
+"""
+import zlib
+from typing import List, Optional, Tuple
+
+try:
+    import brotli
+except ImportError:  # Dependencia opcional: solo gzip
+    brotli = None
+
+TIPOS_COMPRIMIBLES = (
+    b"text/",
+    b"application/json",
+    b"application/geo+json",
+    b"application/x-ndjson",
+    b"application/javascript",
+    b"application/xml",
+    b"image/svg+xml",
+    b"application/vnd.mapbox-vector-tile",
+)
+
+
+def elegir_codificacion(accept_encoding: str) -> Optional[str]:
+    """
+    Codificación a usar según Accept-Encoding ('br', 'gzip' o None)
+
+    Respeta q=0 (codificación rechazada por el cliente).
+    """
+    aceptadas = {}
+    for parte in accept_encoding.lower().split(","):
+        nombre, _, parametros = parte.strip().partition(";")
+        calidad = 1.0
+        parametros = parametros.strip()
+        if parametros.startswith("q="):
+            try:
+                calidad = float(parametros[2:])
+            except ValueError:
+                calidad = 0.0
+        if nombre:
+            aceptadas[nombre] = calidad
+
+    comodin = aceptadas.get("*", 0.0)
+    if brotli is not None and aceptadas.get("br", comodin) > 0:
+        return "br"
+    if aceptadas.get("gzip", comodin) > 0:
+        return "gzip"
+    return None
+
+
+class _Compresor:
+    """Compresión incremental con la interfaz común de gzip y brotli"""
+
+    def __init__(self, codificacion: str, nivel_gzip: int, nivel_brotli: int):
+        self.codificacion = codificacion
+        if codificacion == "br":
+            self._br = brotli.Compressor(quality=nivel_brotli)
+        else:
+            self._gz = zlib.compressobj(nivel_gzip, zlib.DEFLATED, 31)  # 31: formato gzip
+
+    def fragmento(self, datos: bytes) -> bytes:
+        """Comprime un fragmento y lo vacía para que el cliente lo reciba ya"""
+        if self.codificacion == "br":
+            return self._br.process(datos) + self._br.flush()
+        return self._gz.compress(datos) + self._gz.flush(zlib.Z_SYNC_FLUSH)
+
+    def final(self, datos: bytes = b"") -> bytes:
+        if self.codificacion == "br":
+            return self._br.process(datos) + self._br.finish()
+        return self._gz.compress(datos) + self._gz.flush(zlib.Z_FINISH)
+
+
+def _cabecera(cabeceras: List[Tuple[bytes, bytes]], nombre: bytes) -> Optional[bytes]:
+    for clave, valor in cabeceras:
+        if clave.lower() == nombre:
+            return valor
+    return None
+
+
+class CompresionMiddleware:
+    """Middleware ASGI que comprime respuestas HTTP"""
+
+    def __init__(self, app, minimo_bytes: int = 1024, nivel_gzip: int = 6, nivel_brotli: int = 4):
+        self.app = app
+        self.minimo_bytes = minimo_bytes
+        self.nivel_gzip = nivel_gzip
+        self.nivel_brotli = nivel_brotli
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        accept = _cabecera(scope.get("headers", []), b"accept-encoding")
+        codificacion = elegir_codificacion(accept.decode("latin-1")) if accept else None
+        if codificacion is None:
+            await self.app(scope, receive, send)
+            return
+
+        respuesta = _RespuestaComprimida(self, codificacion, send)
+        await self.app(scope, receive, respuesta.send)
+
+
+class _RespuestaComprimida:
+    """Estado de una respuesta: decide al primer fragmento si comprimir"""
+
+    def __init__(self, middleware: CompresionMiddleware, codificacion: str, send):
+        self.middleware = middleware
+        self.codificacion = codificacion
+        self._send = send
+        self._inicio = None
+        self._compresor: Optional[_Compresor] = None
+        self._decidido = False
+
+    def _comprimible(self) -> bool:
+        if self._inicio["status"] < 200 or self._inicio["status"] in (204, 304):
+            return False
+        cabeceras = self._inicio.get("headers", [])
+        if _cabecera(cabeceras, b"content-encoding") is not None:
+            return False
+        tipo = (_cabecera(cabeceras, b"content-type") or b"").lower()
+        return tipo.startswith(TIPOS_COMPRIMIBLES)
+
+    def _cabeceras_comprimidas(self, longitud: Optional[int]) -> List[Tuple[bytes, bytes]]:
+        cabeceras = [
+            (k, v) for k, v in self._inicio.get("headers", [])
+            if k.lower() not in (b"content-length", b"vary")
+        ]
+        vary = _cabecera(self._inicio.get("headers", []), b"vary")
+        cabeceras.append((b"vary", vary + b", Accept-Encoding" if vary else b"Accept-Encoding"))
+        cabeceras.append((b"content-encoding", self.codificacion.encode()))
+        if longitud is not None:
+            cabeceras.append((b"content-length", str(longitud).encode()))
+        return cabeceras
+
+    async def send(self, message):
+        if message["type"] == "http.response.start":
+            # Las cabeceras se envían junto con el primer fragmento del cuerpo
+            self._inicio = message
+            return
+
+        if message["type"] != "http.response.body":
+            await self._send(message)
+            return
+
+        cuerpo = message.get("body", b"")
+        mas = message.get("more_body", False)
+
+        if not self._decidido:
+            self._decidido = True
+            if not self._comprimible() or (not mas and len(cuerpo) < self.middleware.minimo_bytes):
+                await self._send(self._inicio)
+                await self._send(message)
+                return
+
+            self._compresor = _Compresor(
+                self.codificacion, self.middleware.nivel_gzip, self.middleware.nivel_brotli
+            )
+            if not mas:
+                comprimido = self._compresor.final(cuerpo)
+                await self._send({**self._inicio, "headers": self._cabeceras_comprimidas(len(comprimido))})
+                await self._send({"type": "http.response.body", "body": comprimido})
+                return
+
+            await self._send({**self._inicio, "headers": self._cabeceras_comprimidas(None)})
+            await self._send({
+                "type": "http.response.body",
+                "body": self._compresor.fragmento(cuerpo),
+                "more_body": True
+            })
+            return
+
+        if self._compresor is None:
+            await self._send(message)
+            return
+
+        datos = self._compresor.fragmento(cuerpo) if mas else self._compresor.final(cuerpo)
+        await self._send({"type": "http.response.body", "body": datos, "more_body": mas})
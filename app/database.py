@@ -1,6 +1,8 @@
-from sqlalchemy import create_engine
+from typing import Callable, Tuple
+
+from sqlalchemy import create_engine, event
 from sqlalchemy.ext.declarative import declarative_base
-from sqlalchemy.orm import sessionmaker
+from sqlalchemy.orm import Session, sessionmaker
 from dotenv import load_dotenv
 import os 
 
@@ -16,6 +18,28 @@ if not DATABASE_URL:
 
 engine = create_engine(DATABASE_URL)
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+
+# Pool separado para la ingesta de posiciones GPS: un pico de escrituras
+# de los camiones no debe agotar las conexiones del resto de la API
+ingesta_engine = create_engine(
+    DATABASE_URL,
+    pool_size=int(os.getenv("DB_INGESTA_POOL_SIZE", "2")),
+    max_overflow=int(os.getenv("DB_INGESTA_MAX_OVERFLOW", "2")),
+    pool_pre_ping=True
+)
+SessionIngesta = sessionmaker(autocommit=False, autoflush=False, bind=ingesta_engine)
+
+# Pool de las exportaciones: cada exportación retiene una conexión mientras
+# recorre su cursor; con un pool propio no compiten con las peticiones
+# normales y el tamaño limita cuántas corren a la vez
+exportacion_engine = create_engine(
+    DATABASE_URL,
+    pool_size=int(os.getenv("DB_EXPORTACION_POOL_SIZE", "2")),
+    max_overflow=0,
+    pool_timeout=int(os.getenv("DB_EXPORTACION_POOL_TIMEOUT", "5")),
+    pool_pre_ping=True
+)
+SessionExportacion = sessionmaker(autocommit=False, autoflush=False, bind=exportacion_engine)
 Base = declarative_base()
 
 # Obtener la sesion de BD 
@@ -24,4 +48,40 @@ def get_db():
     try:
         yield db
     finally: db.close()
-    
+
+
+def registrar_invalidacion(
+    modelos: Tuple[type, ...],
+    accion: Callable[[], None],
+    solo_nuevos: bool = False
+):
+    """
+    Ejecuta una acción al confirmar cada transacción que escribió alguno de los modelos
+
+    La escritura se detecta en after_flush y la acción se difiere a
+    after_commit: si se invalidara en el flush, otro hilo podría volver a
+    cargar el estado anterior al commit. Un rollback descarta la marca.
+
+    Args:
+        modelos: Clases de modelo que disparan la acción
+        accion: Función sin argumentos, ej. registro.invalidar
+        solo_nuevos: Si True, solo cuentan los objetos insertados
+    """
+    marca = object()
+
+    @event.listens_for(Session, "after_flush")
+    def _marcar(session, flush_context):
+        objetos = list(session.new)
+        if not solo_nuevos:
+            objetos += list(session.dirty) + list(session.deleted)
+        if any(isinstance(objeto, modelos) for objeto in objetos):
+            session.info[marca] = True
+
+    @event.listens_for(Session, "after_commit")
+    def _ejecutar(session):
+        if session.info.pop(marca, False):
+            accion()
+
+    @event.listens_for(Session, "after_rollback")
+    def _descartar(session):
+        session.info.pop(marca, None)
@@ -0,0 +1,79 @@
+"""
+Soporte de GET condicional (ETag / If-None-Match) y Cache-Control
+Las apps de conductores consultan las rutas periódicamente y la mayoría de
+las respuestas no cambian entre consultas; con un ETag barato de calcular
+el servidor responde 304 sin armar el payload y el móvil no lo descarga.
+"""
+import hashlib
+from typing import Optional
+
+from fastapi import Request, Response
+
+# Rutas completadas: ya no cambian
+CACHE_INMUTABLE = "private, max-age=86400, immutable"
+# Resto: el cliente puede guardar la respuesta pero debe revalidarla
+CACHE_REVALIDAR = "private, no-cache"
+
+
+def calcular_etag(*partes) -> str:
+    """
+    ETag débil a partir de los valores que determinan la respuesta
+
+    Args:
+        partes: Versión del recurso (timestamps, conteos, filtros...)
+
+    Returns:
+        ETag con comillas, p. ej. W/"3f2a..."
+    """
+    clave = "|".join("" if p is None else str(p) for p in partes)
+    return f'W/"{hashlib.sha1(clave.encode()).hexdigest()[:20]}"'
+
+
+def etag_coincide(request: Request, etag: str) -> bool:
+    """True si algún ETag de If-None-Match coincide (comparación débil)"""
+    cabecera = request.headers.get("if-none-match")
+    if not cabecera:
+        return False
+    if cabecera.strip() == "*":
+        return True
+    valor = etag[2:] if etag.startswith("W/") else etag
+    for candidato in cabecera.split(","):
+        candidato = candidato.strip()
+        if candidato.startswith("W/"):
+            candidato = candidato[2:]
+        if candidato == valor:
+            return True
+    return False
+
+
+def no_modificado(etag: str, cache_control: str = CACHE_REVALIDAR) -> Response:
+    """Respuesta 304 con las mismas cabeceras de validación"""
+    return Response(
+        status_code=304,
+        headers={"ETag": etag, "Cache-Control": cache_control}
+    )
+
+
+def aplicar_cabeceras(response: Response, etag: str, cache_control: str = CACHE_REVALIDAR):
+    """Agrega ETag y Cache-Control a la respuesta del endpoint"""
+    response.headers["ETag"] = etag
+    response.headers["Cache-Control"] = cache_control
+
+
+def respuesta_condicional(
+    request: Request,
+    response: Response,
+    etag: str,
+    cache_control: str = CACHE_REVALIDAR
+) -> Optional[Response]:
+    """
+    Resuelve la parte condicional de un GET
+
+    Returns:
+        Respuesta 304 si el cliente ya tiene la versión actual; si no,
+        None (y las cabeceras quedan aplicadas a response)
+    """
+    if etag_coincide(request, etag):
+        return no_modificado(etag, cache_control)
+    aplicar_cabeceras(response, etag, cache_control)
+    return None
@@ -0,0 +1,94 @@
+"""
+Serialización JSON rápida para endpoints con payloads grandes
+Los endpoints que la usan devuelven RespuestaJSON directamente: FastAPI no
+pasa el contenido por la validación del response_model ni por
+jsonable_encoder, y orjson codifica las filas tal como salen de la consulta.
+Solo debe usarse con datos que ya tienen la forma del schema (consultas
+por columnas del propio servicio, no entrada del usuario).
+"""
+import json
+from datetime import date, datetime, time, timedelta
+from decimal import Decimal
+from enum import Enum
+from typing import Any, Dict, Iterable, List, Optional, Sequence
+
+from fastapi import Response
+
+try:
+    import orjson
+except ImportError:  # Dependencia opcional: se usa json de la librería estándar
+    orjson = None
+
+
+def _convertir(obj: Any) -> Any:
+    """Tipos que orjson/json no codifican, con el mismo formato que FastAPI"""
+    if isinstance(obj, timedelta):
+        return obj.total_seconds()
+    if isinstance(obj, Decimal):
+        return float(obj)
+    if isinstance(obj, (set, frozenset)):
+        return list(obj)
+    if isinstance(obj, (datetime, date, time)):
+        return obj.isoformat()
+    if isinstance(obj, Enum):
+        return obj.value
+    if hasattr(obj, "tolist"):  # escalares y arrays de numpy
+        return obj.tolist()
+    raise TypeError(f"Tipo no serializable: {type(obj).__name__}")
+
+
+if orjson is not None:
+    _OPCIONES_ORJSON = orjson.OPT_NON_STR_KEYS | orjson.OPT_SERIALIZE_NUMPY
+
+    def dumps(contenido: Any) -> bytes:
+        """Codifica a JSON (bytes UTF-8)"""
+        return orjson.dumps(contenido, default=_convertir, option=_OPCIONES_ORJSON)
+else:
+    def dumps(contenido: Any) -> bytes:
+        """Codifica a JSON (bytes UTF-8)"""
+        return json.dumps(
+            contenido, default=_convertir, ensure_ascii=False, separators=(",", ":")
+        ).encode("utf-8")
+
+
+class RespuestaJSON(Response):
+    """Respuesta JSON codificada con orjson (o json si no está instalado)"""
+
+    media_type = "application/json"
+
+    def render(self, content: Any) -> bytes:
+        return dumps(content)
+
+
+def filas_a_dicts(filas: Sequence, campos: Optional[Iterable[str]] = None) -> List[Dict]:
+    """
+    Convierte filas de una consulta por columnas (Row) a diccionarios
+
+    Args:
+        filas: Resultado de db.query(col1, col2, ...).all()
+        campos: Nombres de las claves; por defecto los de las columnas
+
+    Returns:
+        Lista de dicts, sin instanciar objetos ORM ni modelos Pydantic
+    """
+    if not filas:
+        return []
+    claves = tuple(campos) if campos is not None else filas[0]._fields
+    return [dict(zip(claves, fila)) for fila in filas]
+
+
+def respuesta_rapida(
+    contenido: Any,
+    response: Optional[Response] = None,
+    status_code: int = 200
+) -> RespuestaJSON:
+    """
+    RespuestaJSON que conserva las cabeceras puestas en el Response
+    inyectado al endpoint (ETag, Cache-Control...)
+    """
+    respuesta = RespuestaJSON(contenido, status_code=status_code)
+    if response is not None:
+        for clave, valor in response.headers.items():
+            if clave != "content-length":
+                respuesta.headers[clave] = valor
+    return respuesta
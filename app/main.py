@@ -2,22 +2,100 @@
 Aplicación principal FastAPI
 Sistema de Gestión de Incidencias - EPAGAL Latacunga
 """
-from fastapi import FastAPI
+from app.arranque import fases_arranque  # primero: mide la importación del resto
+
+from contextlib import asynccontextmanager
+from fastapi import FastAPI, Response, status
 from fastapi.middleware.cors import CORSMiddleware
 import os
+import asyncio
+import logging
 
 from app.database import engine, Base
-from app.routers import incidencias, rutas, auth, conductores
+from app.routers import incidencias, rutas, auth, conductores, camiones, gps, notificaciones, tiles, exportaciones
+from app.compresion import CompresionMiddleware
+from app.services.gps_service import worker_map_matching
+from app.services.tiempo_real_service import escucha_eventos
+from app.services.despacho_notificaciones import despachador_notificaciones
+from app.services.calentamiento_service import calentamiento
+from app.services.solver_service import pool_solver
+from app.services.refinamiento_service import refinador_rutas
+
+fases_arranque.registrar_desde_inicio("importacion")
+
+logger = logging.getLogger(__name__)
+
+
+def _activado(variable: str, default: str = "true") -> bool:
+    return os.getenv(variable, default).lower() in ("true", "1", "yes")
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """
+    Arranque y parada de la aplicación
+    
+    El esquema lo crean las migraciones (aplicar_migraciones.py, que el
+    contenedor corre antes de uvicorn); DB_CREATE_ALL=true crea las tablas
+    faltantes desde los modelos, solo para desarrollo local.
+    OSRM, los transformers de pyproj, los campos de distancia, el módulo de
+    rutas (matriz y solver) y los procesos del solver se cargan en su primer
+    uso.
+    """
+    if _activado("DB_CREATE_ALL", "false"):
+        with fases_arranque.medir("create_all"):
+            Base.metadata.create_all(bind=engine)
+    
+    # Worker que ajusta las trazas GPS a la red vial
+    if _activado("GPS_MATCH_WORKER"):
+        with fases_arranque.medir("worker_map_matching"):
+            worker_map_matching.iniciar()
+    
+    # Eventos de conductores publicados por cualquier worker
+    with fases_arranque.medir("escucha_eventos"):
+        escucha_eventos.iniciar(asyncio.get_running_loop())
+    
+    # Hilo que entrega las notificaciones del outbox
+    if _activado("NOTIFICACIONES_WORKER"):
+        with fases_arranque.medir("despachador_notificaciones"):
+            despachador_notificaciones.iniciar()
+    
+    # Hilo que refina las rutas generadas sin OSRM cuando se recupera
+    if _activado("REFINAMIENTO_WORKER"):
+        with fases_arranque.medir("refinador_rutas"):
+            refinador_rutas.iniciar()
+    
+    # Calentar caches antes de aceptar tráfico. Si tarda más de
+    # CALENTAMIENTO_TIMEOUT segundos se sigue en segundo plano y
+    # /health/ready responde 503 hasta que termine.
+    if _activado("CALENTAMIENTO"):
+        tarea = asyncio.create_task(asyncio.to_thread(calentamiento.ejecutar))
+        try:
+            await asyncio.wait_for(
+                asyncio.shield(tarea), float(os.getenv("CALENTAMIENTO_TIMEOUT", "20"))
+            )
+        except asyncio.TimeoutError:
+            logger.warning("Calentamiento incompleto al arrancar, continúa en segundo plano")
+    else:
+        calentamiento.omitir()
+    
+    fases_arranque.finalizar()
+    yield
+    
+    worker_map_matching.detener()
+    escucha_eventos.detener()
+    despachador_notificaciones.detener()
+    refinador_rutas.detener()
+    pool_solver.detener()
 
-# Crear tablas
-Base.metadata.create_all(bind=engine)
 
 app = FastAPI(
     title="Sistema de Gestión de Incidencias - EPAGAL Latacunga",
     description="API para gestión de reportes ciudadanos y optimización de rutas de recolección",
     version="2.0.0",
     docs_url="/docs",
-    redoc_url="/redoc"
+    redoc_url="/redoc",
+    lifespan=lifespan
 )
 
 # Configuración CORS - Orígenes permitidos (hardcoded para producción)
@@ -55,11 +133,22 @@ app.add_middleware(
     max_age=600,  # Cache preflight requests por 10 minutos
 )
 
+# Compresión brotli/gzip de respuestas grandes (listados, rutas, exportaciones)
+app.add_middleware(
+    CompresionMiddleware,
+    minimo_bytes=int(os.getenv("COMPRESION_MINIMO_BYTES", "1024"))
+)
+
 # Incluir routers - todos con prefijo /api para unificar
 app.include_router(auth.router, prefix="/api")
 app.include_router(conductores.router, prefix="/api")
 app.include_router(incidencias.router, prefix="/api")
 app.include_router(rutas.router, prefix="/api")
+app.include_router(camiones.router, prefix="/api")
+app.include_router(gps.router, prefix="/api")
+app.include_router(notificaciones.router, prefix="/api")
+app.include_router(tiles.router, prefix="/api")
+app.include_router(exportaciones.router, prefix="/api")
 
 
 @app.get("/")
@@ -87,3 +176,23 @@ def health_check():
         "status": "ok",
         "service": "incidencias-api"
     }
+
+
+@app.get("/health/ready")
+def health_ready(response: Response):
+    """
+    Readiness: 200 cuando el calentamiento terminó, 503 mientras tanto
+    
+    Es el health check del despliegue: el tráfico pasa al proceso nuevo
+    solo cuando sus caches están cargados.
+    """
+    resumen = calentamiento.resumen()
+    if not resumen["listo"]:
+        response.status_code = status.HTTP_503_SERVICE_UNAVAILABLE
+    return {"status": "ready" if resumen["listo"] else "warming_up", **resumen}
+
+
+@app.get("/health/arranque")
+def health_arranque():
+    """Duración de las fases de arranque de este proceso (ms)"""
+    return fases_arranque.resumen()
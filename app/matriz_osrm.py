@@ -0,0 +1,331 @@
+"""
+Construcción de matrices de distancia/tiempo con OSRM por bloques
+Divide matrices grandes en bloques (origen x destino) que respetan el
+límite --max-table-size de OSRM y la longitud máxima de URL
+"""
+import os
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from typing import List, Dict, Tuple, Optional, Hashable, Iterable
+
+import numpy as np
+
+from app.osrm_service import (
+    OSRMService, MAX_TABLE_SIZE, RADIO_TIERRA_M,
+    FACTOR_DESVIO_VIAL, VELOCIDAD_ESTIMADA_KMH
+)
+
+logger = logging.getLogger(__name__)
+
+
+# Solicitudes /table simultáneas por matriz
+CONCURRENCIA_TABLA = int(os.getenv("OSRM_TABLE_CONCURRENCIA", "4"))
+
+
+class IndiceCoordenadas:
+    """
+    Índice hash de coordenadas únicas
+
+    Las coordenadas se redondean a 6 decimales (~10 cm) para que dos
+    lecturas del mismo punto caigan en la misma fila de la matriz.
+    """
+
+    def __init__(self, precision: int = 6):
+        self.precision = precision
+        self._indice: Dict[Tuple[float, float], int] = {}
+        self.coordenadas: List[Tuple[float, float]] = []
+
+    def __len__(self) -> int:
+        return len(self.coordenadas)
+
+    def agregar(self, coordenada: Tuple[float, float]) -> int:
+        """Agrega una coordenada (lon, lat) y retorna su índice"""
+        clave = (round(coordenada[0], self.precision), round(coordenada[1], self.precision))
+        indice = self._indice.get(clave)
+        if indice is None:
+            indice = len(self.coordenadas)
+            self._indice[clave] = indice
+            self.coordenadas.append(clave)
+        return indice
+
+    def agregar_todas(self, coordenadas: List[Tuple[float, float]]) -> List[int]:
+        return [self.agregar(c) for c in coordenadas]
+
+
+def estimar_bloque(
+    origenes: np.ndarray,
+    destinos: np.ndarray
+) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Estimación vectorizada en línea recta de un bloque de la matriz
+
+    Args:
+        origenes: Array (n, 2) de (lon, lat)
+        destinos: Array (m, 2) de (lon, lat)
+
+    Returns:
+        Tuple[distancias (n, m) en metros, duraciones (n, m) en segundos]
+    """
+    lon1 = np.radians(origenes[:, 0])[:, None]
+    lat1 = np.radians(origenes[:, 1])[:, None]
+    lon2 = np.radians(destinos[:, 0])[None, :]
+    lat2 = np.radians(destinos[:, 1])[None, :]
+
+    a = np.sin((lat2 - lat1) / 2) ** 2 + np.cos(lat1) * np.cos(lat2) * np.sin((lon2 - lon1) / 2) ** 2
+    distancias = 2 * RADIO_TIERRA_M * np.arcsin(np.sqrt(a)) * FACTOR_DESVIO_VIAL
+    duraciones = distancias / (VELOCIDAD_ESTIMADA_KMH / 3.6)
+    return distancias.astype(np.float32), duraciones.astype(np.float32)
+
+
+class MatrizRuteo:
+    """
+    Matriz de ruteo compacta respaldada por arrays NumPy contiguos
+
+    - distancias: float32 en metros
+    - duraciones: int32 en segundos
+
+    Cada fila/columna se identifica con una clave, por ejemplo
+    ('incidencia', 42) o ('punto_fijo', 1), de modo que los consumidores
+    no dependan de la posición de cada punto en la lista original.
+    Una matriz de 1000x1000 ocupa ~8 MB frente a decenas de MB como
+    listas anidadas de floats de Python.
+    """
+
+    INCIDENCIA = "incidencia"
+    PUNTO_FIJO = "punto_fijo"
+
+    def __init__(
+        self,
+        distancias: np.ndarray,
+        duraciones: np.ndarray,
+        claves: List[Hashable],
+        estimada: bool = False
+    ):
+        if distancias.shape != (len(claves), len(claves)) or duraciones.shape != distancias.shape:
+            raise ValueError(
+                f"Dimensiones inconsistentes: {distancias.shape}, {duraciones.shape}, "
+                f"{len(claves)} claves"
+            )
+        self.distancias = np.ascontiguousarray(distancias, dtype=np.float32)
+        self.duraciones = np.ascontiguousarray(np.rint(duraciones), dtype=np.int32)
+        self.claves = list(claves)
+        self.indice: Dict[Hashable, int] = {clave: i for i, clave in enumerate(self.claves)}
+        self.estimada = estimada
+
+    def __len__(self) -> int:
+        return len(self.claves)
+
+    def __contains__(self, clave: Hashable) -> bool:
+        return clave in self.indice
+
+    @property
+    def nbytes(self) -> int:
+        return self.distancias.nbytes + self.duraciones.nbytes
+
+    @staticmethod
+    def clave_incidencia(incidencia_id: int) -> Tuple[str, int]:
+        return (MatrizRuteo.INCIDENCIA, incidencia_id)
+
+    @staticmethod
+    def clave_punto_fijo(punto_id: int) -> Tuple[str, int]:
+        return (MatrizRuteo.PUNTO_FIJO, punto_id)
+
+    def filas(self, claves: Iterable[Hashable]) -> np.ndarray:
+        """Índices de fila de las claves dadas"""
+        return np.fromiter((self.indice[c] for c in claves), dtype=np.int32)
+
+    def distancia(self, origen: Hashable, destino: Hashable) -> float:
+        return float(self.distancias[self.indice[origen], self.indice[destino]])
+
+    def duracion(self, origen: Hashable, destino: Hashable) -> int:
+        return int(self.duraciones[self.indice[origen], self.indice[destino]])
+
+    def submatriz(self, claves: List[Hashable]) -> "MatrizRuteo":
+        """
+        Sub-matriz con las claves dadas en ese orden (ej. las paradas de un camión)
+        """
+        filas = self.filas(claves)
+        seleccion = np.ix_(filas, filas)
+        return MatrizRuteo(
+            self.distancias[seleccion],
+            self.duraciones[seleccion],
+            claves,
+            estimada=self.estimada
+        )
+
+    def con_factor(self, factor: float) -> "MatrizRuteo":
+        """
+        Copia con las duraciones multiplicadas por un factor de tráfico
+
+        Las distancias se comparten con la matriz original (no se copian).
+        """
+        return MatrizRuteo(
+            self.distancias,
+            self.duraciones * np.float32(factor),
+            self.claves,
+            estimada=self.estimada
+        )
+
+    def secuencia(self, claves: List[Hashable]) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Distancias y duraciones de cada tramo al recorrer las claves en orden
+
+        Returns:
+            Tuple[distancias (n-1,), duraciones (n-1,)]
+        """
+        filas = self.filas(claves)
+        return self.distancias[filas[:-1], filas[1:]], self.duraciones[filas[:-1], filas[1:]]
+
+
+class ConstructorMatrizOSRM:
+    """
+    Construye matrices de distancia/tiempo arbitrariamente grandes
+
+    1. Deduplica las coordenadas con un índice hash
+    2. Divide la matriz de coordenadas únicas en bloques origen x destino
+       cuyo total de coordenadas no supera max_tabla
+    3. Solicita los bloques en paralelo con un límite de concurrencia
+    4. Ensambla el resultado en arrays NumPy float32
+    """
+
+    def __init__(
+        self,
+        osrm: Optional[OSRMService] = None,
+        max_tabla: Optional[int] = None,
+        concurrencia: Optional[int] = None
+    ):
+        self.osrm = osrm or OSRMService()
+        self.max_tabla = max_tabla or MAX_TABLE_SIZE
+        self.concurrencia = concurrencia or CONCURRENCIA_TABLA
+
+    def _bloques(self, n_origenes: int, n_destinos: int) -> List[Tuple[int, int, int, int]]:
+        """Divide la matriz en bloques (i0, i1, j0, j1)"""
+        lado = max(1, self.max_tabla // 2)
+        return [
+            (i0, min(i0 + lado, n_origenes), j0, min(j0 + lado, n_destinos))
+            for i0 in range(0, n_origenes, lado)
+            for j0 in range(0, n_destinos, lado)
+        ]
+
+    def _solicitar_bloque(
+        self,
+        coords_origen: List[Tuple[float, float]],
+        coords_destino: List[Tuple[float, float]]
+    ) -> Optional[Tuple[np.ndarray, np.ndarray]]:
+        """Solicita un bloque a OSRM; None si falla"""
+        local = IndiceCoordenadas()
+        idx_origen = local.agregar_todas(coords_origen)
+        idx_destino = local.agregar_todas(coords_destino)
+
+        try:
+            data = self.osrm.request_table(local.coordenadas, idx_origen, idx_destino)
+        except Exception as e:
+            logger.warning(f"Bloque de matriz OSRM {len(coords_origen)}x{len(coords_destino)} falló: {e}")
+            return None
+
+        # OSRM retorna null en pares sin ruta: quedan como NaN
+        distancias = np.array(data["distances"], dtype=np.float64)
+        duraciones = np.array(data["durations"], dtype=np.float64)
+        return distancias.astype(np.float32), duraciones.astype(np.float32)
+
+    def construir(
+        self,
+        sources: List[Tuple[float, float]],
+        destinations: Optional[List[Tuple[float, float]]] = None,
+        permitir_estimacion: bool = True
+    ) -> Optional[Dict]:
+        """
+        Construye la matriz completa sources x destinations
+
+        Args:
+            sources: Puntos de origen (lon, lat)
+            destinations: Puntos de destino (si None, usa sources)
+            permitir_estimacion: Si True, los bloques que fallen (o pares sin
+                ruta) se completan con la estimación en línea recta. Si False,
+                los pares sin ruta quedan en NaN (como el null de /table) y
+                solo un bloque fallido (error de transporte) anula la matriz
+
+        Returns:
+            Dict con 'distances' y 'durations' (np.ndarray float32, metros y
+            segundos) y 'estimada' (True si algún valor es estimado), o None
+            si falló algún bloque y no se permite estimar
+        """
+        if destinations is None:
+            destinations = sources
+
+        indice = IndiceCoordenadas()
+        filas = np.array(indice.agregar_todas(sources), dtype=np.int32)
+        columnas = np.array(indice.agregar_todas(destinations), dtype=np.int32)
+
+        # Filas y columnas únicas de la matriz a solicitar
+        origenes_unicos, pos_filas = np.unique(filas, return_inverse=True)
+        destinos_unicos, pos_columnas = np.unique(columnas, return_inverse=True)
+        coords = np.array(indice.coordenadas, dtype=np.float64)
+
+        n, m = len(origenes_unicos), len(destinos_unicos)
+        distancias = np.full((n, m), np.nan, dtype=np.float32)
+        duraciones = np.full((n, m), np.nan, dtype=np.float32)
+
+        bloques = self._bloques(n, m)
+        logger.info(
+            f"Matriz OSRM {len(sources)}x{len(destinations)} "
+            f"({n}x{m} únicos) en {len(bloques)} bloques"
+        )
+
+        def tarea(bloque):
+            i0, i1, j0, j1 = bloque
+            return bloque, self._solicitar_bloque(
+                [tuple(c) for c in coords[origenes_unicos[i0:i1]]],
+                [tuple(c) for c in coords[destinos_unicos[j0:j1]]]
+            )
+
+        executor = ThreadPoolExecutor(max_workers=self.concurrencia)
+        try:
+            for (i0, i1, j0, j1), resultado in executor.map(tarea, bloques):
+                if resultado is None:
+                    if not permitir_estimacion:
+                        return None
+                    continue
+                distancias[i0:i1, j0:j1], duraciones[i0:i1, j0:j1] = resultado
+        finally:
+            # Si un bloque falló no se esperan los pendientes: la matriz ya se descartó
+            executor.shutdown(wait=False, cancel_futures=True)
+
+        faltantes = np.isnan(distancias) | np.isnan(duraciones)
+        estimada = permitir_estimacion and bool(faltantes.any())
+        if estimada:
+            dist_est, dur_est = estimar_bloque(coords[origenes_unicos], coords[destinos_unicos])
+            distancias[faltantes] = dist_est[faltantes]
+            duraciones[faltantes] = dur_est[faltantes]
+            logger.warning(f"Matriz OSRM: {int(faltantes.sum())} valores estimados en línea recta")
+
+        # Expandir a los sources/destinations originales (con duplicados)
+        seleccion = np.ix_(pos_filas, pos_columnas)
+        return {
+            "distances": distancias[seleccion],
+            "durations": duraciones[seleccion],
+            "estimada": estimada
+        }
+
+    def construir_matriz_ruteo(
+        self,
+        puntos: Dict[Hashable, Tuple[float, float]]
+    ) -> MatrizRuteo:
+        """
+        Construye una MatrizRuteo cuadrada para los puntos dados
+
+        Args:
+            puntos: Dict clave -> (lon, lat), ej.
+                {MatrizRuteo.clave_punto_fijo(1): (-78.61, -0.93), ...}
+
+        Returns:
+            MatrizRuteo con los valores faltantes estimados en línea recta
+        """
+        claves = list(puntos)
+        resultado = self.construir([puntos[c] for c in claves])
+        return MatrizRuteo(
+            resultado["distances"],
+            resultado["durations"],
+            claves,
+            estimada=resultado["estimada"]
+        )
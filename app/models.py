@@ -5,8 +5,9 @@ Fecha: 2025-12-13
 from sqlalchemy import (
     Column, Integer, String, Text, TIMESTAMP, Boolean, 
     SmallInteger, CheckConstraint, ForeignKey, Interval,
-    Float, func
+    Float, UniqueConstraint, func
 )
+from sqlalchemy.dialects.postgresql import JSONB
 from sqlalchemy.orm import relationship
 from geoalchemy2 import Geometry
 from datetime import datetime
@@ -18,10 +19,12 @@ class Incidencia(Base):
     """
     Modelo para reportes de incidencias ciudadanas
     Tipos: acopio, zona_critica, animal_muerto
+    Particionada por mes de reportado_en (migración 014): la clave
+    primaria incluye la columna de partición
     """
     __tablename__ = "incidencias"
 
-    id = Column(Integer, primary_key=True, index=True)
+    id = Column(Integer, primary_key=True, autoincrement=True, index=True)
     tipo = Column(String(20), nullable=False)
     gravedad = Column(SmallInteger, nullable=False)  # 1, 3 o 5
     descripcion = Column(Text)
@@ -35,7 +38,7 @@ class Incidencia(Base):
     ventana_inicio = Column(TIMESTAMP)
     ventana_fin = Column(TIMESTAMP)
     estado = Column(String(15), default='pendiente')  # pendiente, asignada, completada, cancelada
-    reportado_en = Column(TIMESTAMP, default=datetime.utcnow)
+    reportado_en = Column(TIMESTAMP, primary_key=True, default=datetime.utcnow)
     usuario_id = Column(Integer, nullable=True)
     created_at = Column(TIMESTAMP, default=datetime.utcnow)
     updated_at = Column(TIMESTAMP, default=datetime.utcnow, onupdate=datetime.utcnow)
@@ -48,8 +51,14 @@ class Incidencia(Base):
         CheckConstraint("estado IN ('pendiente', 'validada', 'asignada', 'completada', 'cancelada')", name='check_estado'),
     )
 
-    # Relaciones
-    detalles_ruta = relationship("RutaDetalle", back_populates="incidencia")
+    # Relaciones (sin FK en la base: una tabla particionada solo puede ser
+    # referenciada por su clave completa)
+    detalles_ruta = relationship(
+        "RutaDetalle",
+        primaryjoin="Incidencia.id == foreign(RutaDetalle.incidencia_id)",
+        back_populates="incidencia",
+        viewonly=True
+    )
 
     def __repr__(self):
         return f"<Incidencia(id={self.id}, tipo={self.tipo}, gravedad={self.gravedad}, estado={self.estado})>"
@@ -71,6 +80,8 @@ class RutaGenerada(Base):
     camiones_usados = Column(SmallInteger)
     estado = Column(String(15), default='planeada')  # planeada, en_ejecucion, completada
     notas = Column(Text)
+    requiere_refinamiento = Column(Boolean, default=False)  # generada sin OSRM (estimación en línea recta)
+    factor_trafico = Column(Float, default=1.0)  # multiplicador de duración aplicado al planificar
     created_at = Column(TIMESTAMP, default=datetime.utcnow)
     updated_at = Column(TIMESTAMP, default=datetime.utcnow, onupdate=datetime.utcnow)
 
@@ -91,22 +102,27 @@ class RutaDetalle(Base):
     """
     Modelo para puntos individuales en una ruta
     Incluye: depósito, incidencias y botadero
+    Particionada por mes de created_at (migración 014): la clave
+    primaria incluye la columna de partición
     """
     __tablename__ = "rutas_detalle"
 
-    id = Column(Integer, primary_key=True, index=True)
+    id = Column(Integer, primary_key=True, autoincrement=True, index=True)
     ruta_id = Column(Integer, ForeignKey('rutas_generadas.id', ondelete='CASCADE'), nullable=False)
     camion_tipo = Column(String(10))  # 'lateral' o 'posterior'
     camion_id = Column(String(20))  # placa del camión
+    viaje = Column(SmallInteger, default=1)  # viaje del camión (se vacía en el botadero entre viajes)
     orden = Column(SmallInteger, nullable=False)  # secuencia en la ruta
-    incidencia_id = Column(Integer, ForeignKey('incidencias.id', ondelete='SET NULL'), nullable=True)
+    incidencia_id = Column(Integer, nullable=True)  # sin FK: al borrar la incidencia un trigger la anula
     tipo_punto = Column(String(15))  # 'deposito', 'incidencia', 'botadero'
     lat = Column(Float)
     lon = Column(Float)
     llegada_estimada = Column(TIMESTAMP)
     tiempo_servicio = Column(Interval, default='10 minutes')
     carga_acumulada = Column(SmallInteger)
-    created_at = Column(TIMESTAMP, default=datetime.utcnow)
+    visitado_en = Column(TIMESTAMP, nullable=True)  # detectado por geocerca GPS
+    created_at = Column(TIMESTAMP, primary_key=True, default=datetime.utcnow)
+    updated_at = Column(TIMESTAMP, default=datetime.utcnow, onupdate=datetime.utcnow)
 
     # Constraints
     __table_args__ = (
@@ -116,12 +132,66 @@ class RutaDetalle(Base):
 
     # Relaciones
     ruta = relationship("RutaGenerada", back_populates="detalles")
-    incidencia = relationship("Incidencia", back_populates="detalles_ruta")
+    incidencia = relationship(
+        "Incidencia",
+        primaryjoin="foreign(RutaDetalle.incidencia_id) == Incidencia.id",
+        back_populates="detalles_ruta",
+        viewonly=True
+    )
 
     def __repr__(self):
         return f"<RutaDetalle(id={self.id}, ruta={self.ruta_id}, orden={self.orden}, tipo={self.tipo_punto})>"
 
 
+class TrabajoSolverRegistro(Base):
+    """
+    Estado de un trabajo del pool del solver
+    Lo escribe el worker que envió el trabajo; permite consultarlo y
+    cancelarlo desde cualquier worker de la API (migración 016)
+    """
+    __tablename__ = "trabajos_solver"
+
+    id = Column(String(32), primary_key=True)
+    zona = Column(String(10), nullable=False)
+    estado = Column(String(15), nullable=False, default='en_curso')  # en_curso, completado, cancelado, vencido, error
+    error = Column(Text)
+    ruta_id = Column(Integer, ForeignKey('rutas_generadas.id', ondelete='SET NULL'), nullable=True)
+    costo = Column(Float)
+    costo_inicial = Column(Float)
+    segundos_solver = Column(Float)
+    plazo_agotado = Column(Boolean)
+    creado_en = Column(TIMESTAMP, nullable=False)
+    vence_en = Column(TIMESTAMP, nullable=False)
+    terminado_en = Column(TIMESTAMP)
+
+    __table_args__ = (
+        CheckConstraint(
+            "estado IN ('en_curso', 'completado', 'cancelado', 'vencido', 'error')",
+            name='check_trabajo_solver_estado'
+        ),
+    )
+
+    def __repr__(self):
+        return f"<TrabajoSolverRegistro(id={self.id}, zona={self.zona}, estado={self.estado})>"
+
+
+class RutaGeometria(Base):
+    """
+    Geometría del recorrido de cada camión de una ruta (OSRM)
+    Se usa para seguir el avance de los camiones en vivo
+    """
+    __tablename__ = "rutas_geometria"
+
+    id = Column(Integer, primary_key=True, index=True)
+    ruta_id = Column(Integer, ForeignKey('rutas_generadas.id', ondelete='CASCADE'), nullable=False, index=True)
+    camion_id = Column(String(20))  # placa del camión
+    geom = Column(Geometry('LINESTRING', srid=4326), nullable=False)
+    created_at = Column(TIMESTAMP, default=datetime.utcnow)
+
+    def __repr__(self):
+        return f"<RutaGeometria(ruta={self.ruta_id}, camion={self.camion_id})>"
+
+
 class PuntoFijo(Base):
     """
     Modelo para puntos fijos del sistema: depósito y botadero
@@ -147,6 +217,37 @@ class PuntoFijo(Base):
         return f"<PuntoFijo(id={self.id}, nombre={self.nombre}, tipo={self.tipo})>"
 
 
+class Camion(Base):
+    """
+    Modelo para la flota de camiones recolectores
+    La capacidad se mide en puntos de gravedad
+    """
+    __tablename__ = "camiones"
+
+    id = Column(Integer, primary_key=True, index=True)
+    placa = Column(String(20), unique=True, nullable=False, index=True)
+    tipo = Column(String(10), nullable=False)  # 'lateral' o 'posterior'
+    capacidad = Column(SmallInteger, nullable=False)  # puntos de gravedad por viaje
+    estado = Column(String(15), default='disponible')  # disponible, mantenimiento, inactivo
+    deposito_id = Column(Integer, ForeignKey('puntos_fijos.id', ondelete='SET NULL'), nullable=True)
+    costo_km = Column(Float, default=0.0)  # costo operativo por kilómetro
+    created_at = Column(TIMESTAMP, default=datetime.utcnow)
+    updated_at = Column(TIMESTAMP, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+    # Constraints
+    __table_args__ = (
+        CheckConstraint("tipo IN ('lateral', 'posterior')", name='check_camion_tipo_flota'),
+        CheckConstraint("estado IN ('disponible', 'mantenimiento', 'inactivo')", name='check_camion_estado'),
+        CheckConstraint("capacidad > 0", name='check_camion_capacidad'),
+    )
+
+    # Relaciones
+    deposito = relationship("PuntoFijo")
+
+    def __repr__(self):
+        return f"<Camion(id={self.id}, placa={self.placa}, tipo={self.tipo}, estado={self.estado})>"
+
+
 class Config(Base):
     """
     Modelo para configuración global del sistema
@@ -180,6 +281,87 @@ class Config(Base):
         return self.valor
 
 
+class PerfilTrafico(Base):
+    """
+    Multiplicador de tiempos de viaje por zona y hora del día
+    Se aprende de las duraciones reales de rutas completadas
+    """
+    __tablename__ = "perfiles_trafico"
+
+    id = Column(Integer, primary_key=True, index=True)
+    zona = Column(String(10), nullable=False)  # 'oriental' o 'occidental'
+    hora = Column(SmallInteger, nullable=False)  # 0-23, hora local de salida
+    factor = Column(Float, nullable=False, default=1.0)  # duración real / duración OSRM
+    muestras = Column(Integer, default=0)  # rutas usadas para aprender el factor
+    updated_at = Column(TIMESTAMP, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+    # Constraints
+    __table_args__ = (
+        CheckConstraint("zona IN ('oriental', 'occidental')", name='check_perfil_zona'),
+        CheckConstraint("hora BETWEEN 0 AND 23", name='check_perfil_hora'),
+        CheckConstraint("factor > 0", name='check_perfil_factor'),
+        UniqueConstraint('zona', 'hora', name='uq_perfil_zona_hora'),
+    )
+
+    def __repr__(self):
+        return f"<PerfilTrafico(zona={self.zona}, hora={self.hora}, factor={self.factor:.2f})>"
+
+
+class TrazaGPS(Base):
+    """
+    Tramo de recorrido de un camión ajustado a la red vial (map matching)
+    Las posiciones crudas están en posiciones_gps (tabla particionada,
+    se escribe con COPY y no tiene modelo ORM)
+    """
+    __tablename__ = "trazas_gps"
+
+    id = Column(Integer, primary_key=True, index=True)
+    conductor_id = Column(Integer, ForeignKey('conductores.id', ondelete='CASCADE'), nullable=False)
+    desde = Column(TIMESTAMP, nullable=False)
+    hasta = Column(TIMESTAMP, nullable=False)
+    puntos = Column(Integer, nullable=False)  # posiciones usadas en el ajuste
+    distancia = Column(Float)  # metros
+    duracion = Column(Float)  # segundos
+    confianza = Column(Float)  # 0-1 según OSRM
+    geom = Column(Geometry('LINESTRING', srid=4326))
+    created_at = Column(TIMESTAMP, default=datetime.utcnow)
+
+    def __repr__(self):
+        return f"<TrazaGPS(id={self.id}, conductor={self.conductor_id}, puntos={self.puntos})>"
+
+
+class NotificacionOutbox(Base):
+    """
+    Notificación pendiente de envío (patrón outbox)
+    Se inserta en la misma transacción que el cambio de ruta que la origina
+    y un despachador en segundo plano la entrega por su canal. Una fila por
+    canal, así cada canal se reintenta por separado.
+    """
+    __tablename__ = "notificaciones_outbox"
+
+    id = Column(Integer, primary_key=True, index=True)
+    tipo = Column(String(30), nullable=False)  # NUEVA_RUTA, RUTA_CANCELADA, INCIDENCIA_CRITICA...
+    canal = Column(String(15), nullable=False)  # websocket, push, sms
+    zona = Column(String(15))
+    ruta_id = Column(Integer, ForeignKey('rutas_generadas.id', ondelete='SET NULL'), nullable=True)
+    incidencia_id = Column(Integer, nullable=True)  # sin FK (incidencias está particionada)
+    payload = Column(JSONB, nullable=False)
+    estado = Column(String(15), default='pendiente', nullable=False)  # pendiente, enviada, fallida
+    intentos = Column(SmallInteger, default=0, nullable=False)
+    proximo_intento = Column(TIMESTAMP, default=datetime.utcnow, nullable=False)
+    ultimo_error = Column(Text)
+    enviada_en = Column(TIMESTAMP)
+    created_at = Column(TIMESTAMP, default=datetime.utcnow)
+
+    # Constraints
+    __table_args__ = (
+        CheckConstraint("estado IN ('pendiente', 'enviada', 'fallida')", name='check_outbox_estado'),
+    )
+
+    def __repr__(self):
+        return f"<NotificacionOutbox(id={self.id}, tipo={self.tipo}, canal={self.canal}, estado={self.estado})>"
+
+
 class Usuario(Base):
     """
     Modelo para usuarios del sistema
@@ -4,13 +4,168 @@ Calcula rutas optimizadas para los camiones de recolección en Latacunga
 """
 import requests
 import os
-from typing import List, Dict, Tuple, Optional
+import math
+import threading
+import time
+from typing import Callable, List, Dict, Tuple, Optional
 from datetime import datetime, timedelta
 import logging
 
 logger = logging.getLogger(__name__)
 
 
+# Parámetros del modo degradado (estimación en línea recta)
+VELOCIDAD_ESTIMADA_KMH = float(os.getenv("OSRM_VELOCIDAD_ESTIMADA_KMH", "25"))
+FACTOR_DESVIO_VIAL = float(os.getenv("OSRM_FACTOR_DESVIO", "1.3"))  # red vial vs línea recta
+RADIO_TIERRA_M = 6371000.0
+
+# Límite de coordenadas por solicitud /table (--max-table-size de osrm-routed)
+MAX_TABLE_SIZE = int(os.getenv("OSRM_MAX_TABLE_SIZE", "100"))
+
+
+class OSRMNoDisponibleError(Exception):
+    """OSRM no respondió o el circuit breaker está abierto"""
+
+
+class CircuitBreaker:
+    """
+    Circuit breaker para las llamadas a OSRM
+
+    Estados:
+    - cerrado: las solicitudes pasan normalmente
+    - abierto: tras `umbral_fallos` fallos consecutivos se rechazan las
+      solicitudes sin tocar la red durante `tiempo_reintento` segundos
+    - semiabierto: pasado ese tiempo se permite un número limitado de
+      solicitudes de prueba; si tienen éxito se cierra, si fallan se reabre
+    """
+
+    CERRADO = "cerrado"
+    ABIERTO = "abierto"
+    SEMIABIERTO = "semiabierto"
+
+    def __init__(
+        self,
+        umbral_fallos: int = 5,
+        tiempo_reintento: float = 30.0,
+        max_sondeos: int = 1
+    ):
+        self.umbral_fallos = umbral_fallos
+        self.tiempo_reintento = tiempo_reintento
+        self.max_sondeos = max_sondeos
+        self._estado = self.CERRADO
+        self._fallos = 0
+        self._abierto_en = 0.0
+        self._sondeos_en_curso = 0
+        self._lock = threading.Lock()
+        self._al_cerrar: List[Callable[[], None]] = []
+
+    @property
+    def estado(self) -> str:
+        with self._lock:
+            self._actualizar_estado()
+            return self._estado
+
+    def _actualizar_estado(self):
+        """Pasa de abierto a semiabierto cuando vence el tiempo de reintento"""
+        if (
+            self._estado == self.ABIERTO
+            and time.monotonic() - self._abierto_en >= self.tiempo_reintento
+        ):
+            self._estado = self.SEMIABIERTO
+            self._sondeos_en_curso = 0
+            logger.info("Circuit breaker OSRM en estado semiabierto, probando disponibilidad")
+
+    def permitir_solicitud(self) -> bool:
+        """Indica si se puede intentar una solicitud a OSRM"""
+        with self._lock:
+            self._actualizar_estado()
+            if self._estado == self.CERRADO:
+                return True
+            if self._estado == self.SEMIABIERTO and self._sondeos_en_curso < self.max_sondeos:
+                self._sondeos_en_curso += 1
+                return True
+            return False
+
+    def al_cerrar(self, callback: Callable[[], None]):
+        """Registra una función (rápida) que se llama cuando OSRM se recupera"""
+        self._al_cerrar.append(callback)
+
+    def registrar_exito(self):
+        with self._lock:
+            recuperado = self._estado != self.CERRADO
+            if recuperado:
+                logger.info("Circuit breaker OSRM cerrado: servicio recuperado")
+            self._estado = self.CERRADO
+            self._fallos = 0
+            self._sondeos_en_curso = 0
+        if recuperado:
+            for callback in self._al_cerrar:
+                callback()
+
+    def registrar_fallo(self):
+        with self._lock:
+            self._fallos += 1
+            if self._estado == self.SEMIABIERTO or self._fallos >= self.umbral_fallos:
+                if self._estado != self.ABIERTO:
+                    logger.warning(
+                        f"Circuit breaker OSRM abierto tras {self._fallos} fallos. "
+                        f"Reintento en {self.tiempo_reintento:.0f}s"
+                    )
+                self._estado = self.ABIERTO
+                self._abierto_en = time.monotonic()
+                self._sondeos_en_curso = 0
+
+
+# Un breaker por URL de OSRM, compartido por todas las instancias del servicio
+_breakers: Dict[str, CircuitBreaker] = {}
+_breakers_lock = threading.Lock()
+
+
+def obtener_breaker(base_url: str) -> CircuitBreaker:
+    """Obtiene (o crea) el circuit breaker compartido para una URL de OSRM"""
+    with _breakers_lock:
+        if base_url not in _breakers:
+            _breakers[base_url] = CircuitBreaker(
+                umbral_fallos=int(os.getenv("OSRM_CB_UMBRAL_FALLOS", "5")),
+                tiempo_reintento=float(os.getenv("OSRM_CB_TIEMPO_REINTENTO", "30")),
+                max_sondeos=int(os.getenv("OSRM_CB_MAX_SONDEOS", "1"))
+            )
+        return _breakers[base_url]
+
+
+def distancia_haversine(
+    origen: Tuple[float, float],
+    destino: Tuple[float, float]
+) -> float:
+    """
+    Distancia en línea recta (metros) entre dos puntos (lon, lat)
+    """
+    lon1, lat1 = map(math.radians, origen)
+    lon2, lat2 = map(math.radians, destino)
+    dlat = lat2 - lat1
+    dlon = lon2 - lon1
+    a = math.sin(dlat / 2) ** 2 + math.cos(lat1) * math.cos(lat2) * math.sin(dlon / 2) ** 2
+    return 2 * RADIO_TIERRA_M * math.asin(math.sqrt(a))
+
+
+def estimar_tramo(
+    origen: Tuple[float, float],
+    destino: Tuple[float, float]
+) -> Tuple[float, float]:
+    """
+    Estima distancia vial (metros) y duración (segundos) de un tramo
+    a partir de la línea recta, para el modo degradado sin OSRM
+    """
+    distancia = distancia_haversine(origen, destino) * FACTOR_DESVIO_VIAL
+    duracion = distancia / (VELOCIDAD_ESTIMADA_KMH / 3.6)
+    return distancia, duracion
+
+
+def _con_nulos(matriz) -> List[List[Optional[float]]]:
+    """Array NumPy a listas anidadas, con None en lugar de NaN"""
+    return [[None if math.isnan(v) else v for v in fila] for fila in matriz.tolist()]
+
+
 class OSRMService:
     """Servicio para calcular rutas usando OSRM"""
     
@@ -23,17 +178,49 @@ class OSRMService:
         self.session.headers.update({
             'User-Agent': 'Backend-Latacunga-Clean/1.0'
         })
+        self.breaker = obtener_breaker(self.base_url)
         logger.info(f"OSRM Service initialized with URL: {self.base_url}")
     
+    @property
+    def disponible(self) -> bool:
+        """False mientras el circuit breaker esté abierto"""
+        return self.breaker.estado != CircuitBreaker.ABIERTO
+    
+    def _solicitar(self, url: str, params: Dict, timeout: float) -> Dict:
+        """
+        Ejecuta un GET contra OSRM pasando por el circuit breaker
+        
+        Solo cuentan como fallo los timeouts, errores de conexión y
+        respuestas 5xx; un 'NoRoute' o 'InvalidQuery' es una respuesta válida.
+        
+        Raises:
+            OSRMNoDisponibleError: Si el breaker está abierto o OSRM falló
+        """
+        if not self.breaker.permitir_solicitud():
+            raise OSRMNoDisponibleError("Circuit breaker abierto, OSRM no disponible")
+        
+        try:
+            response = self.session.get(url, params=params, timeout=timeout)
+        except requests.RequestException as e:
+            self.breaker.registrar_fallo()
+            raise OSRMNoDisponibleError(str(e)) from e
+        
+        if response.status_code >= 500:
+            self.breaker.registrar_fallo()
+            raise OSRMNoDisponibleError(f"OSRM respondió {response.status_code}")
+        
+        self.breaker.registrar_exito()
+        return response.json()
+    
     def health_check(self) -> bool:
         """Verifica que OSRM esté disponible"""
         try:
             # OSRM no tiene endpoint /health, probamos con una ruta simple
-            response = self.session.get(
+            data = self._solicitar(
                 f"{self.base_url}/route/v1/driving/-78.613,-0.936;-78.614,-0.937",
+                params={},
                 timeout=5
             )
-            data = response.json()
             return data.get("code") == "Ok"
         except Exception as e:
             logger.error(f"OSRM no disponible: {e}")
@@ -74,9 +261,7 @@ class OSRMService:
         }
         
         try:
-            response = self.session.get(url, params=params, timeout=30)
-            response.raise_for_status()
-            data = response.json()
+            data = self._solicitar(url, params, timeout=30)
             
             if data.get("code") != "Ok":
                 logger.error(f"Error en OSRM: {data.get('message')}")
@@ -113,34 +298,31 @@ class OSRMService:
         if destinations is None:
             destinations = sources
         
-        all_coords = sources + [d for d in destinations if d not in sources]
-        coords_str = ";".join([f"{lon},{lat}" for lon, lat in all_coords])
-        
-        url = f"{self.base_url}/table/v1/driving/{coords_str}"
+        # Índice hash de coordenadas únicas (evita el escaneo O(n²) de listas)
+        indice: Dict[Tuple[float, float], int] = {}
+        for coord in list(sources) + list(destinations):
+            indice.setdefault(coord, len(indice))
         
-        # Índices de sources y destinations
-        source_indices = ";".join(str(i) for i in range(len(sources)))
-        
-        if destinations == sources:
-            dest_indices = source_indices
-        else:
-            dest_indices = ";".join(str(i) for i in range(len(sources), len(all_coords)))
-        
-        params = {
-            "sources": source_indices,
-            "destinations": dest_indices,
-            "annotations": "distance,duration"
-        }
+        if len(indice) > MAX_TABLE_SIZE:
+            # Matrices grandes: dividir en bloques que respeten --max-table-size
+            from app.matriz_osrm import ConstructorMatrizOSRM
+            resultado = ConstructorMatrizOSRM(self).construir(
+                sources, destinations, permitir_estimacion=False
+            )
+            if resultado is None:
+                return None
+            # Pares sin ruta: None, igual que el null de una sola solicitud
+            return {
+                "distances": _con_nulos(resultado["distances"]),
+                "durations": _con_nulos(resultado["durations"])
+            }
         
         try:
-            response = self.session.get(url, params=params, timeout=60)
-            response.raise_for_status()
-            data = response.json()
-            
-            if data.get("code") != "Ok":
-                logger.error(f"Error en matriz OSRM: {data.get('message')}")
-                return None
-            
+            data = self.request_table(
+                list(indice),
+                [indice[c] for c in sources],
+                [indice[c] for c in destinations]
+            )
             return {
                 "distances": data["distances"],  # matriz en metros
                 "durations": data["durations"]   # matriz en segundos
@@ -150,6 +332,46 @@ class OSRMService:
             logger.error(f"Error al calcular matriz: {e}")
             return None
     
+    def request_table(
+        self,
+        coordinates: List[Tuple[float, float]],
+        sources_idx: List[int],
+        destinations_idx: List[int],
+        timeout: float = 60
+    ) -> Dict:
+        """
+        Ejecuta una solicitud /table de OSRM sobre coordenadas ya deduplicadas
+        
+        Args:
+            coordinates: Coordenadas únicas (lon, lat)
+            sources_idx: Índices de origen dentro de coordinates
+            destinations_idx: Índices de destino dentro de coordinates
+            timeout: Timeout de la solicitud en segundos
+        
+        Returns:
+            Respuesta de OSRM con 'distances' y 'durations'
+        
+        Raises:
+            OSRMNoDisponibleError: Si OSRM no responde o el breaker está abierto
+            ValueError: Si OSRM responde con un código distinto de 'Ok'
+        """
+        coords_str = ";".join([f"{lon},{lat}" for lon, lat in coordinates])
+        url = f"{self.base_url}/table/v1/driving/{coords_str}"
+        
+        params = {
+            "sources": ";".join(str(i) for i in sources_idx),
+            "destinations": ";".join(str(i) for i in destinations_idx),
+            "annotations": "distance,duration"
+        }
+        
+        data = self._solicitar(url, params, timeout=timeout)
+        
+        if data.get("code") != "Ok":
+            logger.error(f"Error en matriz OSRM: {data.get('message')}")
+            raise ValueError(f"OSRM table: {data.get('code')} {data.get('message')}")
+        
+        return data
+    
     def get_nearest_road(
         self,
         lon: float,
@@ -172,9 +394,7 @@ class OSRMService:
         params = {"number": number}
         
         try:
-            response = self.session.get(url, params=params, timeout=10)
-            response.raise_for_status()
-            data = response.json()
+            data = self._solicitar(url, params, timeout=10)
             
             if data.get("code") != "Ok":
                 return None
@@ -218,9 +438,7 @@ class OSRMService:
         }
         
         try:
-            response = self.session.get(url, params=params, timeout=60)
-            response.raise_for_status()
-            data = response.json()
+            data = self._solicitar(url, params, timeout=60)
             
             if data.get("code") != "Ok":
                 logger.error(f"Error en optimización: {data.get('message')}")
@@ -271,9 +489,7 @@ class OSRMService:
             params["radiuses"] = ";".join(str(r) for r in radiuses)
         
         try:
-            response = self.session.get(url, params=params, timeout=30)
-            response.raise_for_status()
-            data = response.json()
+            data = self._solicitar(url, params, timeout=30)
             
             if data.get("code") != "Ok":
                 logger.error(f"Error en map matching: {data.get('message')}")
@@ -291,9 +507,91 @@ class OSRMService:
             logger.error(f"Error en map matching: {e}")
             return None
 
+    
+    def estimate_route(
+        self,
+        coordinates: List[Tuple[float, float]]
+    ) -> Optional[Dict]:
+        """
+        Estima una ruta sin OSRM (modo degradado)
+        
+        Usa la distancia en línea recta corregida por el factor de desvío
+        vial y una velocidad media urbana. Retorna el mismo formato que
+        calculate_route con 'estimada': True para que la ruta se marque
+        para refinamiento posterior.
+        
+        Args:
+            coordinates: Lista de tuplas (lon, lat)
+        
+        Returns:
+            Dict con distancia, duración, geometría en línea recta y tramos
+        """
+        if len(coordinates) < 2:
+            logger.error("Se necesitan al menos 2 puntos para estimar ruta")
+            return None
+        
+        legs = []
+        for origen, destino in zip(coordinates[:-1], coordinates[1:]):
+            distancia, duracion = estimar_tramo(origen, destino)
+            legs.append({"distance": distancia, "duration": duracion})
+        
+        return {
+            "distance": sum(leg["distance"] for leg in legs),
+            "duration": sum(leg["duration"] for leg in legs),
+            "geometry": {
+                "type": "LineString",
+                "coordinates": [[lon, lat] for lon, lat in coordinates]
+            },
+            "legs": legs,
+            "estimada": True
+        }
+    
+    def estimate_distance_matrix(
+        self,
+        sources: List[Tuple[float, float]],
+        destinations: Optional[List[Tuple[float, float]]] = None
+    ) -> Dict:
+        """
+        Estima la matriz de distancias/tiempos sin OSRM (modo degradado)
+        
+        Returns:
+            Dict con el mismo formato que calculate_distance_matrix y 'estimada': True
+        """
+        if destinations is None:
+            destinations = sources
+        
+        distances = []
+        durations = []
+        for origen in sources:
+            fila_dist = []
+            fila_dur = []
+            for destino in destinations:
+                distancia, duracion = estimar_tramo(origen, destino)
+                fila_dist.append(distancia)
+                fila_dur.append(duracion)
+            distances.append(fila_dist)
+            durations.append(fila_dur)
+        
+        return {
+            "distances": distances,
+            "durations": durations,
+            "estimada": True
+        }
+
+
+# Instancia compartida, creada en el primer uso (no al importar)
+_osrm_service: Optional[OSRMService] = None
+_osrm_lock = threading.Lock()
 
-# Instancia global del servicio
-osrm_service = OSRMService()
+
+def obtener_osrm_service() -> OSRMService:
+    """Servicio OSRM compartido del proceso"""
+    global _osrm_service
+    if _osrm_service is None:
+        with _osrm_lock:
+            if _osrm_service is None:
+                _osrm_service = OSRMService()
+    return _osrm_service
 
 
 # Funciones de utilidad específicas para Latacunga
@@ -320,7 +618,11 @@ def calcular_ruta_recoleccion(
     coordinates.extend([(inc['lon'], inc['lat']) for inc in incidencias])
     coordinates.append(botadero)
     
-    resultado = osrm_service.calculate_route(coordinates)
+    osrm = obtener_osrm_service()
+    resultado = osrm.calculate_route(coordinates)
+    
+    if not resultado:
+        resultado = osrm.estimate_route(coordinates)
     
     if resultado:
         resultado['num_incidencias'] = len(incidencias)
@@ -344,6 +646,12 @@ def obtener_matriz_distancias_zona(
         Matriz de distancias en metros
     """
     coordinates = [(p['lon'], p['lat']) for p in puntos]
-    resultado = osrm_service.calculate_distance_matrix(coordinates)
+    osrm = obtener_osrm_service()
+    resultado = osrm.calculate_distance_matrix(coordinates)
+    
+    if not resultado:
+        # OSRM caído o breaker abierto: estimar en línea recta
+        logger.warning("Matriz OSRM no disponible, usando estimación en línea recta")
+        resultado = osrm.estimate_distance_matrix(coordinates)
     
-    return resultado['distances'] if resultado else None
+    return resultado['distances']
@@ -0,0 +1,135 @@
+"""
+Endpoints para gestión de la flota de camiones
+"""
+from fastapi import APIRouter, Depends, HTTPException, status, Query
+from sqlalchemy.orm import Session
+from typing import List, Optional
+
+from app.database import get_db
+from app.models import Camion, PuntoFijo, Usuario
+from app.schemas.camiones import (
+    CamionCreate, CamionUpdate, CamionResponse, CamionDisponible, EstadoCamion
+)
+from app.services.flota_service import registro_flota
+from app.routers.auth import get_current_user, get_current_admin
+
+router = APIRouter(
+    prefix="/camiones",
+    tags=["Camiones"]
+)
+
+
+def _validar_deposito(db: Session, deposito_id: Optional[int]):
+    """Verifica que el depósito base exista y sea de tipo depósito"""
+    if deposito_id is None:
+        return
+    deposito = db.query(PuntoFijo).filter(
+        PuntoFijo.id == deposito_id,
+        PuntoFijo.tipo == 'deposito'
+    ).first()
+    if not deposito:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"Depósito {deposito_id} no encontrado"
+        )
+
+
+@router.post("/", response_model=CamionResponse, status_code=status.HTTP_201_CREATED)
+def registrar_camion(
+    data: CamionCreate,
+    db: Session = Depends(get_db),
+    admin: Usuario = Depends(get_current_admin)
+):
+    """
+    Registra un camión en la flota (solo administradores)
+    """
+    if db.query(Camion).filter(Camion.placa == data.placa).first():
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"Ya existe un camión con placa {data.placa}"
+        )
+    _validar_deposito(db, data.deposito_id)
+
+    camion = Camion(
+        placa=data.placa,
+        tipo=data.tipo.value,
+        capacidad=data.capacidad,
+        estado=data.estado.value,
+        deposito_id=data.deposito_id,
+        costo_km=data.costo_km
+    )
+    db.add(camion)
+    db.commit()
+    db.refresh(camion)
+    return camion
+
+
+@router.get("/", response_model=List[CamionResponse])
+def listar_camiones(
+    estado: Optional[EstadoCamion] = Query(None, description="Filtrar por estado"),
+    db: Session = Depends(get_db),
+    current_user: Usuario = Depends(get_current_user)
+):
+    """
+    Lista la flota registrada
+    """
+    query = db.query(Camion)
+    if estado:
+        query = query.filter(Camion.estado == estado.value)
+    return query.order_by(Camion.tipo, Camion.placa).all()
+
+
+@router.get("/disponibles", response_model=List[CamionDisponible])
+def listar_camiones_disponibles(
+    db: Session = Depends(get_db),
+    current_user: Usuario = Depends(get_current_user)
+):
+    """
+    Camiones que el planificador usará en la próxima ruta
+    
+    Excluye los que están en mantenimiento/inactivos y los ocupados en
+    rutas en ejecución o planeadas dentro del turno.
+    """
+    return [
+        CamionDisponible(
+            id=c.id,
+            placa=c.placa,
+            tipo=c.tipo,
+            capacidad=c.capacidad,
+            deposito_id=c.deposito_id,
+            costo_km=c.costo_km
+        )
+        for c in registro_flota.disponibles(db)
+    ]
+
+
+@router.patch("/{camion_id}", response_model=CamionResponse)
+def actualizar_camion(
+    camion_id: int,
+    data: CamionUpdate,
+    db: Session = Depends(get_db),
+    admin: Usuario = Depends(get_current_admin)
+):
+    """
+    Actualiza un camión (solo administradores)
+    
+    Usar estado='mantenimiento' para sacarlo de la planificación mientras
+    está en el taller.
+    """
+    camion = db.query(Camion).filter(Camion.id == camion_id).first()
+    if not camion:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail=f"Camión {camion_id} no encontrado"
+        )
+
+    update_data = data.model_dump(exclude_unset=True)
+    if "deposito_id" in update_data:
+        _validar_deposito(db, update_data["deposito_id"])
+
+    for campo, valor in update_data.items():
+        setattr(camion, campo, valor.value if hasattr(valor, 'value') else valor)
+
+    db.commit()
+    db.refresh(camion)
+    return camion
@@ -3,18 +3,25 @@ Router de Conductores
 Endpoints para gestión de conductores y sus asignaciones
 Fecha: 2025-12-13
 """
-from fastapi import APIRouter, Depends, HTTPException, Query
+from fastapi import APIRouter, Depends, HTTPException, Query, Request, Response, WebSocket, WebSocketDisconnect, status
 from sqlalchemy.orm import Session, joinedload
 from typing import List, Optional
 
-from app.database import get_db
+from app.database import get_db, SessionLocal
+from app.http_cache import calcular_etag, respuesta_condicional
+from app.json_rapido import RespuestaJSON
+from app.services.sync_service import SyncService
 from app.schemas.conductores import (
     ConductorCreate, ConductorUpdate, ConductorResponse,
     ConductorDisponible, AsignacionCreate, AsignacionResponse,
     RutaConAsignaciones, MisRutasResponse, IniciarRutaRequest,
-    FinalizarRutaRequest
+    FinalizarRutaRequest, ProgresoRutaRequest, PosicionRequest
 )
 from app.services.conductor_service import ConductorService, AsignacionService
+from app.services.eta_service import EtaService
+from app.services.seguimiento_service import seguimiento
+from app.services.tiempo_real_service import gestor_conexiones
+from app.services.auth_service import AuthService
 from app.routers.auth import get_current_user, get_current_admin, get_current_conductor
 from app.models import Usuario, Conductor, AsignacionConductor, RutaGenerada
 
@@ -112,6 +119,24 @@ async def obtener_conductores_disponibles(
     return ConductorService.obtener_conductores_disponibles(db, zona=zona)
 
 
+@router.get("/sync", response_class=RespuestaJSON, summary="Sincronización incremental")
+def sincronizar_conductor(
+    since: Optional[int] = Query(None, ge=0, description="Última versión recibida (omitir en la primera sincronización)"),
+    conductor: Conductor = Depends(get_current_conductor),
+    db: Session = Depends(get_db)
+):
+    """
+    Cambios en las asignaciones, rutas, paradas e incidencias del conductor
+    autenticado desde la versión `since`
+    
+    La app guarda `version` y la envía en la siguiente llamada. Si
+    `completo` es true (primera sync o versión demasiado antigua) la
+    respuesta trae el estado completo y la app debe reemplazar el suyo; si
+    no, solo los registros cambiados y los ids en `eliminados`.
+    """
+    return RespuestaJSON(SyncService.obtener_cambios(db, conductor.id, since))
+
+
 @router.get("/{conductor_id}", response_model=ConductorResponse, summary="Obtener conductor")
 async def obtener_conductor(
     conductor_id: int,
@@ -213,6 +238,8 @@ async def obtener_mi_ruta_actual(
 
 @router.get("/mis-rutas/todas", response_model=MisRutasResponse, summary="Obtener todas mis rutas")
 async def obtener_mis_rutas(
+    request: Request,
+    response: Response,
     estado: Optional[str] = Query(None, description="Filtrar por estado de asignación"),
     conductor: Conductor = Depends(get_current_conductor),
     db: Session = Depends(get_db)
@@ -220,8 +247,15 @@ async def obtener_mis_rutas(
     """
     Lista todas las rutas asignadas al conductor autenticado
     
-    Incluye estadísticas por estado de asignación.
+    Incluye estadísticas por estado de asignación. Soporta If-None-Match:
+    responde 304 si ninguna asignación ni ruta cambió desde la última consulta.
     """
+    version = AsignacionService.obtener_version_asignaciones(db, conductor.id, estado=estado)
+    etag = calcular_etag("mis-rutas", conductor.id, conductor.updated_at, estado, *version)
+    no_modificadas = respuesta_condicional(request, response, etag)
+    if no_modificadas:
+        return no_modificadas
+    
     asignaciones = AsignacionService.obtener_asignaciones_conductor(
         db, conductor.id, estado=estado
     )
@@ -318,6 +352,83 @@ async def iniciar_mi_ruta(
     }
 
 
+@router.post("/progreso", summary="Reportar llegada a una parada")
+async def reportar_progreso(
+    request: ProgresoRutaRequest,
+    conductor: Conductor = Depends(get_current_conductor),
+    db: Session = Depends(get_db)
+):
+    """
+    Reporta que el camión del conductor llegó a una parada de su ruta
+    
+    Recalcula las ETAs de las paradas restantes con el desfase observado,
+    sin volver a consultar OSRM.
+    """
+    asignacion = db.query(AsignacionConductor).filter(
+        AsignacionConductor.ruta_id == request.ruta_id,
+        AsignacionConductor.conductor_id == conductor.id,
+        AsignacionConductor.estado == 'iniciado'
+    ).first()
+    
+    if not asignacion:
+        raise HTTPException(
+            status_code=404,
+            detail="No tienes una ruta en ejecución con este ID"
+        )
+    
+    detalles = EtaService.recalcular_restantes(
+        db,
+        request.ruta_id,
+        asignacion.camion_id,
+        request.orden,
+        request.momento
+    )
+    
+    if not detalles:
+        raise HTTPException(
+            status_code=404,
+            detail=f"La parada {request.orden} no pertenece a tu camión en esta ruta"
+        )
+    
+    return {
+        "ruta_id": request.ruta_id,
+        "camion_id": asignacion.camion_id,
+        "paradas_restantes": [
+            {
+                "orden": d.orden,
+                "tipo_punto": d.tipo_punto,
+                "incidencia_id": d.incidencia_id,
+                "llegada_estimada": d.llegada_estimada
+            }
+            for d in detalles
+        ]
+    }
+
+
+@router.post("/posicion", summary="Reportar posición actual")
+def reportar_posicion(
+    request: PosicionRequest,
+    conductor: Conductor = Depends(get_current_conductor)
+):
+    """
+    Actualiza el avance del camión del conductor sobre su ruta en ejecución
+    
+    Devuelve la siguiente parada pendiente, las paradas dadas por visitadas
+    (permanencia dentro de la geocerca) y si el camión está desviado.
+    """
+    estado = seguimiento.procesar_posicion(
+        conductor.id, request.lat, request.lon, request.momento
+    )
+    
+    if estado is None:
+        raise HTTPException(
+            status_code=404,
+            detail="No tienes una ruta en ejecución"
+        )
+    
+    return estado
+
+
 @router.post("/finalizar-ruta", summary="Finalizar mi ruta")
 async def finalizar_mi_ruta(
     request: FinalizarRutaRequest,
@@ -465,3 +576,44 @@ async def obtener_asignaciones_conductor(
         )
         for a in asignaciones
     ]
+
+
+# ==================== TIEMPO REAL ====================
+
+@router.websocket("/ws")
+async def eventos_conductor(
+    websocket: WebSocket,
+    token: str = Query(..., description="Token JWT del conductor")
+):
+    """
+    Canal de eventos del conductor autenticado
+    
+    Envía en JSON: ruta_creada, ruta_cancelada y parada_actualizada, en
+    lugar de consultar periódicamente mis-rutas/actual. El cliente puede
+    enviar "ping" para mantener viva la conexión.
+    """
+    db = SessionLocal()
+    try:
+        usuario = AuthService.get_current_user_from_token(db, token)
+        conductor = db.query(Conductor).filter(
+            Conductor.usuario_id == usuario.id
+        ).first() if usuario.tipo_usuario == "conductor" else None
+    except HTTPException:
+        conductor = None
+    finally:
+        db.close()
+    
+    if not conductor:
+        await websocket.close(code=status.WS_1008_POLICY_VIOLATION)
+        return
+    
+    await gestor_conexiones.conectar(websocket, conductor.id, conductor.zona_preferida)
+    try:
+        while True:
+            mensaje = await websocket.receive_text()
+            if mensaje == "ping":
+                await websocket.send_text("pong")
+    except WebSocketDisconnect:
+        pass
+    finally:
+        gestor_conexiones.desconectar(websocket, conductor.id)
@@ -0,0 +1,98 @@
+"""
+Endpoints de exportación masiva (CSV, GeoJSON por líneas, Parquet)
+"""
+from datetime import datetime
+from typing import Optional
+
+from fastapi import APIRouter, Depends, HTTPException, Query, status
+from fastapi.responses import StreamingResponse
+from sqlalchemy.exc import TimeoutError as PoolTimeoutError
+from starlette.background import BackgroundTask
+
+from app.models import Usuario
+from app.schemas.incidencias import ZonaIncidencia
+from app.services.exportacion_service import (
+    ExportacionService, FORMATOS, RECURSOS, MEDIA_TYPES, EXTENSIONES
+)
+from app.routers.auth import get_current_admin
+
+router = APIRouter(
+    prefix="/exportaciones",
+    tags=["Exportaciones"]
+)
+
+
+def _rango_mes(mes: str):
+    """Primer instante del mes 'YYYY-MM' y del mes siguiente"""
+    anio, numero = (int(p) for p in mes.split("-"))
+    if not 1 <= numero <= 12:
+        raise ValueError(mes)
+    inicio = datetime(anio, numero, 1)
+    fin = datetime(anio + 1, 1, 1) if numero == 12 else datetime(anio, numero + 1, 1)
+    return inicio, fin
+
+
+@router.get("/{recurso}")
+def exportar(
+    recurso: str,
+    formato: str = Query("csv", description="csv, ndjson (GeoJSON por líneas) o parquet"),
+    mes: Optional[str] = Query(None, pattern=r"^\d{4}-\d{2}$", description="Mes completo YYYY-MM (reemplaza desde/hasta)"),
+    desde: Optional[datetime] = Query(None, description="Desde (UTC, inclusive)"),
+    hasta: Optional[datetime] = Query(None, description="Hasta (UTC, exclusivo)"),
+    zona: Optional[ZonaIncidencia] = None,
+    estado: Optional[str] = Query(None, description="Estado de la incidencia, ruta o asignación"),
+    current_user: Usuario = Depends(get_current_admin)
+):
+    """
+    Exporta incidencias, rutas (una fila por parada) o asignaciones (solo admin)
+
+    La respuesta se envía en streaming a medida que se lee la base de datos,
+    sin límite de filas. En GeoJSON cada línea es un Feature con el punto
+    (lat/lon) como geometría. Las fechas van en UTC y las duraciones en
+    segundos.
+    """
+    if recurso not in RECURSOS:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail=f"Recursos exportables: {', '.join(RECURSOS)}"
+        )
+    if formato not in FORMATOS:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"formato debe ser uno de: {', '.join(FORMATOS)}"
+        )
+    if mes:
+        try:
+            desde, hasta = _rango_mes(mes)
+        except ValueError:
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail=f"Mes inválido: {mes}"
+            )
+
+    try:
+        exportacion = ExportacionService.iniciar_exportacion(
+            recurso,
+            formato,
+            desde=desde,
+            hasta=hasta,
+            zona=zona.value if zona else None,
+            estado=estado
+        )
+    except RuntimeError as e:
+        raise HTTPException(status_code=status.HTTP_501_NOT_IMPLEMENTED, detail=str(e))
+    except PoolTimeoutError:
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail="Hay demasiadas exportaciones en curso, intente en unos minutos",
+            headers={"Retry-After": "60"}
+        )
+
+    sufijo = mes or datetime.utcnow().strftime("%Y%m%d")
+    nombre = f"{recurso}_{sufijo}.{EXTENSIONES[formato]}"
+    return StreamingResponse(
+        exportacion,
+        media_type=MEDIA_TYPES[formato],
+        headers={"Content-Disposition": f'attachment; filename="{nombre}"'},
+        background=BackgroundTask(exportacion.liberar)
+    )
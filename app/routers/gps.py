@@ -0,0 +1,83 @@
+"""
+Endpoints para ingesta de posiciones GPS de los camiones
+"""
+from datetime import datetime
+
+from fastapi import APIRouter, Depends, HTTPException, Request, status
+from starlette.concurrency import run_in_threadpool
+
+from app.models import Usuario
+from app.routers.auth import get_current_user
+from app.services.gps_service import GPSService, LoteInvalidoError, MAX_POSICIONES_LOTE
+from app.services.seguimiento_service import seguimiento
+
+router = APIRouter(
+    prefix="/gps",
+    tags=["GPS"]
+)
+
+
+@router.post("/posiciones", status_code=status.HTTP_202_ACCEPTED)
+async def recibir_posiciones(
+    request: Request,
+    current_user: Usuario = Depends(get_current_user)
+):
+    """
+    Recibir un lote de posiciones GPS
+    
+    Formatos (según Content-Type):
+    - **application/json**: columnas {"conductor_id": [...], "ts": [...], "lat": [...], "lon": [...]},
+      ts en segundos epoch UTC
+    - **application/octet-stream**: registros empaquetados little-endian
+      (int32 conductor_id, float64 ts, float32 lat, float32 lon), 20 bytes c/u
+    
+    Ambos admiten Content-Encoding: gzip. Un conductor solo puede enviar
+    sus propias posiciones.
+    """
+    cuerpo = await request.body()
+    comprimido = request.headers.get("content-encoding", "").lower() == "gzip"
+    binario = request.headers.get("content-type", "").startswith("application/octet-stream")
+
+    try:
+        if binario:
+            columnas = GPSService.decodificar_binario(cuerpo, comprimido)
+        else:
+            columnas = GPSService.decodificar_json(cuerpo, comprimido)
+    except LoteInvalidoError as e:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(e))
+
+    if len(columnas["ts"]) > MAX_POSICIONES_LOTE:
+        raise HTTPException(
+            status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+            detail=f"Máximo {MAX_POSICIONES_LOTE} posiciones por lote"
+        )
+
+    if current_user.tipo_usuario == "conductor":
+        conductor = current_user.conductor
+        if not conductor or (columnas["conductor_id"] != conductor.id).any():
+            raise HTTPException(
+                status_code=status.HTTP_403_FORBIDDEN,
+                detail="Solo puede enviar posiciones de su propio conductor_id"
+            )
+    elif current_user.tipo_usuario != "admin":
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail="Solo conductores o administradores pueden enviar posiciones"
+        )
+
+    columnas, descartadas = GPSService.filtrar_validas(columnas)
+    # COPY es bloqueante: se ejecuta fuera del event loop
+    guardadas = await run_in_threadpool(GPSService.guardar_posiciones, columnas)
+    
+    # Avance en vivo con la última posición de cada conductor del lote
+    for conductor_id, ts, lat, lon in GPSService.ultimas_por_conductor(columnas):
+        await run_in_threadpool(
+            seguimiento.procesar_posicion,
+            conductor_id, lat, lon, datetime.utcfromtimestamp(ts)
+        )
+
+    return {
+        "recibidas": guardadas + descartadas,
+        "guardadas": guardadas,
+        "descartadas": descartadas
+    }
@@ -4,18 +4,22 @@ Endpoints para gestión de incidencias ciudadanas
 from fastapi import APIRouter, Depends, HTTPException, status, Query
 from sqlalchemy.orm import Session
 from typing import List, Optional
+from datetime import datetime
 
 from app.database import get_db
 from app.models import Incidencia, Config, RutaGenerada
 from app.schemas.incidencias import (
     IncidenciaCreate, 
     IncidenciaResponse, 
+    IncidenciaCercana,
     IncidenciaUpdate,
     IncidenciaStats,
     EstadoIncidencia,
     ZonaIncidencia
 )
 from app.services.incidencia_service import IncidenciaService
+from app.services.heatmap_service import HeatmapService, FORMAS, PERIODOS
+from app.json_rapido import RespuestaJSON, filas_a_dicts
 
 router = APIRouter(
     prefix="/incidencias",
@@ -68,7 +72,11 @@ def crear_incidencia(
         )
 
 
-@router.get("/", response_model=List[IncidenciaResponse])
+# Columnas de IncidenciaResponse, consultadas sin instanciar objetos ORM
+COLUMNAS_INCIDENCIA_RESPONSE = [getattr(Incidencia, campo) for campo in IncidenciaResponse.model_fields]
+
+
+@router.get("/", response_model=List[IncidenciaResponse], response_class=RespuestaJSON)
 def listar_incidencias(
     estado: Optional[EstadoIncidencia] = None,
     zona: Optional[ZonaIncidencia] = None,
@@ -79,8 +87,11 @@ def listar_incidencias(
 ):
     """
     Listar incidencias con filtros opcionales
+    
+    Las filas se serializan directamente con orjson (sin validar cada
+    una contra IncidenciaResponse); el schema sigue documentando la respuesta.
     """
-    query = db.query(Incidencia)
+    query = db.query(*COLUMNAS_INCIDENCIA_RESPONSE)
     
     if estado:
         query = query.filter(Incidencia.estado == estado.value)
@@ -89,8 +100,8 @@ def listar_incidencias(
     if tipo:
         query = query.filter(Incidencia.tipo == tipo)
     
-    incidencias = query.order_by(Incidencia.reportado_en.desc()).offset(skip).limit(limit).all()
-    return incidencias
+    filas = query.order_by(Incidencia.reportado_en.desc()).offset(skip).limit(limit).all()
+    return RespuestaJSON(filas_a_dicts(filas))
 
 
 @router.get("/stats", response_model=IncidenciaStats)
@@ -138,6 +149,7 @@ def verificar_umbral_zona(
 def validar_incidencia(
     incidencia_id: int,
     generar_ruta_auto: bool = Query(True, description="Si True, tras validar verifica umbral y genera ruta automáticamente si corresponde"),
+    en_segundo_plano: bool = Query(False, description="Si True, no espera la ruta: responde trabajo_solver_id en lugar de ruta_generada_id"),
     db: Session = Depends(get_db)
 ):
     """
@@ -145,10 +157,15 @@ def validar_incidencia(
     ser consideradas para generación de rutas.
     """
     try:
-        incidencia, ruta_generada = IncidenciaService.validar_incidencia(db, incidencia_id, generar_ruta_auto=generar_ruta_auto)
+        incidencia, ruta_generada = IncidenciaService.validar_incidencia(
+            db, incidencia_id, generar_ruta_auto=generar_ruta_auto, en_segundo_plano=en_segundo_plano
+        )
 
         response = {"incidencia_id": incidencia.id, "estado": incidencia.estado}
-        if ruta_generada:
+        if ruta_generada and en_segundo_plano:
+            # La ruta se guarda al terminar el solver: GET /rutas/solver/trabajos/{id}
+            response["trabajo_solver_id"] = ruta_generada.id
+        elif ruta_generada:
             response["ruta_generada_id"] = ruta_generada.id
 
         return response
@@ -158,6 +175,106 @@ def validar_incidencia(
         raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail=str(e))
 
 
+@router.get("/near", response_model=List[IncidenciaCercana], response_class=RespuestaJSON)
+def buscar_incidencias_cercanas(
+    lat: float = Query(..., ge=-90, le=90),
+    lon: float = Query(..., ge=-180, le=180),
+    radio: float = Query(500, gt=0, le=20000, description="Radio en metros"),
+    limit: int = Query(50, ge=1, le=500),
+    estado: Optional[EstadoIncidencia] = None,
+    zona: Optional[ZonaIncidencia] = None,
+    tipo: Optional[str] = None,
+    db: Session = Depends(get_db)
+):
+    """
+    Incidencias dentro de un radio, ordenadas por distancia
+    
+    Ejemplo: pendientes a 1 km del camión
+    `/api/incidencias/near?lat=-0.93&lon=-78.61&radio=1000&estado=pendiente`
+    """
+    filas = IncidenciaService.buscar_cercanas(
+        db, COLUMNAS_INCIDENCIA_RESPONSE, lat, lon, radio,
+        limite=limit,
+        estado=estado.value if estado else None,
+        tipo=tipo,
+        zona=zona.value if zona else None
+    )
+    return RespuestaJSON(filas_a_dicts(filas))
+
+
+@router.get("/bbox", response_model=List[IncidenciaResponse], response_class=RespuestaJSON)
+def buscar_incidencias_bbox(
+    min_lon: float = Query(..., ge=-180, le=180),
+    min_lat: float = Query(..., ge=-90, le=90),
+    max_lon: float = Query(..., ge=-180, le=180),
+    max_lat: float = Query(..., ge=-90, le=90),
+    limit: int = Query(500, ge=1, le=1000),
+    estado: Optional[EstadoIncidencia] = None,
+    zona: Optional[ZonaIncidencia] = None,
+    tipo: Optional[str] = None,
+    db: Session = Depends(get_db)
+):
+    """
+    Incidencias dentro de un rectángulo (vista del mapa), más recientes primero
+    """
+    if min_lon >= max_lon or min_lat >= max_lat:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="El rectángulo debe cumplir min_lon < max_lon y min_lat < max_lat"
+        )
+    
+    filas = IncidenciaService.buscar_en_bbox(
+        db, COLUMNAS_INCIDENCIA_RESPONSE, min_lon, min_lat, max_lon, max_lat,
+        limite=limit,
+        estado=estado.value if estado else None,
+        tipo=tipo,
+        zona=zona.value if zona else None
+    )
+    return RespuestaJSON(filas_a_dicts(filas))
+
+
+@router.get("/heatmap", response_class=RespuestaJSON)
+def obtener_heatmap(
+    forma: str = Query("grid", description="grid (cuadrados) o hex (hexágonos)"),
+    celda: float = Query(250, ge=50, le=5000, description="Lado de la celda en metros"),
+    periodo: Optional[str] = Query(None, description="Agrupar también por dia, semana o mes"),
+    tipo: Optional[str] = None,
+    estado: Optional[EstadoIncidencia] = None,
+    zona: Optional[ZonaIncidencia] = None,
+    desde: Optional[datetime] = Query(None, description="Reportadas desde (UTC)"),
+    hasta: Optional[datetime] = Query(None, description="Reportadas antes de (UTC)"),
+    db: Session = Depends(get_db)
+):
+    """
+    Densidad de incidencias por celda para mapas de calor
+    
+    Cada celda trae su centro (lat/lon), el total de incidencias y la suma
+    de gravedad; con `periodo`, una entrada por celda y período.
+    """
+    if forma not in FORMAS:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"forma debe ser una de: {', '.join(FORMAS)}"
+        )
+    if periodo and periodo not in PERIODOS:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"periodo debe ser uno de: {', '.join(PERIODOS)}"
+        )
+    
+    return RespuestaJSON(HeatmapService.obtener_heatmap(
+        db,
+        forma=forma,
+        celda=celda,
+        periodo=periodo,
+        tipo=tipo,
+        estado=estado.value if estado else None,
+        zona=zona.value if zona else None,
+        desde=desde,
+        hasta=hasta
+    ))
+
+
 @router.get("/{incidencia_id}", response_model=IncidenciaResponse)
 def obtener_incidencia(
     incidencia_id: int,
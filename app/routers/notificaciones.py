@@ -0,0 +1,42 @@
+"""
+Endpoints del historial de notificaciones
+"""
+from fastapi import APIRouter, Depends, Query
+from sqlalchemy.orm import Session
+from typing import List, Optional
+
+from app.database import get_db
+from app.models import Usuario
+from app.schemas.notificaciones import NotificacionResponse, EstadoNotificacion
+from app.services.notificacion_service import NotificacionService
+from app.routers.auth import get_current_admin
+
+router = APIRouter(
+    prefix="/notificaciones",
+    tags=["Notificaciones"]
+)
+
+
+@router.get("/historial", response_model=List[NotificacionResponse])
+def historial_notificaciones(
+    limite: int = Query(50, ge=1, le=500),
+    offset: int = Query(0, ge=0),
+    tipo: Optional[str] = Query(None, description="NUEVA_RUTA, RECALCULO_RUTA, RUTA_CANCELADA, INCIDENCIA_CRITICA"),
+    estado: Optional[EstadoNotificacion] = None,
+    ruta_id: Optional[int] = None,
+    db: Session = Depends(get_db),
+    current_user: Usuario = Depends(get_current_admin)
+):
+    """
+    Historial de notificaciones, más recientes primero (solo admin)
+    
+    Incluye las pendientes de envío y las fallidas con su último error.
+    """
+    return NotificacionService.obtener_historial_notificaciones(
+        db,
+        limite=limite,
+        offset=offset,
+        tipo=tipo,
+        estado=estado.value if estado else None,
+        ruta_id=ruta_id
+    )
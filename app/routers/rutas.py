@@ -1,15 +1,19 @@
 """
 Endpoints para gestión de rutas optimizadas
 """
-from fastapi import APIRouter, Depends, HTTPException, status, Query
+from fastapi import APIRouter, Depends, HTTPException, status, Query, Request, Response
 from sqlalchemy.orm import Session
 from typing import List, Optional
 from datetime import datetime
 
 from app.database import get_db
 from app.models import RutaGenerada, RutaDetalle, Incidencia
-from app.services.ruta_service import RutaService
+from app.services.trafico_service import TraficoService, registro_perfiles
+from app.services.seguimiento_service import seguimiento
+from app.services.solver_service import pool_solver
 from app.osrm_service import OSRMService
+from app.json_rapido import RespuestaJSON, respuesta_rapida
+from app.http_cache import calcular_etag, respuesta_condicional, CACHE_INMUTABLE, CACHE_REVALIDAR
 
 router = APIRouter(
     prefix="/rutas",
@@ -20,23 +24,44 @@ router = APIRouter(
 @router.post("/generar/{zona}", status_code=status.HTTP_201_CREATED)
 def generar_ruta_manual(
     zona: str,
+    response: Response,
+    esperar: bool = Query(True, description="False: responde 202 con el trabajo del solver sin esperar la ruta"),
     db: Session = Depends(get_db)
 ):
     """
     Generar manualmente una ruta para una zona específica
     
+    La optimización corre en el pool de procesos del solver y la petición
+    espera la ruta. Con esperar=false responde 202 de inmediato con el
+    trabajo; la ruta se guarda al terminar y se consulta en
+    GET /rutas/solver/trabajos/{id}.
+    
     Args:
         zona: 'oriental' o 'occidental'
     
     Returns:
-        Información de la ruta generada
+        Información de la ruta generada, o del trabajo si esperar=false
     """
+    # Importar aquí: el módulo de rutas carga la matriz y el solver, que el
+    # arranque de la API no necesita
+    from app.services.ruta_service import RutaService
+    
     if zona not in ['oriental', 'occidental']:
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
             detail="Zona debe ser 'oriental' u 'occidental'"
         )
     
+    if not esperar:
+        trabajo = RutaService().generar_en_segundo_plano(db, zona)
+        if not trabajo:
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail=f"No se pudo generar ruta para zona {zona}. Verifique que haya incidencias pendientes."
+            )
+        response.status_code = status.HTTP_202_ACCEPTED
+        return trabajo.resumen()
+    
     try:
         ruta_service = RutaService()
         ruta = ruta_service.generar_ruta_automatica(db, zona)
@@ -56,6 +81,7 @@ def generar_ruta_manual(
             "costo_total_metros": ruta.costo_total,
             "duracion_estimada": str(ruta.duracion_estimada),
             "estado": ruta.estado,
+            "requiere_refinamiento": ruta.requiere_refinamiento,
             "notas": ruta.notas
         }
     except Exception as e:
@@ -65,15 +91,59 @@ def generar_ruta_manual(
         )
 
 
-@router.get("/{ruta_id}")
-def obtener_ruta(
+@router.get("/solver/trabajos")
+def listar_trabajos_solver():
+    """Trabajos del solver de todos los workers (en curso y recientes)"""
+    return pool_solver.listar()
+
+
+@router.get("/solver/trabajos/{trabajo_id}")
+def obtener_trabajo_solver(trabajo_id: str):
+    """
+    Estado de un trabajo del solver
+    
+    estado: en_curso, completado (ruta_id de la ruta guardada), cancelado,
+    vencido (no terminó dentro del plazo) o error
+    """
+    trabajo = pool_solver.obtener(trabajo_id)
+    if not trabajo:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail=f"Trabajo {trabajo_id} no encontrado"
+        )
+    return trabajo
+
+
+@router.delete("/solver/trabajos/{trabajo_id}")
+def cancelar_trabajo_solver(trabajo_id: str):
+    """Cancelar un trabajo del solver (de cualquier worker); su resultado no se guarda"""
+    trabajo = pool_solver.cancelar(trabajo_id)
+    if not trabajo:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail=f"Trabajo {trabajo_id} no encontrado"
+        )
+    if trabajo["estado"] != 'cancelado':
+        raise HTTPException(
+            status_code=status.HTTP_409_CONFLICT,
+            detail=f"El trabajo {trabajo_id} ya terminó ({trabajo['estado']})"
+        )
+    return trabajo
+
+
+@router.post("/{ruta_id}/refinar")
+def refinar_ruta(
     ruta_id: int,
     db: Session = Depends(get_db)
 ):
     """
-    Obtener ruta con puntos para navegación
-    Incluye información detallada de cada punto con sus incidencias asociadas
+    Recalcular con OSRM una ruta generada en modo degradado
+    
+    Las rutas creadas mientras OSRM no estaba disponible usan distancias
+    estimadas en línea recta y quedan marcadas con requiere_refinamiento.
     """
+    from app.services.ruta_service import RutaService
+    
     ruta = db.query(RutaGenerada).filter(RutaGenerada.id == ruta_id).first()
     
     if not ruta:
@@ -82,11 +152,122 @@ def obtener_ruta(
             detail=f"Ruta {ruta_id} no encontrada"
         )
     
+    ruta_refinada = RutaService().refinar_ruta(db, ruta_id)
+    
+    if not ruta_refinada:
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail="OSRM no disponible, intente más tarde"
+        )
+    
+    return {
+        "id": ruta_refinada.id,
+        "requiere_refinamiento": ruta_refinada.requiere_refinamiento,
+        "costo_total_metros": ruta_refinada.costo_total,
+        "duracion_estimada": str(ruta_refinada.duracion_estimada)
+    }
+
+
+@router.get("/trafico/{zona}")
+def obtener_perfil_trafico(
+    zona: str,
+    db: Session = Depends(get_db)
+):
+    """
+    Multiplicadores de tiempo de viaje por hora local (0-23) de una zona
+    
+    Un factor de 1.3 significa que los tramos tardan 30% más que el
+    tiempo a flujo libre calculado por OSRM.
+    """
+    if zona not in ['oriental', 'occidental']:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Zona debe ser 'oriental' u 'occidental'"
+        )
+    
+    perfil = registro_perfiles.perfil(db, zona)
+    return {
+        "zona": zona,
+        "factores": [
+            {"hora": hora, "factor": round(float(factor), 3)}
+            for hora, factor in enumerate(perfil)
+        ]
+    }
+
+
+@router.post("/trafico/aprender")
+def aprender_perfiles_trafico(
+    dias: int = Query(60, ge=1, le=365, description="Antigüedad de las rutas completadas a considerar"),
+    db: Session = Depends(get_db)
+):
+    """
+    Recalcular los perfiles de tráfico con las duraciones reales de las
+    rutas completadas por los conductores
+    """
+    return {"perfiles": TraficoService.aprender_perfiles(db, dias)}
+
+
+def _validar_cache_ruta(
+    db: Session,
+    ruta_id: int,
+    vista: str,
+    request: Request,
+    response: Response
+) -> Optional[Response]:
+    """
+    ETag de una ruta a partir de su versión; 404 si no existe
+    
+    Returns:
+        304 si el cliente ya tiene la versión actual, None si hay que armar
+        la respuesta
+    """
+    from app.services.ruta_service import RutaService
+    
+    version = RutaService.obtener_version_ruta(db, ruta_id)
+    if version is None:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail=f"Ruta {ruta_id} no encontrada"
+        )
+    
+    cache_control = CACHE_INMUTABLE if version.estado == 'completada' else CACHE_REVALIDAR
+    etag = calcular_etag(vista, ruta_id, *version)
+    return respuesta_condicional(request, response, etag, cache_control)
+
+
+@router.get("/{ruta_id}", response_class=RespuestaJSON)
+def obtener_ruta(
+    ruta_id: int,
+    request: Request,
+    response: Response,
+    db: Session = Depends(get_db)
+):
+    """
+    Obtener ruta con puntos para navegación
+    Incluye información detallada de cada punto con sus incidencias asociadas
+    
+    Soporta If-None-Match: si la ruta no cambió responde 304 sin consultar
+    detalles, incidencias ni OSRM.
+    """
+    no_modificada = _validar_cache_ruta(db, ruta_id, "ruta", request, response)
+    if no_modificada:
+        return no_modificada
+    
+    ruta = db.query(RutaGenerada).filter(RutaGenerada.id == ruta_id).first()
+    
     # Obtener detalles de la ruta con incidencias
     detalles = db.query(RutaDetalle).filter(
         RutaDetalle.ruta_id == ruta_id
     ).order_by(RutaDetalle.orden).all()
     
+    # Incidencias de todas las paradas en una sola consulta
+    incidencia_ids = [d.incidencia_id for d in detalles if d.incidencia_id]
+    incidencias_por_id = {}
+    if incidencia_ids:
+        incidencias_por_id = {
+            inc.id: inc for inc in db.query(Incidencia).filter(Incidencia.id.in_(incidencia_ids))
+        }
+    
     # Construir lista de puntos con información de incidencias
     puntos = []
     for detalle in detalles:
@@ -98,16 +279,16 @@ def obtener_ruta(
             "lon": detalle.lon,
             "tipo_camion": detalle.camion_tipo,
             "camion_id": detalle.camion_id,
+            "viaje": detalle.viaje,
             "llegada_estimada": detalle.llegada_estimada,
             "tiempo_servicio": str(detalle.tiempo_servicio) if detalle.tiempo_servicio else None,
-            "carga_acumulada": detalle.carga_acumulada
+            "carga_acumulada": detalle.carga_acumulada,
+            "visitado_en": detalle.visitado_en
         }
         
         # Si es una incidencia, agregar información adicional
         if detalle.tipo_punto == "incidencia" and detalle.incidencia_id:
-            incidencia = db.query(Incidencia).filter(
-                Incidencia.id == detalle.incidencia_id
-            ).first()
+            incidencia = incidencias_por_id.get(detalle.incidencia_id)
             if incidencia:
                 punto["incidencia_id"] = incidencia.id
                 punto["tipo_incidencia"] = incidencia.tipo
@@ -139,7 +320,12 @@ def obtener_ruta(
             # Si falla, seguir con polyline vacío
             pass
     
-    return {
+    if not polyline and len(puntos) >= 2:
+        # Sin OSRM la respuesta está incompleta: que el cliente no la reutilice
+        del response.headers["ETag"]
+        response.headers["Cache-Control"] = "no-store"
+    
+    return respuesta_rapida({
         "id": ruta.id,
         "zona": ruta.zona,
         "estado": ruta.estado,
@@ -148,27 +334,54 @@ def obtener_ruta(
         "duracion_estimada": str(ruta.duracion_estimada),
         "costo_total_metros": ruta.costo_total,
         "fecha_generacion": ruta.fecha_generacion,
+        "requiere_refinamiento": ruta.requiere_refinamiento,
         "puntos": puntos,
         "polyline": polyline
+    }, response)
+
+
+@router.get("/{ruta_id}/seguimiento")
+def obtener_seguimiento_ruta(ruta_id: int):
+    """
+    Estado en vivo de los camiones de una ruta en ejecución
+    
+    Última posición, avance, siguiente parada y desvíos de cada camión
+    seguido por este proceso.
+    """
+    return {
+        "ruta_id": ruta_id,
+        "camiones": [
+            {
+                "conductor_id": activa.conductor_id,
+                "camion_id": activa.camion_id,
+                "desviado": activa.desviado,
+                "paradas_visitadas": int(activa.visitada.sum()),
+                "paradas_totales": int(activa.visitada.size),
+                "ultima_posicion": activa.ultima_posicion
+            }
+            for activa in seguimiento.rutas_activas(ruta_id)
+        ]
     }
 
 
-@router.get("/{ruta_id}/detalles")
+@router.get("/{ruta_id}/detalles", response_class=RespuestaJSON)
 def obtener_detalles_ruta(
     ruta_id: int,
+    request: Request,
+    response: Response,
     db: Session = Depends(get_db)
 ):
     """
     Obtener detalles completos de una ruta con incidencias
     Estructura: {ruta, incidencias, puntos}
+    
+    Soporta If-None-Match (304 si la ruta no cambió).
     """
-    ruta = db.query(RutaGenerada).filter(RutaGenerada.id == ruta_id).first()
+    no_modificada = _validar_cache_ruta(db, ruta_id, "detalles", request, response)
+    if no_modificada:
+        return no_modificada
     
-    if not ruta:
-        raise HTTPException(
-            status_code=status.HTTP_404_NOT_FOUND,
-            detail=f"Ruta {ruta_id} no encontrada"
-        )
+    ruta = db.query(RutaGenerada).filter(RutaGenerada.id == ruta_id).first()
     
     # Obtener detalles de la ruta
     detalles = db.query(RutaDetalle).filter(
@@ -207,18 +420,20 @@ def obtener_detalles_ruta(
             "orden": d.orden,
             "camion_tipo": d.camion_tipo,
             "camion_id": d.camion_id,
+            "viaje": d.viaje,
             "tipo_punto": d.tipo_punto,
             "incidencia_id": d.incidencia_id,
             "lat": d.lat,
             "lon": d.lon,
             "llegada_estimada": d.llegada_estimada,
             "tiempo_servicio": str(d.tiempo_servicio) if d.tiempo_servicio else None,
-            "carga_acumulada": d.carga_acumulada
+            "carga_acumulada": d.carga_acumulada,
+            "visitado_en": d.visitado_en
         }
         for d in detalles
     ]
     
-    return {
+    return respuesta_rapida({
         "ruta": {
             "id": ruta.id,
             "zona": ruta.zona,
@@ -231,7 +446,7 @@ def obtener_detalles_ruta(
         },
         "incidencias": incidencias,
         "puntos": puntos
-    }
+    }, response)
 
 
 @router.get("/zona/{zona}")
@@ -249,6 +464,8 @@ def listar_rutas_por_zona(
         zona: 'oriental' o 'occidental'
         estado: Filtrar por estado (planeada, en_ejecucion, completada)
     """
+    from app.services.ruta_service import RutaService
+    
     if zona not in ['oriental', 'occidental']:
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
@@ -0,0 +1,88 @@
+"""
+Endpoints de teselas vectoriales (MVT) para el mapa del dashboard
+"""
+import hashlib
+from datetime import datetime
+from typing import Optional
+
+from fastapi import APIRouter, Depends, HTTPException, Query, Request, Response, status
+from sqlalchemy.orm import Session
+
+from app.database import get_db
+from app.schemas.incidencias import EstadoIncidencia, ZonaIncidencia
+from app.services.tiles_service import TilesService, CAPAS
+from app.http_cache import calcular_etag, etag_coincide, no_modificado
+
+router = APIRouter(
+    prefix="/tiles",
+    tags=["Mapa"]
+)
+
+MEDIA_TYPE_MVT = "application/vnd.mapbox-vector-tile"
+CACHE_TESELAS = "public, max-age=60"
+
+
+@router.get("/{z}/{x}/{y}.mvt", response_class=Response)
+def obtener_tesela(
+    z: int,
+    x: int,
+    y: int,
+    request: Request,
+    capas: str = Query(",".join(CAPAS), description="Capas separadas por coma: incidencias, rutas"),
+    estado: Optional[EstadoIncidencia] = Query(None, description="Estado de las incidencias"),
+    estado_ruta: Optional[str] = Query(None, description="Estado de las rutas (planeada, en_ejecucion, completada)"),
+    zona: Optional[ZonaIncidencia] = None,
+    desde: Optional[datetime] = Query(None, description="Reportadas/generadas desde (UTC)"),
+    hasta: Optional[datetime] = Query(None, description="Reportadas/generadas antes de (UTC)"),
+    db: Session = Depends(get_db)
+):
+    """
+    Tesela Mapbox Vector Tile (esquema XYZ) con capas de incidencias y rutas
+    
+    Capa `incidencias`: puntos con id, tipo, gravedad, estado, zona; en zooms
+    bajos, un punto por celda con `total` y `suma_gravedad`.
+    Capa `rutas`: recorrido de cada camión con ruta_id, camion_id, zona, estado.
+    
+    Responde 204 si la tesela no tiene geometrías.
+    """
+    if not 0 <= z <= 22 or not (0 <= x < 2 ** z and 0 <= y < 2 ** z):
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"Tesela {z}/{x}/{y} fuera de rango"
+        )
+    
+    capas_pedidas = tuple(c for c in CAPAS if c in {p.strip() for p in capas.split(",")})
+    if not capas_pedidas:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"Capas válidas: {', '.join(CAPAS)}"
+        )
+    
+    if estado_ruta and estado_ruta not in ('planeada', 'en_ejecucion', 'completada'):
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="estado_ruta debe ser 'planeada', 'en_ejecucion' o 'completada'"
+        )
+    
+    tesela = TilesService.generar_tesela(
+        db, z, x, y,
+        capas=capas_pedidas,
+        estado=estado.value if estado else None,
+        estado_ruta=estado_ruta,
+        zona=zona.value if zona else None,
+        desde=desde,
+        hasta=hasta
+    )
+    
+    if not tesela:
+        return Response(status_code=status.HTTP_204_NO_CONTENT)
+    
+    etag = calcular_etag(hashlib.md5(tesela).hexdigest())
+    if etag_coincide(request, etag):
+        return no_modificado(etag, CACHE_TESELAS)
+    
+    return Response(
+        content=tesela,
+        media_type=MEDIA_TYPE_MVT,
+        headers={"ETag": etag, "Cache-Control": CACHE_TESELAS}
+    )
@@ -7,6 +7,7 @@ from app.schemas.incidencias import (
     ZonaIncidencia,
     IncidenciaCreate,
     IncidenciaResponse,
+    IncidenciaCercana,
     IncidenciaUpdate,
     IncidenciaStats
 )
@@ -17,6 +18,7 @@ __all__ = [
     'ZonaIncidencia',
     'IncidenciaCreate',
     'IncidenciaResponse',
+    'IncidenciaCercana',
     'IncidenciaUpdate',
     'IncidenciaStats'
 ]
@@ -0,0 +1,75 @@
+"""
+Schemas de Pydantic para la flota de camiones
+Fecha: 2026-10-18
+"""
+from pydantic import BaseModel, Field
+from typing import Optional
+from datetime import datetime
+from enum import Enum
+
+
+class TipoCamion(str, Enum):
+    """Tipos de camión recolector"""
+    lateral = "lateral"
+    posterior = "posterior"
+
+
+class EstadoCamion(str, Enum):
+    """Estados posibles de un camión"""
+    disponible = "disponible"
+    mantenimiento = "mantenimiento"
+    inactivo = "inactivo"
+
+
+class CamionBase(BaseModel):
+    """Base para Camion"""
+    placa: str = Field(..., min_length=3, max_length=20, description="Placa del camión")
+    tipo: TipoCamion
+    capacidad: int = Field(..., gt=0, le=100, description="Capacidad por viaje en puntos de gravedad")
+    deposito_id: Optional[int] = Field(None, description="Depósito base del camión")
+    costo_km: float = Field(0.0, ge=0, description="Costo operativo por kilómetro")
+
+
+class CamionCreate(CamionBase):
+    """Schema para registrar un camión"""
+    estado: EstadoCamion = EstadoCamion.disponible
+
+    model_config = {
+        "json_schema_extra": {
+            "example": {
+                "placa": "LAT-003",
+                "tipo": "lateral",
+                "capacidad": 15,
+                "deposito_id": 1,
+                "costo_km": 0.9,
+                "estado": "disponible"
+            }
+        }
+    }
+
+
+class CamionUpdate(BaseModel):
+    """Schema para actualizar un camión (todos los campos opcionales)"""
+    capacidad: Optional[int] = Field(None, gt=0, le=100)
+    estado: Optional[EstadoCamion] = None
+    deposito_id: Optional[int] = None
+    costo_km: Optional[float] = Field(None, ge=0)
+
+
+class CamionResponse(CamionBase):
+    """Response de Camion"""
+    id: int
+    estado: EstadoCamion
+    created_at: Optional[datetime] = None
+
+    model_config = {"from_attributes": True}
+
+
+class CamionDisponible(BaseModel):
+    """Camión que el planificador puede usar ahora"""
+    id: int
+    placa: str
+    tipo: TipoCamion
+    capacidad: int
+    deposito_id: Optional[int] = None
+    costo_km: float
@@ -295,6 +295,20 @@ class FinalizarRutaRequest(BaseModel):
     notas: Optional[str] = Field(None, max_length=500, description="Observaciones al finalizar")
 
 
+class ProgresoRutaRequest(BaseModel):
+    """Request para reportar la llegada a una parada de la ruta"""
+    ruta_id: int = Field(..., gt=0)
+    orden: int = Field(..., ge=1, description="Orden de la parada alcanzada")
+    momento: Optional[datetime] = Field(None, description="Hora de llegada (UTC); por defecto ahora")
+
+
+class PosicionRequest(BaseModel):
+    """Posición actual reportada por la app del conductor"""
+    lat: float = Field(..., ge=-90, le=90)
+    lon: float = Field(..., ge=-180, le=180)
+    momento: Optional[datetime] = Field(None, description="Hora de la posición (UTC); por defecto ahora")
+
+
 # ================== SCHEMAS COMBINADOS ==================
 
 class RutaConAsignaciones(BaseModel):
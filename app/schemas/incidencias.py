@@ -92,6 +92,11 @@ class IncidenciaResponse(BaseModel):
         from_attributes = True
 
 
+class IncidenciaCercana(IncidenciaResponse):
+    """Incidencia devuelta por la búsqueda por radio"""
+    distancia_m: float
+
+
 class IncidenciaUpdate(BaseModel):
     """Schema para actualizar una incidencia"""
     estado: Optional[EstadoIncidencia] = None
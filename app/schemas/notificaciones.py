@@ -0,0 +1,34 @@
+"""
+Schemas de Pydantic para el historial de notificaciones
+Fecha: 2026-10-18
+"""
+from pydantic import BaseModel
+from typing import Optional, Dict, Any
+from datetime import datetime
+from enum import Enum
+
+
+class EstadoNotificacion(str, Enum):
+    """Estados de una notificación en el outbox"""
+    pendiente = "pendiente"
+    enviada = "enviada"
+    fallida = "fallida"
+
+
+class NotificacionResponse(BaseModel):
+    """Notificación del outbox (una por canal)"""
+    id: int
+    tipo: str
+    canal: str
+    zona: Optional[str] = None
+    ruta_id: Optional[int] = None
+    incidencia_id: Optional[int] = None
+    payload: Dict[str, Any]
+    estado: EstadoNotificacion
+    intentos: int
+    proximo_intento: Optional[datetime] = None
+    ultimo_error: Optional[str] = None
+    enviada_en: Optional[datetime] = None
+    created_at: Optional[datetime] = None
+
+    model_config = {"from_attributes": True}
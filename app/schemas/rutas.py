@@ -0,0 +1,76 @@
+"""
+Schemas Pydantic para rutas generadas y su detalle
+"""
+from pydantic import BaseModel, Field
+from typing import List, Optional
+from datetime import datetime, timedelta
+from enum import Enum
+
+from app.schemas.camiones import TipoCamion
+from app.schemas.incidencias import ZonaIncidencia
+
+
+class TipoPunto(str, Enum):
+    """Tipo de parada dentro de la secuencia de un camión"""
+    DEPOSITO = "deposito"
+    INCIDENCIA = "incidencia"
+    BOTADERO = "botadero"
+
+
+class EstadoRuta(str, Enum):
+    """Estados de una ruta generada"""
+    PLANEADA = "planeada"
+    EN_EJECUCION = "en_ejecucion"
+    COMPLETADA = "completada"
+
+
+class RutaGeneradaBase(BaseModel):
+    """Base para RutaGenerada"""
+    zona: ZonaIncidencia
+    suma_gravedad: int = Field(..., gt=0, description="Suma de gravedad de incidencias")
+    costo_total: Optional[float] = None
+    duracion_estimada: Optional[timedelta] = None
+    camiones_usados: Optional[int] = Field(None, ge=1, description="Número de camiones")
+    notas: Optional[str] = None
+
+
+class RutaGeneradaResponse(RutaGeneradaBase):
+    """Respuesta con una ruta generada"""
+    id: int
+    fecha_generacion: datetime
+    estado: EstadoRuta
+    created_at: datetime
+    updated_at: datetime
+
+    class Config:
+        from_attributes = True
+
+
+class RutaDetalleBase(BaseModel):
+    """Base para RutaDetalle"""
+    camion_tipo: TipoCamion
+    camion_id: Optional[str] = None
+    viaje: int = Field(1, ge=1, description="Viaje del camión dentro de la ruta")
+    orden: int = Field(..., ge=1, description="Orden en la secuencia de ruta")
+    tipo_punto: TipoPunto
+    lat: Optional[float] = Field(None, ge=-90, le=90)
+    lon: Optional[float] = Field(None, ge=-180, le=180)
+    llegada_estimada: Optional[datetime] = None
+    tiempo_servicio: Optional[timedelta] = timedelta(minutes=10)
+    carga_acumulada: Optional[int] = Field(None, ge=0, description="Carga del viaje en curso")
+
+
+class RutaDetalleResponse(RutaDetalleBase):
+    """Respuesta con una parada de la ruta"""
+    id: int
+    ruta_id: int
+    incidencia_id: Optional[int] = None
+    created_at: datetime
+
+    class Config:
+        from_attributes = True
+
+
+class RutaCompletaResponse(RutaGeneradaResponse):
+    """Ruta con todos sus detalles incluidos"""
+    detalles: List[RutaDetalleResponse] = []
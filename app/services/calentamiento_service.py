@@ -0,0 +1,170 @@
+"""
+Calentamiento de caches al arrancar
+Tras un despliegue las primeras generaciones de ruta y consultas de /rutas/{id}
+pagan conexiones nuevas a Postgres y OSRM, registros vacíos y la compilación
+de las consultas de SQLAlchemy. El lifespan ejecuta estos pasos antes de
+declarar el proceso listo (GET /health/ready).
+"""
+import os
+import logging
+import threading
+from datetime import datetime
+from typing import Dict, List, Optional
+
+from sqlalchemy import text
+
+from app.database import SessionLocal, engine
+from app.models import Config, RutaGenerada
+from app.osrm_service import obtener_osrm_service, MAX_TABLE_SIZE
+from app.arranque import fases_arranque
+from app.services.incidencia_service import transformer_to_utm, transformer_to_wgs84, LatacungaConfig
+from app.services.puntos_fijos_service import registro_puntos_fijos
+from app.services.flota_service import registro_flota
+from app.services.trafico_service import registro_perfiles, ZONAS
+
+logger = logging.getLogger(__name__)
+
+
+# Conexiones del pool que se abren por adelantado
+CONEXIONES_CALENTAMIENTO = int(os.getenv("CALENTAMIENTO_CONEXIONES_DB", "3"))
+
+
+class Calentamiento:
+    """
+    Estado del calentamiento del proceso
+
+    Cada paso es independiente: si uno falla (OSRM caído, por ejemplo) se
+    registra el error y se sigue; el proceso queda listo igual, solo con
+    ese cache frío.
+    """
+
+    def __init__(self):
+        self.listo = threading.Event()
+        self.errores: Dict[str, str] = {}
+        self.iniciado_en: Optional[datetime] = None
+        self.terminado_en: Optional[datetime] = None
+
+    def omitir(self):
+        """Declara listo el proceso sin calentar"""
+        self.listo.set()
+
+    def ejecutar(self):
+        """Ejecuta todos los pasos (bloqueante) y marca el proceso como listo"""
+        self.iniciado_en = datetime.utcnow()
+        pasos = [
+            ("pool_db", self._pool_db),
+            ("proyecciones", self._proyecciones),
+            ("registros", self._registros),
+            ("campos_distancia", self._campos_distancia),
+            ("rutas_activas", self._rutas_activas),
+            ("conexion_osrm", self._conexion_osrm),
+        ]
+        try:
+            for nombre, paso in pasos:
+                with fases_arranque.medir(f"calentamiento.{nombre}"):
+                    try:
+                        paso()
+                    except Exception as e:
+                        self.errores[nombre] = str(e)
+                        logger.warning(f"Calentamiento '{nombre}' falló: {e}")
+        finally:
+            self.terminado_en = datetime.utcnow()
+            self.listo.set()
+
+    def resumen(self) -> Dict:
+        return {
+            "listo": self.listo.is_set(),
+            "iniciado_en": self.iniciado_en,
+            "terminado_en": self.terminado_en,
+            "errores": dict(self.errores)
+        }
+
+    @staticmethod
+    def _pool_db():
+        """Abre varias conexiones a la vez para que queden en el pool"""
+        conexiones = []
+        try:
+            for _ in range(CONEXIONES_CALENTAMIENTO):
+                conexion = engine.connect()
+                conexiones.append(conexion)
+                conexion.execute(text("SELECT 1"))
+        finally:
+            for conexion in conexiones:
+                conexion.close()
+
+    @staticmethod
+    def _proyecciones():
+        """Carga pyproj y la base de datos PROJ con una conversión de ida y vuelta"""
+        easting, northing = transformer_to_utm().transform(
+            LatacungaConfig.CENTRO_LON, LatacungaConfig.CENTRO_LAT
+        )
+        transformer_to_wgs84().transform(easting, northing)
+
+    @staticmethod
+    def _registros():
+        """Config, puntos fijos, flota y perfiles de tráfico"""
+        # El módulo de rutas (matriz y solver) se importa aquí y no al
+        # cargar la API: este paso corre en segundo plano y lo deja listo
+        from app.services.ruta_service import RutaService
+
+        db = SessionLocal()
+        try:
+            db.query(Config).all()
+            RutaService.obtener_umbral(db)
+            registro_puntos_fijos.depositos(db)
+            registro_flota.todos(db)
+            for zona in ZONAS:
+                registro_perfiles.perfil(db, zona)
+        finally:
+            db.close()
+
+    @staticmethod
+    def _campos_distancia():
+        """Campos de tiempo de viaje de depósitos y botaderos (se leen de disco)"""
+        from app.campos_distancia import obtener_campos
+
+        obtener_campos()
+
+    @staticmethod
+    def _rutas_activas():
+        """Consultas de /rutas/{id} sobre las rutas vigentes (compila el SQL y calienta el buffer)"""
+        from app.services.ruta_service import RutaService
+
+        db = SessionLocal()
+        try:
+            rutas = db.query(RutaGenerada.id).filter(
+                RutaGenerada.estado.in_(['planeada', 'en_ejecucion'])
+            ).order_by(RutaGenerada.id.desc()).limit(10).all()
+            for (ruta_id,) in rutas:
+                RutaService.obtener_version_ruta(db, ruta_id)
+                RutaService.obtener_detalles_ruta(db, ruta_id)
+        finally:
+            db.close()
+
+    @staticmethod
+    def _conexion_osrm():
+        """
+        Abre la conexión keep-alive del cliente OSRM compartido con una
+        consulta /table pequeña entre los puntos fijos (no guarda nada: los
+        tramos desde y hacia los puntos fijos salen de los campos de
+        distancia y las matrices entre incidencias se piden por ruta)
+        """
+        osrm = obtener_osrm_service()
+        if not osrm.disponible:
+            raise RuntimeError("OSRM no disponible (circuit breaker abierto)")
+
+        db = SessionLocal()
+        try:
+            fijos = registro_puntos_fijos.depositos(db) + registro_puntos_fijos.botaderos(db)
+        finally:
+            db.close()
+
+        coords: List = [(p.lon, p.lat) for p in fijos][:MAX_TABLE_SIZE]
+        if len(coords) < 2:
+            return
+        if osrm.calculate_distance_matrix(coords, coords) is None:
+            raise RuntimeError("OSRM no respondió la matriz")
+
+
+# Estado del proceso actual
+calentamiento = Calentamiento()
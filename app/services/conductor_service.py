@@ -5,17 +5,19 @@ Fecha: 2025-12-13
 """
 from typing import List, Optional, Tuple
 from sqlalchemy.orm import Session, joinedload
-from sqlalchemy import and_, or_
+from sqlalchemy import and_, or_, func
 from fastapi import HTTPException, status
 from datetime import datetime
 
-from app.models import Conductor, Usuario, AsignacionConductor, RutaGenerada
+from app.models import Conductor, Usuario, AsignacionConductor, RutaGenerada, RutaDetalle
 from app.schemas.conductores import (
     ConductorCreate, ConductorUpdate, ConductorResponse,
     ConductorDisponible, AsignacionCreate, AsignacionResponse,
     RutaConAsignaciones
 )
 from app.services.auth_service import AuthService
+from app.services.flota_service import registro_flota
+from app.services.seguimiento_service import seguimiento
 
 
 class ConductorService:
@@ -314,6 +316,20 @@ class AsignacionService:
                 detail="El conductor ya está asignado a esta ruta"
             )
         
+        # Si se indica placa, debe pertenecer a la flota registrada
+        if data.camion_id and registro_flota.todos(db):
+            camion = registro_flota.obtener_por_placa(db, data.camion_id)
+            if not camion:
+                raise HTTPException(
+                    status_code=status.HTTP_400_BAD_REQUEST,
+                    detail=f"Camión {data.camion_id} no registrado en la flota"
+                )
+            if camion.tipo != data.camion_tipo:
+                raise HTTPException(
+                    status_code=status.HTTP_400_BAD_REQUEST,
+                    detail=f"Camión {data.camion_id} es {camion.tipo}, no {data.camion_tipo}"
+                )
+        
         # Crear asignación
         asignacion = AsignacionConductor(
             ruta_id=data.ruta_id,
@@ -325,11 +341,66 @@ class AsignacionService:
         )
         
         db.add(asignacion)
+        db.flush()
+        
+        # Completar la placa con los camiones planificados en la ruta
+        AsignacionService.asignar_placas_ruta(db, data.ruta_id)
+        
         db.commit()
         db.refresh(asignacion)
         
         return asignacion
 
+    @staticmethod
+    def asignar_placas_ruta(db: Session, ruta_id: int) -> int:
+        """
+        Completa en lote la placa de las asignaciones de una ruta
+        
+        Cada asignación activa sin camion_id recibe una placa planificada en
+        rutas_detalle del mismo tipo de camión que aún no esté asignada.
+        No hace commit.
+        
+        Args:
+            db: Sesión de base de datos
+            ruta_id: ID de la ruta
+            
+        Returns:
+            Número de asignaciones actualizadas
+        """
+        # Placas planificadas por tipo, en orden de aparición en la ruta
+        filas = db.query(RutaDetalle.camion_tipo, RutaDetalle.camion_id).filter(
+            RutaDetalle.ruta_id == ruta_id,
+            RutaDetalle.camion_id.isnot(None)
+        ).order_by(RutaDetalle.orden).all()
+        
+        placas_por_tipo = {}
+        for tipo, placa in filas:
+            placas = placas_por_tipo.setdefault(tipo, [])
+            if placa not in placas:
+                placas.append(placa)
+        
+        asignaciones = db.query(AsignacionConductor).filter(
+            AsignacionConductor.ruta_id == ruta_id,
+            AsignacionConductor.estado.in_(['asignado', 'iniciado'])
+        ).order_by(AsignacionConductor.id).all()
+        
+        en_uso = {a.camion_id for a in asignaciones if a.camion_id}
+        actualizadas = 0
+        
+        for asignacion in asignaciones:
+            if asignacion.camion_id:
+                continue
+            libre = next(
+                (p for p in placas_por_tipo.get(asignacion.camion_tipo, []) if p not in en_uso),
+                None
+            )
+            if libre:
+                asignacion.camion_id = libre
+                en_uso.add(libre)
+                actualizadas += 1
+        
+        return actualizadas
+
     @staticmethod
     def obtener_asignaciones_ruta(
         db: Session,
@@ -379,6 +450,33 @@ class AsignacionService:
         
         return query.order_by(AsignacionConductor.fecha_asignacion.desc()).all()
 
+    @staticmethod
+    def obtener_version_asignaciones(
+        db: Session,
+        conductor_id: int,
+        estado: Optional[str] = None
+    ) -> Tuple:
+        """
+        Versión de las asignaciones de un conductor (para ETag)
+        
+        Returns:
+            (total, última modificación de asignación, última modificación de ruta)
+        """
+        query = db.query(
+            func.count(AsignacionConductor.id),
+            func.max(AsignacionConductor.updated_at),
+            func.max(RutaGenerada.updated_at)
+        ).join(
+            RutaGenerada, RutaGenerada.id == AsignacionConductor.ruta_id
+        ).filter(
+            AsignacionConductor.conductor_id == conductor_id
+        )
+        
+        if estado:
+            query = query.filter(AsignacionConductor.estado == estado)
+        
+        return tuple(query.one())
+
     @staticmethod
     def iniciar_ruta(
         db: Session,
@@ -430,6 +528,9 @@ class AsignacionService:
         db.commit()
         db.refresh(asignacion)
         
+        # Empezar a seguir el avance del camión con GPS
+        seguimiento.registrar(db, asignacion)
+        
         return asignacion
 
     @staticmethod
@@ -493,4 +594,6 @@ class AsignacionService:
         db.commit()
         db.refresh(asignacion)
         
+        seguimiento.quitar(asignacion.conductor_id)
+        
         return asignacion
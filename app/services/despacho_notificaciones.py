@@ -0,0 +1,286 @@
+"""
+Despachador de notificaciones del outbox
+Un hilo por proceso reclama lotes de notificaciones_outbox con
+FOR UPDATE SKIP LOCKED moviendo su proximo_intento al fin de un plazo de
+reserva, y confirma antes de enviar: ningún bloqueo queda abierto durante
+las llamadas a los webhooks. Cada notificación se entrega y se actualiza en
+su propia transacción, y las que fallan se reprograman con backoff
+exponencial. Como la fila solo pasa a 'enviada' después del envío, un
+reinicio del worker no pierde notificaciones: al vencer la reserva otro
+worker las retoma (en el peor caso se reenvía alguna).
+"""
+import os
+import random
+import logging
+import threading
+from datetime import datetime, timedelta
+from typing import Dict, List, Optional
+
+import requests
+from sqlalchemy.orm import Session
+
+from app.database import SessionLocal, registrar_invalidacion
+from app.models import Conductor, NotificacionOutbox, Usuario
+from app.services.tiempo_real_service import (
+    publicar_evento, RUTA_CREADA, RUTA_CANCELADA
+)
+
+logger = logging.getLogger(__name__)
+
+
+INTERVALO_DESPACHO = float(os.getenv("NOTIFICACIONES_INTERVALO", "5"))
+LOTE_DESPACHO = int(os.getenv("NOTIFICACIONES_LOTE", "50"))
+# Reserva de un lote reclamado; debe cubrir la entrega de todo el lote
+RESERVA_SEGUNDOS = float(os.getenv("NOTIFICACIONES_RESERVA_SEGUNDOS", "300"))
+MAX_INTENTOS = int(os.getenv("NOTIFICACIONES_MAX_INTENTOS", "8"))
+BACKOFF_BASE_SEGUNDOS = 10
+BACKOFF_MAX_SEGUNDOS = 1800
+
+# 'local' reemplaza todos los canales por CanalLocal (desarrollo y pruebas)
+MODO_NOTIFICACIONES = os.getenv("NOTIFICACIONES_MODO", "real")
+
+PUSH_WEBHOOK_URL = os.getenv("PUSH_WEBHOOK_URL")
+SMS_WEBHOOK_URL = os.getenv("SMS_WEBHOOK_URL")
+WEBHOOK_TOKEN = os.getenv("NOTIFICACIONES_WEBHOOK_TOKEN")
+
+
+class ErrorEnvio(Exception):
+    """El canal no pudo entregar la notificación; se reintenta más tarde"""
+    pass
+
+
+class CanalNotificacion:
+    """Canal de entrega; las subclases implementan enviar()"""
+
+    nombre = ""
+
+    def enviar(self, db: Session, notificacion: NotificacionOutbox) -> None:
+        raise NotImplementedError
+
+
+class CanalWebSocket(CanalNotificacion):
+    """Conductores conectados a /conductores/ws (vía NOTIFY)"""
+
+    nombre = "websocket"
+
+    EVENTOS = {
+        "NUEVA_RUTA": RUTA_CREADA,
+        "RECALCULO_RUTA": RUTA_CREADA,
+        "RUTA_CANCELADA": RUTA_CANCELADA,
+    }
+
+    def enviar(self, db: Session, notificacion: NotificacionOutbox) -> None:
+        evento = self.EVENTOS.get(notificacion.tipo)
+        if evento is None:
+            return
+        if not publicar_evento(evento, notificacion.payload, zona=notificacion.zona):
+            raise ErrorEnvio("No se pudo publicar el evento")
+
+
+class _CanalWebhook(CanalNotificacion):
+    """Envío a un proveedor externo por HTTP; sin URL configurada solo registra"""
+
+    url: Optional[str] = None
+
+    def _cuerpo(self, db: Session, notificacion: NotificacionOutbox) -> Dict:
+        raise NotImplementedError
+
+    def enviar(self, db: Session, notificacion: NotificacionOutbox) -> None:
+        cuerpo = self._cuerpo(db, notificacion)
+        if not self.url:
+            logger.info(f"[{self.nombre}] {notificacion.payload.get('mensaje')}")
+            return
+
+        headers = {"Authorization": f"Bearer {WEBHOOK_TOKEN}"} if WEBHOOK_TOKEN else {}
+        try:
+            response = requests.post(self.url, json=cuerpo, headers=headers, timeout=10)
+        except requests.RequestException as e:
+            raise ErrorEnvio(str(e))
+        if response.status_code >= 400:
+            raise ErrorEnvio(f"HTTP {response.status_code}: {response.text[:200]}")
+
+
+class CanalPush(_CanalWebhook):
+    """Push a la app de conductores, un tópico por zona"""
+
+    nombre = "push"
+    url = PUSH_WEBHOOK_URL
+
+    def _cuerpo(self, db: Session, notificacion: NotificacionOutbox) -> Dict:
+        return {
+            "topico": f"conductores_{notificacion.zona or 'todas'}",
+            "titulo": notificacion.payload.get("tipo"),
+            "cuerpo": notificacion.payload.get("mensaje"),
+            "datos": notificacion.payload
+        }
+
+
+class CanalSMS(_CanalWebhook):
+    """SMS a los conductores activos de la zona"""
+
+    nombre = "sms"
+    url = SMS_WEBHOOK_URL
+
+    def _cuerpo(self, db: Session, notificacion: NotificacionOutbox) -> Dict:
+        query = db.query(Conductor.telefono).join(Usuario).filter(
+            Usuario.activo.is_(True),
+            Conductor.estado != 'inactivo',
+            Conductor.telefono.isnot(None)
+        )
+        if notificacion.zona:
+            query = query.filter(Conductor.zona_preferida.in_([notificacion.zona, 'ambas']))
+        return {
+            "destinatarios": [t for (t,) in query.all()],
+            "mensaje": notificacion.payload.get("mensaje")
+        }
+
+
+class CanalLocal(CanalNotificacion):
+    """Guarda en memoria lo enviado, para desarrollo y pruebas"""
+
+    def __init__(self, nombre: str):
+        self.nombre = nombre
+        self.enviadas: List[Dict] = []
+
+    def enviar(self, db: Session, notificacion: NotificacionOutbox) -> None:
+        self.enviadas.append({
+            "id": notificacion.id,
+            "tipo": notificacion.tipo,
+            "zona": notificacion.zona,
+            "payload": notificacion.payload
+        })
+
+
+def canales_por_defecto() -> Dict[str, CanalNotificacion]:
+    if MODO_NOTIFICACIONES == "local":
+        return {nombre: CanalLocal(nombre) for nombre in ("websocket", "push", "sms")}
+    return {canal.nombre: canal for canal in (CanalWebSocket(), CanalPush(), CanalSMS())}
+
+
+def calcular_backoff(intentos: int) -> timedelta:
+    """Espera antes del siguiente intento: exponencial con tope y 20% de jitter"""
+    segundos = min(BACKOFF_MAX_SEGUNDOS, BACKOFF_BASE_SEGUNDOS * 2 ** (intentos - 1))
+    return timedelta(seconds=segundos * (1 + 0.2 * random.random()))
+
+
+class DespachadorNotificaciones:
+    """
+    Hilo que vacía el outbox por lotes
+
+    Duerme INTERVALO_DESPACHO segundos entre ciclos o hasta que una sesión
+    de este proceso confirma notificaciones nuevas (despertar()).
+    """
+
+    def __init__(self, canales: Optional[Dict[str, CanalNotificacion]] = None):
+        self.canales = canales if canales is not None else canales_por_defecto()
+        self._detener = threading.Event()
+        self._pendientes = threading.Event()
+        self._hilo: Optional[threading.Thread] = None
+
+    def registrar_canal(self, canal: CanalNotificacion):
+        self.canales[canal.nombre] = canal
+
+    def iniciar(self):
+        if self._hilo and self._hilo.is_alive():
+            return
+        self._detener.clear()
+        self._hilo = threading.Thread(target=self._bucle, name="despacho-notificaciones", daemon=True)
+        self._hilo.start()
+        logger.info(f"Despachador de notificaciones iniciado (canales: {', '.join(self.canales)})")
+
+    def detener(self):
+        self._detener.set()
+        self._pendientes.set()
+        if self._hilo:
+            self._hilo.join(timeout=5)
+
+    def despertar(self):
+        self._pendientes.set()
+
+    def _bucle(self):
+        while not self._detener.is_set():
+            try:
+                # Seguir mientras los lotes salgan llenos
+                while self.procesar_lote() == LOTE_DESPACHO and not self._detener.is_set():
+                    pass
+            except Exception as e:
+                logger.error(f"Error en despachador de notificaciones: {e}")
+            self._pendientes.wait(INTERVALO_DESPACHO)
+            self._pendientes.clear()
+
+    def procesar_lote(self) -> int:
+        """
+        Entrega un lote de notificaciones pendientes
+
+        Returns:
+            Número de notificaciones procesadas (enviadas o reprogramadas)
+        """
+        db = SessionLocal()
+        try:
+            # 1. Reclamar el lote: el bloqueo dura solo esta transacción
+            ahora = datetime.utcnow()
+            reservada_hasta = ahora + timedelta(seconds=RESERVA_SEGUNDOS)
+            lote = db.query(NotificacionOutbox).filter(
+                NotificacionOutbox.estado == 'pendiente',
+                NotificacionOutbox.proximo_intento <= ahora
+            ).order_by(
+                NotificacionOutbox.proximo_intento
+            ).limit(LOTE_DESPACHO).with_for_update(skip_locked=True).all()
+
+            ids = [n.id for n in lote]
+            for notificacion in lote:
+                notificacion.proximo_intento = reservada_hasta
+            db.commit()
+
+            # 2. Entregar cada una en su propia transacción corta
+            for notificacion_id in ids:
+                notificacion = db.get(NotificacionOutbox, notificacion_id)
+                # Si la reserva venció, otro worker pudo retomarla
+                if (
+                    notificacion is None
+                    or notificacion.estado != 'pendiente'
+                    or notificacion.proximo_intento != reservada_hasta
+                ):
+                    db.rollback()
+                    continue
+                self._entregar(db, notificacion)
+                db.commit()
+
+            return len(ids)
+        finally:
+            db.close()
+
+    def _entregar(self, db: Session, notificacion: NotificacionOutbox):
+        notificacion.intentos += 1
+        canal = self.canales.get(notificacion.canal)
+        try:
+            if canal is None:
+                raise ErrorEnvio(f"Canal '{notificacion.canal}' no registrado")
+            canal.enviar(db, notificacion)
+        except Exception as e:
+            notificacion.ultimo_error = str(e)[:500]
+            if notificacion.intentos >= MAX_INTENTOS:
+                notificacion.estado = 'fallida'
+                logger.error(
+                    f"Notificación {notificacion.id} ({notificacion.tipo}/{notificacion.canal}) "
+                    f"descartada tras {notificacion.intentos} intentos: {e}"
+                )
+            else:
+                notificacion.proximo_intento = datetime.utcnow() + calcular_backoff(notificacion.intentos)
+                logger.warning(
+                    f"Notificación {notificacion.id} por {notificacion.canal} falló "
+                    f"(intento {notificacion.intentos}), se reintenta: {e}"
+                )
+            return
+
+        notificacion.estado = 'enviada'
+        notificacion.enviada_en = datetime.utcnow()
+        notificacion.ultimo_error = None
+
+
+# Instancia compartida del proceso
+despachador_notificaciones = DespachadorNotificaciones()
+
+
+# Entrega inmediata en vez de esperar al siguiente ciclo
+registrar_invalidacion((NotificacionOutbox,), despachador_notificaciones.despertar, solo_nuevos=True)
@@ -0,0 +1,176 @@
+"""
+Motor de horas estimadas de llegada (ETA) por parada
+Combina la duración de cada tramo devuelta por OSRM, el tiempo de servicio
+según el tipo de parada y la hora de salida del camión
+"""
+import logging
+from datetime import datetime, timedelta
+from typing import List, Dict, Optional, Sequence
+
+import numpy as np
+from sqlalchemy.orm import Session
+
+from app.models import RutaDetalle
+
+logger = logging.getLogger(__name__)
+
+
+class EtaService:
+    """Servicio de cálculo y recálculo de ETAs"""
+
+    # Tiempo de servicio (minutos) por tipo de parada
+    SERVICIO_PUNTO_FIJO = {
+        'deposito': 5,
+        'botadero': 15
+    }
+
+    # Tiempo de servicio (minutos) por tipo de incidencia
+    SERVICIO_INCIDENCIA = {
+        'acopio': 10,
+        'zona_critica': 15,
+        'animal_muerto': 20
+    }
+
+    SERVICIO_INCIDENCIA_DEFAULT = 10
+
+    @staticmethod
+    def tiempo_servicio(tipo_punto: str, tipo_incidencia: Optional[str] = None) -> timedelta:
+        """
+        Tiempo de servicio de una parada
+
+        Args:
+            tipo_punto: 'deposito', 'incidencia' o 'botadero'
+            tipo_incidencia: Tipo de la incidencia si tipo_punto == 'incidencia'
+        """
+        if tipo_punto == 'incidencia':
+            minutos = EtaService.SERVICIO_INCIDENCIA.get(
+                tipo_incidencia, EtaService.SERVICIO_INCIDENCIA_DEFAULT
+            )
+        else:
+            minutos = EtaService.SERVICIO_PUNTO_FIJO.get(tipo_punto, 0)
+        return timedelta(minutes=minutos)
+
+    @staticmethod
+    def calcular_offsets(
+        duraciones_tramos: Sequence[float],
+        servicios: Sequence[float],
+        factor_trafico: float = 1.0
+    ) -> np.ndarray:
+        """
+        Segundos desde la salida hasta la llegada a cada parada
+
+        llegada[0] = 0
+        llegada[i] = sum(servicio[k] + tramo[k] * factor) para k < i
+
+        Args:
+            duraciones_tramos: Duración (s) de los n-1 tramos entre paradas
+            servicios: Tiempo de servicio (s) de las n paradas
+            factor_trafico: Multiplicador de las duraciones de tramo
+
+        Returns:
+            Array (n,) de offsets en segundos
+        """
+        servicios = np.asarray(servicios, dtype=np.float64)
+        tramos = np.asarray(duraciones_tramos, dtype=np.float64) * factor_trafico
+        if tramos.shape[0] != servicios.shape[0] - 1:
+            raise ValueError(
+                f"Se esperaban {servicios.shape[0] - 1} tramos para "
+                f"{servicios.shape[0]} paradas, llegaron {tramos.shape[0]}"
+            )
+
+        offsets = np.zeros(servicios.shape[0], dtype=np.float64)
+        np.cumsum(servicios[:-1] + tramos, out=offsets[1:])
+        return offsets
+
+    @staticmethod
+    def calcular_llegadas(
+        salida: datetime,
+        legs: List[Dict],
+        servicios: List[timedelta],
+        factor_trafico: float = 1.0
+    ) -> List[datetime]:
+        """
+        Hora estimada de llegada a cada parada de un camión
+
+        Args:
+            salida: Hora de salida del depósito (UTC)
+            legs: Tramos de OSRM (calculate_route(...)["legs"])
+            servicios: Tiempo de servicio de cada parada
+            factor_trafico: Multiplicador de tráfico para la hora de salida
+
+        Returns:
+            Lista de datetimes, una por parada
+        """
+        offsets = EtaService.calcular_offsets(
+            [leg["duration"] for leg in legs],
+            [s.total_seconds() for s in servicios],
+            factor_trafico
+        )
+        return [salida + timedelta(seconds=float(s)) for s in offsets]
+
+    @staticmethod
+    def recalcular_restantes(
+        db: Session,
+        ruta_id: int,
+        camion_id: Optional[str],
+        orden: int,
+        momento: Optional[datetime] = None
+    ) -> List[RutaDetalle]:
+        """
+        Recalcula las ETAs de las paradas pendientes cuando el camión
+        reporta que llegó a una parada
+
+        No consulta OSRM: las diferencias entre las llegadas planificadas ya
+        contienen la duración de cada tramo y el tiempo de servicio, así que
+        basta con desplazar las paradas restantes al momento reportado.
+
+        Args:
+            db: Sesión de base de datos
+            ruta_id: ID de la ruta
+            camion_id: Camión que reporta; si es None se toma el de la parada
+                alcanzada (el orden es único dentro de la ruta)
+            orden: Orden de la parada alcanzada
+            momento: Hora de llegada reportada (por defecto ahora, UTC)
+
+        Returns:
+            Detalles actualizados desde la parada alcanzada (incluida)
+        """
+        momento = momento or datetime.utcnow()
+
+        if camion_id is None:
+            # Sin filtrar por camión se desplazarían también las paradas
+            # posteriores de los demás camiones de la ruta
+            alcanzada = db.query(RutaDetalle.camion_id).filter(
+                RutaDetalle.ruta_id == ruta_id,
+                RutaDetalle.orden == orden
+            ).first()
+            if alcanzada is None:
+                return []
+            camion_id = alcanzada.camion_id
+
+        detalles = db.query(RutaDetalle).filter(
+            RutaDetalle.ruta_id == ruta_id,
+            RutaDetalle.camion_id == camion_id if camion_id is not None
+            else RutaDetalle.camion_id.is_(None)
+        ).order_by(RutaDetalle.orden).all()
+
+        restantes = [d for d in detalles if d.orden >= orden and d.llegada_estimada]
+        if not restantes or restantes[0].orden != orden:
+            return []
+
+        planificadas = np.array(
+            [d.llegada_estimada for d in restantes], dtype='datetime64[us]'
+        )
+        nuevas = np.datetime64(momento, 'us') + (planificadas - planificadas[0])
+
+        for detalle, llegada in zip(restantes, nuevas.tolist()):
+            detalle.llegada_estimada = llegada
+
+        retraso = (momento - planificadas[0].tolist()).total_seconds()
+        logger.info(
+            f"ETAs recalculadas ruta {ruta_id} camión {camion_id}: "
+            f"{len(restantes)} paradas, desfase {retraso / 60:+.1f} min"
+        )
+
+        db.commit()
+        return restantes
@@ -0,0 +1,324 @@
+"""
+Exportación de incidencias, rutas y asignaciones en streaming
+La consulta se recorre con un cursor del lado del servidor (yield_per) y
+cada lote se codifica y se envía antes de leer el siguiente: la memoria no
+depende del tamaño de la exportación. Formatos: CSV, GeoJSON por líneas
+(un Feature por línea) y Parquet si pyarrow está instalado.
+"""
+import io
+import csv
+import os
+import logging
+from datetime import datetime, timedelta
+from typing import Dict, Iterator, List, Optional
+
+from sqlalchemy import Boolean, DateTime, Float, Integer, Interval, select
+
+from app.database import SessionExportacion
+from app.models import AsignacionConductor, Conductor, Incidencia, RutaDetalle, RutaGenerada
+from app.json_rapido import dumps
+
+logger = logging.getLogger(__name__)
+
+
+FORMATOS = ('csv', 'ndjson', 'parquet')
+MEDIA_TYPES = {
+    'csv': "text/csv; charset=utf-8",
+    'ndjson': "application/x-ndjson",
+    'parquet': "application/vnd.apache.parquet",
+}
+EXTENSIONES = {'csv': 'csv', 'ndjson': 'geojsonl', 'parquet': 'parquet'}
+
+# Filas por lote del cursor (y por grupo de filas en Parquet)
+TAMANO_LOTE = int(os.getenv("EXPORTACION_TAMANO_LOTE", "2000"))
+
+
+def _consulta_incidencias():
+    return select(
+        Incidencia.id, Incidencia.tipo, Incidencia.gravedad, Incidencia.estado,
+        Incidencia.zona, Incidencia.descripcion, Incidencia.foto_url,
+        Incidencia.lat, Incidencia.lon, Incidencia.utm_easting, Incidencia.utm_northing,
+        Incidencia.ventana_inicio, Incidencia.ventana_fin, Incidencia.reportado_en,
+        Incidencia.usuario_id
+    ).order_by(Incidencia.id)
+
+
+def _consulta_rutas():
+    # Una fila por parada con los datos de su ruta
+    return select(
+        RutaGenerada.id.label("ruta_id"), RutaGenerada.zona,
+        RutaGenerada.estado.label("estado_ruta"), RutaGenerada.fecha_generacion,
+        RutaGenerada.suma_gravedad, RutaGenerada.costo_total,
+        RutaGenerada.duracion_estimada, RutaGenerada.camiones_usados,
+        RutaDetalle.id.label("parada_id"), RutaDetalle.camion_tipo, RutaDetalle.camion_id,
+        RutaDetalle.viaje, RutaDetalle.orden, RutaDetalle.tipo_punto,
+        RutaDetalle.incidencia_id, RutaDetalle.lat, RutaDetalle.lon,
+        RutaDetalle.llegada_estimada, RutaDetalle.carga_acumulada, RutaDetalle.visitado_en
+    ).outerjoin(
+        RutaDetalle, RutaDetalle.ruta_id == RutaGenerada.id
+    ).order_by(RutaGenerada.id, RutaDetalle.camion_id, RutaDetalle.viaje, RutaDetalle.orden)
+
+
+def _consulta_asignaciones():
+    return select(
+        AsignacionConductor.id, AsignacionConductor.ruta_id, RutaGenerada.zona,
+        AsignacionConductor.conductor_id, Conductor.nombre_completo.label("conductor"),
+        AsignacionConductor.camion_tipo, AsignacionConductor.camion_id,
+        AsignacionConductor.estado, AsignacionConductor.fecha_asignacion,
+        AsignacionConductor.fecha_inicio, AsignacionConductor.fecha_finalizacion
+    ).join(
+        Conductor, Conductor.id == AsignacionConductor.conductor_id
+    ).join(
+        RutaGenerada, RutaGenerada.id == AsignacionConductor.ruta_id
+    ).order_by(AsignacionConductor.id)
+
+
+# Consulta base y columnas de filtro de cada recurso exportable
+RECURSOS = {
+    'incidencias': {
+        'consulta': _consulta_incidencias,
+        'fecha': Incidencia.reportado_en,
+        'zona': Incidencia.zona,
+        'estado': Incidencia.estado,
+    },
+    'rutas': {
+        'consulta': _consulta_rutas,
+        'fecha': RutaGenerada.fecha_generacion,
+        'zona': RutaGenerada.zona,
+        'estado': RutaGenerada.estado,
+    },
+    'asignaciones': {
+        'consulta': _consulta_asignaciones,
+        'fecha': AsignacionConductor.fecha_asignacion,
+        'zona': RutaGenerada.zona,
+        'estado': AsignacionConductor.estado,
+    },
+}
+
+
+def parquet_disponible() -> bool:
+    try:
+        import pyarrow  # noqa: F401
+        return True
+    except ImportError:
+        return False
+
+
+def _valor(valor):
+    """Valor plano para CSV/Parquet (intervalos en segundos)"""
+    if isinstance(valor, timedelta):
+        return valor.total_seconds()
+    return valor
+
+
+class _SalidaParquet(io.RawIOBase):
+    """
+    Archivo de solo escritura para ParquetWriter: acumula lo escrito hasta
+    que se vacía con leer() y lleva la posición absoluta, que Parquet usa
+    para los offsets del pie del archivo
+    """
+
+    def __init__(self):
+        super().__init__()
+        self._partes: List[bytes] = []
+        self._posicion = 0
+
+    def writable(self) -> bool:
+        return True
+
+    def write(self, datos) -> int:
+        datos = bytes(datos)
+        self._partes.append(datos)
+        self._posicion += len(datos)
+        return len(datos)
+
+    def tell(self) -> int:
+        return self._posicion
+
+    def leer(self) -> bytes:
+        datos = b"".join(self._partes)
+        self._partes.clear()
+        return datos
+
+
+class Exportacion:
+    """
+    Exportación en curso: sesión propia y cursor abierto
+
+    La consulta se ejecuta al crearla, así un pool agotado o un error de SQL
+    se informa antes de empezar a enviar la respuesta. cerrar() es
+    idempotente: la llama el propio iterador al terminar, al fallar o al
+    descartarse si el cliente se desconecta, y liberar() cubre el caso de
+    una respuesta que nunca empezó a enviarse.
+    """
+
+    def __init__(self, recurso: str, formato: str, filtros: Dict):
+        definicion = RECURSOS[recurso]
+        consulta = definicion['consulta']()
+        if filtros.get("desde"):
+            consulta = consulta.where(definicion['fecha'] >= filtros["desde"])
+        if filtros.get("hasta"):
+            consulta = consulta.where(definicion['fecha'] < filtros["hasta"])
+        if filtros.get("zona"):
+            consulta = consulta.where(definicion['zona'] == filtros["zona"])
+        if filtros.get("estado"):
+            consulta = consulta.where(definicion['estado'] == filtros["estado"])
+
+        self.recurso = recurso
+        self.formato = formato
+        self.columnas = consulta.selected_columns
+        self.campos = [c.name for c in self.columnas]
+        self.filas = 0
+
+        self._db = SessionExportacion()
+        try:
+            self._resultado = self._db.execute(
+                consulta.execution_options(yield_per=TAMANO_LOTE)
+            )
+        except Exception:
+            self._db.close()
+            raise
+        self._cerrada = False
+        self._iniciada = False
+
+    def liberar(self):
+        """Cierra la exportación si nunca se empezó a recorrer"""
+        if not self._iniciada:
+            self.cerrar()
+
+    def cerrar(self):
+        if self._cerrada:
+            return
+        self._cerrada = True
+        try:
+            self._resultado.close()
+        finally:
+            self._db.close()
+
+    def __iter__(self) -> Iterator[bytes]:
+        codificar = {
+            'csv': self._csv,
+            'ndjson': self._ndjson,
+            'parquet': self._parquet,
+        }[self.formato]
+        self._iniciada = True
+        inicio = datetime.utcnow()
+        try:
+            yield from codificar(self._resultado.partitions())
+            logger.info(
+                f"Exportación {self.recurso}.{self.formato}: {self.filas} filas "
+                f"en {(datetime.utcnow() - inicio).total_seconds():.1f}s"
+            )
+        except Exception as e:
+            # Las cabeceras ya se enviaron: el cliente recibe un archivo truncado
+            logger.error(f"Exportación {self.recurso}.{self.formato} interrumpida: {e}")
+            raise
+        finally:
+            self.cerrar()
+
+    def _csv(self, lotes) -> Iterator[bytes]:
+        buffer = io.StringIO()
+        escritor = csv.writer(buffer)
+        escritor.writerow(self.campos)
+        for lote in lotes:
+            escritor.writerows([_valor(v) for v in fila] for fila in lote)
+            self.filas += len(lote)
+            yield buffer.getvalue().encode("utf-8")
+            buffer.seek(0)
+            buffer.truncate()
+        if buffer.tell():
+            yield buffer.getvalue().encode("utf-8")
+
+    def _ndjson(self, lotes) -> Iterator[bytes]:
+        for lote in lotes:
+            lineas = []
+            for fila in lote:
+                propiedades = dict(zip(self.campos, fila))
+                lat, lon = propiedades.pop("lat", None), propiedades.pop("lon", None)
+                lineas.append(dumps({
+                    "type": "Feature",
+                    "geometry": (
+                        {"type": "Point", "coordinates": [lon, lat]}
+                        if lat is not None and lon is not None else None
+                    ),
+                    "properties": propiedades
+                }))
+            self.filas += len(lote)
+            yield b"\n".join(lineas) + b"\n"
+
+    def _esquema_arrow(self, pa):
+        tipos = []
+        for columna in self.columnas:
+            tipo_sql = columna.type
+            if isinstance(tipo_sql, Boolean):
+                tipo = pa.bool_()
+            elif isinstance(tipo_sql, Integer):
+                tipo = pa.int64()
+            elif isinstance(tipo_sql, (Float, Interval)):
+                tipo = pa.float64()
+            elif isinstance(tipo_sql, DateTime):
+                tipo = pa.timestamp("us")
+            else:
+                tipo = pa.string()
+            tipos.append(pa.field(columna.name, tipo))
+        return pa.schema(tipos)
+
+    def _parquet(self, lotes) -> Iterator[bytes]:
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+
+        esquema = self._esquema_arrow(pa)
+        salida = _SalidaParquet()
+        escritor = pq.ParquetWriter(salida, esquema, compression="zstd")
+        try:
+            for lote in lotes:
+                columnas = list(zip(*lote))
+                escritor.write_table(pa.Table.from_arrays(
+                    [
+                        pa.array([_valor(v) for v in valores], type=campo.type)
+                        for valores, campo in zip(columnas, esquema)
+                    ],
+                    schema=esquema
+                ))
+                self.filas += len(lote)
+                yield salida.leer()
+        finally:
+            escritor.close()
+        yield salida.leer()
+
+
+class ExportacionService:
+    """Servicio de exportaciones masivas"""
+
+    @staticmethod
+    def iniciar_exportacion(
+        recurso: str,
+        formato: str,
+        desde: Optional[datetime] = None,
+        hasta: Optional[datetime] = None,
+        zona: Optional[str] = None,
+        estado: Optional[str] = None
+    ) -> Exportacion:
+        """
+        Abre la consulta de una exportación
+
+        Args:
+            recurso: 'incidencias', 'rutas' (una fila por parada) o 'asignaciones'
+            formato: 'csv', 'ndjson' (GeoJSON por líneas) o 'parquet'
+            desde, hasta: Rango de fechas (reporte, generación o asignación)
+            zona: Zona de la incidencia o de la ruta
+            estado: Estado del registro exportado (de la ruta en 'rutas')
+
+        Returns:
+            Exportacion iterable por fragmentos de bytes; debe cerrarse
+        """
+        if recurso not in RECURSOS:
+            raise ValueError(f"Recurso no exportable: {recurso}")
+        if formato not in FORMATOS:
+            raise ValueError(f"Formato no soportado: {formato}")
+        if formato == 'parquet' and not parquet_disponible():
+            raise RuntimeError("La exportación Parquet requiere el paquete pyarrow")
+
+        return Exportacion(recurso, formato, {
+            "desde": desde, "hasta": hasta, "zona": zona, "estado": estado
+        })
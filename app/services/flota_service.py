@@ -0,0 +1,176 @@
+"""
+Registro en memoria de la flota de camiones
+El planificador consulta la flota disponible en cada generación de ruta;
+el registro evita leer la tabla camiones cada vez
+"""
+import os
+import time
+import threading
+import logging
+from datetime import datetime, timedelta
+from typing import List, Optional, Set, NamedTuple
+
+from sqlalchemy import and_, or_, text
+from sqlalchemy.orm import Session
+
+from app.database import registrar_invalidacion
+from app.models import Camion, RutaDetalle, RutaGenerada
+
+logger = logging.getLogger(__name__)
+
+# Clave del advisory lock que serializa la reserva de camiones entre zonas
+LOCK_RESERVA_FLOTA = 703504
+
+
+class CamionInfo(NamedTuple):
+    """Copia inmutable de un Camion, segura de compartir entre sesiones"""
+    id: int
+    placa: str
+    tipo: str
+    capacidad: int
+    estado: str
+    deposito_id: Optional[int]
+    costo_km: float
+
+
+class RegistroFlota:
+    """
+    Cache de la tabla camiones
+
+    Se invalida cuando una sesión de este proceso escribe un Camion y,
+    como otros workers también pueden hacerlo, se recarga pasado TTL_SEGUNDOS.
+    Los camiones ocupados en rutas activas NO se cachean: cambian con
+    cada ruta generada o completada.
+    """
+
+    TTL_SEGUNDOS = float(os.getenv("FLOTA_TTL", "300"))
+
+    # Una ruta planeada reserva sus camiones solo durante el turno para el
+    # que se generó; pasada la ventana nadie la ejecutó y deja de ocuparlos
+    VENTANA_PLANEADA = timedelta(hours=float(os.getenv("FLOTA_VENTANA_PLANEADA_HORAS", "12")))
+
+    def __init__(self):
+        self._camiones: List[CamionInfo] = []
+        self._cargado_en: Optional[float] = None
+        self._lock = threading.Lock()
+
+    def invalidar(self):
+        """Fuerza la recarga en la próxima consulta"""
+        with self._lock:
+            self._cargado_en = None
+
+    def _asegurar_cargado(self, db: Session):
+        with self._lock:
+            if self._cargado_en is not None and time.monotonic() - self._cargado_en < self.TTL_SEGUNDOS:
+                return
+
+            camiones = db.query(Camion).order_by(Camion.id).all()
+            self._camiones = [
+                CamionInfo(
+                    c.id, c.placa, c.tipo, c.capacidad, c.estado,
+                    c.deposito_id, c.costo_km or 0.0
+                )
+                for c in camiones
+            ]
+            self._cargado_en = time.monotonic()
+
+            logger.info(f"Flota cargada: {len(self._camiones)} camiones")
+
+    def todos(self, db: Session) -> List[CamionInfo]:
+        self._asegurar_cargado(db)
+        return list(self._camiones)
+
+    def obtener_por_placa(self, db: Session, placa: str) -> Optional[CamionInfo]:
+        """Busca un camión por placa"""
+        self._asegurar_cargado(db)
+        for camion in self._camiones:
+            if camion.placa == placa:
+                return camion
+        return None
+
+    @staticmethod
+    def placas_ocupadas(
+        db: Session,
+        excluir_ruta_id: Optional[int] = None,
+        zona: Optional[str] = None
+    ) -> Set[str]:
+        """
+        Placas asignadas a rutas en ejecución o planeadas dentro de VENTANA_PLANEADA
+
+        Args:
+            db: Sesión de base de datos
+            excluir_ruta_id: Ruta que no cuenta como ocupación (ej. la que se replanifica)
+            zona: Si se indica, solo las rutas de esa zona
+        """
+        desde = datetime.utcnow() - RegistroFlota.VENTANA_PLANEADA
+        query = db.query(RutaDetalle.camion_id).join(
+            RutaGenerada, RutaGenerada.id == RutaDetalle.ruta_id
+        ).filter(
+            or_(
+                RutaGenerada.estado == 'en_ejecucion',
+                and_(
+                    RutaGenerada.estado == 'planeada',
+                    RutaGenerada.fecha_generacion >= desde
+                )
+            ),
+            RutaDetalle.camion_id.isnot(None)
+        )
+        if excluir_ruta_id is not None:
+            query = query.filter(RutaGenerada.id != excluir_ruta_id)
+        if zona is not None:
+            query = query.filter(RutaGenerada.zona == zona)
+
+        return {placa for (placa,) in query.distinct().all()}
+
+    @staticmethod
+    def bloquear_reservas(db: Session):
+        """
+        Serializa la reserva de camiones hasta el fin de la transacción
+
+        Dos zonas pueden leer los mismos camiones disponibles antes de que
+        cualquiera confirme su ruta; quien guarda una ruta toma este lock y
+        vuelve a consultar placas_ocupadas antes de asignarlos.
+        """
+        db.execute(text("SELECT pg_advisory_xact_lock(:clave)"), {"clave": LOCK_RESERVA_FLOTA})
+
+    def disponibles(
+        self,
+        db: Session,
+        excluir_ruta_id: Optional[int] = None,
+        zona: Optional[str] = None,
+        cupo: Optional[int] = None
+    ) -> List[CamionInfo]:
+        """
+        Camiones que se pueden planificar ahora
+
+        Excluye los que están en mantenimiento/inactivos y los ocupados en
+        otra ruta activa. Orden: mayor capacidad primero y, a igual
+        capacidad, menor costo por km.
+
+        Args:
+            db: Sesión de base de datos
+            excluir_ruta_id: Ruta que no cuenta como ocupación
+            zona: Zona que se planifica (para aplicar el cupo)
+            cupo: Camiones máximos de la flota para la zona; descuenta los
+                que ya ocupan sus rutas activas, para que una zona no deje
+                sin camiones a la otra
+        """
+        ocupadas = self.placas_ocupadas(db, excluir_ruta_id)
+        camiones = sorted(
+            (
+                c for c in self.todos(db)
+                if c.estado == 'disponible' and c.placa not in ocupadas
+            ),
+            key=lambda c: (-c.capacidad, c.costo_km, c.id)
+        )
+        if zona is not None and cupo is not None:
+            en_zona = len(self.placas_ocupadas(db, excluir_ruta_id, zona))
+            camiones = camiones[:max(0, cupo - en_zona)]
+        return camiones
+
+
+# Registro compartido del proceso
+registro_flota = RegistroFlota()
+
+
+registrar_invalidacion((Camion,), registro_flota.invalidar)
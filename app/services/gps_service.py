@@ -0,0 +1,344 @@
+"""
+Ingesta de posiciones GPS de los camiones y map matching en segundo plano
+Las posiciones llegan en lotes columnares (JSON, opcionalmente gzip, o
+binario empaquetado), se validan con NumPy y se escriben con COPY en la
+tabla particionada posiciones_gps usando un pool de conexiones propio
+"""
+import io
+import os
+import gzip
+import json
+import logging
+import threading
+import time
+from datetime import datetime
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+from geoalchemy2 import WKTElement
+from sqlalchemy import text
+
+from app.database import ingesta_engine, SessionIngesta
+from app.models import TrazaGPS
+from app.osrm_service import OSRMService
+from app.services.sync_service import SyncService
+
+logger = logging.getLogger(__name__)
+
+
+# Registro binario: conductor_id int32, ts float64 (epoch s), lat/lon float32
+DTYPE_POSICION = np.dtype([
+    ("conductor_id", "<i4"),
+    ("ts", "<f8"),
+    ("lat", "<f4"),
+    ("lon", "<f4"),
+])
+
+# Máximo de posiciones por lote (20 camiones x 1 posición/5 s x 10 min = 2400)
+MAX_POSICIONES_LOTE = int(os.getenv("GPS_MAX_POSICIONES_LOTE", "20000"))
+
+# Map matching
+INTERVALO_MATCHING = float(os.getenv("GPS_MATCH_INTERVALO", "60"))  # segundos
+VENTANA_MATCHING = int(os.getenv("GPS_MATCH_VENTANA", "100"))  # puntos por llamada a OSRM
+MIN_PUNTOS_MATCHING = int(os.getenv("GPS_MATCH_MIN_PUNTOS", "12"))  # 1 min a 5 s
+RADIO_MATCHING_M = int(os.getenv("GPS_MATCH_RADIO_M", "25"))
+
+# Clave del advisory lock que asegura un solo worker entre procesos
+LOCK_WORKER_MATCHING = 703501
+
+
+class LoteInvalidoError(ValueError):
+    """El cuerpo del lote no tiene el formato esperado"""
+
+
+class GPSService:
+    """Servicio de ingesta de posiciones GPS"""
+
+    @staticmethod
+    def decodificar_json(cuerpo: bytes, comprimido: bool = False) -> Dict[str, np.ndarray]:
+        """
+        Decodifica un lote columnar JSON
+
+        Formato: {"conductor_id": [...], "ts": [...], "lat": [...], "lon": [...]}
+        con ts en segundos epoch (UTC).
+        """
+        try:
+            if comprimido:
+                cuerpo = gzip.decompress(cuerpo)
+            datos = json.loads(cuerpo)
+            columnas = {
+                "conductor_id": np.asarray(datos["conductor_id"], dtype=np.int32),
+                "ts": np.asarray(datos["ts"], dtype=np.float64),
+                "lat": np.asarray(datos["lat"], dtype=np.float64),
+                "lon": np.asarray(datos["lon"], dtype=np.float64),
+            }
+        except (OSError, ValueError, KeyError, TypeError) as e:
+            raise LoteInvalidoError(f"Lote JSON inválido: {e}")
+
+        longitudes = {len(c) for c in columnas.values()}
+        if len(longitudes) != 1:
+            raise LoteInvalidoError("Las columnas del lote tienen distinto largo")
+        return columnas
+
+    @staticmethod
+    def decodificar_binario(cuerpo: bytes, comprimido: bool = False) -> Dict[str, np.ndarray]:
+        """
+        Decodifica un lote binario de registros DTYPE_POSICION (20 bytes c/u)
+        """
+        try:
+            if comprimido:
+                cuerpo = gzip.decompress(cuerpo)
+        except OSError as e:
+            raise LoteInvalidoError(f"Lote gzip inválido: {e}")
+
+        if len(cuerpo) % DTYPE_POSICION.itemsize:
+            raise LoteInvalidoError(
+                f"Tamaño {len(cuerpo)} no es múltiplo de {DTYPE_POSICION.itemsize} bytes"
+            )
+        registros = np.frombuffer(cuerpo, dtype=DTYPE_POSICION)
+        return {
+            "conductor_id": registros["conductor_id"].astype(np.int32),
+            "ts": registros["ts"].astype(np.float64),
+            "lat": registros["lat"].astype(np.float64),
+            "lon": registros["lon"].astype(np.float64),
+        }
+
+    @staticmethod
+    def filtrar_validas(columnas: Dict[str, np.ndarray]) -> Tuple[Dict[str, np.ndarray], int]:
+        """
+        Descarta posiciones con coordenadas o timestamps imposibles
+
+        Returns:
+            Tuple[columnas filtradas, número de descartadas]
+        """
+        ahora = time.time()
+        validas = (
+            np.isfinite(columnas["lat"]) & np.isfinite(columnas["lon"]) & np.isfinite(columnas["ts"])
+            & (np.abs(columnas["lat"]) <= 90) & (np.abs(columnas["lon"]) <= 180)
+            & (columnas["ts"] > ahora - 7 * 86400) & (columnas["ts"] < ahora + 300)
+            & (columnas["conductor_id"] > 0)
+        )
+        descartadas = int((~validas).sum())
+        return {k: v[validas] for k, v in columnas.items()}, descartadas
+
+    @staticmethod
+    def ultimas_por_conductor(columnas: Dict[str, np.ndarray]) -> List[Tuple[int, float, float, float]]:
+        """Posición más reciente de cada conductor del lote (conductor_id, ts, lat, lon)"""
+        if len(columnas["ts"]) == 0:
+            return []
+        # Orden por conductor y ts: la última fila de cada grupo es la más reciente
+        orden = np.lexsort((columnas["ts"], columnas["conductor_id"]))
+        conductores = columnas["conductor_id"][orden]
+        ultimas = orden[np.append(conductores[1:] != conductores[:-1], True)]
+        return list(zip(
+            columnas["conductor_id"][ultimas].tolist(), columnas["ts"][ultimas].tolist(),
+            columnas["lat"][ultimas].tolist(), columnas["lon"][ultimas].tolist()
+        ))
+
+    @staticmethod
+    def _formatear_copy(columnas: Dict[str, np.ndarray]) -> io.StringIO:
+        """Texto para COPY ... FROM STDIN (formato text, separado por tabs)"""
+        instantes = np.datetime_as_string(
+            np.rint(columnas["ts"] * 1e6).astype(np.int64).astype("datetime64[us]"), unit="us"
+        )
+        buffer = io.StringIO()
+        buffer.writelines(
+            f"{c}\t{t}+00\t{lat:.7f}\t{lon:.7f}\n"
+            for c, t, lat, lon in zip(
+                columnas["conductor_id"].tolist(), instantes.tolist(),
+                columnas["lat"].tolist(), columnas["lon"].tolist()
+            )
+        )
+        buffer.seek(0)
+        return buffer
+
+    @staticmethod
+    def guardar_posiciones(columnas: Dict[str, np.ndarray]) -> int:
+        """
+        Escribe las posiciones con COPY usando el pool de ingesta
+
+        Returns:
+            Número de posiciones escritas
+        """
+        total = len(columnas["ts"])
+        if total == 0:
+            return 0
+
+        buffer = GPSService._formatear_copy(columnas)
+        conexion = ingesta_engine.raw_connection()
+        try:
+            with conexion.cursor() as cursor:
+                cursor.copy_expert(
+                    "COPY posiciones_gps (conductor_id, ts, lat, lon) FROM STDIN",
+                    buffer
+                )
+            conexion.commit()
+        except Exception:
+            conexion.rollback()
+            raise
+        finally:
+            conexion.close()
+
+        return total
+
+    @staticmethod
+    def crear_particiones(dias: int = 7):
+        """Asegura las particiones diarias de hoy y los próximos días"""
+        with ingesta_engine.begin() as conexion:
+            conexion.execute(
+                text(
+                    "SELECT crear_particion_posiciones_gps(CURRENT_DATE + d) "
+                    "FROM generate_series(0, :dias) AS d"
+                ),
+                {"dias": dias}
+            )
+
+
+class MapMatchingWorker:
+    """
+    Hilo que ajusta las posiciones nuevas de cada conductor a la red vial
+
+    Procesa ventanas de hasta VENTANA_MATCHING puntos desde la última traza
+    guardada de cada conductor (trazas_gps.hasta hace de cursor). Con
+    varios procesos uvicorn, un advisory lock de Postgres deja activo a uno
+    solo por ciclo.
+    """
+
+    def __init__(self, osrm: Optional[OSRMService] = None):
+        self._osrm = osrm
+        self._detener = threading.Event()
+        self._hilo: Optional[threading.Thread] = None
+
+    @property
+    def osrm(self) -> OSRMService:
+        # Se crea al primer ciclo, no al importar el módulo
+        if self._osrm is None:
+            self._osrm = OSRMService()
+        return self._osrm
+
+    def iniciar(self):
+        if self._hilo and self._hilo.is_alive():
+            return
+        self._detener.clear()
+        self._hilo = threading.Thread(target=self._bucle, name="map-matching", daemon=True)
+        self._hilo.start()
+        logger.info("Worker de map matching iniciado")
+
+    def detener(self):
+        self._detener.set()
+        if self._hilo:
+            self._hilo.join(timeout=5)
+
+    def _bucle(self):
+        ciclo = 0
+        while not self._detener.wait(INTERVALO_MATCHING):
+            try:
+                if ciclo % 60 == 0:
+                    GPSService.crear_particiones()
+                    SyncService.podar_cambios()
+                self.procesar_pendientes()
+            except Exception as e:
+                logger.error(f"Error en worker de map matching: {e}")
+            ciclo += 1
+
+    def procesar_pendientes(self) -> int:
+        """
+        Un ciclo de map matching para todos los conductores con posiciones nuevas
+
+        Returns:
+            Número de trazas guardadas
+        """
+        # Conexión dedicada: el advisory lock es de sesión y debe liberarse
+        # en la misma conexión que lo tomó
+        conexion = ingesta_engine.connect()
+        db = SessionIngesta(bind=conexion)
+        try:
+            adquirido = db.execute(
+                text("SELECT pg_try_advisory_lock(:clave)"), {"clave": LOCK_WORKER_MATCHING}
+            ).scalar()
+            if not adquirido:
+                return 0
+
+            try:
+                pendientes = db.execute(text("""
+                    SELECT p.conductor_id,
+                           COALESCE(MAX(t.hasta), (now() AT TIME ZONE 'UTC') - interval '1 day') AS cursor
+                    FROM (
+                        SELECT DISTINCT conductor_id FROM posiciones_gps
+                        WHERE ts > now() - interval '1 day'
+                    ) p
+                    LEFT JOIN trazas_gps t ON t.conductor_id = p.conductor_id
+                    GROUP BY p.conductor_id
+                """)).all()
+
+                guardadas = 0
+                for conductor_id, cursor in pendientes:
+                    guardadas += self._procesar_conductor(db, conductor_id, cursor)
+                return guardadas
+            finally:
+                db.execute(text("SELECT pg_advisory_unlock(:clave)"), {"clave": LOCK_WORKER_MATCHING})
+                db.commit()
+        finally:
+            db.close()
+            conexion.close()
+
+    def _procesar_conductor(self, db, conductor_id: int, cursor: datetime) -> int:
+        guardadas = 0
+        while True:
+            filas = db.execute(text("""
+                SELECT extract(epoch FROM ts) AS epoch, lat, lon
+                FROM posiciones_gps
+                WHERE conductor_id = :conductor_id
+                  AND ts > (CAST(:cursor AS timestamp) AT TIME ZONE 'UTC')
+                ORDER BY ts
+                LIMIT :ventana
+            """), {"conductor_id": conductor_id, "cursor": cursor, "ventana": VENTANA_MATCHING}).all()
+
+            # Esperar a tener suficientes puntos salvo que la ventana esté llena
+            if len(filas) < MIN_PUNTOS_MATCHING:
+                return guardadas
+
+            traza = self._ajustar(conductor_id, filas)
+            db.add(traza)
+            db.commit()
+            guardadas += 1
+            cursor = traza.hasta
+
+            if len(filas) < VENTANA_MATCHING:
+                return guardadas
+
+    def _ajustar(self, conductor_id: int, filas: List) -> TrazaGPS:
+        """Llama a OSRM match para una ventana de posiciones"""
+        epochs = [float(f.epoch) for f in filas]
+        coordenadas = [(f.lon, f.lat) for f in filas]
+
+        resultado = self.osrm.match_gps_trace(
+            coordenadas,
+            timestamps=[int(e) for e in epochs],
+            radiuses=[RADIO_MATCHING_M] * len(coordenadas)
+        )
+
+        traza = TrazaGPS(
+            conductor_id=conductor_id,
+            desde=datetime.utcfromtimestamp(epochs[0]),
+            hasta=datetime.utcfromtimestamp(epochs[-1]),
+            puntos=len(filas)
+        )
+
+        # Sin ajuste igual se avanza el cursor para no reintentar la ventana
+        if resultado:
+            traza.distancia = resultado["distance"]
+            traza.duracion = resultado["duration"]
+            traza.confianza = resultado["confidence"]
+            puntos = resultado["geometry"]["coordinates"]
+            if len(puntos) >= 2:
+                wkt = "LINESTRING(" + ", ".join(f"{lon} {lat}" for lon, lat in puntos) + ")"
+                traza.geom = WKTElement(wkt, srid=4326)
+        else:
+            traza.confianza = 0.0
+
+        return traza
+
+
+# Worker compartido del proceso (se inicia en el arranque de la app)
+worker_map_matching = MapMatchingWorker()
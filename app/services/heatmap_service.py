@@ -0,0 +1,251 @@
+"""
+Agregación de incidencias en celdas para mapas de calor
+Postgres agrupa las incidencias en una grilla cuadrada o hexagonal sobre las
+coordenadas UTM (utm_easting/utm_northing) y devuelve solo los conteos por
+celda. Los resultados se guardan por combinación de parámetros y se
+actualizan sumando solo las incidencias nuevas, por fecha de reporte y con
+un margen para las transacciones que confirman tarde.
+"""
+import os
+import math
+import time
+import threading
+import logging
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from datetime import datetime, timedelta
+from typing import Dict, List, Optional, Tuple
+
+from sqlalchemy import text
+from sqlalchemy.orm import Session
+
+from app.services.incidencia_service import transformer_to_wgs84
+
+logger = logging.getLogger(__name__)
+
+
+FORMAS = ('grid', 'hex')
+PERIODOS = ('dia', 'semana', 'mes')
+_DATE_TRUNC = {'dia': 'day', 'semana': 'week', 'mes': 'month'}
+
+# Cada cuánto se recalcula todo (incidencias eliminadas, correcciones)
+TTL_COMPLETO_SEGUNDOS = float(os.getenv("HEATMAP_TTL_COMPLETO", "3600"))
+MAX_ENTRADAS = int(os.getenv("HEATMAP_CACHE_MAX", "200"))
+
+# Una incidencia puede confirmarse después de otras reportadas más tarde: los
+# conteos guardados solo cubren hasta este margen atrás y lo más reciente se
+# vuelve a consultar en cada petición
+MARGEN_SEGUNDOS = int(os.getenv("HEATMAP_MARGEN_SEGUNDOS", "120"))
+
+_INICIO = datetime(1970, 1, 1)
+_FIN = datetime(9999, 12, 31)
+
+
+@dataclass
+class _Agregado:
+    """Conteos de una combinación de parámetros y hasta dónde cubren"""
+    conteos: Dict[Tuple, List[int]] = field(default_factory=dict)  # clave celda -> [total, suma_gravedad]
+    corte: datetime = _INICIO  # incluye las incidencias con reportado_en <= corte
+    marca: Optional[datetime] = None  # max(updated_at) al calcular
+    calculado_en: float = 0.0
+
+
+class HeatmapService:
+    """Servicio de agregación espacial de incidencias"""
+
+    _cache: "OrderedDict[Tuple, _Agregado]" = OrderedDict()
+    _lock = threading.Lock()
+
+    @staticmethod
+    def _sql_celdas(forma: str, periodo: Optional[str], condiciones: str) -> str:
+        """
+        Consulta de conteos por celda de las incidencias con
+        :corte_desde < reportado_en <= :corte_hasta
+
+        grid: celda = floor(utm / tamaño)
+        hex: hexágonos con vértice arriba de lado :celda; cada punto va al
+        centro más cercano entre dos grillas rectangulares desplazadas
+        (w = √3·lado, h = 3·lado), lo que equivale a la teselación hexagonal
+        """
+        columna_periodo = (
+            f"date_trunc('{_DATE_TRUNC[periodo]}', reportado_en)" if periodo else "NULL::timestamp"
+        )
+        puntos = f"""
+            SELECT utm_easting AS x, utm_northing AS y, gravedad,
+                   {columna_periodo} AS periodo
+            FROM incidencias
+            WHERE reportado_en > :corte_desde AND reportado_en <= :corte_hasta
+              AND utm_easting IS NOT NULL AND utm_northing IS NOT NULL{condiciones}
+        """
+        if forma == 'grid':
+            return f"""
+                SELECT floor(x / :celda)::bigint AS cx, floor(y / :celda)::bigint AS cy, periodo,
+                       count(*)::int AS total, sum(gravedad)::int AS suma_gravedad
+                FROM ({puntos}) p
+                GROUP BY 1, 2, 3
+            """
+        return f"""
+            SELECT CASE WHEN d1 <= d2 THEN i1 ELSE i2 END AS cx,
+                   CASE WHEN d1 <= d2 THEN j1 ELSE j2 END AS cy,
+                   periodo,
+                   count(*)::int AS total, sum(gravedad)::int AS suma_gravedad
+            FROM (
+                SELECT periodo, gravedad,
+                       2 * round(x / :w)::bigint AS i1, 2 * round(y / :h)::bigint AS j1,
+                       2 * floor(x / :w)::bigint + 1 AS i2, 2 * floor(y / :h)::bigint + 1 AS j2,
+                       power(x - round(x / :w) * :w, 2) + power(y - round(y / :h) * :h, 2) AS d1,
+                       power(x - (floor(x / :w) + 0.5) * :w, 2) + power(y - (floor(y / :h) + 0.5) * :h, 2) AS d2
+                FROM ({puntos}) p
+            ) c
+            GROUP BY 1, 2, 3
+        """
+
+    @staticmethod
+    def _centro(forma: str, celda: float, cx: int, cy: int) -> Tuple[float, float]:
+        """Centro UTM de una celda"""
+        if forma == 'grid':
+            return (cx + 0.5) * celda, (cy + 0.5) * celda
+        # Índices en medias celdas de las grillas rectangulares
+        return cx * math.sqrt(3) * celda / 2, cy * 3 * celda / 2
+
+    @staticmethod
+    def _acumular(conteos: Dict[Tuple, List[int]], filas):
+        for cx, cy, periodo, total, suma in filas:
+            conteo = conteos.setdefault((cx, cy, periodo), [0, 0])
+            conteo[0] += total
+            conteo[1] += suma
+
+    @staticmethod
+    def obtener_heatmap(
+        db: Session,
+        forma: str = 'grid',
+        celda: float = 250,
+        periodo: Optional[str] = None,
+        tipo: Optional[str] = None,
+        estado: Optional[str] = None,
+        zona: Optional[str] = None,
+        desde: Optional[datetime] = None,
+        hasta: Optional[datetime] = None
+    ) -> Dict:
+        """
+        Conteo de incidencias por celda
+
+        Args:
+            db: Sesión de base de datos
+            forma: 'grid' (cuadrados de lado celda) o 'hex' (hexágonos de lado celda)
+            celda: Tamaño de celda en metros
+            periodo: Agrupar además por 'dia', 'semana' o 'mes' de reporte
+            tipo, estado, zona: Filtros
+            desde, hasta: Rango de fecha de reporte (UTC)
+
+        Returns:
+            Dict con las celdas (centro lat/lon, total, suma_gravedad, periodo)
+        """
+        condiciones, parametros = "", {"celda": celda}
+        for columna, valor in (("tipo", tipo), ("estado", estado), ("zona", zona)):
+            if valor:
+                condiciones += f" AND {columna} = :{columna}"
+                parametros[columna] = valor
+        if desde:
+            condiciones += " AND reportado_en >= :desde"
+            parametros["desde"] = desde
+        if hasta:
+            condiciones += " AND reportado_en < :hasta"
+            parametros["hasta"] = hasta
+        if forma == 'hex':
+            parametros["w"] = math.sqrt(3) * celda
+            parametros["h"] = 3 * celda
+
+        clave = (forma, celda, periodo, tipo, estado, zona, desde, hasta)
+        sql = HeatmapService._sql_celdas(forma, periodo, condiciones)
+
+        corte = datetime.utcnow() - timedelta(seconds=MARGEN_SEGUNDOS)
+        marca = db.execute(text("SELECT MAX(updated_at) FROM incidencias")).scalar()
+
+        with HeatmapService._lock:
+            agregado = HeatmapService._cache.get(clave)
+
+        completo = (
+            agregado is None
+            or time.monotonic() - agregado.calculado_en > TTL_COMPLETO_SEGUNDOS
+        )
+        if not completo and estado and marca != agregado.marca:
+            # El estado es lo único que cambia en una incidencia: si alguna ya
+            # contada cambió, los conteos filtrados por estado no sirven
+            completo = db.execute(
+                text(
+                    "SELECT EXISTS (SELECT 1 FROM incidencias "
+                    "WHERE reportado_en <= :corte AND updated_at > :marca)"
+                ),
+                {"corte": agregado.corte, "marca": agregado.marca}
+            ).scalar()
+
+        if completo:
+            agregado = _Agregado(calculado_en=time.monotonic())
+            filas = db.execute(
+                text(sql), {**parametros, "corte_desde": _INICIO, "corte_hasta": corte}
+            ).all()
+            HeatmapService._acumular(agregado.conteos, filas)
+        elif corte > agregado.corte:
+            # Incremental: solo las incidencias reportadas desde el último corte
+            filas = db.execute(
+                text(sql), {**parametros, "corte_desde": agregado.corte, "corte_hasta": corte}
+            ).all()
+            agregado = _Agregado(
+                conteos={k: list(v) for k, v in agregado.conteos.items()},
+                calculado_en=agregado.calculado_en
+            )
+            HeatmapService._acumular(agregado.conteos, filas)
+
+        agregado.corte = max(agregado.corte, corte)
+        agregado.marca = marca
+
+        with HeatmapService._lock:
+            HeatmapService._cache[clave] = agregado
+            HeatmapService._cache.move_to_end(clave)
+            while len(HeatmapService._cache) > MAX_ENTRADAS:
+                HeatmapService._cache.popitem(last=False)
+
+        # Lo reportado dentro del margen no se guarda: se suma a una copia
+        conteos = agregado.conteos
+        recientes = db.execute(
+            text(sql), {**parametros, "corte_desde": agregado.corte, "corte_hasta": _FIN}
+        ).all()
+        if recientes:
+            conteos = {k: list(v) for k, v in conteos.items()}
+            HeatmapService._acumular(conteos, recientes)
+
+        return HeatmapService._formatear(conteos, forma, celda, periodo)
+
+    @staticmethod
+    def _formatear(
+        conteos: Dict[Tuple, List[int]],
+        forma: str,
+        celda: float,
+        periodo: Optional[str]
+    ) -> Dict:
+        claves = list(conteos)
+        centros = [HeatmapService._centro(forma, celda, cx, cy) for cx, cy, _ in claves]
+        lons, lats = transformer_to_wgs84().transform(
+            [c[0] for c in centros], [c[1] for c in centros]
+        ) if centros else ([], [])
+
+        celdas = [
+            {
+                "lat": round(lat, 6),
+                "lon": round(lon, 6),
+                "total": conteos[clave][0],
+                "suma_gravedad": conteos[clave][1],
+                "periodo": clave[2]
+            }
+            for clave, lon, lat in zip(claves, lons, lats)
+        ]
+        celdas.sort(key=lambda c: (c["periodo"] or datetime.min, -c["total"]))
+
+        return {
+            "forma": forma,
+            "celda_m": celda,
+            "periodo": periodo,
+            "total": sum(c["total"] for c in celdas),
+            "celdas": celdas
+        }
@@ -2,21 +2,32 @@
 Servicios para gestión de incidencias
 Incluye clasificación automática de zona y cálculo de ventanas de atención
 """
+from sqlalchemy import cast, func
 from sqlalchemy.orm import Session
-from geoalchemy2 import WKTElement
+from geoalchemy2 import WKTElement, Geography
 from datetime import datetime, timedelta
-from typing import List, Optional, Tuple
-import pyproj
-from pyproj import Transformer
+from typing import List, Optional, Tuple, Union
+import math
+from functools import lru_cache
 
 from app.models import Incidencia, Config, RutaGenerada
 from app.schemas.incidencias import IncidenciaCreate, TipoIncidencia
+from app.services.solver_service import TrabajoSolver
 
 
 # Configuración de proyecciones
-# WGS84 -> UTM Zone 17S (Ecuador)
-transformer_to_utm = Transformer.from_crs("EPSG:4326", "EPSG:32717", always_xy=True)
-transformer_to_wgs84 = Transformer.from_crs("EPSG:32717", "EPSG:4326", always_xy=True)
+# WGS84 <-> UTM Zone 17S (Ecuador). pyproj carga la base de datos PROJ al
+# importarse: los transformers se crean en el primer uso, no al arrancar.
+@lru_cache(maxsize=None)
+def transformer_to_utm():
+    from pyproj import Transformer
+    return Transformer.from_crs("EPSG:4326", "EPSG:32717", always_xy=True)
+
+
+@lru_cache(maxsize=None)
+def transformer_to_wgs84():
+    from pyproj import Transformer
+    return Transformer.from_crs("EPSG:32717", "EPSG:4326", always_xy=True)
 
 
 # CONFIGURACIÓN DE COORDENADAS DE LATACUNGA
@@ -89,7 +100,7 @@ class IncidenciaService:
     @staticmethod
     def convertir_a_utm(lon: float, lat: float) -> Tuple[float, float]:
         """Convierte coordenadas WGS84 a UTM Zone 17S (Ecuador)"""
-        easting, northing = transformer_to_utm.transform(lon, lat)
+        easting, northing = transformer_to_utm().transform(lon, lat)
         return easting, northing
 
     @staticmethod
@@ -113,8 +124,9 @@ class IncidenciaService:
     def crear_incidencia(
         db: Session,
         incidencia_data: IncidenciaCreate,
-        generar_ruta_auto: bool = True
-    ) -> Tuple[Incidencia, Optional[RutaGenerada]]:
+        generar_ruta_auto: bool = True,
+        en_segundo_plano: bool = False
+    ) -> Tuple[Incidencia, Optional[Union[RutaGenerada, TrabajoSolver]]]:
         """
         Crea una nueva incidencia con clasificación automática
         y verifica si debe generar ruta automáticamente
@@ -130,9 +142,11 @@ class IncidenciaService:
             db: Sesión de base de datos
             incidencia_data: Datos de la incidencia a crear
             generar_ruta_auto: Si True, verifica umbral y genera ruta automáticamente
+            en_segundo_plano: Si True, la ruta se envía al solver sin esperar
             
         Returns:
-            Tuple[incidencia_creada, ruta_generada_o_None]
+            Tuple[incidencia_creada, ruta_generada_o_None]; con
+            en_segundo_plano, el TrabajoSolver en lugar de la ruta
         """
         # 1. Obtener gravedad según tipo
         gravedad = IncidenciaService.GRAVEDAD_MAP[incidencia_data.tipo]
@@ -208,6 +222,7 @@ class IncidenciaService:
                 # Notificar incidencia crítica si aplica
                 if gravedad >= 5:
                     NotificacionService.notificar_incidencia_critica(
+                        db,
                         incidencia.id,
                         incidencia.tipo,
                         zona,
@@ -215,6 +230,7 @@ class IncidenciaService:
                         incidencia.lat,
                         incidencia.lon
                     )
+                    db.commit()
                 
                 # Evaluar si debemos recalcular
                 debe_recalcular = ruta_service.evaluar_necesidad_recalculo(
@@ -231,7 +247,8 @@ class IncidenciaService:
                     ruta_generada = ruta_service.recalcular_ruta_zona(
                         db,
                         zona,
-                        motivo=f"Nueva incidencia {incidencia.tipo} (gravedad {gravedad})"
+                        motivo=f"Nueva incidencia {incidencia.tipo} (gravedad {gravedad})",
+                        en_segundo_plano=en_segundo_plano
                     )
                 else:
                     logger.info(
@@ -252,22 +269,16 @@ class IncidenciaService:
                         f"Generando ruta automática..."
                     )
                     
-                    ruta_generada = ruta_service.generar_ruta_automatica(db, zona)
+                    if en_segundo_plano:
+                        ruta_generada = ruta_service.generar_en_segundo_plano(db, zona)
+                    else:
+                        ruta_generada = ruta_service.generar_ruta_automatica(db, zona)
                     
-                    if ruta_generada:
+                    if ruta_generada and not en_segundo_plano:
                         logger.info(
                             f"✅ Ruta generada automáticamente: ID={ruta_generada.id}, "
                             f"zona={zona}, camiones={ruta_generada.camiones_usados}"
                         )
-                        
-                        # Notificar nueva ruta
-                        NotificacionService.notificar_nueva_ruta(
-                            ruta_generada.id,
-                            zona,
-                            ruta_generada.camiones_usados,
-                            ruta_generada.suma_gravedad,
-                            es_recalculo=False
-                        )
         
         return incidencia, ruta_generada
 
@@ -294,9 +305,12 @@ class IncidenciaService:
         """Calcula la suma total de gravedad de incidencias validadas en una zona
 
         Solo las incidencias validadas (estado='validada') cuentan para el umbral.
+        Se suma en la base de datos (index-only scan sobre idx_incidencias_validadas).
         """
-        incidencias = IncidenciaService.obtener_incidencias_validadas_por_zona(db, zona)
-        return sum(inc.gravedad for inc in incidencias)
+        return db.query(func.coalesce(func.sum(Incidencia.gravedad), 0)).filter(
+            Incidencia.zona == zona,
+            Incidencia.estado == 'validada'
+        ).scalar()
 
     @staticmethod
     def verificar_umbral_ruta(
@@ -325,14 +339,17 @@ class IncidenciaService:
     def validar_incidencia(
         db: Session,
         incidencia_id: int,
-        generar_ruta_auto: bool = True
-    ) -> Tuple[Incidencia, Optional[RutaGenerada]]:
+        generar_ruta_auto: bool = True,
+        en_segundo_plano: bool = False
+    ) -> Tuple[Incidencia, Optional[Union[RutaGenerada, TrabajoSolver]]]:
         """
         Marca una incidencia como 'validada' (control por administrador)
 
         Si generar_ruta_auto es True, tras validar se verifica el umbral y se
         puede generar una ruta automáticamente (mismo comportamiento que al crear
-        rutas pero solo considerando incidencias validadas).
+        rutas pero solo considerando incidencias validadas). Con
+        en_segundo_plano la ruta se envía al solver sin esperar y se retorna
+        el TrabajoSolver en lugar de la ruta.
         """
         incidencia = db.query(Incidencia).filter(Incidencia.id == incidencia_id).first()
         if not incidencia:
@@ -347,7 +364,6 @@ class IncidenciaService:
         if generar_ruta_auto:
             # Importar aquí para evitar dependencia circular
             from app.services.ruta_service import RutaService
-            from app.services.notificacion_service import NotificacionService
 
             ruta_service = RutaService()
             zona = incidencia.zona
@@ -362,30 +378,18 @@ class IncidenciaService:
                     ruta_generada = ruta_service.recalcular_ruta_zona(
                         db,
                         zona,
-                        motivo=f"Incidencia validada {incidencia.tipo} (gravedad {incidencia.gravedad})"
+                        motivo=f"Incidencia validada {incidencia.tipo} (gravedad {incidencia.gravedad})",
+                        en_segundo_plano=en_segundo_plano
                     )
-                    if ruta_generada:
-                        NotificacionService.notificar_nueva_ruta(
-                            ruta_generada.id,
-                            zona,
-                            ruta_generada.camiones_usados,
-                            ruta_generada.suma_gravedad,
-                            es_recalculo=True
-                        )
             else:
                 # No hay rutas planeadas: verificar umbral con incidencias validadas
                 suma_gravedad = IncidenciaService.calcular_suma_gravedad_zona(db, zona)
                 supera, umbral = ruta_service.verificar_supera_umbral(db, zona, suma_gravedad)
                 if supera:
-                    ruta_generada = ruta_service.generar_ruta_automatica(db, zona)
-                    if ruta_generada:
-                        NotificacionService.notificar_nueva_ruta(
-                            ruta_generada.id,
-                            zona,
-                            ruta_generada.camiones_usados,
-                            ruta_generada.suma_gravedad,
-                            es_recalculo=False
-                        )
+                    if en_segundo_plano:
+                        ruta_generada = ruta_service.generar_en_segundo_plano(db, zona)
+                    else:
+                        ruta_generada = ruta_service.generar_ruta_automatica(db, zona)
 
         return incidencia, ruta_generada
 
@@ -419,3 +423,89 @@ class IncidenciaService:
             "por_tipo": por_tipo,
             "por_zona": por_zona
         }
+
+    @staticmethod
+    def _filtrar(query, estado: Optional[str], tipo: Optional[str], zona: Optional[str]):
+        if estado:
+            query = query.filter(Incidencia.estado == estado)
+        if tipo:
+            query = query.filter(Incidencia.tipo == tipo)
+        if zona:
+            query = query.filter(Incidencia.zona == zona)
+        return query
+
+    @staticmethod
+    def buscar_cercanas(
+        db: Session,
+        columnas: List,
+        lat: float,
+        lon: float,
+        radio_m: float,
+        limite: int = 50,
+        estado: Optional[str] = None,
+        tipo: Optional[str] = None,
+        zona: Optional[str] = None
+    ) -> List:
+        """
+        Incidencias a menos de radio_m metros de un punto, de la más cercana
+        a la más lejana
+        
+        El filtro && con el punto expandido usa el índice GIST de geom; la
+        distancia exacta se verifica en geography y el orden usa KNN (<->).
+        
+        Args:
+            db: Sesión de base de datos
+            columnas: Columnas de Incidencia a devolver
+            lat, lon: Punto de búsqueda
+            radio_m: Radio en metros
+            limite: Máximo de resultados
+            estado, tipo, zona: Filtros opcionales
+            
+        Returns:
+            Filas con las columnas pedidas y distancia_m
+        """
+        punto = func.ST_SetSRID(func.ST_MakePoint(lon, lat), 4326)
+        
+        # Grados que cubren el radio (la longitud se estira con la latitud)
+        grados = radio_m / 111320.0 / max(math.cos(math.radians(lat)), 0.01)
+        
+        query = db.query(
+            *columnas,
+            func.ST_Distance(cast(Incidencia.geom, Geography), cast(punto, Geography)).label("distancia_m")
+        ).filter(
+            Incidencia.geom.op('&&')(func.ST_Expand(punto, grados)),
+            func.ST_DWithin(cast(Incidencia.geom, Geography), cast(punto, Geography), radio_m)
+        )
+        query = IncidenciaService._filtrar(query, estado, tipo, zona)
+        
+        return query.order_by(Incidencia.geom.op('<->')(punto)).limit(limite).all()
+
+    @staticmethod
+    def buscar_en_bbox(
+        db: Session,
+        columnas: List,
+        min_lon: float,
+        min_lat: float,
+        max_lon: float,
+        max_lat: float,
+        limite: int = 500,
+        estado: Optional[str] = None,
+        tipo: Optional[str] = None,
+        zona: Optional[str] = None
+    ) -> List:
+        """
+        Incidencias dentro de un rectángulo (más recientes primero)
+        
+        Args:
+            db: Sesión de base de datos
+            columnas: Columnas de Incidencia a devolver
+            min_lon, min_lat, max_lon, max_lat: Límites en WGS84
+            limite: Máximo de resultados
+            estado, tipo, zona: Filtros opcionales
+        """
+        sobre = func.ST_MakeEnvelope(min_lon, min_lat, max_lon, max_lat, 4326)
+        
+        query = db.query(*columnas).filter(Incidencia.geom.op('&&')(sobre))
+        query = IncidenciaService._filtrar(query, estado, tipo, zona)
+        
+        return query.order_by(Incidencia.reportado_en.desc()).limit(limite).all()
@@ -1,24 +1,71 @@
 """
 Servicio de notificaciones para conductores y supervisores
+Las notificaciones no se envían aquí: se escriben en notificaciones_outbox
+dentro de la transacción del llamador y las entrega el despachador en
+segundo plano (ver despacho_notificaciones)
 """
+import os
 from datetime import datetime
 from typing import List, Dict, Optional
 import logging
 
+from sqlalchemy.orm import Session
+
+from app.models import NotificacionOutbox
+
 logger = logging.getLogger(__name__)
 
 
+# Canales habilitados en este despliegue
+CANALES_ACTIVOS = tuple(
+    c.strip() for c in os.getenv("NOTIFICACIONES_CANALES", "websocket,push,sms").split(",") if c.strip()
+)
+
+# Canales por tipo de notificación
+CANALES_POR_TIPO = {
+    "NUEVA_RUTA": ("websocket", "push"),
+    "RECALCULO_RUTA": ("websocket", "push", "sms"),
+    "RUTA_CANCELADA": ("websocket", "push"),
+    "INCIDENCIA_CRITICA": ("push", "sms"),
+}
+
+
 class NotificacionService:
     """Servicio para gestión de notificaciones"""
     
-    # En producción, esto se integraría con servicios reales como:
-    # - Push notifications (Firebase, OneSignal)
-    # - SMS (Twilio)
-    # - Email (SendGrid)
-    # - WebSocket para actualizaciones en tiempo real
+    @staticmethod
+    def _encolar(
+        db: Session,
+        tipo: str,
+        mensaje: Dict,
+        zona: str,
+        ruta_id: Optional[int] = None,
+        incidencia_id: Optional[int] = None
+    ) -> int:
+        """
+        Agrega la notificación al outbox, una fila por canal
+        
+        No hace commit: la notificación se guarda solo si se confirma la
+        transacción que la origina.
+        
+        Returns:
+            Número de filas encoladas
+        """
+        canales = [c for c in CANALES_POR_TIPO.get(tipo, ()) if c in CANALES_ACTIVOS]
+        for canal in canales:
+            db.add(NotificacionOutbox(
+                tipo=tipo,
+                canal=canal,
+                zona=zona,
+                ruta_id=ruta_id,
+                incidencia_id=incidencia_id,
+                payload=mensaje
+            ))
+        return len(canales)
     
     @staticmethod
     def notificar_nueva_ruta(
+        db: Session,
         ruta_id: int,
         zona: str,
         camiones_usados: int,
@@ -29,6 +76,7 @@ class NotificacionService:
         Notifica a los conductores sobre una nueva ruta asignada
         
         Args:
+            db: Sesión de la transacción que crea la ruta
             ruta_id: ID de la ruta generada
             zona: Zona de la ruta (oriental/occidental)
             camiones_usados: Número de camiones asignados
@@ -56,22 +104,24 @@ class NotificacionService:
             )
         }
         
-        # Simular envío de notificación
+        NotificacionService._encolar(
+            db,
+            "RECALCULO_RUTA" if es_recalculo else "NUEVA_RUTA",
+            mensaje,
+            zona,
+            ruta_id=ruta_id
+        )
+        
         logger.info(
-            f"📢 NOTIFICACIÓN ENVIADA a conductores de zona {zona}: "
+            f"📢 NOTIFICACIÓN ENCOLADA para conductores de zona {zona}: "
             f"{mensaje['mensaje']}"
         )
         
-        # En producción, aquí se enviaría la notificación real
-        # Ejemplo:
-        # - Firebase Cloud Messaging para apps móviles
-        # - WebSocket para dashboard en tiempo real
-        # - SMS para notificaciones críticas
-        
         return mensaje
     
     @staticmethod
     def notificar_ruta_cancelada(
+        db: Session,
         ruta_id: int,
         zona: str,
         motivo: str = "Recálculo por nueva incidencia"
@@ -80,6 +130,7 @@ class NotificacionService:
         Notifica que una ruta planificada fue cancelada/reemplazada
         
         Args:
+            db: Sesión de la transacción que cancela la ruta
             ruta_id: ID de la ruta cancelada
             zona: Zona de la ruta
             motivo: Razón de la cancelación
@@ -104,10 +155,13 @@ class NotificacionService:
             f"Motivo: {motivo}"
         )
         
+        NotificacionService._encolar(db, "RUTA_CANCELADA", mensaje, zona, ruta_id=ruta_id)
+        
         return mensaje
     
     @staticmethod
     def notificar_incidencia_critica(
+        db: Session,
         incidencia_id: int,
         tipo: str,
         zona: str,
@@ -119,6 +173,7 @@ class NotificacionService:
         Notifica sobre una incidencia crítica (alta prioridad)
         
         Args:
+            db: Sesión de base de datos
             incidencia_id: ID de la incidencia
             tipo: Tipo de incidencia
             zona: Zona donde ocurrió
@@ -146,6 +201,9 @@ class NotificacionService:
         }
         
         if es_critica:
+            NotificacionService._encolar(
+                db, "INCIDENCIA_CRITICA", mensaje, zona, incidencia_id=incidencia_id
+            )
             logger.warning(
                 f"🚨 INCIDENCIA CRÍTICA: {tipo} en zona {zona}, "
                 f"gravedad {gravedad}, ID {incidencia_id}"
@@ -158,16 +216,36 @@ class NotificacionService:
         return mensaje
     
     @staticmethod
-    def obtener_historial_notificaciones() -> List[Dict]:
+    def obtener_historial_notificaciones(
+        db: Session,
+        limite: int = 50,
+        offset: int = 0,
+        tipo: Optional[str] = None,
+        estado: Optional[str] = None,
+        ruta_id: Optional[int] = None
+    ) -> List[NotificacionOutbox]:
         """
-        Obtiene el historial de notificaciones enviadas
-        
-        En producción, esto consultaría una tabla de notificaciones en la BD
-        Por ahora retorna un array vacío
+        Obtiene el historial de notificaciones, más recientes primero
         
+        Args:
+            db: Sesión de base de datos
+            limite: Máximo de registros
+            offset: Registros a saltar (paginación)
+            tipo: Filtrar por tipo de notificación
+            estado: Filtrar por estado (pendiente, enviada, fallida)
+            ruta_id: Filtrar por ruta
+            
         Returns:
-            Lista de notificaciones enviadas
+            Lista de notificaciones (una por canal)
         """
-        # En producción, esto consultaría la base de datos
-        # SELECT * FROM notificaciones ORDER BY timestamp DESC
-        return []
+        query = db.query(NotificacionOutbox)
+        if tipo:
+            query = query.filter(NotificacionOutbox.tipo == tipo)
+        if estado:
+            query = query.filter(NotificacionOutbox.estado == estado)
+        if ruta_id is not None:
+            query = query.filter(NotificacionOutbox.ruta_id == ruta_id)
+        
+        return query.order_by(
+            NotificacionOutbox.created_at.desc(), NotificacionOutbox.id.desc()
+        ).offset(offset).limit(limite).all()
@@ -0,0 +1,86 @@
+"""
+Mantenimiento de las particiones mensuales de incidencias y rutas_detalle
+Crea por adelantado las particiones de los próximos meses y separa al
+esquema archivo las de meses viejos que ya no tienen registros activos
+(funciones SQL de la migración 014). Lo ejecuta a diario el job programado
+mantener_particiones.py, fuera de los workers de la API.
+
+Las consultas por estado no acotan la fecha, así que Postgres no poda
+particiones en el plan: lo que mantiene barato recorrerlas es que archivar()
+deje en la tabla principal solo los meses recientes o con registros activos.
+"""
+import os
+import logging
+from typing import Dict, List
+
+from sqlalchemy import text
+
+from app.database import engine
+
+logger = logging.getLogger(__name__)
+
+
+TABLAS_MENSUALES = ('incidencias', 'rutas_detalle')
+
+# Meses que se mantienen en las tablas principales (el actual incluido)
+MESES_CALIENTES = int(os.getenv("PARTICIONES_MESES_CALIENTES", "6"))
+MESES_ADELANTE = int(os.getenv("PARTICIONES_MESES_ADELANTE", "3"))
+
+# Clave del advisory lock: un solo proceso archiva a la vez
+LOCK_ARCHIVO = 703502
+
+
+class ParticionesService:
+    """Servicio de mantenimiento de particiones"""
+
+    @staticmethod
+    def crear_particiones(meses: int = MESES_ADELANTE):
+        """Asegura las particiones del mes actual y los próximos meses"""
+        with engine.begin() as conexion:
+            for tabla in TABLAS_MENSUALES:
+                conexion.execute(
+                    text(
+                        "SELECT crear_particion_mensual(:tabla, "
+                        "(date_trunc('month', CURRENT_DATE) + make_interval(months => m))::date) "
+                        "FROM generate_series(0, :meses) AS m"
+                    ),
+                    {"tabla": tabla, "meses": meses}
+                )
+
+    @staticmethod
+    def archivar(meses_calientes: int = MESES_CALIENTES) -> Dict[str, List[str]]:
+        """
+        Separa al esquema archivo las particiones anteriores a los últimos
+        meses_calientes meses sin registros activos
+
+        Una partición con incidencias sin atender o paradas de rutas sin
+        terminar se mantiene hasta que se cierren.
+
+        Args:
+            meses_calientes: Meses que quedan en las tablas principales
+
+        Returns:
+            Dict tabla -> particiones archivadas (vacío si otro proceso
+            estaba archivando)
+        """
+        if meses_calientes < 1:
+            raise ValueError("Debe quedar al menos el mes actual")
+
+        archivadas: Dict[str, List[str]] = {}
+        with engine.begin() as conexion:
+            adquirido = conexion.execute(
+                text("SELECT pg_try_advisory_xact_lock(:clave)"), {"clave": LOCK_ARCHIVO}
+            ).scalar()
+            if not adquirido:
+                return archivadas
+
+            for tabla in TABLAS_MENSUALES:
+                archivadas[tabla] = list(conexion.execute(
+                    text("SELECT archivar_particiones(:tabla, :meses)"),
+                    {"tabla": tabla, "meses": meses_calientes}
+                ).scalars())
+
+        for tabla, particiones in archivadas.items():
+            if particiones:
+                logger.info(f"Particiones de {tabla} archivadas: {', '.join(particiones)}")
+        return archivadas
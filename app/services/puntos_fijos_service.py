@@ -0,0 +1,151 @@
+"""
+Registro en memoria de puntos fijos (depósitos y botaderos)
+Evita consultar puntos_fijos en cada cálculo de ruta y permite
+trabajar con varios depósitos/botaderos eligiendo el más cercano
+"""
+import os
+import time
+import threading
+import logging
+from typing import List, Tuple, Optional, NamedTuple
+
+import numpy as np
+from sqlalchemy.orm import Session
+
+from app.database import registrar_invalidacion
+from app.models import PuntoFijo
+from app.osrm_service import estimar_tramo
+
+logger = logging.getLogger(__name__)
+
+
+class PuntoFijoInfo(NamedTuple):
+    """Copia inmutable de un PuntoFijo, segura de compartir entre sesiones"""
+    id: int
+    nombre: str
+    tipo: str
+    lat: float
+    lon: float
+
+
+class RegistroPuntosFijos:
+    """
+    Cache de los puntos fijos activos
+
+    Se carga una vez y se invalida cuando una sesión de este proceso
+    inserta, modifica o elimina un PuntoFijo. Como otros workers también
+    pueden modificarlos, además se recarga pasado TTL_SEGUNDOS.
+    """
+
+    TTL_SEGUNDOS = float(os.getenv("PUNTOS_FIJOS_TTL", "300"))
+
+    def __init__(self):
+        self._depositos: List[PuntoFijoInfo] = []
+        self._botaderos: List[PuntoFijoInfo] = []
+        self._cargado_en: Optional[float] = None
+        self._lock = threading.Lock()
+
+    def invalidar(self):
+        """Fuerza la recarga en la próxima consulta"""
+        with self._lock:
+            self._cargado_en = None
+
+    def _asegurar_cargado(self, db: Session):
+        with self._lock:
+            if self._cargado_en is not None and time.monotonic() - self._cargado_en < self.TTL_SEGUNDOS:
+                return
+
+            puntos = db.query(PuntoFijo).filter(PuntoFijo.activo == True).order_by(PuntoFijo.id).all()
+            infos = [PuntoFijoInfo(p.id, p.nombre, p.tipo, p.lat, p.lon) for p in puntos]
+            self._depositos = [p for p in infos if p.tipo == 'deposito']
+            self._botaderos = [p for p in infos if p.tipo == 'botadero']
+            self._cargado_en = time.monotonic()
+
+            logger.info(
+                f"Puntos fijos cargados: {len(self._depositos)} depósitos, "
+                f"{len(self._botaderos)} botaderos"
+            )
+
+    def depositos(self, db: Session) -> List[PuntoFijoInfo]:
+        self._asegurar_cargado(db)
+        return list(self._depositos)
+
+    def botaderos(self, db: Session) -> List[PuntoFijoInfo]:
+        self._asegurar_cargado(db)
+        return list(self._botaderos)
+
+    def obtener(self, db: Session, punto_id: int) -> Optional[PuntoFijoInfo]:
+        """Busca un punto fijo activo por ID"""
+        self._asegurar_cargado(db)
+        for punto in self._depositos + self._botaderos:
+            if punto.id == punto_id:
+                return punto
+        return None
+
+    @staticmethod
+    def _tiempo_minimo(
+        punto: PuntoFijoInfo,
+        coordenadas: List[Tuple[float, float]],
+        desde_punto: bool
+    ) -> float:
+        """
+        Tiempo de viaje (s) entre el punto fijo y la parada más cercana
+
+        Usa el campo precalculado si existe; si no, la estimación en línea recta.
+        """
+        from app.campos_distancia import obtener_campos
+
+        campo = obtener_campos().obtener(punto.id, punto.lon, punto.lat)
+        if campo:
+            _, duraciones = campo.consultar_muchos(np.array(coordenadas))
+            if not np.all(np.isnan(duraciones)):
+                return float(np.nanmin(duraciones))
+
+        origen = (punto.lon, punto.lat)
+        return min(
+            estimar_tramo(origen, c)[1] if desde_punto else estimar_tramo(c, origen)[1]
+            for c in coordenadas
+        )
+
+    def _mas_cercano(
+        self,
+        candidatos: List[PuntoFijoInfo],
+        coordenadas: List[Tuple[float, float]],
+        desde_punto: bool
+    ) -> Optional[PuntoFijoInfo]:
+        if not candidatos:
+            return None
+        if len(candidatos) == 1 or not coordenadas:
+            return candidatos[0]
+        return min(candidatos, key=lambda p: self._tiempo_minimo(p, coordenadas, desde_punto))
+
+    def deposito_mas_cercano(
+        self,
+        db: Session,
+        coordenadas: List[Tuple[float, float]]
+    ) -> Optional[PuntoFijoInfo]:
+        """
+        Depósito con menor tiempo de viaje hacia las paradas de un camión
+
+        Args:
+            db: Sesión de base de datos (solo se usa si hay que recargar)
+            coordenadas: Paradas (lon, lat) del camión
+        """
+        return self._mas_cercano(self.depositos(db), coordenadas, desde_punto=True)
+
+    def botadero_mas_cercano(
+        self,
+        db: Session,
+        coordenadas: List[Tuple[float, float]]
+    ) -> Optional[PuntoFijoInfo]:
+        """
+        Botadero con menor tiempo de viaje desde las paradas de un camión
+        """
+        return self._mas_cercano(self.botaderos(db), coordenadas, desde_punto=False)
+
+
+# Registro compartido del proceso
+registro_puntos_fijos = RegistroPuntosFijos()
+
+
+registrar_invalidacion((PuntoFijo,), registro_puntos_fijos.invalidar)
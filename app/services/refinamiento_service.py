@@ -0,0 +1,103 @@
+"""
+Refinamiento de rutas generadas en modo degradado
+Las rutas creadas con OSRM caído usan tramos y geometría en línea recta
+(requiere_refinamiento). Un hilo por proceso las recalcula en cuanto el
+circuit breaker de OSRM de ese proceso vuelve a cerrarse y, por si la
+recuperación la observó otro worker, cada INTERVALO_REFINAMIENTO segundos.
+"""
+import os
+import logging
+import threading
+from typing import Optional
+
+from sqlalchemy import text
+
+from app.database import SessionLocal, engine
+from app.osrm_service import obtener_osrm_service
+
+logger = logging.getLogger(__name__)
+
+
+INTERVALO_REFINAMIENTO = float(os.getenv("REFINAMIENTO_INTERVALO", "300"))
+
+# Clave del advisory lock: un solo worker refina a la vez
+LOCK_REFINAMIENTO = 703503
+
+
+class RefinadorRutas:
+    """Hilo que refina las rutas planeadas con requiere_refinamiento"""
+
+    def __init__(self):
+        self._detener = threading.Event()
+        self._despertar = threading.Event()
+        self._hilo: Optional[threading.Thread] = None
+
+    def iniciar(self):
+        if self._hilo and self._hilo.is_alive():
+            return
+        obtener_osrm_service().breaker.al_cerrar(self.despertar)
+        self._detener.clear()
+        self._hilo = threading.Thread(target=self._bucle, name="refinamiento-rutas", daemon=True)
+        self._hilo.start()
+        logger.info("Refinador de rutas iniciado")
+
+    def detener(self):
+        self._detener.set()
+        self._despertar.set()
+        if self._hilo:
+            self._hilo.join(timeout=5)
+
+    def despertar(self):
+        self._despertar.set()
+
+    def _bucle(self):
+        while not self._detener.is_set():
+            self._despertar.wait(INTERVALO_REFINAMIENTO)
+            self._despertar.clear()
+            if self._detener.is_set():
+                break
+            try:
+                self.ejecutar()
+            except Exception as e:
+                logger.error(f"Error en refinador de rutas: {e}")
+
+    def ejecutar(self) -> int:
+        """
+        Refina las rutas pendientes si OSRM está disponible
+
+        Returns:
+            Número de rutas refinadas (0 si otro worker está refinando)
+        """
+        from app.services.ruta_service import RutaService
+
+        osrm = obtener_osrm_service()
+        if not osrm.disponible:
+            return 0
+
+        # Conexión dedicada: el advisory lock es de sesión y refinar_ruta
+        # confirma una transacción por ruta
+        conexion = engine.connect()
+        db = SessionLocal(bind=conexion)
+        try:
+            adquirido = db.execute(
+                text("SELECT pg_try_advisory_lock(:clave)"), {"clave": LOCK_REFINAMIENTO}
+            ).scalar()
+            if not adquirido:
+                return 0
+            try:
+                refinadas = RutaService(osrm).refinar_rutas_pendientes(db)
+            finally:
+                db.rollback()
+                db.execute(text("SELECT pg_advisory_unlock(:clave)"), {"clave": LOCK_REFINAMIENTO})
+                db.commit()
+        finally:
+            db.close()
+            conexion.close()
+
+        if refinadas:
+            logger.info(f"{refinadas} rutas refinadas con OSRM")
+        return refinadas
+
+
+# Refinador del proceso actual
+refinador_rutas = RefinadorRutas()
@@ -2,17 +2,29 @@
 Servicio para generación automática de rutas optimizadas
 Gestiona la activación por umbral y asignación de camiones
 """
+from sqlalchemy import func, select
 from sqlalchemy.orm import Session
 from datetime import datetime, timedelta
-from typing import List, Dict, Optional, Tuple
+from typing import List, Dict, Optional, Tuple, Union
 import logging
 
+import numpy as np
+from geoalchemy2 import WKTElement
+
+from app.database import SessionLocal
 from app.models import (
-    Incidencia, RutaGenerada, RutaDetalle, 
-    PuntoFijo, Config
+    Incidencia, RutaGenerada, RutaDetalle, RutaGeometria, Config, AsignacionConductor
 )
-from app.osrm_service import OSRMService
+from app.osrm_service import OSRMService, obtener_osrm_service
+from app.matriz_osrm import ConstructorMatrizOSRM, MatrizRuteo
+from app.solver_vrp import asignar_viajes
+from app.campos_distancia import obtener_campos
+from app.services.puntos_fijos_service import registro_puntos_fijos, PuntoFijoInfo
+from app.services.flota_service import registro_flota
+from app.services.trafico_service import registro_perfiles, ZONAS
+from app.services.eta_service import EtaService
 from app.services.notificacion_service import NotificacionService
+from app.services.solver_service import pool_solver, TrabajoSolver
 
 logger = logging.getLogger(__name__)
 
@@ -27,8 +39,15 @@ class RutaService:
     # Umbral por defecto si no está configurado
     UMBRAL_DEFAULT = 20
     
+    # Flota por defecto si no está configurada (claves flota_posterior / flota_lateral)
+    FLOTA_DEFAULT = {"posterior": 1, "lateral": 2}
+    
+    # Viajes por camión y turno (clave max_viajes_por_camion)
+    MAX_VIAJES_DEFAULT = 3
+    
     def __init__(self, osrm_service: Optional[OSRMService] = None):
-        self.osrm = osrm_service or OSRMService()
+        # Cliente compartido: reutiliza las conexiones keep-alive a OSRM
+        self.osrm = osrm_service or obtener_osrm_service()
     
     @staticmethod
     def obtener_umbral(db: Session) -> int:
@@ -65,188 +84,449 @@ class RutaService:
         
         return supera, umbral
     
+    @staticmethod
+    def _obtener_config_int(db: Session, clave: str, default: int) -> int:
+        """Obtiene un entero de la tabla config, con valor por defecto"""
+        config = db.query(Config).filter(Config.clave == clave).first()
+        if config:
+            return int(config.get_valor_convertido())
+        return default
+    
+    def obtener_flota(self, db: Session, zona: Optional[str] = None) -> List[Dict]:
+        """
+        Camiones disponibles para planificar, mayor capacidad primero
+        
+        Usa la tabla camiones (excluyendo los que están en taller o en otra
+        ruta activa). Si la flota aún no está registrada, recurre a las
+        claves flota_posterior / flota_lateral con las capacidades por defecto.
+        
+        Args:
+            db: Sesión de base de datos
+            zona: Zona que se planifica; limita la flota a la clave
+                flota_cupo_<zona> (por defecto, la parte de la flota
+                operativa que le corresponde)
+        
+        Returns:
+            Lista de dicts {"tipo", "capacidad", "placa", "deposito_id"}
+        """
+        camiones = registro_flota.todos(db)
+        if camiones:
+            cupo = None
+            if zona is not None:
+                operativos = sum(1 for c in camiones if c.estado == 'disponible')
+                cupo = self._obtener_config_int(
+                    db, f"flota_cupo_{zona}", -(-operativos // len(ZONAS))
+                )
+            return [
+                {
+                    "tipo": c.tipo,
+                    "capacidad": c.capacidad,
+                    "placa": c.placa,
+                    "deposito_id": c.deposito_id
+                }
+                for c in registro_flota.disponibles(db, zona=zona, cupo=cupo)
+            ]
+        
+        flota = []
+        for tipo, capacidad in (
+            ("posterior", RutaService.CAPACIDAD_POSTERIOR),
+            ("lateral", RutaService.CAPACIDAD_LATERAL)
+        ):
+            cantidad = self._obtener_config_int(
+                db, f"flota_{tipo}", RutaService.FLOTA_DEFAULT[tipo]
+            )
+            flota.extend(
+                {"tipo": tipo, "capacidad": capacidad, "placa": None, "deposito_id": None}
+                for _ in range(cantidad)
+            )
+        return flota
+    
     def asignar_camiones(
         self,
-        incidencias: List[Incidencia]
-    ) -> List[Dict]:
+        incidencias: List[Incidencia],
+        flota: Optional[List[Dict]] = None,
+        max_viajes: int = MAX_VIAJES_DEFAULT
+    ) -> Tuple[List[Dict], List[Incidencia]]:
         """
-        Asigna camiones según capacidad y gravedad de incidencias
+        Asigna incidencias a los viajes de cada camión según capacidad
         
         Estrategia:
         1. Ordenar incidencias por gravedad (descendente)
-        2. Usar posterior primero (mayor capacidad)
-        3. Si excede capacidad, usar lateral adicional
+        2. Llenar el viaje abierto de los camiones en uso (posterior primero)
+        3. Si no cabe, sacar otro camión de la flota con capacidad suficiente
+        4. Si no quedan camiones, abrir un nuevo viaje (tras descargar en el
+           botadero) en el camión con menos viajes, hasta max_viajes
         
         Args:
             incidencias: Lista de incidencias pendientes
+            flota: Camiones disponibles [{"tipo", "capacidad", "placa", ...}]
+                (por defecto FLOTA_DEFAULT sin placas)
+            max_viajes: Viajes máximos por camión en un turno
             
         Returns:
-            Lista de dicts con asignaciones: 
-            [{"tipo": "posterior", "incidencias": [...], "carga": 15}, ...]
-        """
-        # Ordenar por gravedad descendente (más urgentes primero)
-        incidencias_ordenadas = sorted(
-            incidencias, 
-            key=lambda x: x.gravedad, 
-            reverse=True
-        )
-        
-        camiones = []
+            Tuple[camiones, incidencias_sin_asignar] donde cada camión es:
+            {"tipo": "posterior", "capacidad": 25, "carga": 25,
+             "incidencias": [...], "viajes": [{"incidencias": [...], "carga": 25}, ...]}
+        """
+        if flota is None:
+            flota = [
+                {"tipo": tipo, "capacidad": capacidad, "placa": None, "deposito_id": None}
+                for tipo, capacidad in (
+                    ("posterior", RutaService.CAPACIDAD_POSTERIOR),
+                    ("lateral", RutaService.CAPACIDAD_LATERAL)
+                )
+                for _ in range(RutaService.FLOTA_DEFAULT[tipo])
+            ]
         
-        # Intentar usar posterior primero
-        carga_actual = 0
-        camion_actual = {
-            "tipo": "posterior",
-            "incidencias": [],
-            "carga": 0
-        }
+        viajes, indices_sin_asignar = asignar_viajes(
+            [inc.gravedad for inc in incidencias],
+            [c["capacidad"] for c in flota],
+            max_viajes
+        )
         
-        for inc in incidencias_ordenadas:
-            # Si cabe en el camión actual
-            if carga_actual + inc.gravedad <= RutaService.CAPACIDAD_POSTERIOR:
-                camion_actual["incidencias"].append(inc)
-                carga_actual += inc.gravedad
-                camion_actual["carga"] = carga_actual
-            else:
-                # Guardar camión actual si tiene incidencias
-                if camion_actual["incidencias"]:
-                    camiones.append(camion_actual)
-                
-                # Crear nuevo camión lateral (menor capacidad)
-                carga_actual = inc.gravedad
-                camion_actual = {
-                    "tipo": "lateral",
-                    "incidencias": [inc],
-                    "carga": carga_actual
+        camiones = [
+            dict(c, viajes=[
+                {
+                    "incidencias": [incidencias[i] for i in viaje],
+                    "carga": sum(incidencias[i].gravedad for i in viaje)
                 }
+                for viaje in viajes_camion
+            ])
+            for c, viajes_camion in zip(flota, viajes)
+        ]
+        sin_asignar = [incidencias[i] for i in indices_sin_asignar]
         
-        # Agregar último camión
-        if camion_actual["incidencias"]:
-            camiones.append(camion_actual)
+        camiones = [c for c in camiones if c["viajes"]]
+        for camion in camiones:
+            camion["incidencias"] = [inc for v in camion["viajes"] for inc in v["incidencias"]]
+            camion["carga"] = max(v["carga"] for v in camion["viajes"])
         
         logger.info(
             f"Asignación de camiones: {len(camiones)} camiones "
             f"({sum(1 for c in camiones if c['tipo']=='posterior')} posterior, "
-            f"{sum(1 for c in camiones if c['tipo']=='lateral')} lateral)"
+            f"{sum(1 for c in camiones if c['tipo']=='lateral')} lateral), "
+            f"{sum(len(c['viajes']) for c in camiones)} viajes"
         )
         
-        return camiones
+        if sin_asignar:
+            logger.warning(
+                f"Flota insuficiente: {len(sin_asignar)} incidencias quedan "
+                f"validadas para la siguiente ruta"
+            )
+        
+        return camiones, sin_asignar
+    
+    def _ordenar_viaje(
+        self,
+        inicio: Tuple[float, float],
+        incidencias: List[Incidencia],
+        fin: Tuple[float, float]
+    ) -> List[Incidencia]:
+        """
+        Ordena las incidencias de un viaje con el TSP de OSRM
+        (inicio fijo, fin fijo); si no es posible, conserva el orden dado
+        """
+        if len(incidencias) <= 2 or not self.osrm.disponible:
+            return list(incidencias)
+        
+        coords = [inicio] + [(inc.lon, inc.lat) for inc in incidencias] + [fin]
+        resultado_tsp = self.osrm.optimize_trip(
+            coords,
+            source="first",  # Empezar en depósito/botadero
+            destination="last",  # Terminar en botadero
+            roundtrip=False
+        )
+        
+        if not resultado_tsp:
+            logger.warning("No se pudo optimizar con TSP, usando orden original")
+            return list(incidencias)
+        
+        # waypoint_order[i] = posición del punto de entrada i dentro del trip
+        posiciones = resultado_tsp["waypoint_order"][1:-1]
+        return [inc for _, inc in sorted(zip(posiciones, incidencias), key=lambda par: par[0])]
     
     def calcular_ruta_optima(
         self,
         db: Session,
         camion: Dict,
-        zona: str
+        zona: str,
+        matriz: Optional[MatrizRuteo] = None
     ) -> Optional[Dict]:
         """
         Calcula la ruta óptima para un camión
         
-        Secuencia: Depósito -> Incidencias (optimizadas) -> Botadero
+        Secuencia: Depósito -> Incidencias viaje 1 -> Botadero
+                   -> Incidencias viaje 2 -> Botadero -> ...
         
         Args:
             db: Sesión de base de datos
-            camion: Dict con tipo e incidencias asignadas
+            camion: Dict con tipo y viajes asignados. Con "ordenado": True
+                se respeta el orden de cada viaje (ya optimizado por el
+                solver) y "botadero_id" fija el botadero
             zona: Zona de la ruta
+            matriz: Sub-matriz del camión (ver _submatriz_camion); en modo
+                degradado sus tramos reemplazan la estimación en línea recta
             
         Returns:
-            Dict con información de la ruta calculada
+            Dict con información de la ruta calculada, incluida la secuencia
+            de paradas [{"tipo_punto", "lon", "lat", "incidencia", "viaje"}]
         """
-        # Obtener puntos fijos
-        deposito = db.query(PuntoFijo).filter(
-            PuntoFijo.tipo == 'deposito',
-            PuntoFijo.activo == True
-        ).first()
+        incidencias_coords = [
+            (inc.lon, inc.lat) for inc in camion["incidencias"]
+        ]
         
-        botadero = db.query(PuntoFijo).filter(
-            PuntoFijo.tipo == 'botadero',
-            PuntoFijo.activo == True
-        ).first()
+        # Obtener puntos fijos (desde el registro en memoria): el depósito
+        # base del camión, o el más cercano si no tiene uno asignado
+        deposito = None
+        if camion.get("deposito_id"):
+            deposito = registro_puntos_fijos.obtener(db, camion["deposito_id"])
+        if not deposito:
+            deposito = registro_puntos_fijos.deposito_mas_cercano(db, incidencias_coords)
+        botadero = None
+        if camion.get("botadero_id"):
+            botadero = registro_puntos_fijos.obtener(db, camion["botadero_id"])
+        if not botadero:
+            botadero = registro_puntos_fijos.botadero_mas_cercano(db, incidencias_coords)
         
         if not deposito or not botadero:
             logger.error("No se encontraron depósito o botadero activos")
             return None
         
-        # Construir lista de coordenadas
-        # Inicio: depósito
-        coordenadas = [(deposito.lon, deposito.lat)]
+        logger.info(f"Calculando ruta: depósito={deposito.lon},{deposito.lat}, "
+                   f"incidencias={len(incidencias_coords)}, viajes={len(camion['viajes'])}, "
+                   f"botadero={botadero.lon},{botadero.lat}")
         
-        # Incidencias (usar OSRM optimize si hay más de 2)
-        incidencias_coords = [
-            (inc.lon, inc.lat) for inc in camion["incidencias"]
-        ]
+        # Construir secuencia de paradas, optimizando el orden de cada viaje
+        secuencia = [{
+            "tipo_punto": "deposito", "lon": deposito.lon, "lat": deposito.lat,
+            "incidencia": None, "viaje": 1
+        }]
+        inicio = (deposito.lon, deposito.lat)
+        fin = (botadero.lon, botadero.lat)
         
-        logger.info(f"Calculando ruta: depósito={deposito.lon},{deposito.lat}, "
-                   f"incidencias={len(incidencias_coords)}, botadero={botadero.lon},{botadero.lat}")
-        
-        if len(incidencias_coords) > 2:
-            # Optimizar orden de visita con TSP
-            todas_coords = [(deposito.lon, deposito.lat)] + incidencias_coords + [(botadero.lon, botadero.lat)]
-            resultado_tsp = self.osrm.optimize_trip(
-                todas_coords,
-                source="first",  # Empezar en depósito
-                destination="last",  # Terminar en botadero
-                roundtrip=False
-            )
-            
-            if resultado_tsp:
-                # OSRM optimize_trip ya retorna la ruta completa
-                # Usar los datos directamente
-                coordenadas = todas_coords  # Usar coordenadas originales en orden dado
-                # No necesitamos reorganizar porque OSRM trip ya lo hace
-                logger.info(f"Ruta optimizada con TSP: {len(coordenadas)} puntos")
+        for num_viaje, viaje in enumerate(camion["viajes"], 1):
+            if camion.get("ordenado"):
+                paradas = viaje["incidencias"]
             else:
-                # Fallback: usar orden original
-                coordenadas.extend(incidencias_coords)
-                coordenadas.append((botadero.lon, botadero.lat))
-                logger.warning("No se pudo optimizar con TSP, usando orden original")
-        else:
-            # Pocas incidencias, usar orden directo
-            coordenadas.extend(incidencias_coords)
-            coordenadas.append((botadero.lon, botadero.lat))
-            logger.info(f"Orden directo: {len(coordenadas)} puntos")
+                paradas = self._ordenar_viaje(inicio, viaje["incidencias"], fin)
+            for inc in paradas:
+                secuencia.append({
+                    "tipo_punto": "incidencia", "lon": inc.lon, "lat": inc.lat,
+                    "incidencia": inc, "viaje": num_viaje
+                })
+            secuencia.append({
+                "tipo_punto": "botadero", "lon": botadero.lon, "lat": botadero.lat,
+                "incidencia": None, "viaje": num_viaje
+            })
+            # El siguiente viaje sale del botadero tras descargar
+            inicio = fin
+        
+        coordenadas = [(p["lon"], p["lat"]) for p in secuencia]
         
         # Calcular ruta final
         ruta = self.osrm.calculate_route(coordenadas)
         
+        if not ruta:
+            # Modo degradado: OSRM caído o circuit breaker abierto
+            logger.warning(
+                "OSRM no disponible, estimando ruta en línea recta "
+                "(la ruta quedará marcada para refinamiento)"
+            )
+            ruta = self.osrm.estimate_route(coordenadas)
+            if ruta and matriz is not None:
+                self._tramos_desde_matriz(ruta, matriz, secuencia, deposito, botadero)
+            elif ruta:
+                self._ajustar_tramos_fijos(ruta, coordenadas, deposito, botadero)
+        
         if not ruta:
             logger.error("Error al calcular ruta con OSRM")
             return None
         
         return {
             "coordenadas": coordenadas,
+            "secuencia": secuencia,
             "distancia": ruta["distance"],  # metros
             "duracion": ruta["duration"],   # segundos
             "geometria": ruta["geometry"],
+            "legs": ruta["legs"],
             "deposito": deposito,
-            "botadero": botadero
+            "botadero": botadero,
+            "estimada": ruta.get("estimada", False)
         }
     
-    def generar_ruta_automatica(
+    @staticmethod
+    def _tramos_desde_matriz(
+        ruta: Dict,
+        matriz: MatrizRuteo,
+        secuencia: List[Dict],
+        deposito: PuntoFijoInfo,
+        botadero: PuntoFijoInfo
+    ):
+        """
+        Reemplaza los tramos de una ruta estimada por los de la matriz con
+        la que se resolvió la zona (OSRM y campos precalculados)
+        """
+        claves = [
+            MatrizRuteo.clave_incidencia(p["incidencia"].id) if p["incidencia"] is not None
+            else MatrizRuteo.clave_punto_fijo(deposito.id if p["tipo_punto"] == 'deposito' else botadero.id)
+            for p in secuencia
+        ]
+        distancias, duraciones = matriz.secuencia(claves)
+        ruta["legs"] = [
+            {"distance": float(d), "duration": float(t)}
+            for d, t in zip(distancias, duraciones)
+        ]
+        ruta["distance"] = sum(leg["distance"] for leg in ruta["legs"])
+        ruta["duration"] = sum(leg["duration"] for leg in ruta["legs"])
+    
+    @staticmethod
+    def _submatriz_camion(matriz: MatrizRuteo, camion: Dict) -> MatrizRuteo:
+        """Sub-matriz con el depósito, el botadero y las paradas de un camión"""
+        return matriz.submatriz(
+            [MatrizRuteo.clave_punto_fijo(camion["deposito_id"])]
+            + [MatrizRuteo.clave_incidencia(inc.id) for inc in camion["incidencias"]]
+            + [MatrizRuteo.clave_punto_fijo(camion["botadero_id"])]
+        )
+    
+    @staticmethod
+    def _ajustar_tramos_fijos(
+        ruta: Dict,
+        coordenadas: List[Tuple[float, float]],
+        deposito: PuntoFijoInfo,
+        botadero: PuntoFijoInfo
+    ):
+        """
+        Reemplaza los tramos depósito -> primera parada y última parada ->
+        botadero de una ruta estimada por los valores de los campos
+        precalculados, que sí siguen la red vial
+        """
+        campos = obtener_campos()
+        legs = ruta["legs"]
+        
+        campo_deposito = campos.obtener(deposito.id, deposito.lon, deposito.lat)
+        if campo_deposito:
+            tramo = campo_deposito.consultar(*coordenadas[1])
+            if tramo:
+                legs[0] = {"distance": tramo[0], "duration": tramo[1]}
+        
+        campo_botadero = campos.obtener(botadero.id, botadero.lon, botadero.lat)
+        if campo_botadero:
+            tramo = campo_botadero.consultar(*coordenadas[-2])
+            if tramo:
+                legs[-1] = {"distance": tramo[0], "duration": tramo[1]}
+        
+        ruta["distance"] = sum(leg["distance"] for leg in legs)
+        ruta["duration"] = sum(leg["duration"] for leg in legs)
+    
+    @staticmethod
+    def _ventana_relativa(incidencia: Incidencia, salida: datetime) -> Optional[List[int]]:
+        """Ventana de atención en segundos desde la salida (None si no tiene)"""
+        if incidencia.ventana_fin is None:
+            return None
+        inicio = incidencia.ventana_inicio or salida
+        return [
+            int((inicio - salida).total_seconds()),
+            int((incidencia.ventana_fin - salida).total_seconds())
+        ]
+    
+    def _matriz_zona(
         self,
-        db: Session,
-        zona: str
-    ) -> Optional[RutaGenerada]:
+        fijos: List[PuntoFijoInfo],
+        incidencias: List[Incidencia]
+    ) -> MatrizRuteo:
         """
-        Genera automáticamente una ruta óptima para una zona
+        Matriz de ruteo (flujo libre) de los puntos fijos y las incidencias
         
-        Proceso:
-        1. Obtener incidencias pendientes de la zona
-        2. Calcular suma de gravedad
-        3. Asignar camiones según capacidad
-        4. Calcular rutas óptimas para cada camión
-        5. Crear registros en base de datos
-        6. Actualizar estado de incidencias a 'asignada'
+        A OSRM solo se le piden los pares incidencia x incidencia. Las filas
+        y columnas de los puntos fijos salen de los campos precalculados
+        (depósito -> celda, celda -> botadero); el sentido contrario, que el
+        solver solo usa para salir del botadero hacia el siguiente viaje, se
+        aproxima con el mismo valor. Si un punto fijo no tiene campo vigente
+        o alguna incidencia cae fuera de su grilla, su fila y su columna se
+        piden a OSRM.
+        
+        Returns:
+            MatrizRuteo con los puntos fijos primero y luego las incidencias
+        """
+        n_fijos = len(fijos)
+        claves = (
+            [MatrizRuteo.clave_punto_fijo(p.id) for p in fijos]
+            + [MatrizRuteo.clave_incidencia(inc.id) for inc in incidencias]
+        )
+        coords = np.array(
+            [(p.lon, p.lat) for p in fijos] + [(inc.lon, inc.lat) for inc in incidencias],
+            dtype=np.float64
+        )
+        n = len(claves)
+        distancias = np.full((n, n), np.nan, dtype=np.float32)
+        duraciones = np.full((n, n), np.nan, dtype=np.float32)
+        
+        constructor = ConstructorMatrizOSRM(self.osrm)
+        coords_inc = [tuple(c) for c in coords[n_fijos:]]
+        interna = constructor.construir(coords_inc)
+        distancias[n_fijos:, n_fijos:] = interna["distances"]
+        duraciones[n_fijos:, n_fijos:] = interna["durations"]
+        estimada = interna["estimada"]
+        
+        # Puntos fijos desde los campos: primero el sentido aproximado y
+        # luego el exacto de cada campo, que prevalece
+        campos = obtener_campos()
+        consultas = {}
+        sin_campo = []
+        for k, punto in enumerate(fijos):
+            campo = campos.obtener(punto.id, punto.lon, punto.lat)
+            if campo is None:
+                sin_campo.append(k)
+                continue
+            dist, dur = campo.consultar_muchos(coords)
+            if np.isnan(dur).any():
+                sin_campo.append(k)
+                continue
+            consultas[k] = (campo.tipo, dist, dur)
+        
+        for k, (_, dist, dur) in consultas.items():
+            distancias[k, :], duraciones[k, :] = dist, dur
+            distancias[:, k], duraciones[:, k] = dist, dur
+        for k, (tipo, dist, dur) in consultas.items():
+            if tipo == 'botadero':
+                distancias[:, k], duraciones[:, k] = dist, dur
+            else:
+                distancias[k, :], duraciones[k, :] = dist, dur
+        
+        if sin_campo:
+            logger.info(f"{len(sin_campo)} puntos fijos sin campo vigente, se piden a OSRM")
+            coords_fijos = [tuple(coords[k]) for k in sin_campo]
+            todas = [tuple(c) for c in coords]
+            filas = constructor.construir(coords_fijos, todas)
+            columnas = constructor.construir(todas, coords_fijos)
+            distancias[sin_campo, :], duraciones[sin_campo, :] = filas["distances"], filas["durations"]
+            distancias[:, sin_campo], duraciones[:, sin_campo] = columnas["distances"], columnas["durations"]
+            estimada = estimada or filas["estimada"] or columnas["estimada"]
+        
+        np.fill_diagonal(distancias, 0)
+        np.fill_diagonal(duraciones, 0)
+        return MatrizRuteo(distancias, duraciones, claves, estimada=estimada)
+    
+    def preparar_problema(self, db: Session, zona: str) -> Optional[Dict]:
+        """
+        Arma el problema de ruteo de una zona para el solver
+        
+        Lee las incidencias validadas, la flota y los puntos fijos, y
+        construye la matriz de duraciones (OSRM, o línea recta donde no
+        responda) con el factor de tráfico de la hora de salida. Cada camión
+        sale de su depósito base, o del más cercano a la zona. Los tramos
+        de los puntos fijos salen de los campos precalculados (_matriz_zona).
         
         Args:
             db: Sesión de base de datos
-            zona: Zona para generar ruta ('oriental' o 'occidental')
+            zona: Zona de la ruta
             
         Returns:
-            RutaGenerada creada o None si hay error
+            Plan {"problema", "matriz", "flota", "salida", "factor_trafico",
+            "suma_gravedad", "total_incidencias"} o None si no hay
+            incidencias, camiones o puntos fijos
         """
-        logger.info(f"Iniciando generación automática de ruta para zona {zona}")
-        
-        # 1. Obtener incidencias validadas (listas para asignar a rutas)
+        # Incidencias validadas (listas para asignar a rutas)
         incidencias = db.query(Incidencia).filter(
             Incidencia.zona == zona,
             Incidencia.estado == 'validada'
@@ -256,12 +536,298 @@ class RutaService:
             logger.warning(f"No hay incidencias validadas en zona {zona}")
             return None
         
-        # 2. Calcular suma de gravedad
         suma_gravedad = sum(inc.gravedad for inc in incidencias)
         logger.info(f"Suma de gravedad en zona {zona}: {suma_gravedad}")
         
-        # 3. Asignar camiones
-        asignacion_camiones = self.asignar_camiones(incidencias)
+        flota = self.obtener_flota(db, zona)
+        if not flota:
+            logger.warning(f"Sin camiones disponibles para la zona {zona}")
+            return None
+        
+        max_viajes = self._obtener_config_int(
+            db, 'max_viajes_por_camion', RutaService.MAX_VIAJES_DEFAULT
+        )
+        
+        coords = [(inc.lon, inc.lat) for inc in incidencias]
+        botadero = registro_puntos_fijos.botadero_mas_cercano(db, coords)
+        deposito_zona = registro_puntos_fijos.deposito_mas_cercano(db, coords)
+        depositos = [
+            (registro_puntos_fijos.obtener(db, c["deposito_id"]) if c.get("deposito_id") else None)
+            or deposito_zona
+            for c in flota
+        ]
+        
+        if not botadero or not all(depositos):
+            logger.error("No se encontraron depósito o botadero activos")
+            return None
+        
+        # Perfil de tráfico para la hora de salida (OSRM da flujo libre)
+        salida = datetime.utcnow()
+        factor_trafico = registro_perfiles.factor(db, zona, salida)
+        
+        # Nodos: puntos fijos primero, luego las incidencias en su orden
+        fijos = list({p.id: p for p in depositos + [botadero]}.values())
+        matriz = self._matriz_zona(fijos, incidencias)
+        nodo = matriz.indice
+        
+        problema = {
+            "duraciones": matriz.con_factor(factor_trafico).duraciones,
+            "fijos": len(fijos),
+            "incidencias": [inc.id for inc in incidencias],
+            "demandas": [inc.gravedad for inc in incidencias],
+            "servicios": [
+                int(EtaService.tiempo_servicio('incidencia', inc.tipo).total_seconds())
+                for inc in incidencias
+            ],
+            "ventanas": [self._ventana_relativa(inc, salida) for inc in incidencias],
+            "camiones": [
+                {
+                    "capacidad": c["capacidad"],
+                    "deposito": nodo[MatrizRuteo.clave_punto_fijo(deposito.id)]
+                }
+                for c, deposito in zip(flota, depositos)
+            ],
+            "botadero": nodo[MatrizRuteo.clave_punto_fijo(botadero.id)],
+            "servicio_deposito": int(EtaService.tiempo_servicio('deposito').total_seconds()),
+            "servicio_botadero": int(EtaService.tiempo_servicio('botadero').total_seconds()),
+            "max_viajes": max_viajes
+        }
+        
+        return {
+            "problema": problema,
+            # Matriz en flujo libre: guardar_solucion toma de ella la
+            # sub-matriz de cada camión para los tramos en modo degradado
+            "matriz": matriz,
+            # El orden de los viajes lo fija el solver con estos puntos fijos
+            "flota": [
+                dict(c, deposito_id=deposito.id, botadero_id=botadero.id, ordenado=True)
+                for c, deposito in zip(flota, depositos)
+            ],
+            "salida": salida,
+            "factor_trafico": factor_trafico,
+            "suma_gravedad": suma_gravedad,
+            "total_incidencias": len(incidencias)
+        }
+    
+    def generar_ruta_automatica(
+        self,
+        db: Session,
+        zona: str,
+        es_recalculo: bool = False
+    ) -> Optional[RutaGenerada]:
+        """
+        Genera una ruta óptima para una zona esperando al solver
+        
+        Proceso:
+        1. Armar el problema: incidencias validadas, flota, puntos fijos y matriz
+        2. Resolver el reparto en viajes y el orden de paradas en el pool
+           de procesos del solver
+        3. Crear registros en base de datos (guardar_solucion)
+        
+        El hilo que llama queda bloqueado hasta la solución, aunque el
+        cálculo corre en otro proceso. Si el trabajo vence, falla o se
+        cancela no se resuelve en el proceso de la API: retorna None. Para
+        no esperar, generar_en_segundo_plano.
+        
+        Args:
+            db: Sesión de base de datos
+            zona: Zona para generar ruta ('oriental' o 'occidental')
+            es_recalculo: True si reemplaza rutas planeadas de la zona
+            
+        Returns:
+            RutaGenerada creada o None si hay error
+        """
+        logger.info(f"Iniciando generación automática de ruta para zona {zona}")
+        
+        plan = self.preparar_problema(db, zona)
+        if plan is None:
+            return None
+        
+        trabajo = pool_solver.enviar(zona, plan["problema"])
+        ruta_generada = None
+        try:
+            solucion = trabajo.esperar()
+            if solucion is None:
+                logger.warning(
+                    f"Solver sin resultado para zona {zona} (trabajo {trabajo.id}: {trabajo.estado})"
+                )
+                return None
+            ruta_generada = self.guardar_solucion(db, zona, plan, solucion, es_recalculo)
+        finally:
+            trabajo.completar(ruta_generada.id if ruta_generada else None)
+        
+        return ruta_generada
+    
+    def generar_en_segundo_plano(
+        self,
+        db: Session,
+        zona: str,
+        es_recalculo: bool = False
+    ) -> Optional[TrabajoSolver]:
+        """
+        Envía la generación de ruta de una zona al pool del solver sin esperar
+        
+        Un hilo de persistencia guarda la ruta con su propia sesión cuando
+        llega la solución; el estado se consulta con el id del trabajo.
+        
+        Args:
+            db: Sesión para armar el problema
+            zona: Zona para generar ruta
+            es_recalculo: True si reemplaza rutas planeadas de la zona
+            
+        Returns:
+            TrabajoSolver enviado o None si no hay nada que resolver
+        """
+        plan = self.preparar_problema(db, zona)
+        if plan is None:
+            return None
+        
+        def guardar(trabajo: TrabajoSolver, solucion: Dict) -> Optional[int]:
+            sesion = SessionLocal()
+            try:
+                ruta = self.guardar_solucion(sesion, zona, plan, solucion, es_recalculo)
+                return ruta.id if ruta else None
+            finally:
+                sesion.close()
+        
+        return pool_solver.enviar(zona, plan["problema"], al_terminar=guardar)
+    
+    def guardar_solucion(
+        self,
+        db: Session,
+        zona: str,
+        plan: Dict,
+        solucion: Dict,
+        es_recalculo: bool = False
+    ) -> Optional[RutaGenerada]:
+        """
+        Persiste la solución del solver como una ruta planeada
+        
+        Proceso:
+        1. Leer las incidencias de la solución que siguen validadas
+        2. Calcular geometría y ETAs de cada camión con OSRM, sin bloqueos
+        3. Reservar: advisory lock de la flota (serializa con la otra zona),
+           descartar los camiones que otra ruta ocupó mientras tanto y
+           bloquear las incidencias; un camión con incidencias que dejaron
+           de estar validadas se recalcula sin ellas
+        4. Crear el registro de ruta, guardar los detalles y actualizar las
+           incidencias a 'asignada'
+        5. Actualizar totales
+        6. Encolar la notificación a conductores (misma transacción)
+        
+        Args:
+            db: Sesión de base de datos
+            zona: Zona de la ruta
+            plan: Plan de preparar_problema
+            solucion: Solución de app.solver_vrp.resolver
+            es_recalculo: True si reemplaza rutas planeadas de la zona
+            
+        Returns:
+            RutaGenerada creada o None si hay error
+        """
+        logger.info(
+            f"Solución del solver para zona {zona}: costo {solucion['costo_inicial']:.0f} -> "
+            f"{solucion['costo']:.0f} en {solucion['segundos']:.2f}s"
+            + (" (plazo agotado)" if solucion["agotado"] else "")
+        )
+        
+        # 1. Incidencias de la solución que siguen validadas
+        ids = [i for camion in solucion["camiones"] for viaje in camion["viajes"] for i in viaje]
+        incidencias = {
+            inc.id: inc
+            for inc in db.query(Incidencia).filter(
+                Incidencia.id.in_(ids),
+                Incidencia.estado == 'validada'
+            ).all()
+        } if ids else {}
+        
+        asignacion_camiones = []
+        for camion_solucion in solucion["camiones"]:
+            camion = self._camion_con_viajes(
+                plan["flota"][camion_solucion["indice"]],
+                [[incidencias[i] for i in viaje if i in incidencias] for viaje in camion_solucion["viajes"]]
+            )
+            if camion:
+                asignacion_camiones.append(camion)
+        
+        if not asignacion_camiones:
+            logger.warning(f"Sin incidencias por asignar en zona {zona}")
+            db.rollback()
+            return None
+        
+        # 2. Geometría y ETAs con OSRM antes de tomar cualquier bloqueo
+        rutas_info = []
+        for idx, camion in enumerate(asignacion_camiones, 1):
+            ruta_info = self.calcular_ruta_optima(
+                db, camion, zona, self._submatriz_camion(plan["matriz"], camion)
+            )
+            if not ruta_info:
+                logger.error(f"Error al calcular ruta para camión {idx}")
+                db.rollback()
+                return None
+            rutas_info.append(ruta_info)
+        db.rollback()  # cierra la transacción de lectura
+        
+        # 3. Reserva de camiones e incidencias (hasta el commit)
+        registro_flota.bloquear_reservas(db)
+        ocupadas = registro_flota.placas_ocupadas(db)
+        bloqueadas = {
+            inc.id
+            for inc in db.query(Incidencia).filter(
+                Incidencia.id.in_([inc.id for c in asignacion_camiones for inc in c["incidencias"]]),
+                Incidencia.estado == 'validada'
+            ).with_for_update().all()
+        }
+        
+        vigentes = []
+        sin_camion = 0
+        for camion, ruta_info in zip(asignacion_camiones, rutas_info):
+            if camion.get("placa") and camion["placa"] in ocupadas:
+                sin_camion += sum(1 for inc in camion["incidencias"] if inc.id in bloqueadas)
+                logger.warning(
+                    f"Camión {camion['placa']} ocupado por otra ruta mientras se resolvía "
+                    f"la zona {zona}: sus incidencias quedan validadas"
+                )
+                continue
+            if any(inc.id not in bloqueadas for inc in camion["incidencias"]):
+                camion = self._camion_con_viajes(
+                    camion,
+                    [[inc for inc in v["incidencias"] if inc.id in bloqueadas] for v in camion["viajes"]]
+                )
+                if not camion:
+                    continue
+                ruta_info = self.calcular_ruta_optima(
+                    db, camion, zona, self._submatriz_camion(plan["matriz"], camion)
+                )
+                if not ruta_info:
+                    logger.error("Error al recalcular un camión con incidencias que cambiaron de estado")
+                    db.rollback()
+                    return None
+            vigentes.append((camion, ruta_info))
+        
+        if not vigentes:
+            logger.warning(f"Sin camiones ni incidencias por asignar en zona {zona}")
+            db.rollback()
+            return None
+        
+        suma_gravedad = plan["suma_gravedad"]
+        asignadas = sum(len(c["incidencias"]) for c, _ in vigentes)
+        total_viajes = sum(len(c["viajes"]) for c, _ in vigentes)
+        notas = (
+            f"Ruta generada automáticamente por umbral. "
+            f"{asignadas} incidencias, "
+            f"{len(vigentes)} camiones, {total_viajes} viajes"
+        )
+        pendientes = len(solucion["sin_asignar"]) + sin_camion
+        if pendientes > 0:
+            notas += f". {pendientes} incidencias pendientes por falta de flota"
+            logger.warning(
+                f"Flota insuficiente: {pendientes} incidencias quedan "
+                f"validadas para la siguiente ruta"
+            )
+        
+        salida = plan["salida"]
+        factor_trafico = plan["factor_trafico"]
         
         # 4. Crear registro de ruta
         ruta_generada = RutaGenerada(
@@ -270,107 +836,237 @@ class RutaService:
             suma_gravedad=suma_gravedad,
             costo_total=0.0,  # Se actualizará después
             duracion_estimada=timedelta(seconds=0),  # Se actualizará después
-            camiones_usados=len(asignacion_camiones),
+            camiones_usados=len(vigentes),
             estado='planeada',
-            notas=f"Ruta generada automáticamente por umbral. {len(incidencias)} incidencias, {len(asignacion_camiones)} camiones"
+            factor_trafico=factor_trafico,
+            notas=notas
         )
         
         db.add(ruta_generada)
         db.flush()  # Obtener ID sin commitear aún
         
-        # 5. Calcular y guardar detalles de ruta para cada camión
+        # Guardar detalles de ruta para cada camión
         distancia_total = 0.0
         duracion_total = 0
         orden_global = 1
+        requiere_refinamiento = False
         
-        for idx, camion in enumerate(asignacion_camiones, 1):
-            ruta_info = self.calcular_ruta_optima(db, camion, zona)
-            
-            if not ruta_info:
-                logger.error(f"Error al calcular ruta para camión {idx}")
-                db.rollback()
-                return None
+        for idx, (camion, ruta_info) in enumerate(vigentes, 1):
+            camion_id = camion.get("placa") or f"{camion['tipo'].upper()}-{idx}"
             
             distancia_total += ruta_info["distancia"]
-            duracion_total += ruta_info["duracion"]
+            duracion_total += ruta_info["duracion"] * factor_trafico
+            requiere_refinamiento = requiere_refinamiento or ruta_info["estimada"]
             
-            # Crear detalles de ruta
-            # Punto 1: Depósito
-            detalle_deposito = RutaDetalle(
-                ruta_id=ruta_generada.id,
-                camion_tipo=camion["tipo"],
-                camion_id=f"{camion['tipo'].upper()}-{idx}",
-                orden=orden_global,
-                tipo_punto='deposito',
-                lat=ruta_info["deposito"].lat,
-                lon=ruta_info["deposito"].lon,
-                llegada_estimada=datetime.utcnow(),
-                tiempo_servicio=timedelta(minutes=5),
-                carga_acumulada=0
+            # Geometría del recorrido para el seguimiento en vivo
+            geometria = self._geometria_camion(ruta_generada.id, camion_id, ruta_info["geometria"])
+            if geometria is not None:
+                db.add(geometria)
+            
+            # ETAs por tramo de OSRM + servicio según tipo de parada
+            secuencia = ruta_info["secuencia"]
+            servicios = [
+                EtaService.tiempo_servicio(
+                    p["tipo_punto"],
+                    p["incidencia"].tipo if p["incidencia"] is not None else None
+                )
+                for p in secuencia
+            ]
+            llegadas = EtaService.calcular_llegadas(
+                salida, ruta_info["legs"], servicios, factor_trafico
             )
-            db.add(detalle_deposito)
-            orden_global += 1
             
-            # Puntos 2-N: Incidencias
+            # Crear detalles: depósito -> incidencias -> botadero (por viaje)
             carga_acum = 0
-            tiempo_acum = timedelta(minutes=5)  # Tiempo en depósito
             
-            for inc in camion["incidencias"]:
-                carga_acum += inc.gravedad
-                tiempo_acum += timedelta(minutes=15)  # Estimado por incidencia
+            for punto, llegada, servicio in zip(secuencia, llegadas, servicios):
+                tipo_punto = punto["tipo_punto"]
+                inc = punto["incidencia"]
                 
-                detalle_incidencia = RutaDetalle(
+                if inc is not None:
+                    carga_acum += inc.gravedad
+                
+                detalle = RutaDetalle(
                     ruta_id=ruta_generada.id,
                     camion_tipo=camion["tipo"],
-                    camion_id=f"{camion['tipo'].upper()}-{idx}",
+                    camion_id=camion_id,
+                    viaje=punto["viaje"],
                     orden=orden_global,
-                    incidencia_id=inc.id,
-                    tipo_punto='incidencia',
-                    lat=inc.lat,
-                    lon=inc.lon,
-                    llegada_estimada=datetime.utcnow() + tiempo_acum,
-                    tiempo_servicio=timedelta(minutes=10),
+                    incidencia_id=inc.id if inc is not None else None,
+                    tipo_punto=tipo_punto,
+                    lat=punto["lat"],
+                    lon=punto["lon"],
+                    llegada_estimada=llegada,
+                    tiempo_servicio=servicio,
                     carga_acumulada=carga_acum
                 )
-                db.add(detalle_incidencia)
+                db.add(detalle)
                 orden_global += 1
                 
-                # Actualizar estado de incidencia a 'asignada'
-                inc.estado = 'asignada'
-            
-            # Último punto: Botadero
-            tiempo_acum += timedelta(minutes=10)
-            detalle_botadero = RutaDetalle(
-                ruta_id=ruta_generada.id,
-                camion_tipo=camion["tipo"],
-                camion_id=f"{camion['tipo'].upper()}-{idx}",
-                orden=orden_global,
-                tipo_punto='botadero',
-                lat=ruta_info["botadero"].lat,
-                lon=ruta_info["botadero"].lon,
-                llegada_estimada=datetime.utcnow() + tiempo_acum,
-                tiempo_servicio=timedelta(minutes=15),
-                carga_acumulada=carga_acum
-            )
-            db.add(detalle_botadero)
-            orden_global += 1
+                if tipo_punto == 'botadero':
+                    # El camión se vacía antes del siguiente viaje
+                    carga_acum = 0
+                if inc is not None:
+                    # Actualizar estado de incidencia a 'asignada'
+                    inc.estado = 'asignada'
         
-        # 6. Actualizar totales en ruta generada
+        # 5. Actualizar totales en ruta generada
         ruta_generada.costo_total = distancia_total  # metros
         ruta_generada.duracion_estimada = timedelta(seconds=duracion_total)
         
+        if requiere_refinamiento:
+            ruta_generada.requiere_refinamiento = True
+            ruta_generada.notas += (
+                ". [ESTIMADA] Distancias calculadas en línea recta por indisponibilidad "
+                "de OSRM, pendiente de refinamiento"
+            )
+        
+        # 6. Notificación en el outbox: se confirma junto con la ruta
+        NotificacionService.notificar_nueva_ruta(
+            db,
+            ruta_generada.id,
+            zona,
+            ruta_generada.camiones_usados,
+            suma_gravedad,
+            es_recalculo=es_recalculo
+        )
+        
         # Commit final
         db.commit()
         db.refresh(ruta_generada)
         
         logger.info(
             f"Ruta generada exitosamente: ID={ruta_generada.id}, "
-            f"zona={zona}, camiones={len(asignacion_camiones)}, "
+            f"zona={zona}, camiones={len(vigentes)}, "
             f"distancia={distancia_total:.2f}m, duración={duracion_total/60:.2f}min"
         )
         
         return ruta_generada
     
+    @staticmethod
+    def _camion_con_viajes(camion: Dict, paradas_por_viaje: List[List[Incidencia]]) -> Optional[Dict]:
+        """Camión de la flota con sus viajes no vacíos (None si no le queda ninguna parada)"""
+        viajes = [
+            {"incidencias": paradas, "carga": sum(inc.gravedad for inc in paradas)}
+            for paradas in paradas_por_viaje if paradas
+        ]
+        if not viajes:
+            return None
+        return dict(
+            camion,
+            viajes=viajes,
+            incidencias=[inc for v in viajes for inc in v["incidencias"]],
+            carga=max(v["carga"] for v in viajes)
+        )
+    
+    @staticmethod
+    def _geometria_camion(ruta_id: int, camion_id: str, geometria: Dict) -> Optional[RutaGeometria]:
+        """Fila de RutaGeometria del recorrido de un camión (None si tiene menos de 2 puntos)"""
+        puntos_linea = geometria["coordinates"]
+        if len(puntos_linea) < 2:
+            return None
+        return RutaGeometria(
+            ruta_id=ruta_id,
+            camion_id=camion_id,
+            geom=WKTElement(
+                "LINESTRING(" + ", ".join(f"{lon} {lat}" for lon, lat in puntos_linea) + ")",
+                srid=4326
+            )
+        )
+    
+    def refinar_ruta(
+        self,
+        db: Session,
+        ruta_id: int
+    ) -> Optional[RutaGenerada]:
+        """
+        Recalcula con OSRM una ruta generada en modo degradado
+        
+        Mantiene el orden de paradas ya planificado y reemplaza las
+        distancias, duraciones y la geometría en línea recta de cada camión
+        por las de la red vial, en una sola transacción.
+        
+        Args:
+            db: Sesión de base de datos
+            ruta_id: ID de la ruta marcada con requiere_refinamiento
+            
+        Returns:
+            RutaGenerada actualizada o None si OSRM sigue sin responder
+        """
+        ruta = db.query(RutaGenerada).filter(RutaGenerada.id == ruta_id).first()
+        if not ruta or not ruta.requiere_refinamiento:
+            return ruta
+        
+        if not self.osrm.disponible:
+            logger.info(f"OSRM sigue sin estar disponible, ruta {ruta_id} sin refinar")
+            return None
+        
+        # Agrupar las paradas por camión respetando el orden planificado
+        detalles_por_camion: Dict[str, List[RutaDetalle]] = {}
+        for detalle in self.obtener_detalles_ruta(db, ruta_id):
+            detalles_por_camion.setdefault(detalle.camion_id, []).append(detalle)
+        
+        # Geometrías en línea recta del modo degradado
+        for geometria in db.query(RutaGeometria).filter(RutaGeometria.ruta_id == ruta_id).all():
+            db.delete(geometria)
+        
+        factor_trafico = ruta.factor_trafico or 1.0
+        distancia_total = 0.0
+        duracion_total = 0.0
+        for camion_id, detalles in detalles_por_camion.items():
+            resultado = self.osrm.calculate_route([(d.lon, d.lat) for d in detalles])
+            if not resultado:
+                logger.warning(f"No se pudo refinar camión {camion_id} de ruta {ruta_id}")
+                db.rollback()
+                return None
+            
+            geometria = self._geometria_camion(ruta_id, camion_id, resultado["geometry"])
+            if geometria is not None:
+                db.add(geometria)
+            
+            distancia_total += resultado["distance"]
+            duracion_total += resultado["duration"] * factor_trafico
+            
+            # Reemplazar las ETAs estimadas por las de los tramos reales
+            llegadas = EtaService.calcular_llegadas(
+                detalles[0].llegada_estimada or datetime.utcnow(),
+                resultado["legs"],
+                [d.tiempo_servicio or timedelta(0) for d in detalles],
+                factor_trafico
+            )
+            for detalle, llegada in zip(detalles, llegadas):
+                detalle.llegada_estimada = llegada
+        
+        ruta.costo_total = distancia_total
+        ruta.duracion_estimada = timedelta(seconds=duracion_total)
+        ruta.requiere_refinamiento = False
+        ruta.notas = (ruta.notas or "") + f"\n[REFINADA] {datetime.utcnow().isoformat()}"
+        db.commit()
+        db.refresh(ruta)
+        
+        logger.info(f"Ruta {ruta_id} refinada con OSRM: distancia={distancia_total:.2f}m")
+        return ruta
+    
+    def refinar_rutas_pendientes(self, db: Session) -> int:
+        """
+        Refina todas las rutas planeadas que se generaron en modo degradado
+        
+        Returns:
+            Número de rutas refinadas
+        """
+        rutas = db.query(RutaGenerada).filter(
+            RutaGenerada.requiere_refinamiento == True,
+            RutaGenerada.estado == 'planeada'
+        ).all()
+        
+        refinadas = 0
+        for ruta in rutas:
+            if not self.osrm.disponible:
+                break
+            if self.refinar_ruta(db, ruta.id):
+                refinadas += 1
+        return refinadas
+    
     @staticmethod
     def obtener_rutas_por_zona(
         db: Session,
@@ -395,6 +1091,35 @@ class RutaService:
             RutaDetalle.ruta_id == ruta_id
         ).order_by(RutaDetalle.orden).all()
     
+    @staticmethod
+    def obtener_version_ruta(db: Session, ruta_id: int) -> Optional[Tuple]:
+        """
+        Valores que cambian cuando cambia cualquier dato de la ruta
+        
+        Una sola consulta de agregados (sin cargar detalles ni incidencias):
+        estado y updated_at de la ruta, última modificación y número de
+        detalles, de asignaciones y de las incidencias de sus paradas.
+        
+        Returns:
+            Tupla para calcular_etag, o None si la ruta no existe
+        """
+        detalles = select(
+            func.max(RutaDetalle.updated_at), func.count(RutaDetalle.id)
+        ).where(RutaDetalle.ruta_id == ruta_id).subquery()
+        asignaciones = select(
+            func.max(AsignacionConductor.updated_at), func.count(AsignacionConductor.id)
+        ).where(AsignacionConductor.ruta_id == ruta_id).subquery()
+        incidencias = select(func.max(Incidencia.updated_at)).where(
+            Incidencia.id.in_(
+                select(RutaDetalle.incidencia_id).where(RutaDetalle.ruta_id == ruta_id)
+            )
+        ).scalar_subquery()
+        
+        return db.execute(
+            select(RutaGenerada.estado, RutaGenerada.updated_at, detalles, asignaciones, incidencias)
+            .where(RutaGenerada.id == ruta_id)
+        ).first()
+    
     @staticmethod
     def verificar_rutas_planeadas_zona(
         db: Session,
@@ -432,7 +1157,7 @@ class RutaService:
         Returns:
             Suma total de gravedad
         """
-        query = db.query(Incidencia).filter(Incidencia.zona == zona)
+        query = db.query(func.coalesce(func.sum(Incidencia.gravedad), 0)).filter(Incidencia.zona == zona)
         
         if incluir_asignadas:
             # Incluir validadas y asignadas (pero solo si la ruta está 'planeada', no en ejecución)
@@ -441,15 +1166,15 @@ class RutaService:
             # Solo validadas (listas para asignar)
             query = query.filter(Incidencia.estado == 'validada')
         
-        incidencias = query.all()
-        return sum(inc.gravedad for inc in incidencias)
+        return query.scalar()
     
     def recalcular_ruta_zona(
         self,
         db: Session,
         zona: str,
-        motivo: str = "Nueva incidencia crítica"
-    ) -> Optional[RutaGenerada]:
+        motivo: str = "Nueva incidencia crítica",
+        en_segundo_plano: bool = False
+    ) -> Optional[Union[RutaGenerada, TrabajoSolver]]:
         """
         Recalcula la ruta de una zona cuando llegan nuevas incidencias críticas
         
@@ -457,18 +1182,19 @@ class RutaService:
         1. Verificar si hay rutas planeadas en la zona
         2. Liberar incidencias de rutas planeadas (volver a 'pendiente')
         3. Marcar rutas antiguas como canceladas
-        4. Generar nueva ruta con todas las incidencias
-        5. Notificar a conductores
+        4. Generar la nueva ruta con todas las incidencias
+        5. Notificar a conductores (al guardarse la nueva ruta)
         
         Args:
             db: Sesión de base de datos
             zona: Zona a recalcular
             motivo: Razón del recálculo
+            en_segundo_plano: True para enviar la ruta al solver sin esperar
             
         Returns:
-            Nueva RutaGenerada o None si no se pudo recalcular
+            Nueva RutaGenerada (o su TrabajoSolver si en_segundo_plano), None
+            si no se pudo recalcular
         """
-        inicio_recalculo = datetime.utcnow()
         logger.info(f"🔄 Iniciando RECÁLCULO de ruta para zona {zona}. Motivo: {motivo}")
         
         # 1. Obtener rutas planeadas
@@ -504,6 +1230,7 @@ class RutaService:
                 
                 # 4. Notificar cancelación
                 NotificacionService.notificar_ruta_cancelada(
+                    db,
                     ruta.id,
                     zona,
                     motivo
@@ -512,28 +1239,20 @@ class RutaService:
             db.commit()
         
         # 5. Generar nueva ruta con TODAS las incidencias pendientes
-        nueva_ruta = self.generar_ruta_automatica(db, zona)
-        
-        if nueva_ruta:
-            tiempo_recalculo = (datetime.utcnow() - inicio_recalculo).total_seconds()
-            logger.info(
-                f"✅ RECÁLCULO COMPLETADO en {tiempo_recalculo:.2f} segundos. "
-                f"Nueva ruta ID: {nueva_ruta.id}"
-            )
-            
-            # 6. Notificar nueva ruta (indicando que es recálculo)
-            NotificacionService.notificar_nueva_ruta(
-                nueva_ruta.id,
-                zona,
-                nueva_ruta.camiones_usados,
-                nueva_ruta.suma_gravedad,
-                es_recalculo=True
-            )
-            
-            return nueva_ruta
+        #    (la notificación de recálculo se encola con la ruta)
+        if en_segundo_plano:
+            trabajo = self.generar_en_segundo_plano(db, zona, es_recalculo=True)
+            if trabajo:
+                logger.info(f"✅ RECÁLCULO ENVIADO al solver: zona {zona}, trabajo {trabajo.id}")
+                return trabajo
         else:
-            logger.error(f"❌ Error al generar nueva ruta durante recálculo de zona {zona}")
-            return None
+            nueva_ruta = self.generar_ruta_automatica(db, zona, es_recalculo=True)
+            if nueva_ruta:
+                logger.info(f"✅ RECÁLCULO COMPLETADO: zona {zona}, nueva ruta ID {nueva_ruta.id}")
+                return nueva_ruta
+        
+        logger.error(f"❌ Error al generar nueva ruta durante recálculo de zona {zona}")
+        return None
     
     def evaluar_necesidad_recalculo(
         self,
@@ -0,0 +1,415 @@
+"""
+Seguimiento en vivo de camiones sobre su ruta planificada
+Cada posición reportada se proyecta sobre la geometría de la ruta usando un
+índice espacial en memoria (grilla de segmentos), sin consultar la base de
+datos. Solo los eventos (parada visitada) se escriben en la base.
+"""
+import os
+import json
+import math
+import logging
+import threading
+import time
+from datetime import datetime
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+from sqlalchemy import func
+from sqlalchemy.orm import Session
+
+from app.database import SessionLocal
+from app.models import AsignacionConductor, RutaDetalle, RutaGenerada, RutaGeometria
+from app.services.eta_service import EtaService
+from app.services.tiempo_real_service import publicar_evento, PARADA_ACTUALIZADA
+
+logger = logging.getLogger(__name__)
+
+
+# Radio de la geocerca de cada parada y permanencia mínima para darla por visitada
+RADIO_GEOCERCA_M = float(os.getenv("SEGUIMIENTO_RADIO_GEOCERCA_M", "40"))
+PERMANENCIA_MIN_S = float(os.getenv("SEGUIMIENTO_PERMANENCIA_S", "60"))
+
+# Solo se evalúan la siguiente parada pendiente y las que están a menos de
+# esta distancia, a lo largo de la ruta, del avance actual: el botadero de
+# un viaje posterior queda fuera aunque el camión pase por el mismo punto
+VENTANA_AVANCE_M = float(os.getenv("SEGUIMIENTO_VENTANA_AVANCE_M", "200"))
+
+# Donde la ruta pasa varias veces por el mismo lugar, las pasadas a menos de
+# esta diferencia de distancia se consideran empatadas y gana la más temprana
+TOLERANCIA_PASADA_M = 5.0
+
+# Distancia a la ruta a partir de la cual se considera desvío, y por cuánto tiempo
+DISTANCIA_DESVIO_M = float(os.getenv("SEGUIMIENTO_DESVIO_M", "150"))
+TIEMPO_DESVIO_S = float(os.getenv("SEGUIMIENTO_TIEMPO_DESVIO_S", "60"))
+
+# Espera antes de volver a buscar en la base la ruta de un conductor sin ruta
+# (otro worker pudo iniciarla)
+REINTENTO_SIN_RUTA_S = 30.0
+
+# Tamaño de celda del índice de segmentos
+CELDA_M = 250.0
+
+# Proyección equirectangular local (suficiente para el área de Latacunga)
+LAT_REFERENCIA = -0.93
+M_POR_GRADO_LAT = 110574.0
+M_POR_GRADO_LON = 111320.0 * math.cos(math.radians(LAT_REFERENCIA))
+
+
+def proyectar(lon, lat):
+    """(lon, lat) en grados -> (x, y) en metros en el plano local"""
+    return np.asarray(lon) * M_POR_GRADO_LON, np.asarray(lat) * M_POR_GRADO_LAT
+
+
+class RutaActiva:
+    """
+    Geometría y paradas de un camión en ejecución, preparadas para
+    consultas rápidas: segmentos en metros, longitud acumulada e índice
+    de celdas -> segmentos
+    """
+
+    def __init__(
+        self,
+        ruta_id: int,
+        conductor_id: int,
+        camion_id: Optional[str],
+        linea: List[Tuple[float, float]],
+        paradas: List[RutaDetalle]
+    ):
+        self.ruta_id = ruta_id
+        self.conductor_id = conductor_id
+        self.camion_id = camion_id
+
+        x, y = proyectar([p[0] for p in linea], [p[1] for p in linea])
+        self.ax, self.ay = x[:-1], y[:-1]
+        self.dx, self.dy = x[1:] - x[:-1], y[1:] - y[:-1]
+        self.largo2 = np.maximum(self.dx ** 2 + self.dy ** 2, 1e-9)
+        self.acumulado = np.concatenate([[0.0], np.cumsum(np.sqrt(self.largo2))])
+
+        self.celdas: Dict[Tuple[int, int], np.ndarray] = self._indexar()
+
+        self.paradas_id = np.array([p.id for p in paradas], dtype=np.int64)
+        self.paradas_orden = np.array([p.orden for p in paradas], dtype=np.int32)
+        self.paradas_tipo = [p.tipo_punto for p in paradas]
+        px, py = proyectar([p.lon for p in paradas], [p.lat for p in paradas])
+        self.paradas_x, self.paradas_y = px, py
+        self.visitada = np.array([p.visitado_en is not None for p in paradas], dtype=bool)
+        self.paradas_avance = self._avance_paradas()
+
+        # Estado del seguimiento (el avance se retoma desde la última parada visitada)
+        self.avance = float(self.paradas_avance[self.visitada].max()) if self.visitada.any() else 0.0
+        self.entrada_geocerca: Dict[int, datetime] = {}
+        self.fuera_desde: Optional[datetime] = None
+        self.desviado = False
+        self.ultima_posicion: Optional[Dict] = None
+
+    def _indexar(self) -> Dict[Tuple[int, int], np.ndarray]:
+        """Asigna cada segmento a las celdas que cubre su caja envolvente"""
+        celdas: Dict[Tuple[int, int], List[int]] = {}
+        bx, by = self.ax + self.dx, self.ay + self.dy
+        x0 = np.floor(np.minimum(self.ax, bx) / CELDA_M).astype(int)
+        x1 = np.floor(np.maximum(self.ax, bx) / CELDA_M).astype(int)
+        y0 = np.floor(np.minimum(self.ay, by) / CELDA_M).astype(int)
+        y1 = np.floor(np.maximum(self.ay, by) / CELDA_M).astype(int)
+        for i in range(len(self.ax)):
+            for cx in range(x0[i], x1[i] + 1):
+                for cy in range(y0[i], y1[i] + 1):
+                    celdas.setdefault((cx, cy), []).append(i)
+        return {k: np.array(v, dtype=np.int32) for k, v in celdas.items()}
+
+    def _candidatos(self, x: float, y: float) -> np.ndarray:
+        """Segmentos en la celda de la posición y sus 8 vecinas"""
+        cx, cy = int(x // CELDA_M), int(y // CELDA_M)
+        vecinos = [
+            self.celdas[(i, j)]
+            for i in (cx - 1, cx, cx + 1)
+            for j in (cy - 1, cy, cy + 1)
+            if (i, j) in self.celdas
+        ]
+        if not vecinos:
+            return np.empty(0, dtype=np.int32)
+        return np.unique(np.concatenate(vecinos))
+
+    def _avance_paradas(self) -> np.ndarray:
+        """Posición de cada parada a lo largo de la ruta, sin retroceder entre paradas"""
+        avances = np.zeros(len(self.paradas_x))
+        previo = 0.0
+        for i, (x, y) in enumerate(zip(self.paradas_x.tolist(), self.paradas_y.tolist())):
+            _, avance = self.proyectar_sobre_ruta(x, y, previo)
+            if not math.isnan(avance):
+                previo = avance
+            avances[i] = previo
+        return avances
+
+    def proyectar_sobre_ruta(self, x: float, y: float, minimo: float = 0.0) -> Tuple[float, float]:
+        """
+        Distancia a la ruta (m) y avance a lo largo de ella (m)
+
+        Si no hay segmentos en las celdas vecinas, la distancia es al menos
+        CELDA_M y se devuelve infinito sin recorrer toda la ruta. Si la ruta
+        pasa varias veces por la posición, se toma la primera pasada desde
+        `minimo` (avance ya recorrido).
+        """
+        segmentos = self._candidatos(x, y)
+        if segmentos.size == 0:
+            return math.inf, math.nan
+
+        ax, ay = self.ax[segmentos], self.ay[segmentos]
+        dx, dy = self.dx[segmentos], self.dy[segmentos]
+        t = np.clip(((x - ax) * dx + (y - ay) * dy) / self.largo2[segmentos], 0.0, 1.0)
+        distancias = np.hypot(ax + t * dx - x, ay + t * dy - y)
+        avances = self.acumulado[segmentos] + t * np.sqrt(self.largo2[segmentos])
+
+        validos = avances >= minimo
+        if not validos.any():
+            validos[:] = True
+        cercanos = validos & (distancias <= distancias[validos].min() + TOLERANCIA_PASADA_M)
+        k = int(np.flatnonzero(cercanos)[np.argmin(avances[cercanos])])
+        return float(distancias[k]), float(avances[k])
+
+    def siguiente_parada(self) -> Optional[int]:
+        """Índice de la primera parada pendiente"""
+        pendientes = np.flatnonzero(~self.visitada)
+        return int(pendientes[0]) if pendientes.size else None
+
+
+class SeguimientoService:
+    """
+    Registro en memoria de las rutas en ejecución, por conductor
+
+    Cada proceso mantiene su propio registro y lo completa bajo demanda
+    desde la base (por ejemplo, tras un reinicio), así que funciona con
+    varios workers mientras cada conductor reporte siempre al mismo o se
+    tolere recargar una vez su ruta.
+    """
+
+    def __init__(self):
+        self._rutas: Dict[int, RutaActiva] = {}
+        # Conductores sin ruta en ejecución -> instante de la última consulta
+        self._sin_ruta: Dict[int, float] = {}
+        self._lock = threading.Lock()
+
+    # ---------------------------------------------------------------- carga
+
+    @staticmethod
+    def _linea_camion(db: Session, ruta_id: int, camion_id: Optional[str], paradas: List[RutaDetalle]):
+        """Geometría guardada del camión o, si no existe, las paradas en línea recta"""
+        fila = db.query(func.ST_AsGeoJSON(RutaGeometria.geom)).filter(
+            RutaGeometria.ruta_id == ruta_id,
+            RutaGeometria.camion_id == camion_id
+        ).first()
+        if fila and fila[0]:
+            return [tuple(c) for c in json.loads(fila[0])["coordinates"]]
+        return [(p.lon, p.lat) for p in paradas]
+
+    def registrar(self, db: Session, asignacion: AsignacionConductor) -> Optional[RutaActiva]:
+        """Carga en memoria la ruta de una asignación iniciada"""
+        query = db.query(RutaDetalle).filter(RutaDetalle.ruta_id == asignacion.ruta_id)
+        if asignacion.camion_id:
+            query = query.filter(RutaDetalle.camion_id == asignacion.camion_id)
+        paradas = query.order_by(RutaDetalle.orden).all()
+
+        if not paradas:
+            return None
+
+        # Sin placa en la asignación se toma el primer camión de la ruta
+        camion_id = asignacion.camion_id or paradas[0].camion_id
+        paradas = [p for p in paradas if p.camion_id == camion_id]
+        linea = self._linea_camion(db, asignacion.ruta_id, camion_id, paradas)
+        if len(linea) < 2:
+            return None
+
+        activa = RutaActiva(asignacion.ruta_id, asignacion.conductor_id, camion_id, linea, paradas)
+        with self._lock:
+            self._rutas[asignacion.conductor_id] = activa
+            self._sin_ruta.pop(asignacion.conductor_id, None)
+
+        logger.info(
+            f"Seguimiento activo: conductor {asignacion.conductor_id}, ruta {asignacion.ruta_id}, "
+            f"{len(paradas)} paradas, {len(activa.celdas)} celdas"
+        )
+        return activa
+
+    def quitar(self, conductor_id: int):
+        with self._lock:
+            self._rutas.pop(conductor_id, None)
+            self._sin_ruta.pop(conductor_id, None)
+
+    def obtener(self, conductor_id: int) -> Optional[RutaActiva]:
+        """Ruta activa del conductor, cargándola desde la base si hace falta"""
+        activa = self._rutas.get(conductor_id)
+        if activa:
+            return activa
+        consultado = self._sin_ruta.get(conductor_id)
+        if consultado is not None and time.monotonic() - consultado < REINTENTO_SIN_RUTA_S:
+            return None
+
+        db = SessionLocal()
+        try:
+            asignacion = db.query(AsignacionConductor).join(
+                RutaGenerada, RutaGenerada.id == AsignacionConductor.ruta_id
+            ).filter(
+                AsignacionConductor.conductor_id == conductor_id,
+                AsignacionConductor.estado == 'iniciado',
+                RutaGenerada.estado == 'en_ejecucion'
+            ).order_by(AsignacionConductor.fecha_inicio.desc()).first()
+
+            if asignacion:
+                return self.registrar(db, asignacion)
+
+            with self._lock:
+                self._sin_ruta[conductor_id] = time.monotonic()
+            return None
+        finally:
+            db.close()
+
+    def rutas_activas(self, ruta_id: Optional[int] = None) -> List[RutaActiva]:
+        return [r for r in list(self._rutas.values()) if ruta_id is None or r.ruta_id == ruta_id]
+
+    # ----------------------------------------------------------- posiciones
+
+    def procesar_posicion(
+        self,
+        conductor_id: int,
+        lat: float,
+        lon: float,
+        momento: Optional[datetime] = None
+    ) -> Optional[Dict]:
+        """
+        Actualiza el progreso de un conductor con una posición
+
+        Returns:
+            Estado del seguimiento o None si el conductor no tiene ruta en ejecución
+        """
+        activa = self.obtener(conductor_id)
+        if not activa:
+            return None
+
+        momento = momento or datetime.utcnow()
+        x, y = proyectar(lon, lat)
+        x, y = float(x), float(y)
+
+        distancia_ruta, avance = activa.proyectar_sobre_ruta(x, y, activa.avance - VENTANA_AVANCE_M)
+        if distancia_ruta <= DISTANCIA_DESVIO_M:
+            activa.avance = max(activa.avance, avance)
+        visitadas = self._actualizar_geocercas(activa, x, y, avance, momento)
+        self._actualizar_desvio(activa, distancia_ruta, momento)
+
+        siguiente = activa.siguiente_parada()
+        estado = {
+            "ruta_id": activa.ruta_id,
+            "camion_id": activa.camion_id,
+            "distancia_ruta_m": None if math.isinf(distancia_ruta) else round(distancia_ruta, 1),
+            "avance_m": None if math.isnan(avance) else round(avance, 1),
+            "recorrido_total_m": round(float(activa.acumulado[-1]), 1),
+            "desviado": activa.desviado,
+            "siguiente_parada": None if siguiente is None else {
+                "id": int(activa.paradas_id[siguiente]),
+                "orden": int(activa.paradas_orden[siguiente]),
+                "tipo_punto": activa.paradas_tipo[siguiente],
+                "distancia_m": round(float(np.hypot(
+                    activa.paradas_x[siguiente] - x, activa.paradas_y[siguiente] - y
+                )), 1)
+            },
+            "paradas_visitadas": int(activa.visitada.sum()),
+            "paradas_totales": int(activa.visitada.size),
+            "visitadas_ahora": visitadas,
+            "momento": momento
+        }
+        activa.ultima_posicion = {"lat": lat, "lon": lon, **estado}
+
+        if visitadas:
+            self._guardar_visitas(activa, visitadas, momento)
+        return estado
+
+    @staticmethod
+    def _actualizar_geocercas(
+        activa: RutaActiva,
+        x: float,
+        y: float,
+        avance: float,
+        momento: datetime
+    ) -> List[int]:
+        """
+        Marca como visitadas las paradas donde el camión permaneció lo suficiente
+
+        Solo cuentan la siguiente parada pendiente y las pendientes cercanas
+        al avance actual (VENTANA_AVANCE_M); así una parada saltada no
+        bloquea las siguientes, y las paradas repetidas en el mismo lugar
+        (botadero entre viajes) se visitan de a una.
+        """
+        elegibles = np.zeros(activa.visitada.size, dtype=bool)
+        siguiente = activa.siguiente_parada()
+        if siguiente is not None:
+            elegibles[siguiente] = True
+        if not math.isnan(avance):
+            elegibles |= np.abs(activa.paradas_avance - avance) <= VENTANA_AVANCE_M
+
+        distancias = np.hypot(activa.paradas_x - x, activa.paradas_y - y)
+        dentro = (distancias <= RADIO_GEOCERCA_M) & ~activa.visitada & elegibles
+
+        # Salir de una geocerca reinicia su permanencia
+        for idx in list(activa.entrada_geocerca):
+            if not dentro[idx]:
+                del activa.entrada_geocerca[idx]
+
+        visitadas = []
+        for idx in np.flatnonzero(dentro).tolist():
+            entrada = activa.entrada_geocerca.setdefault(idx, momento)
+            if (momento - entrada).total_seconds() >= PERMANENCIA_MIN_S:
+                activa.visitada[idx] = True
+                del activa.entrada_geocerca[idx]
+                visitadas.append(int(activa.paradas_orden[idx]))
+        return visitadas
+
+    @staticmethod
+    def _actualizar_desvio(activa: RutaActiva, distancia_ruta: float, momento: datetime):
+        """Marca desvío si el camión lleva TIEMPO_DESVIO_S lejos de la ruta"""
+        if distancia_ruta <= DISTANCIA_DESVIO_M:
+            activa.fuera_desde = None
+            activa.desviado = False
+            return
+
+        if activa.fuera_desde is None:
+            activa.fuera_desde = momento
+        elif not activa.desviado and (momento - activa.fuera_desde).total_seconds() >= TIEMPO_DESVIO_S:
+            activa.desviado = True
+            logger.warning(
+                f"Desvío detectado: conductor {activa.conductor_id}, ruta {activa.ruta_id}, "
+                f"{distancia_ruta:.0f} m fuera de la ruta"
+            )
+
+    @staticmethod
+    def _guardar_visitas(activa: RutaActiva, ordenes: List[int], momento: datetime):
+        """Registra visitado_en y ajusta las ETAs restantes desde la primera parada visitada"""
+        db = SessionLocal()
+        try:
+            db.query(RutaDetalle).filter(
+                RutaDetalle.ruta_id == activa.ruta_id,
+                RutaDetalle.orden.in_(ordenes)
+            ).update({RutaDetalle.visitado_en: momento}, synchronize_session=False)
+            db.commit()
+
+            restantes = EtaService.recalcular_restantes(
+                db, activa.ruta_id, activa.camion_id, min(ordenes), momento
+            )
+            logger.info(f"Ruta {activa.ruta_id}: paradas {ordenes} visitadas")
+            
+            publicar_evento(
+                PARADA_ACTUALIZADA,
+                {
+                    "ruta_id": activa.ruta_id,
+                    "camion_id": activa.camion_id,
+                    "visitadas": ordenes,
+                    "llegadas_estimadas": {d.orden: d.llegada_estimada for d in restantes[:50]}
+                },
+                conductor_ids=[activa.conductor_id]
+            )
+        except Exception as e:
+            db.rollback()
+            logger.error(f"Error guardando visitas de ruta {activa.ruta_id}: {e}")
+        finally:
+            db.close()
+
+
+# Registro compartido del proceso
+seguimiento = SeguimientoService()
@@ -0,0 +1,595 @@
+"""
+Pool de procesos del solver de rutas
+La optimización de una ruta es CPU intensiva: dentro del proceso de la API
+compite por el GIL con las peticiones y sube la latencia de todo el worker.
+Los trabajos se envían con el problema serializado (app/solver_vrp.py) a un
+ProcessPoolExecutor con un proceso por núcleo, de modo que las dos zonas se
+resuelven en paralelo; la API solo arma el problema y persiste la solución.
+
+Los trabajos esperan en una cola del worker y pasan al pool cuando hay un
+proceso libre. Desde ese momento corre su plazo: el solver devuelve la mejor
+solución encontrada al vencer, y si no respondió con el margen (proceso
+colgado) el trabajo se descarta. Una vez que llega la solución el plazo ya
+no aplica a la persistencia de la ruta. Un trabajo cancelado mientras se
+resuelve termina en su plazo, pero su resultado no se persiste.
+
+Cada worker de uvicorn tiene su propio pool y sus trabajos en memoria; el
+estado se copia a la tabla trabajos_solver (RegistroTrabajos) para que
+cualquier worker pueda consultarlo o cancelarlo.
+"""
+import os
+import uuid
+import logging
+import threading
+import multiprocessing
+from collections import deque
+from concurrent.futures import (
+    Future, ProcessPoolExecutor, ThreadPoolExecutor, CancelledError,
+    TimeoutError as FuturesTimeoutError
+)
+from concurrent.futures.process import BrokenProcessPool
+from datetime import datetime, timedelta
+from typing import Callable, Deque, Dict, List, Optional
+
+from app.database import SessionLocal
+from app.models import TrabajoSolverRegistro
+
+logger = logging.getLogger(__name__)
+
+
+# Procesos del pool de cada worker; por defecto los núcleos se reparten entre
+# los WEB_CONCURRENCY workers de uvicorn. 0 resuelve en el hilo que envía el
+# trabajo, sin procesos aparte (desarrollo)
+_procesos = os.getenv("SOLVER_PROCESOS")
+WORKERS_WEB = max(1, int(os.getenv("WEB_CONCURRENCY", "1")))
+PROCESOS_SOLVER = int(_procesos) if _procesos else max(1, (os.cpu_count() or 1) // WORKERS_WEB)
+
+# Plazo de cada trabajo y margen de espera para la cola y la serialización
+LIMITE_SEGUNDOS = float(os.getenv("SOLVER_LIMITE_SEGUNDOS", "10"))
+MARGEN_ESPERA_SEGUNDOS = float(os.getenv("SOLVER_MARGEN_SEGUNDOS", "5"))
+
+# Tiempo que se conservan los trabajos terminados para consultar su estado y
+# cada cuánto se purgan de la tabla (por worker)
+RETENCION_TRABAJOS = timedelta(hours=1)
+INTERVALO_PURGA = timedelta(minutes=10)
+
+EN_CURSO = 'en_curso'
+COMPLETADO = 'completado'
+CANCELADO = 'cancelado'
+VENCIDO = 'vencido'
+ERROR = 'error'
+
+
+class TrabajoSolver:
+    """Un problema enviado al pool y su estado"""
+
+    def __init__(self, zona: str, limite_segundos: float):
+        self.id = uuid.uuid4().hex
+        self.zona = zona
+        self.limite_segundos = limite_segundos
+        self.creado_en = datetime.utcnow()
+        # Provisorio mientras espera en la cola; se fija al entrar al pool
+        self.vence_en = self._vencimiento()
+        self.iniciado_en: Optional[datetime] = None
+        self.terminado_en: Optional[datetime] = None
+        self.estado = EN_CURSO
+        self.error: Optional[str] = None
+        self.solucion: Optional[Dict] = None
+        self.ruta_id: Optional[int] = None
+        # Resultado del trabajo; lo completa el pool al responder el proceso
+        self.future: Future = Future()
+        self.interno: Optional[Future] = None
+        self.temporizador: Optional[threading.Timer] = None
+        self.despachado = threading.Event()
+        # Ordena la llegada de la solución frente al vencimiento
+        self.lock = threading.Lock()
+
+    @property
+    def terminado(self) -> bool:
+        return self.estado != EN_CURSO
+
+    def _vencimiento(self) -> datetime:
+        return datetime.utcnow() + timedelta(
+            seconds=self.limite_segundos + MARGEN_ESPERA_SEGUNDOS
+        )
+
+    def _iniciar(self) -> bool:
+        """
+        Marca la salida de la cola: desde aquí corre el plazo
+
+        Returns:
+            False si el trabajo se canceló mientras esperaba
+        """
+        if not self.future.set_running_or_notify_cancel():
+            return False
+        self.iniciado_en = datetime.utcnow()
+        self.vence_en = self._vencimiento()
+        self.despachado.set()
+        return True
+
+    def vencer(self) -> bool:
+        """
+        Descarta el trabajo por plazo si la solución todavía no llegó
+
+        Returns:
+            False si ya había terminado o la solución ya llegó (se está
+            persistiendo y el plazo no aplica)
+        """
+        with self.lock:
+            if self.terminado or self.future.done():
+                return False
+            self._finalizar(VENCIDO)
+        if self.interno is not None:
+            self.interno.cancel()
+        return True
+
+    def _finalizar(self, estado: str, error: Optional[str] = None):
+        if self.terminado:
+            return
+        self.estado = estado
+        self.error = error
+        self.terminado_en = datetime.utcnow()
+        self.despachado.set()
+        if self.temporizador is not None:
+            self.temporizador.cancel()
+        registro_trabajos.guardar(self)
+
+    def cancelar(self) -> bool:
+        """
+        Cancela el trabajo; si ya se está resolviendo, el proceso termina
+        en su plazo y el resultado se descarta
+
+        Returns:
+            False si el trabajo ya había terminado
+        """
+        if self.terminado:
+            return False
+        # Solo cancela el future si sigue en la cola del worker
+        self.future.cancel()
+        if self.interno is not None:
+            self.interno.cancel()
+        self._finalizar(CANCELADO)
+        logger.info(f"Trabajo de solver {self.id} (zona {self.zona}) cancelado")
+        return True
+
+    def esperar(self) -> Optional[Dict]:
+        """
+        Espera la solución hasta el vencimiento del trabajo (bloqueante)
+
+        La espera en la cola no cuenta para el plazo; está acotada porque
+        cada trabajo que va delante tiene el suyo.
+
+        Returns:
+            Solución del solver, o None si se canceló, venció o falló
+        """
+        self.despachado.wait()
+        restante = (self.vence_en - datetime.utcnow()).total_seconds()
+        try:
+            try:
+                solucion = self.future.result(timeout=max(0.0, restante))
+            except FuturesTimeoutError:
+                if self.vencer():
+                    logger.warning(
+                        f"Trabajo de solver {self.id} (zona {self.zona}) sin resultado "
+                        f"en {self.limite_segundos + MARGEN_ESPERA_SEGUNDOS:.0f}s, se descarta"
+                    )
+                    return None
+                if not self.future.done():
+                    # Cancelado mientras se resolvía
+                    return None
+                solucion = self.future.result()
+        except CancelledError:
+            return None
+        except Exception as e:
+            self._finalizar(ERROR, str(e))
+            return None
+        self.solucion = solucion
+        if registro_trabajos.cancelado(self.id):
+            # Cancelado desde otro worker
+            self._finalizar(CANCELADO)
+        return None if self.estado == CANCELADO else solucion
+
+    def completar(self, ruta_id: Optional[int]):
+        """Registra la ruta guardada con la solución (None si no se pudo guardar)"""
+        self.ruta_id = ruta_id
+        if ruta_id:
+            self._finalizar(COMPLETADO)
+        else:
+            self._finalizar(ERROR, "No se pudo guardar la ruta")
+
+    def resumen(self) -> Dict:
+        solucion = self.solucion or {}
+        return {
+            "id": self.id,
+            "zona": self.zona,
+            "estado": self.estado,
+            "creado_en": self.creado_en,
+            "vence_en": self.vence_en,
+            "terminado_en": self.terminado_en,
+            "ruta_id": self.ruta_id,
+            "error": self.error,
+            "costo": solucion.get("costo"),
+            "costo_inicial": solucion.get("costo_inicial"),
+            "segundos_solver": solucion.get("segundos"),
+            "plazo_agotado": solucion.get("agotado")
+        }
+
+
+class RegistroTrabajos:
+    """
+    Copia en la base del estado de los trabajos (tabla trabajos_solver)
+
+    Los errores de la base se registran y no interrumpen el trabajo: el
+    worker que lo envió sigue teniendo su estado en memoria.
+    """
+
+    @staticmethod
+    def guardar(trabajo: TrabajoSolver):
+        """Inserta o actualiza el trabajo; no pisa una cancelación hecha desde otro worker"""
+        solucion = trabajo.solucion or {}
+        db = SessionLocal()
+        try:
+            fila = db.get(TrabajoSolverRegistro, trabajo.id, with_for_update=True)
+            if fila is None:
+                fila = TrabajoSolverRegistro(
+                    id=trabajo.id,
+                    zona=trabajo.zona,
+                    creado_en=trabajo.creado_en,
+                    vence_en=trabajo.vence_en
+                )
+                db.add(fila)
+            elif fila.estado != EN_CURSO:
+                db.rollback()
+                return
+            fila.vence_en = trabajo.vence_en
+            fila.estado = trabajo.estado
+            fila.error = trabajo.error
+            fila.ruta_id = trabajo.ruta_id
+            fila.terminado_en = trabajo.terminado_en
+            fila.costo = solucion.get("costo")
+            fila.costo_inicial = solucion.get("costo_inicial")
+            fila.segundos_solver = solucion.get("segundos")
+            fila.plazo_agotado = solucion.get("agotado")
+            db.commit()
+        except Exception as e:
+            db.rollback()
+            logger.error(f"No se pudo guardar el estado del trabajo de solver {trabajo.id}: {e}")
+        finally:
+            db.close()
+
+    @staticmethod
+    def cancelado(trabajo_id: str) -> bool:
+        """True si el trabajo se canceló (desde cualquier worker)"""
+        db = SessionLocal()
+        try:
+            estado = db.query(TrabajoSolverRegistro.estado).filter(
+                TrabajoSolverRegistro.id == trabajo_id
+            ).scalar()
+            return estado == CANCELADO
+        except Exception as e:
+            logger.error(f"No se pudo consultar el trabajo de solver {trabajo_id}: {e}")
+            return False
+        finally:
+            db.close()
+
+    @staticmethod
+    def cancelar(trabajo_id: str) -> Optional[Dict]:
+        """
+        Marca como cancelado un trabajo de otro worker; ese worker descarta
+        la solución al terminar
+
+        Returns:
+            Resumen del trabajo o None si no existe
+        """
+        db = SessionLocal()
+        try:
+            fila = db.get(TrabajoSolverRegistro, trabajo_id, with_for_update=True)
+            if fila is None:
+                return None
+            if fila.estado == EN_CURSO:
+                fila.estado = CANCELADO
+                fila.terminado_en = datetime.utcnow()
+                db.commit()
+                logger.info(f"Trabajo de solver {trabajo_id} (zona {fila.zona}) cancelado")
+            return RegistroTrabajos._resumen(fila)
+        finally:
+            db.close()
+
+    @staticmethod
+    def obtener(trabajo_id: str) -> Optional[Dict]:
+        db = SessionLocal()
+        try:
+            fila = db.get(TrabajoSolverRegistro, trabajo_id)
+            return RegistroTrabajos._resumen(fila) if fila else None
+        finally:
+            db.close()
+
+    @staticmethod
+    def listar(limite: int = 50) -> List[Dict]:
+        db = SessionLocal()
+        try:
+            filas = db.query(TrabajoSolverRegistro).order_by(
+                TrabajoSolverRegistro.creado_en.desc()
+            ).limit(limite).all()
+            return [RegistroTrabajos._resumen(fila) for fila in filas]
+        finally:
+            db.close()
+
+    @staticmethod
+    def purgar(limite: datetime):
+        """Borra los trabajos terminados antes de limite"""
+        db = SessionLocal()
+        try:
+            db.query(TrabajoSolverRegistro).filter(
+                TrabajoSolverRegistro.terminado_en < limite
+            ).delete(synchronize_session=False)
+            db.commit()
+        except Exception as e:
+            db.rollback()
+            logger.error(f"No se pudieron purgar los trabajos de solver: {e}")
+        finally:
+            db.close()
+
+    @staticmethod
+    def _resumen(fila: TrabajoSolverRegistro) -> Dict:
+        return {
+            "id": fila.id,
+            "zona": fila.zona,
+            "estado": fila.estado,
+            "creado_en": fila.creado_en,
+            "vence_en": fila.vence_en,
+            "terminado_en": fila.terminado_en,
+            "ruta_id": fila.ruta_id,
+            "error": fila.error,
+            "costo": fila.costo,
+            "costo_inicial": fila.costo_inicial,
+            "segundos_solver": fila.segundos_solver,
+            "plazo_agotado": fila.plazo_agotado
+        }
+
+
+class PoolSolver:
+    """
+    Pool de procesos compartido por los hilos del worker
+
+    El ProcessPoolExecutor se crea con el primer trabajo, con el método
+    spawn: los procesos hijos no heredan el pool de conexiones a Postgres ni
+    los hilos del proceso de la API, y solo importan el solver. Al pool se
+    envían a lo sumo tantos trabajos como procesos; el resto espera en la
+    cola del worker.
+    """
+
+    def __init__(self, procesos: int = PROCESOS_SOLVER):
+        self.procesos = procesos
+        self._executor: Optional[ProcessPoolExecutor] = None
+        self._persistencia: Optional[ThreadPoolExecutor] = None
+        self._lock = threading.Lock()
+        self._trabajos: Dict[str, TrabajoSolver] = {}
+        self._cola: Deque = deque()
+        self._en_pool = 0
+        self._ultima_purga = datetime.min
+
+    def _obtener_executor(self) -> ProcessPoolExecutor:
+        if self._executor is None:
+            with self._lock:
+                if self._executor is None:
+                    self._executor = ProcessPoolExecutor(
+                        max_workers=self.procesos,
+                        mp_context=multiprocessing.get_context("spawn")
+                    )
+                    logger.info(f"Pool del solver iniciado con {self.procesos} procesos")
+        return self._executor
+
+    def _obtener_persistencia(self) -> ThreadPoolExecutor:
+        if self._persistencia is None:
+            with self._lock:
+                if self._persistencia is None:
+                    self._persistencia = ThreadPoolExecutor(
+                        max_workers=2, thread_name_prefix="solver-persistencia"
+                    )
+        return self._persistencia
+
+    def detener(self):
+        """Cancela los trabajos en cola y cierra el pool"""
+        with self._lock:
+            executor, self._executor = self._executor, None
+            persistencia, self._persistencia = self._persistencia, None
+            self._cola.clear()
+        for trabajo in list(self._trabajos.values()):
+            trabajo.cancelar()
+        if executor is not None:
+            executor.shutdown(wait=False, cancel_futures=True)
+        if persistencia is not None:
+            persistencia.shutdown(wait=False, cancel_futures=True)
+
+    def _enviar_al_pool(self, problema: Dict) -> Future:
+        from app.solver_vrp import resolver
+
+        if self.procesos <= 0:
+            future: Future = Future()
+            future.set_running_or_notify_cancel()
+            try:
+                future.set_result(resolver(problema))
+            except Exception as e:
+                future.set_exception(e)
+            return future
+
+        try:
+            return self._obtener_executor().submit(resolver, problema)
+        except BrokenProcessPool:
+            # Un proceso hijo murió (OOM, kill): se reemplaza el pool completo
+            logger.error("Pool del solver roto, se crea uno nuevo")
+            with self._lock:
+                roto, self._executor = self._executor, None
+            if roto is not None:
+                roto.shutdown(wait=False, cancel_futures=True)
+            return self._obtener_executor().submit(resolver, problema)
+
+    def enviar(
+        self,
+        zona: str,
+        problema: Dict,
+        limite_segundos: Optional[float] = None,
+        al_terminar: Optional[Callable[[TrabajoSolver, Dict], Optional[int]]] = None
+    ) -> TrabajoSolver:
+        """
+        Encola un problema para el pool
+
+        Args:
+            zona: Zona del problema (para el registro de trabajos)
+            problema: Problema serializable de app.solver_vrp
+            limite_segundos: Plazo del solver (por defecto SOLVER_LIMITE_SEGUNDOS)
+            al_terminar: Si se indica, se llama en un hilo de persistencia
+                con el trabajo y la solución, y debe retornar el id de la
+                ruta guardada. Sin él, quien envía espera con
+                trabajo.esperar() y persiste en su propio hilo.
+
+        Returns:
+            TrabajoSolver registrado
+        """
+        limite = LIMITE_SEGUNDOS if limite_segundos is None else limite_segundos
+        trabajo = TrabajoSolver(zona, limite)
+        self._registrar(trabajo)
+
+        problema = dict(problema, limite_segundos=limite)
+        trabajo.future.add_done_callback(
+            lambda future: self._terminado(trabajo, future, al_terminar)
+        )
+        with self._lock:
+            self._cola.append((trabajo, problema, al_terminar))
+
+        logger.info(
+            f"Trabajo de solver {trabajo.id} encolado: zona {zona}, "
+            f"{len(problema['incidencias'])} incidencias, plazo {limite:.0f}s"
+        )
+        self._despachar()
+        return trabajo
+
+    def _despachar(self):
+        """Pasa trabajos de la cola al pool mientras haya procesos libres"""
+        while True:
+            with self._lock:
+                if not self._cola or (self.procesos > 0 and self._en_pool >= self.procesos):
+                    return
+                trabajo, problema, al_terminar = self._cola.popleft()
+                # Un trabajo cancelado mientras esperaba no pasa al pool
+                if not trabajo._iniciar():
+                    continue
+                self._en_pool += 1
+
+            if al_terminar is not None:
+                # Sin nadie esperando, el vencimiento lo aplica un temporizador
+                trabajo.temporizador = threading.Timer(
+                    (trabajo.vence_en - datetime.utcnow()).total_seconds(), self._vencer, (trabajo,)
+                )
+                trabajo.temporizador.daemon = True
+                trabajo.temporizador.start()
+            trabajo.interno = self._enviar_al_pool(problema)
+            trabajo.interno.add_done_callback(
+                lambda interno, trabajo=trabajo: self._liberar(trabajo, interno)
+            )
+
+    def _liberar(self, trabajo: TrabajoSolver, interno: Future):
+        """Callback del pool: libera el proceso y pasa el resultado al trabajo"""
+        with self._lock:
+            self._en_pool -= 1
+        with trabajo.lock:
+            if interno.cancelled():
+                trabajo.future.set_exception(CancelledError())
+            elif interno.exception() is not None:
+                trabajo.future.set_exception(interno.exception())
+            else:
+                trabajo.future.set_result(interno.result())
+        self._despachar()
+
+    @staticmethod
+    def _vencer(trabajo: TrabajoSolver):
+        if trabajo.vencer():
+            logger.warning(f"Trabajo de solver {trabajo.id} (zona {trabajo.zona}) vencido")
+
+    def _terminado(
+        self,
+        trabajo: TrabajoSolver,
+        future: Future,
+        al_terminar: Optional[Callable[[TrabajoSolver, Dict], Optional[int]]]
+    ):
+        """Callback del trabajo: registra el resultado y persiste"""
+        # Con la solución recibida el plazo ya no aplica a la persistencia
+        if trabajo.temporizador is not None:
+            trabajo.temporizador.cancel()
+        if future.cancelled():
+            trabajo._finalizar(CANCELADO)
+            return
+        error = future.exception()
+        if error is not None:
+            trabajo._finalizar(ERROR, str(error))
+            logger.error(f"Trabajo de solver {trabajo.id} falló: {error}")
+            return
+
+        trabajo.solucion = future.result()
+        if trabajo.terminado or al_terminar is None:
+            return
+        self._obtener_persistencia().submit(self._persistir, trabajo, al_terminar)
+
+    @staticmethod
+    def _persistir(
+        trabajo: TrabajoSolver,
+        al_terminar: Callable[[TrabajoSolver, Dict], Optional[int]]
+    ):
+        if trabajo.terminado:
+            return
+        if registro_trabajos.cancelado(trabajo.id):
+            trabajo._finalizar(CANCELADO)
+            return
+        try:
+            ruta_id = al_terminar(trabajo, trabajo.solucion)
+        except Exception as e:
+            trabajo._finalizar(ERROR, str(e))
+            logger.error(f"Error al persistir el trabajo de solver {trabajo.id}: {e}")
+            return
+        trabajo.completar(ruta_id)
+
+    def _registrar(self, trabajo: TrabajoSolver):
+        ahora = datetime.utcnow()
+        limite = ahora - RETENCION_TRABAJOS
+        with self._lock:
+            for trabajo_id in [
+                t.id for t in self._trabajos.values()
+                if t.terminado and t.terminado_en < limite
+            ]:
+                del self._trabajos[trabajo_id]
+            self._trabajos[trabajo.id] = trabajo
+            purgar = ahora - self._ultima_purga >= INTERVALO_PURGA
+            if purgar:
+                self._ultima_purga = ahora
+        if purgar:
+            registro_trabajos.purgar(limite)
+        registro_trabajos.guardar(trabajo)
+
+    def obtener(self, trabajo_id: str) -> Optional[Dict]:
+        """Resumen de un trabajo de cualquier worker (None si no existe)"""
+        trabajo = self._trabajos.get(trabajo_id)
+        return trabajo.resumen() if trabajo else registro_trabajos.obtener(trabajo_id)
+
+    def listar(self) -> List[Dict]:
+        """Trabajos en curso y recientes de todos los workers"""
+        return registro_trabajos.listar()
+
+    def cancelar(self, trabajo_id: str) -> Optional[Dict]:
+        """
+        Cancela un trabajo por id, sea de este worker o de otro
+
+        Returns:
+            Resumen del trabajo tras cancelar (con su estado final si ya
+            había terminado) o None si no existe
+        """
+        trabajo = self._trabajos.get(trabajo_id)
+        if trabajo is None:
+            return registro_trabajos.cancelar(trabajo_id)
+        trabajo.cancelar()
+        return trabajo.resumen()
+
+
+# Registro compartido y pool del proceso actual
+registro_trabajos = RegistroTrabajos()
+pool_solver = PoolSolver()
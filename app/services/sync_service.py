@@ -0,0 +1,241 @@
+"""
+Sincronización incremental para la app de conductores
+Los triggers de la migración 011 anotan en cambios_sync cada cambio en
+asignaciones, paradas, rutas e incidencias junto con la transacción que lo
+hizo. La app envía la última versión que recibió y solo descarga el estado
+actual de lo que cambió desde entonces.
+
+La versión es el xmin del snapshot (pg_snapshot_xmin): toda transacción
+anterior ya terminó, así que ningún cambio por debajo del cursor puede
+confirmarse después de entregarlo, por larga que sea la transacción.
+"""
+import os
+import logging
+from datetime import datetime, timedelta
+from typing import Dict, List, Optional, Set
+
+from sqlalchemy import text
+from sqlalchemy.orm import Session
+
+from app.database import ingesta_engine
+from app.models import AsignacionConductor, Incidencia, RutaDetalle, RutaGenerada
+from app.json_rapido import filas_a_dicts
+
+logger = logging.getLogger(__name__)
+
+
+RETENCION_CAMBIOS_DIAS = int(os.getenv("SYNC_RETENCION_DIAS", "14"))
+
+COLUMNAS_ASIGNACION = (
+    AsignacionConductor.id, AsignacionConductor.ruta_id, AsignacionConductor.camion_tipo,
+    AsignacionConductor.camion_id, AsignacionConductor.estado, AsignacionConductor.fecha_asignacion,
+    AsignacionConductor.fecha_inicio, AsignacionConductor.fecha_finalizacion
+)
+COLUMNAS_RUTA = (
+    RutaGenerada.id, RutaGenerada.zona, RutaGenerada.estado, RutaGenerada.suma_gravedad,
+    RutaGenerada.camiones_usados, RutaGenerada.fecha_generacion, RutaGenerada.duracion_estimada
+)
+COLUMNAS_PARADA = (
+    RutaDetalle.id, RutaDetalle.ruta_id, RutaDetalle.camion_id, RutaDetalle.viaje,
+    RutaDetalle.orden, RutaDetalle.tipo_punto, RutaDetalle.incidencia_id, RutaDetalle.lat,
+    RutaDetalle.lon, RutaDetalle.llegada_estimada, RutaDetalle.visitado_en
+)
+COLUMNAS_INCIDENCIA = (
+    Incidencia.id, Incidencia.tipo, Incidencia.gravedad, Incidencia.estado,
+    Incidencia.descripcion, Incidencia.foto_url
+)
+
+
+class SyncService:
+    """Servicio de sincronización incremental por versión"""
+
+    @staticmethod
+    def version_actual(db: Session) -> int:
+        """
+        Cursor seguro: la transacción más antigua aún en curso
+
+        Los cambios de transacciones anteriores ya están confirmados (o
+        descartados) y visibles; los de esa transacción y las siguientes se
+        consultan en la próxima sync aunque algunos ya se hayan entregado.
+        Se lee antes de consultar los cambios.
+        """
+        return db.execute(
+            text("SELECT CAST(CAST(pg_snapshot_xmin(pg_current_snapshot()) AS text) AS bigint)")
+        ).scalar()
+
+    @staticmethod
+    def version_minima(db: Session) -> Optional[int]:
+        """Transacción más antigua conservada (las anteriores se podaron)"""
+        return db.execute(
+            text("SELECT CAST(CAST(MIN(txid) AS text) AS bigint) FROM cambios_sync")
+        ).scalar()
+
+    @staticmethod
+    def _filtrar_paradas(paradas: List, camion_por_ruta: Dict[int, Optional[str]]) -> List:
+        """Paradas del camión asignado al conductor (todas si la asignación no tiene placa)"""
+        return [
+            p for p in paradas
+            if p.ruta_id in camion_por_ruta
+            and (camion_por_ruta[p.ruta_id] is None or p.camion_id == camion_por_ruta[p.ruta_id])
+        ]
+
+    @staticmethod
+    def _respuesta(
+        version: int,
+        completo: bool,
+        asignaciones: List,
+        rutas: List,
+        paradas: List,
+        incidencias: List,
+        eliminados: Optional[Dict[str, List[int]]] = None
+    ) -> Dict:
+        return {
+            "version": version,
+            "completo": completo,
+            "asignaciones": filas_a_dicts(asignaciones),
+            "rutas": filas_a_dicts(rutas),
+            "paradas": filas_a_dicts(paradas),
+            "incidencias": filas_a_dicts(incidencias),
+            "eliminados": eliminados or {"asignaciones": [], "paradas": []}
+        }
+
+    @staticmethod
+    def obtener_snapshot(db: Session, conductor_id: int, version: int) -> Dict:
+        """
+        Estado completo de las asignaciones activas del conductor
+
+        Se usa en la primera sincronización y cuando la versión del cliente
+        es anterior a los cambios conservados.
+        """
+        asignaciones = db.query(*COLUMNAS_ASIGNACION).filter(
+            AsignacionConductor.conductor_id == conductor_id,
+            AsignacionConductor.estado.in_(['asignado', 'iniciado'])
+        ).all()
+        camion_por_ruta = {a.ruta_id: a.camion_id for a in asignaciones}
+
+        rutas, paradas, incidencias = [], [], []
+        if camion_por_ruta:
+            rutas = db.query(*COLUMNAS_RUTA).filter(RutaGenerada.id.in_(camion_por_ruta)).all()
+            paradas = SyncService._filtrar_paradas(
+                db.query(*COLUMNAS_PARADA).filter(
+                    RutaDetalle.ruta_id.in_(camion_por_ruta)
+                ).order_by(RutaDetalle.ruta_id, RutaDetalle.orden).all(),
+                camion_por_ruta
+            )
+            incidencia_ids = {p.incidencia_id for p in paradas if p.incidencia_id}
+            if incidencia_ids:
+                incidencias = db.query(*COLUMNAS_INCIDENCIA).filter(
+                    Incidencia.id.in_(incidencia_ids)
+                ).all()
+
+        return SyncService._respuesta(version, True, asignaciones, rutas, paradas, incidencias)
+
+    @staticmethod
+    def obtener_cambios(db: Session, conductor_id: int, since: Optional[int]) -> Dict:
+        """
+        Cambios de las asignaciones, rutas, paradas e incidencias del
+        conductor posteriores a una versión
+
+        Args:
+            db: Sesión de base de datos
+            conductor_id: Conductor autenticado
+            since: Última versión recibida por la app (None o 0: todo)
+
+        Returns:
+            Dict con version (cursor para la siguiente llamada), completo
+            (True si la app debe reemplazar su estado), los registros
+            cambiados con su estado actual y los ids eliminados
+        """
+        version = SyncService.version_actual(db)
+
+        minima = SyncService.version_minima(db)
+        if not since or (minima is not None and since < minima):
+            return SyncService.obtener_snapshot(db, conductor_id, version)
+
+        # Dos ramas para que cada una use su índice cubriente (un OR obliga
+        # a leer la tabla); un cambio en ambas ramas solo se repite en los ids
+        cambios = db.execute(text("""
+            SELECT tabla, registro_id, operacion
+            FROM cambios_sync
+            WHERE conductor_id = :conductor_id
+              AND txid >= CAST(CAST(:since AS text) AS xid8)
+            UNION ALL
+            SELECT tabla, registro_id, operacion
+            FROM cambios_sync
+            WHERE ruta_id IN (SELECT ruta_id FROM asignaciones_conductores
+                              WHERE conductor_id = :conductor_id)
+              AND txid >= CAST(CAST(:since AS text) AS xid8)
+        """), {"since": since, "conductor_id": conductor_id}).all()
+
+        ids: Dict[str, Set[int]] = {
+            "asignaciones_conductores": set(), "rutas_detalle": set(),
+            "rutas_generadas": set(), "incidencias": set()
+        }
+        for tabla, registro_id, _ in cambios:
+            ids.setdefault(tabla, set()).add(registro_id)
+
+        # Estado actual de lo que cambió (lo que ya no existe o dejó de ser
+        # del conductor se informa como eliminado)
+        asignaciones = []
+        if ids["asignaciones_conductores"]:
+            asignaciones = db.query(*COLUMNAS_ASIGNACION).filter(
+                AsignacionConductor.id.in_(ids["asignaciones_conductores"]),
+                AsignacionConductor.conductor_id == conductor_id
+            ).all()
+
+        camion_por_ruta = {
+            ruta_id: camion_id for ruta_id, camion_id in db.query(
+                AsignacionConductor.ruta_id, AsignacionConductor.camion_id
+            ).filter(
+                AsignacionConductor.conductor_id == conductor_id,
+                AsignacionConductor.estado != 'cancelado'
+            ).all()
+        }
+
+        ruta_ids = (ids["rutas_generadas"] | {a.ruta_id for a in asignaciones}) & set(camion_por_ruta)
+        rutas = db.query(*COLUMNAS_RUTA).filter(RutaGenerada.id.in_(ruta_ids)).all() if ruta_ids else []
+
+        paradas = []
+        if ids["rutas_detalle"]:
+            paradas = SyncService._filtrar_paradas(
+                db.query(*COLUMNAS_PARADA).filter(
+                    RutaDetalle.id.in_(ids["rutas_detalle"])
+                ).order_by(RutaDetalle.ruta_id, RutaDetalle.orden).all(),
+                camion_por_ruta
+            )
+
+        incidencias = []
+        if ids["incidencias"]:
+            incidencias = db.query(*COLUMNAS_INCIDENCIA).filter(
+                Incidencia.id.in_(ids["incidencias"])
+            ).all()
+
+        eliminados = {
+            "asignaciones": sorted(ids["asignaciones_conductores"] - {a.id for a in asignaciones}),
+            "paradas": sorted(
+                ids["rutas_detalle"] - {p.id for p in paradas}
+            )
+        }
+
+        return SyncService._respuesta(
+            max(version, since), False, asignaciones, rutas, paradas, incidencias, eliminados
+        )
+
+    @staticmethod
+    def podar_cambios(dias: int = RETENCION_CAMBIOS_DIAS) -> int:
+        """
+        Elimina cambios más antiguos que la retención
+
+        Las apps con una versión anterior recibirán un snapshot completo.
+
+        Returns:
+            Filas eliminadas
+        """
+        with ingesta_engine.begin() as conexion:
+            eliminadas = conexion.execute(
+                text("DELETE FROM cambios_sync WHERE creado_en < :limite"),
+                {"limite": datetime.utcnow() - timedelta(days=dias)}
+            ).rowcount
+        if eliminadas:
+            logger.info(f"Podados {eliminadas} cambios de sincronización (> {dias} días)")
+        return eliminadas
@@ -0,0 +1,205 @@
+"""
+Canal de eventos en tiempo real para la app de conductores
+Los eventos se publican con NOTIFY de Postgres; cada proceso uvicorn
+escucha el canal con LISTEN y los reenvía a los WebSockets de sus
+conductores conectados, así un evento generado en cualquier worker llega a
+todos los conductores sin importar a qué worker estén conectados
+"""
+import os
+import json
+import select
+import asyncio
+import logging
+import threading
+from datetime import datetime
+from typing import Callable, Dict, List, Optional, Set
+
+from fastapi import WebSocket
+from sqlalchemy import text
+
+from app.database import engine
+
+logger = logging.getLogger(__name__)
+
+
+CANAL_EVENTOS = os.getenv("CANAL_EVENTOS_CONDUCTORES", "eventos_conductores")
+
+# Tipos de evento
+RUTA_CREADA = "ruta_creada"
+RUTA_CANCELADA = "ruta_cancelada"
+PARADA_ACTUALIZADA = "parada_actualizada"
+
+# NOTIFY admite hasta 8000 bytes por mensaje
+MAX_PAYLOAD_BYTES = 7900
+
+
+def publicar_evento(
+    tipo: str,
+    datos: Dict,
+    conductor_ids: Optional[List[int]] = None,
+    zona: Optional[str] = None
+) -> bool:
+    """
+    Publica un evento para los conductores
+
+    Destinatarios: los conductor_ids indicados o, si no se indican, los
+    conductores de la zona (zona preferida igual o 'ambas'); sin ninguno
+    de los dos, todos los conectados.
+
+    Returns:
+        True si el evento se publicó
+    """
+    evento = {
+        "tipo": tipo,
+        "datos": datos,
+        "conductor_ids": conductor_ids,
+        "zona": zona,
+        "timestamp": datetime.utcnow().isoformat()
+    }
+    payload = json.dumps(evento, default=str)
+    if len(payload.encode()) > MAX_PAYLOAD_BYTES:
+        logger.error(f"Evento {tipo} demasiado grande para NOTIFY ({len(payload)} bytes)")
+        return False
+
+    try:
+        with engine.begin() as conexion:
+            conexion.execute(
+                text("SELECT pg_notify(:canal, :payload)"),
+                {"canal": CANAL_EVENTOS, "payload": payload}
+            )
+        return True
+    except Exception as e:
+        # Un fallo del canal no debe interrumpir la operación que originó el evento
+        logger.error(f"No se pudo publicar evento {tipo}: {e}")
+        return False
+
+
+class GestorConexiones:
+    """WebSockets abiertos en este proceso, por conductor"""
+
+    def __init__(self):
+        self._conexiones: Dict[int, Set[WebSocket]] = {}
+        self._zonas: Dict[int, str] = {}
+
+    @property
+    def total(self) -> int:
+        return sum(len(c) for c in self._conexiones.values())
+
+    async def conectar(self, websocket: WebSocket, conductor_id: int, zona: str):
+        await websocket.accept()
+        self._conexiones.setdefault(conductor_id, set()).add(websocket)
+        self._zonas[conductor_id] = zona
+        logger.info(f"Conductor {conductor_id} conectado por WebSocket ({self.total} conexiones)")
+
+    def desconectar(self, websocket: WebSocket, conductor_id: int):
+        conexiones = self._conexiones.get(conductor_id)
+        if conexiones:
+            conexiones.discard(websocket)
+            if not conexiones:
+                del self._conexiones[conductor_id]
+                self._zonas.pop(conductor_id, None)
+
+    def _destinatarios(self, evento: Dict) -> List[int]:
+        if evento.get("conductor_ids"):
+            return [c for c in evento["conductor_ids"] if c in self._conexiones]
+        zona = evento.get("zona")
+        if zona:
+            return [c for c, z in self._zonas.items() if z in (zona, 'ambas')]
+        return list(self._conexiones)
+
+    async def difundir(self, evento: Dict):
+        """Envía el evento a los conductores destinatarios conectados aquí"""
+        mensaje = {k: evento[k] for k in ("tipo", "datos", "timestamp")}
+        for conductor_id in self._destinatarios(evento):
+            for websocket in list(self._conexiones.get(conductor_id, ())):
+                try:
+                    await websocket.send_json(mensaje)
+                except Exception:
+                    self.desconectar(websocket, conductor_id)
+
+
+class EscuchaEventos:
+    """
+    Hilo con una conexión dedicada en LISTEN sobre CANAL_EVENTOS
+
+    Cada notificación se entrega al GestorConexiones en el event loop de
+    la aplicación, salvo los eventos internos entre procesos (ver
+    al_recibir), que no llegan a los conductores.
+    """
+
+    def __init__(self, gestor: GestorConexiones):
+        self.gestor = gestor
+        self._internos: Dict[str, Callable[[Dict], None]] = {}
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._detener = threading.Event()
+        self._hilo: Optional[threading.Thread] = None
+
+    def iniciar(self, loop: asyncio.AbstractEventLoop):
+        if self._hilo and self._hilo.is_alive():
+            return
+        self._loop = loop
+        self._detener.clear()
+        self._hilo = threading.Thread(target=self._bucle, name="listen-eventos", daemon=True)
+        self._hilo.start()
+
+    def detener(self):
+        self._detener.set()
+        if self._hilo:
+            self._hilo.join(timeout=5)
+
+    def al_recibir(self, tipo: str, manejador: Callable[[Dict], None]):
+        """
+        Atiende en este proceso los eventos internos de un tipo (ej. invalidar
+        una cache de los demás workers); se ejecuta en el hilo de LISTEN
+        """
+        self._internos[tipo] = manejador
+
+    def _bucle(self):
+        while not self._detener.is_set():
+            try:
+                self._escuchar()
+            except Exception as e:
+                logger.error(f"Conexión LISTEN perdida, reintentando: {e}")
+                self._detener.wait(5)
+
+    def _escuchar(self):
+        # Conexión fuera del pool: queda en autocommit y ocupada con LISTEN
+        conexion = engine.raw_connection()
+        conexion.detach()
+        try:
+            pg = conexion.driver_connection
+            pg.autocommit = True
+            with pg.cursor() as cursor:
+                cursor.execute(f'LISTEN "{CANAL_EVENTOS}"')
+            logger.info(f"Escuchando eventos en canal {CANAL_EVENTOS}")
+
+            while not self._detener.is_set():
+                if select.select([pg], [], [], 5) == ([], [], []):
+                    continue
+                pg.poll()
+                while pg.notifies:
+                    notificacion = pg.notifies.pop(0)
+                    self._entregar(notificacion.payload)
+        finally:
+            conexion.close()
+
+    def _entregar(self, payload: str):
+        try:
+            evento = json.loads(payload)
+        except ValueError:
+            logger.warning("Evento con payload inválido descartado")
+            return
+        manejador = self._internos.get(evento.get("tipo"))
+        if manejador is not None:
+            try:
+                manejador(evento.get("datos") or {})
+            except Exception as e:
+                logger.error(f"Error al atender evento {evento.get('tipo')}: {e}")
+            return
+        if self._loop and self.gestor.total:
+            asyncio.run_coroutine_threadsafe(self.gestor.difundir(evento), self._loop)
+
+
+# Instancias compartidas del proceso
+gestor_conexiones = GestorConexiones()
+escucha_eventos = EscuchaEventos(gestor_conexiones)
@@ -0,0 +1,232 @@
+"""
+Teselas vectoriales (Mapbox Vector Tiles) de incidencias y rutas
+PostGIS arma cada tesela con ST_AsMVT solo con las geometrías dentro de su
+sobre (índice GIST), así el costo depende de lo visible y no del historial.
+En zooms bajos las incidencias se agrupan por celda para acotar el tamaño.
+"""
+import os
+import time
+import threading
+import logging
+from collections import OrderedDict
+from datetime import datetime
+from typing import Dict, Optional, Tuple
+
+from sqlalchemy import text
+from sqlalchemy.orm import Session
+
+from app.database import registrar_invalidacion
+from app.models import Incidencia, RutaGenerada, RutaGeometria
+from app.services.tiempo_real_service import escucha_eventos, publicar_evento
+
+logger = logging.getLogger(__name__)
+
+
+CAPAS = ('incidencias', 'rutas')
+
+# Evento interno con el que un worker avisa a los demás que cambió el mapa
+MAPA_MODIFICADO = "mapa_modificado"
+
+EXTENT = 4096
+BUFFER = 64
+
+# Por debajo de este zoom las incidencias se agrupan en celdas
+ZOOM_AGRUPACION = int(os.getenv("TILES_ZOOM_AGRUPACION", "14"))
+# Tamaño de celda en píxeles de la tesela (256 px de ancho)
+CELDA_PIXELES = 16
+
+# Circunferencia de la Tierra en EPSG:3857
+MUNDO_METROS = 40075016.68557849
+
+
+class CacheTeselas:
+    """
+    LRU de teselas ya generadas
+
+    Cualquier escritura confirmada de incidencias o rutas cambia la versión
+    y deja obsoletas todas las entradas: en este proceso al confirmar y en
+    los demás workers al recibir MAPA_MODIFICADO por LISTEN/NOTIFY.
+    TTL_SEGUNDOS solo acota lo que tarda en verse un cambio si la conexión
+    LISTEN está caída.
+    """
+
+    TTL_SEGUNDOS = float(os.getenv("TILES_TTL", "300"))
+    MAX_ENTRADAS = int(os.getenv("TILES_CACHE_MAX", "2000"))
+
+    def __init__(self):
+        self._teselas: "OrderedDict[Tuple, Tuple[bytes, float]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.version = 0
+
+    def invalidar(self):
+        with self._lock:
+            self.version += 1
+            self._teselas.clear()
+
+    def obtener(self, clave: Tuple) -> Optional[bytes]:
+        with self._lock:
+            entrada = self._teselas.get(clave)
+            if entrada is None:
+                return None
+            tesela, creada = entrada
+            if time.monotonic() - creada > self.TTL_SEGUNDOS:
+                del self._teselas[clave]
+                return None
+            self._teselas.move_to_end(clave)
+            return tesela
+
+    def guardar(self, clave: Tuple, tesela: bytes, version: int):
+        with self._lock:
+            if version != self.version:
+                # Hubo una escritura mientras se generaba: no cachear
+                return
+            self._teselas[clave] = (tesela, time.monotonic())
+            self._teselas.move_to_end(clave)
+            while len(self._teselas) > self.MAX_ENTRADAS:
+                self._teselas.popitem(last=False)
+
+
+# Cache compartida del proceso
+cache_teselas = CacheTeselas()
+
+
+def _mapa_modificado():
+    """Invalida las teselas aquí y en los demás workers"""
+    cache_teselas.invalidar()
+    publicar_evento(MAPA_MODIFICADO, {"pid": os.getpid()})
+
+
+def _invalidar_por_evento(datos: Dict):
+    if datos.get("pid") != os.getpid():
+        cache_teselas.invalidar()
+
+
+registrar_invalidacion((Incidencia, RutaGenerada, RutaGeometria), _mapa_modificado)
+escucha_eventos.al_recibir(MAPA_MODIFICADO, _invalidar_por_evento)
+
+
+def _filtros(prefijo: str, columna_fecha: str, estado: Optional[str], filtros: Dict) -> Tuple[str, Dict]:
+    """Condiciones SQL y parámetros de los filtros de una capa"""
+    condiciones, parametros = [], {}
+    if estado:
+        condiciones.append(f"{prefijo}.estado = :estado_{prefijo}")
+        parametros[f"estado_{prefijo}"] = estado
+    if filtros.get("zona"):
+        condiciones.append(f"{prefijo}.zona = :zona")
+        parametros["zona"] = filtros["zona"]
+    if filtros.get("desde"):
+        condiciones.append(f"{prefijo}.{columna_fecha} >= :desde")
+        parametros["desde"] = filtros["desde"]
+    if filtros.get("hasta"):
+        condiciones.append(f"{prefijo}.{columna_fecha} < :hasta")
+        parametros["hasta"] = filtros["hasta"]
+    return "".join(f" AND {c}" for c in condiciones), parametros
+
+
+class TilesService:
+    """Servicio de generación de teselas MVT"""
+
+    @staticmethod
+    def _sql_incidencias(z: int, condiciones: str) -> str:
+        base = f"""
+            FROM incidencias i, limites l
+            WHERE i.geom && l.geom_4326{condiciones}
+        """
+        if z >= ZOOM_AGRUPACION:
+            return f"""
+                SELECT ST_AsMVT(t, 'incidencias', {EXTENT}, 'geom') FROM (
+                    SELECT ST_AsMVTGeom(ST_Transform(i.geom, 3857), l.geom, {EXTENT}, {BUFFER}, true) AS geom,
+                           i.id, i.tipo, i.gravedad, i.estado, i.zona,
+                           extract(epoch FROM i.reportado_en)::bigint AS reportado_en,
+                           1 AS total
+                    {base}
+                ) t
+            """
+        # Agrupar por celda: un punto por celda con el número de incidencias
+        return f"""
+            SELECT ST_AsMVT(t, 'incidencias', {EXTENT}, 'geom') FROM (
+                SELECT ST_AsMVTGeom(ST_Centroid(ST_Collect(ST_Transform(i.geom, 3857))), l.geom, {EXTENT}, {BUFFER}, true) AS geom,
+                       count(*)::int AS total,
+                       max(i.gravedad)::int AS gravedad,
+                       sum(i.gravedad)::int AS suma_gravedad
+                {base}
+                GROUP BY ST_SnapToGrid(ST_Transform(i.geom, 3857), :celda), l.geom
+            ) t
+        """
+
+    @staticmethod
+    def _sql_rutas(condiciones: str) -> str:
+        return f"""
+            SELECT ST_AsMVT(t, 'rutas', {EXTENT}, 'geom') FROM (
+                SELECT ST_AsMVTGeom(ST_Transform(g.geom, 3857), l.geom, {EXTENT}, {BUFFER}, true) AS geom,
+                       g.ruta_id, g.camion_id, r.zona, r.estado,
+                       extract(epoch FROM r.fecha_generacion)::bigint AS fecha_generacion
+                FROM rutas_geometria g
+                JOIN rutas_generadas r ON r.id = g.ruta_id, limites l
+                WHERE g.geom && l.geom_4326{condiciones}
+            ) t
+        """
+
+    @staticmethod
+    def generar_tesela(
+        db: Session,
+        z: int,
+        x: int,
+        y: int,
+        capas: Tuple[str, ...] = CAPAS,
+        estado: Optional[str] = None,
+        estado_ruta: Optional[str] = None,
+        zona: Optional[str] = None,
+        desde: Optional[datetime] = None,
+        hasta: Optional[datetime] = None
+    ) -> bytes:
+        """
+        Tesela MVT con las capas pedidas
+
+        Args:
+            db: Sesión de base de datos
+            z, x, y: Coordenadas de la tesela (esquema XYZ)
+            capas: Subconjunto de CAPAS
+            estado: Estado de las incidencias
+            estado_ruta: Estado de las rutas
+            zona: Zona de incidencias y rutas
+            desde, hasta: Rango de fechas (reporte de la incidencia /
+                generación de la ruta)
+
+        Returns:
+            Bytes de la tesela (vacío si no hay geometrías)
+        """
+        filtros = {"zona": zona, "desde": desde, "hasta": hasta}
+        clave = (z, x, y, capas, estado, estado_ruta, zona, desde, hasta)
+
+        tesela = cache_teselas.obtener(clave)
+        if tesela is not None:
+            return tesela
+        version = cache_teselas.version
+
+        consultas, parametros = [], {"z": z, "x": x, "y": y}
+        if 'incidencias' in capas:
+            condiciones, p = _filtros("i", "reportado_en", estado, filtros)
+            consultas.append(f"({TilesService._sql_incidencias(z, condiciones)})")
+            parametros.update(p)
+            parametros["celda"] = MUNDO_METROS / (2 ** z) / 256 * CELDA_PIXELES
+        if 'rutas' in capas:
+            condiciones, p = _filtros("r", "fecha_generacion", estado_ruta, filtros)
+            consultas.append(f"({TilesService._sql_rutas(condiciones)})")
+            parametros.update(p)
+
+        if not consultas:
+            return b""
+
+        # Las capas MVT se concatenan byte a byte en una sola tesela
+        sql = f"""
+            WITH limites AS (
+                SELECT ST_TileEnvelope(:z, :x, :y) AS geom,
+                       ST_Transform(ST_TileEnvelope(:z, :x, :y, margin => {BUFFER / EXTENT}), 4326) AS geom_4326
+            )
+            SELECT {' || '.join(f'COALESCE({c}, ' + "''::bytea)" for c in consultas)}
+        """
+        tesela = bytes(db.execute(text(sql), parametros).scalar() or b"")
+
+        cache_teselas.guardar(clave, tesela, version)
+        return tesela
@@ -0,0 +1,213 @@
+"""
+Perfiles de tráfico por zona y hora del día
+OSRM devuelve tiempos a flujo libre; el centro de Latacunga se congestiona
+en horario escolar. Los perfiles guardan un multiplicador de duración por
+hora, aprendido de las rutas completadas por los conductores.
+"""
+import os
+import time
+import threading
+import logging
+from datetime import datetime, timedelta
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+from sqlalchemy.orm import Session, contains_eager
+
+from app.database import registrar_invalidacion
+from app.models import AsignacionConductor, PerfilTrafico, RutaDetalle, RutaGenerada
+
+logger = logging.getLogger(__name__)
+
+
+# Latacunga está en UTC-5; las fechas se guardan en UTC
+UTC_OFFSET_HORAS = int(os.getenv("TRAFICO_UTC_OFFSET_HORAS", "-5"))
+
+ZONAS = ('oriental', 'occidental')
+
+# Perfil inicial: entrada/salida escolar y hora pico de la tarde
+FACTORES_DEFAULT = np.ones(24, dtype=np.float32)
+FACTORES_DEFAULT[[7, 12, 13]] = 1.35
+FACTORES_DEFAULT[[17, 18]] = 1.25
+
+# Límites para descartar registros anómalos (rutas olvidadas abiertas, etc.)
+RATIO_MIN = 0.5
+RATIO_MAX = 3.0
+
+# Peso del perfil por defecto al combinarlo con pocas muestras
+MUESTRAS_PRIOR = 3
+
+
+def hora_local(fecha: datetime) -> int:
+    """Hora local (0-23) de una fecha guardada en UTC"""
+    return (fecha + timedelta(hours=UTC_OFFSET_HORAS)).hour
+
+
+class RegistroPerfiles:
+    """
+    Cache de perfiles_trafico: un array de 24 factores por zona
+
+    Se invalida al escribir un PerfilTrafico en este proceso y se recarga
+    pasado TTL_SEGUNDOS.
+    """
+
+    TTL_SEGUNDOS = float(os.getenv("PERFILES_TRAFICO_TTL", "900"))
+
+    def __init__(self):
+        self._perfiles: Dict[str, np.ndarray] = {}
+        self._cargado_en: Optional[float] = None
+        self._lock = threading.Lock()
+
+    def invalidar(self):
+        """Fuerza la recarga en la próxima consulta"""
+        with self._lock:
+            self._cargado_en = None
+
+    def _asegurar_cargado(self, db: Session):
+        with self._lock:
+            if self._cargado_en is not None and time.monotonic() - self._cargado_en < self.TTL_SEGUNDOS:
+                return
+
+            perfiles = {zona: FACTORES_DEFAULT.copy() for zona in ZONAS}
+            for fila in db.query(PerfilTrafico).all():
+                perfiles.setdefault(fila.zona, FACTORES_DEFAULT.copy())[fila.hora] = fila.factor
+            self._perfiles = perfiles
+            self._cargado_en = time.monotonic()
+
+    def perfil(self, db: Session, zona: str) -> np.ndarray:
+        """Factores por hora (24,) de una zona"""
+        self._asegurar_cargado(db)
+        return self._perfiles.get(zona, FACTORES_DEFAULT).copy()
+
+    def factor(self, db: Session, zona: str, salida: datetime) -> float:
+        """Multiplicador de duración para una salida (UTC) en una zona"""
+        self._asegurar_cargado(db)
+        return float(self._perfiles.get(zona, FACTORES_DEFAULT)[hora_local(salida)])
+
+
+# Registro compartido del proceso
+registro_perfiles = RegistroPerfiles()
+
+
+registrar_invalidacion((PerfilTrafico,), registro_perfiles.invalidar)
+
+
+class TraficoService:
+    """Servicio para aprender y consultar perfiles de tráfico"""
+
+    @staticmethod
+    def _duracion_planificada(detalles: List[RutaDetalle]) -> Optional[Tuple[float, float]]:
+        """
+        Segundos entre la salida del depósito y el fin del último servicio
+
+        Returns:
+            (duración total, segundos de servicio en las paradas), o None
+            si el camión no tiene al menos dos paradas con llegada estimada
+        """
+        con_llegada = [d for d in detalles if d.llegada_estimada]
+        if len(con_llegada) < 2:
+            return None
+        inicio = min(d.llegada_estimada for d in con_llegada)
+        fin = max(d.llegada_estimada + (d.tiempo_servicio or timedelta(0)) for d in con_llegada)
+        servicio = sum((d.tiempo_servicio or timedelta(0)).total_seconds() for d in con_llegada)
+        return (fin - inicio).total_seconds(), servicio
+
+    @staticmethod
+    def recolectar_muestras(db: Session, dias: int = 60) -> List[Tuple[str, int, float]]:
+        """
+        Cociente duración real / duración a flujo libre de rutas completadas
+
+        Args:
+            db: Sesión de base de datos
+            dias: Antigüedad máxima de las asignaciones consideradas
+
+        Returns:
+            Lista de (zona, hora_local_salida, ratio)
+        """
+        desde = datetime.utcnow() - timedelta(days=dias)
+        asignaciones = db.query(AsignacionConductor).join(
+            RutaGenerada, RutaGenerada.id == AsignacionConductor.ruta_id
+        ).options(
+            contains_eager(AsignacionConductor.ruta)
+        ).filter(
+            AsignacionConductor.estado == 'completado',
+            AsignacionConductor.fecha_inicio.isnot(None),
+            AsignacionConductor.fecha_finalizacion.isnot(None),
+            AsignacionConductor.fecha_inicio >= desde
+        ).all()
+
+        # Detalles de todas las rutas en una sola consulta
+        ruta_ids = {a.ruta_id for a in asignaciones}
+        detalles_por_camion: Dict[Tuple[int, Optional[str]], List[RutaDetalle]] = {}
+        if ruta_ids:
+            for detalle in db.query(RutaDetalle).filter(RutaDetalle.ruta_id.in_(ruta_ids)).all():
+                detalles_por_camion.setdefault((detalle.ruta_id, detalle.camion_id), []).append(detalle)
+
+        muestras = []
+        for asignacion in asignaciones:
+            detalles = detalles_por_camion.get((asignacion.ruta_id, asignacion.camion_id))
+            if detalles is None:
+                # Sin placa: solo es inequívoco si la ruta tiene un único camión
+                camiones = [k for k in detalles_por_camion if k[0] == asignacion.ruta_id]
+                if len(camiones) != 1:
+                    continue
+                detalles = detalles_por_camion[camiones[0]]
+
+            duraciones = TraficoService._duracion_planificada(detalles)
+            if not duraciones:
+                continue
+            planificada, servicio = duraciones
+
+            # El factor solo escala los tramos: se compara tiempo de viaje
+            # real contra el planificado llevado a flujo libre (sin acumular
+            # el factor aplicado), ambos sin el tiempo de servicio
+            viaje_planificado = planificada - servicio
+            if viaje_planificado <= 0:
+                continue
+            factor_aplicado = asignacion.ruta.factor_trafico or 1.0
+            real = (asignacion.fecha_finalizacion - asignacion.fecha_inicio).total_seconds()
+            ratio = (real - servicio) / (viaje_planificado / factor_aplicado)
+
+            if RATIO_MIN <= ratio <= RATIO_MAX:
+                muestras.append((asignacion.ruta.zona, hora_local(asignacion.fecha_inicio), ratio))
+
+        return muestras
+
+    @staticmethod
+    def aprender_perfiles(db: Session, dias: int = 60) -> Dict[str, List[float]]:
+        """
+        Recalcula perfiles_trafico a partir de las rutas completadas
+
+        Por cada (zona, hora) usa la mediana de las muestras, combinada con
+        el perfil por defecto cuando hay pocas (MUESTRAS_PRIOR).
+
+        Returns:
+            Perfiles resultantes {zona: [24 factores]}
+        """
+        muestras = TraficoService.recolectar_muestras(db, dias)
+
+        agrupadas: Dict[Tuple[str, int], List[float]] = {}
+        for zona, hora, ratio in muestras:
+            agrupadas.setdefault((zona, hora), []).append(ratio)
+
+        existentes = {(p.zona, p.hora): p for p in db.query(PerfilTrafico).all()}
+
+        for (zona, hora), ratios in agrupadas.items():
+            n = len(ratios)
+            mediana = float(np.median(ratios))
+            factor = (n * mediana + MUESTRAS_PRIOR * float(FACTORES_DEFAULT[hora])) / (n + MUESTRAS_PRIOR)
+
+            perfil = existentes.get((zona, hora))
+            if perfil is None:
+                perfil = PerfilTrafico(zona=zona, hora=hora)
+                db.add(perfil)
+            perfil.factor = round(factor, 3)
+            perfil.muestras = n
+
+        db.commit()
+        logger.info(
+            f"Perfiles de tráfico actualizados: {len(muestras)} muestras, "
+            f"{len(agrupadas)} franjas zona/hora"
+        )
+
+        return {zona: registro_perfiles.perfil(db, zona).round(3).tolist() for zona in ZONAS}
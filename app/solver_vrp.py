@@ -0,0 +1,349 @@
+"""
+Solver de rutas de recolección: reparto en viajes y orden de paradas
+Módulo puro (sin base de datos ni OSRM) para que los procesos del pool del
+solver (app/services/solver_service.py) lo importen rápido. El problema y
+la solución son dicts de arrays, listas y números: se serializan sin
+depender de los modelos. La matriz viaja como un solo array int32
+(MatrizRuteo.duraciones) y los tramos se leen con indexado vectorizado.
+
+Problema:
+    {
+        "duraciones": np.ndarray,   # (n, n) int32, segundos con tráfico
+        "fijos": 2,                 # nodos 0..fijos-1: depósitos y botadero
+        "incidencias": [id, ...],   # la incidencia i es el nodo fijos + i
+        "demandas": [int],          # gravedad de cada incidencia
+        "servicios": [int],         # segundos de servicio de cada incidencia
+        "ventanas": [[inicio, fin] | None],  # segundos desde la salida
+        "camiones": [{"capacidad": 25, "deposito": 0}, ...],
+        "botadero": 1,
+        "servicio_deposito": 300,
+        "servicio_botadero": 900,
+        "max_viajes": 3,
+        "limite_segundos": 10.0
+    }
+
+Solución:
+    {
+        "camiones": [{"indice": 0, "viajes": [[id, ...], ...]}, ...],
+        "sin_asignar": [id, ...],
+        "costo": float, "costo_inicial": float,
+        "iteraciones": int, "agotado": bool, "segundos": float
+    }
+"""
+import time
+from typing import Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+
+# Costo (segundos equivalentes) de cada segundo de atraso sobre la ventana
+PENALIZACION_ATRASO = 10
+
+# Mejora mínima para aceptar un movimiento (evita ciclos por redondeo)
+MEJORA_MINIMA = 1e-6
+
+
+def asignar_viajes(
+    demandas: Sequence[int],
+    capacidades: Sequence[int],
+    max_viajes: int
+) -> Tuple[List[List[List[int]]], List[int]]:
+    """
+    Reparte incidencias en los viajes de cada camión según capacidad
+
+    Estrategia:
+    1. Ordenar incidencias por demanda (descendente)
+    2. Llenar el viaje abierto de los camiones en uso (en el orden de la flota)
+    3. Si no cabe, sacar otro camión de la flota con capacidad suficiente
+    4. Si no quedan camiones, abrir un nuevo viaje (tras descargar en el
+       botadero) en el camión con menos viajes, hasta max_viajes
+
+    Args:
+        demandas: Gravedad de cada incidencia
+        capacidades: Capacidad de cada camión de la flota
+        max_viajes: Viajes máximos por camión en un turno
+
+    Returns:
+        Tuple[viajes, sin_asignar]: viajes[c] es la lista de viajes del
+        camión c (cada viaje, índices de incidencias) y sin_asignar los
+        índices que no caben en la flota
+    """
+    orden = sorted(range(len(demandas)), key=lambda i: demandas[i], reverse=True)
+    viajes: List[List[List[int]]] = [[] for _ in capacidades]
+    cargas: List[List[int]] = [[] for _ in capacidades]
+    sin_asignar: List[int] = []
+
+    for i in orden:
+        demanda = demandas[i]
+        en_uso = [c for c in range(len(capacidades)) if viajes[c]]
+
+        # Si cabe en el viaje abierto de algún camión en uso
+        destino = next(
+            (c for c in en_uso if cargas[c][-1] + demanda <= capacidades[c]),
+            None
+        )
+
+        if destino is None:
+            libre = next(
+                (c for c in range(len(capacidades))
+                 if not viajes[c] and capacidades[c] >= demanda),
+                None
+            )
+            if libre is not None:
+                destino = libre
+            else:
+                candidatos = [
+                    c for c in en_uso
+                    if len(viajes[c]) < max_viajes and capacidades[c] >= demanda
+                ]
+                if not candidatos:
+                    sin_asignar.append(i)
+                    continue
+                destino = min(candidatos, key=lambda c: (len(viajes[c]), -capacidades[c]))
+            viajes[destino].append([])
+            cargas[destino].append(0)
+
+        viajes[destino][-1].append(i)
+        cargas[destino][-1] += demanda
+
+    return viajes, sin_asignar
+
+
+class _Evaluador:
+    """Costo de los viajes de un camión: tiempo de viaje + atrasos penalizados"""
+
+    def __init__(self, problema: Dict):
+        self.duraciones = np.asarray(problema["duraciones"], dtype=np.int32)
+        self.fijos = problema["fijos"]
+        self.servicios = problema["servicios"]
+        self.ventanas = problema["ventanas"]
+        self.con_ventanas = any(v is not None for v in self.ventanas)
+        self.botadero = problema["botadero"]
+        self.servicio_deposito = problema.get("servicio_deposito", 0)
+        self.servicio_botadero = problema.get("servicio_botadero", 0)
+
+    def costo_camion(self, deposito: int, viajes: List[List[int]]) -> float:
+        # Secuencia de nodos: depósito, paradas de cada viaje y botadero
+        nodos = [deposito]
+        for viaje in viajes:
+            nodos.extend(self.fijos + i for i in viaje)
+            nodos.append(self.botadero)
+        filas = np.array(nodos, dtype=np.intp)
+        tramos = self.duraciones[filas[:-1], filas[1:]]
+        costo = float(tramos.sum())
+        if not self.con_ventanas:
+            return costo
+
+        # Atrasos: hace falta el reloj acumulado con esperas y servicios
+        t = self.servicio_deposito
+        for nodo, tramo in zip(nodos[1:], tramos.tolist()):
+            t += tramo
+            if nodo < self.fijos:
+                t += self.servicio_botadero
+                continue
+
+            i = nodo - self.fijos
+            ventana = self.ventanas[i]
+            if ventana is not None:
+                inicio, fin = ventana
+                if t < inicio:
+                    t = inicio
+                elif t > fin:
+                    costo += PENALIZACION_ATRASO * (t - fin)
+            t += self.servicios[i]
+
+        return costo
+
+    def vecino_mas_cercano(self, inicio: int, viaje: List[int]) -> List[int]:
+        """Orden inicial de un viaje: la parada más cercana primero"""
+        pendientes = np.array(viaje, dtype=np.intp)
+        orden = []
+        actual = inicio
+        while pendientes.size:
+            k = int(np.argmin(self.duraciones[actual, self.fijos + pendientes]))
+            siguiente = int(pendientes[k])
+            pendientes = np.delete(pendientes, k)
+            orden.append(siguiente)
+            actual = self.fijos + siguiente
+        return orden
+
+
+def resolver(problema: Dict) -> Dict:
+    """
+    Resuelve el problema de ruteo dentro del plazo limite_segundos
+
+    1. Reparto greedy por capacidad (asignar_viajes)
+    2. Orden inicial de cada viaje por vecino más cercano
+    3. Búsqueda local hasta no mejorar o agotar el plazo: 2-opt dentro de
+       cada viaje y reubicación de paradas entre viajes (de cualquier
+       camión) respetando la capacidad
+
+    Al vencer el plazo se devuelve la mejor solución encontrada; con
+    limite_segundos=0 solo se construye la solución inicial.
+
+    Args:
+        problema: Dict serializable descrito en el docstring del módulo
+
+    Returns:
+        Dict de la solución
+    """
+    inicio_reloj = time.monotonic()
+    vence = inicio_reloj + max(0.0, float(problema.get("limite_segundos", 0)))
+
+    camiones = problema["camiones"]
+    demandas = problema["demandas"]
+    ids = problema["incidencias"]
+    evaluador = _Evaluador(problema)
+
+    viajes, sin_asignar = asignar_viajes(
+        demandas, [c["capacidad"] for c in camiones], problema["max_viajes"]
+    )
+
+    for c, viajes_camion in enumerate(viajes):
+        origen = camiones[c]["deposito"]
+        for v, viaje in enumerate(viajes_camion):
+            viajes_camion[v] = evaluador.vecino_mas_cercano(origen, viaje)
+            origen = problema["botadero"]
+
+    costos = [
+        evaluador.costo_camion(camiones[c]["deposito"], viajes[c])
+        for c in range(len(camiones))
+    ]
+    costo_inicial = sum(costos)
+
+    iteraciones = 0
+    agotado = False
+    mejorado = True
+    while mejorado:
+        if time.monotonic() >= vence:
+            agotado = True
+            break
+        iteraciones += 1
+        mejorado = _mejorar_2opt(evaluador, camiones, viajes, costos, vence)
+        mejorado = _reubicar(evaluador, camiones, viajes, costos, demandas, vence) or mejorado
+
+    return {
+        "camiones": [
+            {
+                "indice": c,
+                "viajes": [[ids[i] for i in viaje] for viaje in viajes_camion if viaje]
+            }
+            for c, viajes_camion in enumerate(viajes)
+            if any(viajes_camion)
+        ],
+        "sin_asignar": [ids[i] for i in sin_asignar],
+        "costo": sum(costos),
+        "costo_inicial": costo_inicial,
+        "iteraciones": iteraciones,
+        "agotado": agotado,
+        "segundos": time.monotonic() - inicio_reloj
+    }
+
+
+def _mejorar_2opt(
+    evaluador: _Evaluador,
+    camiones: List[Dict],
+    viajes: List[List[List[int]]],
+    costos: List[float],
+    vence: float
+) -> bool:
+    """Invierte tramos de cada viaje mientras baje el costo del camión"""
+    mejorado = False
+    for c, viajes_camion in enumerate(viajes):
+        deposito = camiones[c]["deposito"]
+        for v, viaje in enumerate(viajes_camion):
+            n = len(viaje)
+            for a in range(n - 1):
+                if time.monotonic() >= vence:
+                    return mejorado
+                for b in range(a + 1, n):
+                    candidato = viaje[:a] + viaje[a:b + 1][::-1] + viaje[b + 1:]
+                    viajes_camion[v] = candidato
+                    costo = evaluador.costo_camion(deposito, viajes_camion)
+                    if costo < costos[c] - MEJORA_MINIMA:
+                        costos[c] = costo
+                        viaje = candidato
+                        mejorado = True
+                    else:
+                        viajes_camion[v] = viaje
+    return mejorado
+
+
+def _reubicar(
+    evaluador: _Evaluador,
+    camiones: List[Dict],
+    viajes: List[List[List[int]]],
+    costos: List[float],
+    demandas: Sequence[int],
+    vence: float
+) -> bool:
+    """
+    Mueve cada parada a la posición de otro viaje que más reduzca el costo
+    total, si el viaje destino tiene capacidad
+    """
+    mejorado = False
+    for c_origen, viajes_origen in enumerate(viajes):
+        for v_origen in range(len(viajes_origen)):
+            for i in list(viajes_origen[v_origen]):
+                if time.monotonic() >= vence:
+                    return mejorado
+                mejor = _mejor_reubicacion(
+                    evaluador, camiones, viajes, costos, demandas, c_origen, v_origen, i
+                )
+                if mejor is None:
+                    continue
+
+                c_destino, v_destino, posicion, costo_origen, costo_destino = mejor
+                viajes_origen[v_origen].remove(i)
+                viajes[c_destino][v_destino].insert(posicion, i)
+                costos[c_origen] = costo_origen
+                costos[c_destino] = costo_destino
+                mejorado = True
+    return mejorado
+
+
+def _mejor_reubicacion(
+    evaluador: _Evaluador,
+    camiones: List[Dict],
+    viajes: List[List[List[int]]],
+    costos: List[float],
+    demandas: Sequence[int],
+    c_origen: int,
+    v_origen: int,
+    i: int
+) -> Optional[Tuple[int, int, int, float, float]]:
+    """(camión, viaje, posición, costo origen, costo destino) del mejor movimiento de i"""
+    viajes_origen = viajes[c_origen]
+    sin_i = [list(viaje) for viaje in viajes_origen]
+    sin_i[v_origen].remove(i)
+    costo_sin_i = evaluador.costo_camion(camiones[c_origen]["deposito"], sin_i)
+
+    mejor = None
+    mejor_delta = -MEJORA_MINIMA
+    for c_destino, viajes_destino in enumerate(viajes):
+        capacidad = camiones[c_destino]["capacidad"]
+        base = sin_i if c_destino == c_origen else [list(viaje) for viaje in viajes_destino]
+        costo_base = costo_sin_i if c_destino == c_origen else costos[c_destino]
+
+        for v_destino, viaje in enumerate(base):
+            if (c_destino, v_destino) == (c_origen, v_origen) or not viaje:
+                continue
+            if sum(demandas[j] for j in viaje) + demandas[i] > capacidad:
+                continue
+
+            for posicion in range(len(viaje) + 1):
+                viaje.insert(posicion, i)
+                costo = evaluador.costo_camion(camiones[c_destino]["deposito"], base)
+                del viaje[posicion]
+
+                if c_destino == c_origen:
+                    delta = costo - costos[c_origen]
+                    nuevo_origen = nuevo_destino = costo
+                else:
+                    delta = (costo_sin_i + costo) - (costos[c_origen] + costo_base)
+                    nuevo_origen, nuevo_destino = costo_sin_i, costo
+
+                if delta < mejor_delta:
+                    mejor_delta = delta
+                    mejor = (c_destino, v_destino, posicion, nuevo_origen, nuevo_destino)
+    return mejor
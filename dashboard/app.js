@@ -89,6 +89,7 @@ document.querySelectorAll('.tab-btn').forEach(btn => {
         // Cargar datos según la tab
         if (tabName === 'incidencias') loadIncidencias();
         else if (tabName === 'rutas') loadRutas();
+        else if (tabName === 'mapa') loadMapa();
         else if (tabName === 'conductores') loadConductores();
         else if (tabName === 'stats') loadStats();
     });
@@ -653,6 +654,97 @@ document.getElementById('createConductorForm').addEventListener('submit', async
     }
 });
 
+// ==================== MAPA ====================
+
+// Las incidencias y rutas llegan como teselas vectoriales (/api/tiles):
+// el mapa solo descarga lo visible, sin importar cuánto historial haya
+let mapa = null;
+
+function urlTeselas() {
+    const params = new URLSearchParams();
+    const estado = document.getElementById('filterMapaEstado').value;
+    const zona = document.getElementById('filterMapaZona').value;
+    const estadoRuta = document.getElementById('filterMapaRutaEstado').value;
+    if (estado) params.append('estado', estado);
+    if (zona) params.append('zona', zona);
+    if (estadoRuta) params.append('estado_ruta', estadoRuta);
+    
+    const query = params.toString();
+    return `${API_URL}/api/tiles/{z}/{x}/{y}.mvt` + (query ? '?' + query : '');
+}
+
+function loadMapa() {
+    if (mapa) {
+        mapa.resize();
+        return;
+    }
+    
+    mapa = new maplibregl.Map({
+        container: 'mapaContenedor',
+        center: [-78.615, -0.935],  // Latacunga
+        zoom: 13,
+        style: {
+            version: 8,
+            sources: {
+                osm: {
+                    type: 'raster',
+                    tiles: ['https://tile.openstreetmap.org/{z}/{x}/{y}.png'],
+                    tileSize: 256,
+                    attribution: '© OpenStreetMap'
+                }
+            },
+            layers: [{ id: 'osm', type: 'raster', source: 'osm' }]
+        }
+    });
+    mapa.addControl(new maplibregl.NavigationControl());
+    
+    mapa.on('load', () => {
+        mapa.addSource('epagal', { type: 'vector', tiles: [urlTeselas()], maxzoom: 22 });
+        
+        mapa.addLayer({
+            id: 'rutas',
+            type: 'line',
+            source: 'epagal',
+            'source-layer': 'rutas',
+            paint: {
+                'line-width': 3,
+                'line-color': ['match', ['get', 'estado'],
+                    'en_ejecucion', '#f59e0b',
+                    'completada', '#10b981',
+                    '#3b82f6']
+            }
+        });
+        
+        // En zooms bajos cada punto agrupa una celda (propiedad total)
+        mapa.addLayer({
+            id: 'incidencias',
+            type: 'circle',
+            source: 'epagal',
+            'source-layer': 'incidencias',
+            paint: {
+                'circle-radius': ['interpolate', ['linear'], ['get', 'total'], 1, 5, 50, 18],
+                'circle-color': ['interpolate', ['linear'], ['get', 'gravedad'], 1, '#fbbf24', 5, '#ef4444'],
+                'circle-stroke-width': 1,
+                'circle-stroke-color': '#ffffff'
+            }
+        });
+        
+        mapa.on('click', 'incidencias', (e) => {
+            const p = e.features[0].properties;
+            const html = p.id
+                ? `<strong>#${p.id}</strong> ${formatTipo(p.tipo)}<br>Gravedad: ${p.gravedad}<br>${formatEstado(p.estado)}`
+                : `<strong>${p.total} incidencias</strong><br>Suma de gravedad: ${p.suma_gravedad}`;
+            new maplibregl.Popup().setLngLat(e.lngLat).setHTML(html).addTo(mapa);
+        });
+    });
+}
+
+function actualizarMapa() {
+    if (mapa && mapa.getSource('epagal')) {
+        mapa.getSource('epagal').setTiles([urlTeselas()]);
+    }
+}
+
 // ==================== ESTADÍSTICAS ====================
 
 async function loadStats() {
@@ -0,0 +1,46 @@
+#!/usr/bin/env python3
+"""
+Mantenimiento de las particiones mensuales de incidencias y rutas_detalle
+Crea las particiones de los próximos meses y archiva (esquema archivo) las
+de meses viejos sin registros activos. Se programa a diario (cron job
+epagal-particiones en render.yaml, o cron del servidor) y sirve también
+para archivar a mano:
+    python mantener_particiones.py
+    python mantener_particiones.py --meses-calientes 3
+    python mantener_particiones.py --solo-crear
+"""
+import argparse
+import logging
+
+from app.services.particiones_service import ParticionesService, MESES_CALIENTES, MESES_ADELANTE
+
+logging.basicConfig(level=logging.INFO)
+
+parser = argparse.ArgumentParser(description="Mantenimiento de particiones mensuales")
+parser.add_argument("--meses-calientes", type=int, default=MESES_CALIENTES,
+                    help=f"Meses que quedan en las tablas principales (por defecto {MESES_CALIENTES})")
+parser.add_argument("--meses-adelante", type=int, default=MESES_ADELANTE,
+                    help=f"Particiones futuras a crear (por defecto {MESES_ADELANTE})")
+parser.add_argument("--solo-crear", action="store_true", help="No archivar")
+args = parser.parse_args()
+
+print("=" * 60)
+print("MANTENIMIENTO DE PARTICIONES")
+print("=" * 60)
+
+ParticionesService.crear_particiones(args.meses_adelante)
+print(f"\n  ✓ Particiones aseguradas hasta {args.meses_adelante} meses adelante")
+
+if not args.solo_crear:
+    archivadas = ParticionesService.archivar(args.meses_calientes)
+    if not archivadas:
+        print("\n  ✗ Otro proceso está archivando, intente más tarde")
+    for tabla, particiones in archivadas.items():
+        if particiones:
+            print(f"\n  ✓ {tabla}: {len(particiones)} archivadas")
+            for particion in particiones:
+                print(f"    - archivo.{particion}")
+        else:
+            print(f"\n  - {tabla}: nada para archivar")
+
+print("\n" + "=" * 60)
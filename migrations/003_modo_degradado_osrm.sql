@@ -0,0 +1,14 @@
+-- Migración: Modo degradado de OSRM
+-- Descripción: Marca las rutas generadas con estimaciones en línea recta
+--              (circuit breaker de OSRM abierto) para refinarlas después
+-- Fecha: 2026-10-18
+
+ALTER TABLE rutas_generadas
+    ADD COLUMN IF NOT EXISTS requiere_refinamiento BOOLEAN DEFAULT FALSE;
+
+-- Solo interesan las rutas pendientes de refinar
+CREATE INDEX IF NOT EXISTS idx_rutas_generadas_refinamiento
+    ON rutas_generadas (estado)
+    WHERE requiere_refinamiento = TRUE;
+
+COMMENT ON COLUMN rutas_generadas.requiere_refinamiento IS 'TRUE si la ruta se generó sin OSRM y sus distancias son estimadas';
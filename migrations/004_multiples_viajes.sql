@@ -0,0 +1,18 @@
+-- Migración: Múltiples viajes por camión
+-- Descripción: Permite que un camión descargue en el botadero y vuelva a
+--              recolectar dentro de la misma ruta cuando la flota no alcanza
+-- Fecha: 2026-10-18
+
+ALTER TABLE rutas_detalle
+    ADD COLUMN IF NOT EXISTS viaje SMALLINT DEFAULT 1;
+
+UPDATE rutas_detalle SET viaje = 1 WHERE viaje IS NULL;
+
+COMMENT ON COLUMN rutas_detalle.viaje IS 'Número de viaje del camión; entre viajes descarga en el botadero';
+
+-- Flota disponible y viajes máximos por camión
+INSERT INTO config (clave, valor, descripcion, tipo_dato) VALUES
+    ('flota_posterior', '1', 'Camiones posteriores (25 pts) disponibles por ruta', 'integer'),
+    ('flota_lateral', '2', 'Camiones laterales (15 pts) disponibles por ruta', 'integer'),
+    ('max_viajes_por_camion', '3', 'Viajes máximos por camión en una ruta', 'integer')
+ON CONFLICT (clave) DO NOTHING;
@@ -0,0 +1,36 @@
+-- Migración: Registro de flota de camiones
+-- Descripción: Reemplaza las capacidades fijas del planificador por la
+--              flota real (placa, tipo, capacidad, estado, depósito base)
+-- Fecha: 2026-10-18
+
+CREATE TABLE IF NOT EXISTS camiones (
+    id                  SERIAL PRIMARY KEY,
+    placa               VARCHAR(20) UNIQUE NOT NULL,
+    tipo                VARCHAR(10) NOT NULL CHECK (tipo IN ('lateral', 'posterior')),
+    capacidad           SMALLINT NOT NULL CHECK (capacidad > 0),
+    estado              VARCHAR(15) DEFAULT 'disponible' CHECK (estado IN ('disponible', 'mantenimiento', 'inactivo')),
+    deposito_id         INTEGER REFERENCES puntos_fijos(id) ON DELETE SET NULL,
+    costo_km            DOUBLE PRECISION DEFAULT 0,
+    created_at          TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    updated_at          TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+);
+
+-- El planificador solo consulta camiones disponibles
+CREATE INDEX IF NOT EXISTS idx_camiones_disponibles
+    ON camiones (tipo, capacidad DESC)
+    WHERE estado = 'disponible';
+
+-- Flota inicial (equivalente a la configuración anterior)
+INSERT INTO camiones (placa, tipo, capacidad, deposito_id, costo_km)
+SELECT v.placa, v.tipo, v.capacidad, pf.id, v.costo_km
+FROM (VALUES
+    ('POS-001', 'posterior', 25, 1.20),
+    ('LAT-001', 'lateral', 15, 0.90),
+    ('LAT-002', 'lateral', 15, 0.90)
+) AS v(placa, tipo, capacidad, costo_km)
+LEFT JOIN puntos_fijos pf ON pf.nombre = 'Depósito EPAGAL'
+ON CONFLICT (placa) DO NOTHING;
+
+COMMENT ON TABLE camiones IS 'Flota de camiones recolectores';
+COMMENT ON COLUMN camiones.capacidad IS 'Capacidad por viaje en puntos de gravedad';
+COMMENT ON COLUMN camiones.deposito_id IS 'Depósito base donde inicia sus rutas';
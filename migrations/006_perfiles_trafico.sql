@@ -0,0 +1,20 @@
+-- Migración: Perfiles de tráfico por hora
+-- Descripción: Multiplicadores de duración por zona y hora local, aprendidos
+--              de las rutas completadas, y factor aplicado a cada ruta
+-- Fecha: 2026-10-18
+
+CREATE TABLE IF NOT EXISTS perfiles_trafico (
+    id                  SERIAL PRIMARY KEY,
+    zona                VARCHAR(10) NOT NULL CHECK (zona IN ('oriental', 'occidental')),
+    hora                SMALLINT NOT NULL CHECK (hora BETWEEN 0 AND 23),
+    factor              DOUBLE PRECISION NOT NULL DEFAULT 1.0 CHECK (factor > 0),
+    muestras            INTEGER DEFAULT 0,
+    updated_at          TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    CONSTRAINT uq_perfil_zona_hora UNIQUE (zona, hora)
+);
+
+ALTER TABLE rutas_generadas
+    ADD COLUMN IF NOT EXISTS factor_trafico DOUBLE PRECISION DEFAULT 1.0;
+
+COMMENT ON TABLE perfiles_trafico IS 'Multiplicador de tiempos OSRM por zona y hora local de salida';
+COMMENT ON COLUMN rutas_generadas.factor_trafico IS 'Factor de tráfico aplicado al planificar la ruta';
@@ -0,0 +1,64 @@
+-- Migración: Ingesta de posiciones GPS
+-- Descripción: Tabla de posiciones append-only particionada por día (se
+--              escribe con COPY) y trazas ajustadas a la red vial
+-- Fecha: 2026-10-18
+
+-- ============================================================================
+-- 1. POSICIONES CRUDAS (particionada por día)
+-- ============================================================================
+-- Sin PK ni FKs: solo se inserta y se lee por rangos de tiempo
+CREATE TABLE IF NOT EXISTS posiciones_gps (
+    conductor_id        INTEGER NOT NULL,
+    ts                  TIMESTAMPTZ NOT NULL,
+    lat                 DOUBLE PRECISION NOT NULL,
+    lon                 DOUBLE PRECISION NOT NULL,
+    recibido_en         TIMESTAMPTZ NOT NULL DEFAULT now()
+) PARTITION BY RANGE (ts);
+
+-- Filas fuera de las particiones creadas (relojes desfasados, etc.)
+CREATE TABLE IF NOT EXISTS posiciones_gps_default
+    PARTITION OF posiciones_gps DEFAULT;
+
+-- Consultas por conductor y ventana de tiempo (map matching)
+CREATE INDEX IF NOT EXISTS idx_posiciones_gps_conductor_ts
+    ON posiciones_gps (conductor_id, ts);
+
+-- Crea la partición diaria de una fecha si no existe
+CREATE OR REPLACE FUNCTION crear_particion_posiciones_gps(dia DATE)
+RETURNS VOID AS $$
+DECLARE
+    nombre TEXT := 'posiciones_gps_' || to_char(dia, 'YYYYMMDD');
+BEGIN
+    EXECUTE format(
+        'CREATE TABLE IF NOT EXISTS %I PARTITION OF posiciones_gps
+         FOR VALUES FROM (%L) TO (%L)',
+        nombre, dia::timestamptz, (dia + 1)::timestamptz
+    );
+END;
+$$ LANGUAGE plpgsql;
+
+-- Particiones para hoy y la próxima semana (el worker crea las siguientes)
+SELECT crear_particion_posiciones_gps(CURRENT_DATE + d)
+FROM generate_series(0, 7) AS d;
+
+-- ============================================================================
+-- 2. TRAZAS AJUSTADAS A LA RED VIAL
+-- ============================================================================
+CREATE TABLE IF NOT EXISTS trazas_gps (
+    id                  SERIAL PRIMARY KEY,
+    conductor_id        INTEGER NOT NULL REFERENCES conductores(id) ON DELETE CASCADE,
+    desde               TIMESTAMP NOT NULL,
+    hasta               TIMESTAMP NOT NULL,
+    puntos              INTEGER NOT NULL,
+    distancia           DOUBLE PRECISION,
+    duracion            DOUBLE PRECISION,
+    confianza           DOUBLE PRECISION,
+    geom                GEOMETRY(LineString, 4326),
+    created_at          TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+);
+
+CREATE INDEX IF NOT EXISTS idx_trazas_gps_conductor_hasta ON trazas_gps (conductor_id, hasta DESC);
+CREATE INDEX IF NOT EXISTS idx_trazas_gps_geom ON trazas_gps USING GIST (geom);
+
+COMMENT ON TABLE posiciones_gps IS 'Posiciones GPS crudas de los camiones, particionadas por día';
+COMMENT ON TABLE trazas_gps IS 'Recorridos de los camiones ajustados a la red vial con OSRM match';
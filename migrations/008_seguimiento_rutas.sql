@@ -0,0 +1,20 @@
+-- Migración: Seguimiento en vivo de rutas
+-- Descripción: Geometría del recorrido de cada camión y hora de visita de
+--              cada parada detectada por geocerca GPS
+-- Fecha: 2026-10-18
+
+CREATE TABLE IF NOT EXISTS rutas_geometria (
+    id                  SERIAL PRIMARY KEY,
+    ruta_id             INTEGER NOT NULL REFERENCES rutas_generadas(id) ON DELETE CASCADE,
+    camion_id           VARCHAR(20),
+    geom                GEOMETRY(LineString, 4326) NOT NULL,
+    created_at          TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+);
+
+CREATE INDEX IF NOT EXISTS idx_rutas_geometria_ruta ON rutas_geometria (ruta_id, camion_id);
+
+ALTER TABLE rutas_detalle
+    ADD COLUMN IF NOT EXISTS visitado_en TIMESTAMP;
+
+COMMENT ON TABLE rutas_geometria IS 'Recorrido planificado (OSRM) de cada camión de una ruta';
+COMMENT ON COLUMN rutas_detalle.visitado_en IS 'Hora en que el GPS del camión permaneció en la geocerca de la parada';
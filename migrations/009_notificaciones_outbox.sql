@@ -0,0 +1,33 @@
+-- Migración: Outbox de notificaciones
+-- Descripción: Notificaciones escritas en la misma transacción que el cambio
+--              de ruta y entregadas por un despachador en segundo plano
+-- Fecha: 2026-10-18
+
+CREATE TABLE IF NOT EXISTS notificaciones_outbox (
+    id                  SERIAL PRIMARY KEY,
+    tipo                VARCHAR(30) NOT NULL,
+    canal               VARCHAR(15) NOT NULL,
+    zona                VARCHAR(15),
+    ruta_id             INTEGER REFERENCES rutas_generadas(id) ON DELETE SET NULL,
+    incidencia_id       INTEGER REFERENCES incidencias(id) ON DELETE SET NULL,
+    payload             JSONB NOT NULL,
+    estado              VARCHAR(15) NOT NULL DEFAULT 'pendiente',
+    intentos            SMALLINT NOT NULL DEFAULT 0,
+    proximo_intento     TIMESTAMP NOT NULL DEFAULT (now() AT TIME ZONE 'UTC'),
+    ultimo_error        TEXT,
+    enviada_en          TIMESTAMP,
+    created_at          TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    CONSTRAINT check_outbox_estado CHECK (estado IN ('pendiente', 'enviada', 'fallida'))
+);
+
+-- El despachador solo recorre las pendientes
+CREATE INDEX IF NOT EXISTS idx_outbox_pendientes
+    ON notificaciones_outbox (proximo_intento)
+    WHERE estado = 'pendiente';
+
+-- Historial
+CREATE INDEX IF NOT EXISTS idx_outbox_created ON notificaciones_outbox (created_at DESC);
+CREATE INDEX IF NOT EXISTS idx_outbox_ruta ON notificaciones_outbox (ruta_id);
+
+COMMENT ON TABLE notificaciones_outbox IS 'Notificaciones pendientes/enviadas, una fila por canal';
+COMMENT ON COLUMN notificaciones_outbox.proximo_intento IS 'No se reintenta antes de esta hora (backoff exponencial)';
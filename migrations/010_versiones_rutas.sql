@@ -0,0 +1,19 @@
+-- Migración: Versionado de detalles de ruta para caché HTTP
+-- Descripción: updated_at en rutas_detalle para derivar ETags de las rutas
+--              (ETAs recalculadas y paradas visitadas cambian la versión)
+-- Fecha: 2026-10-18
+
+ALTER TABLE rutas_detalle
+    ADD COLUMN IF NOT EXISTS updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP;
+
+UPDATE rutas_detalle SET updated_at = COALESCE(visitado_en, created_at) WHERE updated_at IS NULL;
+
+DROP TRIGGER IF EXISTS update_rutas_detalle_updated_at ON rutas_detalle;
+CREATE TRIGGER update_rutas_detalle_updated_at BEFORE UPDATE ON rutas_detalle
+    FOR EACH ROW EXECUTE FUNCTION update_updated_at_column();
+
+-- Versión de las asignaciones de un conductor
+CREATE INDEX IF NOT EXISTS idx_asignaciones_conductor_updated
+    ON asignaciones_conductores (conductor_id, updated_at);
+
+COMMENT ON COLUMN rutas_detalle.updated_at IS 'Última modificación (ETA, visita); forma parte del ETag de la ruta';
@@ -0,0 +1,111 @@
+-- Migración: Registro de cambios para sincronización incremental
+-- Descripción: cambios_sync guarda cada cambio en asignaciones, paradas,
+--              rutas e incidencias con la transacción que lo hizo; la app
+--              de conductores pide solo lo cambiado desde su última versión
+--              (xmin del snapshot en su sync anterior)
+-- Requiere: PostgreSQL 13+ (xid8, pg_current_xact_id)
+-- Fecha: 2026-10-18
+
+-- ============================================================================
+-- 1. TABLA DE CAMBIOS
+-- ============================================================================
+-- Append-only, la escriben los triggers; se poda periódicamente
+CREATE TABLE IF NOT EXISTS cambios_sync (
+    version             BIGSERIAL PRIMARY KEY,
+    tabla               VARCHAR(30) NOT NULL,   -- asignaciones_conductores, rutas_detalle, rutas_generadas, incidencias
+    registro_id         INTEGER NOT NULL,
+    operacion           CHAR(1) NOT NULL,       -- I, U, D
+    ruta_id             INTEGER,
+    conductor_id        INTEGER,
+    txid                XID8 NOT NULL DEFAULT pg_current_xact_id(),
+    creado_en           TIMESTAMP NOT NULL DEFAULT (now() AT TIME ZONE 'UTC')
+);
+
+-- Índices cubrientes: cada rama de la consulta de sync (por conductor y
+-- por ruta) se resuelve con un index-only scan
+CREATE INDEX IF NOT EXISTS idx_cambios_sync_conductor
+    ON cambios_sync (conductor_id, txid) INCLUDE (tabla, registro_id, operacion)
+    WHERE conductor_id IS NOT NULL;
+CREATE INDEX IF NOT EXISTS idx_cambios_sync_ruta
+    ON cambios_sync (ruta_id, txid) INCLUDE (tabla, registro_id, operacion)
+    WHERE ruta_id IS NOT NULL;
+CREATE INDEX IF NOT EXISTS idx_cambios_sync_creado ON cambios_sync (creado_en);
+
+-- ============================================================================
+-- 2. TRIGGERS
+-- ============================================================================
+CREATE OR REPLACE FUNCTION registrar_cambio_asignacion()
+RETURNS TRIGGER AS $$
+DECLARE
+    fila asignaciones_conductores%ROWTYPE;
+BEGIN
+    IF TG_OP = 'DELETE' THEN fila := OLD; ELSE fila := NEW; END IF;
+    INSERT INTO cambios_sync (tabla, registro_id, operacion, ruta_id, conductor_id)
+    VALUES ('asignaciones_conductores', fila.id, left(TG_OP, 1), fila.ruta_id, fila.conductor_id);
+    -- Si la asignación pasa a otro conductor, el anterior también debe enterarse
+    IF TG_OP = 'UPDATE' AND OLD.conductor_id IS DISTINCT FROM NEW.conductor_id THEN
+        INSERT INTO cambios_sync (tabla, registro_id, operacion, ruta_id, conductor_id)
+        VALUES ('asignaciones_conductores', OLD.id, 'D', OLD.ruta_id, OLD.conductor_id);
+    END IF;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS trigger_sync_asignaciones ON asignaciones_conductores;
+CREATE TRIGGER trigger_sync_asignaciones
+    AFTER INSERT OR UPDATE OR DELETE ON asignaciones_conductores
+    FOR EACH ROW EXECUTE FUNCTION registrar_cambio_asignacion();
+
+CREATE OR REPLACE FUNCTION registrar_cambio_parada()
+RETURNS TRIGGER AS $$
+DECLARE
+    fila rutas_detalle%ROWTYPE;
+BEGIN
+    IF TG_OP = 'DELETE' THEN fila := OLD; ELSE fila := NEW; END IF;
+    INSERT INTO cambios_sync (tabla, registro_id, operacion, ruta_id)
+    VALUES ('rutas_detalle', fila.id, left(TG_OP, 1), fila.ruta_id);
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS trigger_sync_rutas_detalle ON rutas_detalle;
+CREATE TRIGGER trigger_sync_rutas_detalle
+    AFTER INSERT OR UPDATE OR DELETE ON rutas_detalle
+    FOR EACH ROW EXECUTE FUNCTION registrar_cambio_parada();
+
+CREATE OR REPLACE FUNCTION registrar_cambio_ruta()
+RETURNS TRIGGER AS $$
+BEGIN
+    INSERT INTO cambios_sync (tabla, registro_id, operacion, ruta_id)
+    VALUES ('rutas_generadas', NEW.id, 'U', NEW.id);
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS trigger_sync_rutas_generadas ON rutas_generadas;
+CREATE TRIGGER trigger_sync_rutas_generadas
+    AFTER UPDATE ON rutas_generadas
+    FOR EACH ROW EXECUTE FUNCTION registrar_cambio_ruta();
+
+-- Solo interesa el estado de incidencias que están en alguna ruta
+CREATE OR REPLACE FUNCTION registrar_cambio_incidencia()
+RETURNS TRIGGER AS $$
+BEGIN
+    INSERT INTO cambios_sync (tabla, registro_id, operacion, ruta_id)
+    SELECT DISTINCT 'incidencias', NEW.id, 'U', rd.ruta_id
+    FROM rutas_detalle rd
+    WHERE rd.incidencia_id = NEW.id;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS trigger_sync_incidencias ON incidencias;
+CREATE TRIGGER trigger_sync_incidencias
+    AFTER UPDATE OF estado ON incidencias
+    FOR EACH ROW
+    WHEN (OLD.estado IS DISTINCT FROM NEW.estado)
+    EXECUTE FUNCTION registrar_cambio_incidencia();
+
+COMMENT ON TABLE cambios_sync IS 'Registro de cambios para GET /api/conductores/sync';
+COMMENT ON COLUMN cambios_sync.txid IS 'Transacción que hizo el cambio; el cursor de sync es el xmin del snapshot';
+COMMENT ON COLUMN cambios_sync.creado_en IS 'Inicio de la transacción que hizo el cambio (UTC)';
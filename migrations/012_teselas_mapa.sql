@@ -0,0 +1,8 @@
+-- Migración: Teselas vectoriales del mapa
+-- Descripción: Índice espacial de recorridos usado por /api/tiles (las
+--              incidencias ya tienen idx_incidencias_geom)
+-- Fecha: 2026-10-18
+
+-- Recorridos de rutas por sobre de tesela
+CREATE INDEX IF NOT EXISTS idx_rutas_geometria_geom ON rutas_geometria USING GIST (geom);
+
@@ -0,0 +1,6 @@
+-- Migración: Agregación de incidencias para mapas de calor
+-- Descripción: Índice sobre updated_at para detectar cambios de estado al
+--              actualizar incrementalmente los conteos por celda
+-- Fecha: 2026-10-18
+
+CREATE INDEX IF NOT EXISTS idx_incidencias_updated_at ON incidencias (updated_at);
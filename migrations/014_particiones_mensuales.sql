@@ -0,0 +1,278 @@
+-- Migración: Particionado mensual y archivo de incidencias y rutas_detalle
+-- Descripción: incidencias (por reportado_en) y rutas_detalle (por created_at)
+--              pasan a tablas particionadas por mes. Las particiones viejas
+--              sin registros activos se separan al esquema archivo, así las
+--              consultas por estado/zona solo recorren los meses recientes.
+-- Fecha: 2026-10-18
+--
+-- Notas:
+--   * La clave primaria pasa a (id, fecha): Postgres exige que incluya la
+--     columna de partición. Los ids siguen saliendo de la misma secuencia.
+--   * Las FKs que apuntaban a incidencias(id) (rutas_detalle.incidencia_id y
+--     notificaciones_outbox.incidencia_id) no pueden apuntar a una tabla
+--     particionada por id solo; el ON DELETE SET NULL se mantiene con un
+--     trigger.
+--   * Las consultas por estado/zona (suma de gravedad, incidencias
+--     validadas, sync) no filtran por fecha: un estado activo puede tener
+--     cualquier antigüedad. No hay poda de particiones en el plan; lo que
+--     acota el recorrido es el archivo, que deja en la tabla solo los meses
+--     calientes y los que aún tienen registros activos, y en cada uno los
+--     índices parciales por estado (migración 015).
+--   * Ejecutar en una ventana de mantenimiento: copia ambas tablas.
+
+BEGIN;
+
+CREATE SCHEMA IF NOT EXISTS archivo;
+
+-- ============================================================================
+-- 1. FUNCIONES DE PARTICIONES
+-- ============================================================================
+-- Crea la partición mensual <tabla>_pYYYYMM de un mes si no existe.
+-- CREATE TABLE ... PARTITION OF falla si la partición por defecto ya tiene
+-- filas de ese mes: en ese caso se separa la partición por defecto, sus
+-- filas del mes pasan a la partición nueva y las demás a una partición por
+-- defecto reconstruida (copiar en vez de DELETE no dispara los triggers de
+-- borrado, que desvincularían las paradas de esas incidencias).
+CREATE OR REPLACE FUNCTION crear_particion_mensual(tabla TEXT, mes DATE)
+RETURNS VOID AS $$
+DECLARE
+    inicio TIMESTAMP := date_trunc('month', mes)::date;
+    fin TIMESTAMP := (date_trunc('month', mes) + interval '1 month')::date;
+    nombre TEXT := tabla || '_p' || to_char(mes, 'YYYYMM');
+    defecto TEXT := tabla || '_default';
+    columna TEXT;
+    en_defecto BOOLEAN;
+BEGIN
+    IF to_regclass(nombre) IS NOT NULL THEN
+        RETURN;
+    END IF;
+
+    SELECT a.attname INTO columna
+    FROM pg_partitioned_table p
+    JOIN pg_attribute a ON a.attrelid = p.partrelid AND a.attnum = p.partattrs[0]
+    WHERE p.partrelid = tabla::regclass;
+
+    en_defecto := false;
+    IF to_regclass(defecto) IS NOT NULL THEN
+        EXECUTE format(
+            'SELECT EXISTS (SELECT 1 FROM %I WHERE %I >= %L AND %I < %L)',
+            defecto, columna, inicio, columna, fin
+        ) INTO en_defecto;
+    END IF;
+
+    IF NOT en_defecto THEN
+        EXECUTE format(
+            'CREATE TABLE %I PARTITION OF %I FOR VALUES FROM (%L) TO (%L)',
+            nombre, tabla, inicio, fin
+        );
+        RETURN;
+    END IF;
+
+    RAISE NOTICE 'La partición por defecto de % tiene filas de %: se mueven a %', tabla, to_char(mes, 'YYYY-MM'), nombre;
+    EXECUTE format('ALTER TABLE %I DETACH PARTITION %I', tabla, defecto);
+
+    EXECUTE format('CREATE TABLE %I (LIKE %I INCLUDING DEFAULTS INCLUDING CONSTRAINTS)', nombre, tabla);
+    EXECUTE format(
+        'INSERT INTO %I SELECT * FROM %I WHERE %I >= %L AND %I < %L',
+        nombre, defecto, columna, inicio, columna, fin
+    );
+
+    EXECUTE format('CREATE TABLE %I (LIKE %I INCLUDING DEFAULTS INCLUDING CONSTRAINTS)', defecto || '_nueva', tabla);
+    EXECUTE format(
+        'INSERT INTO %I SELECT * FROM %I WHERE NOT (%I >= %L AND %I < %L)',
+        defecto || '_nueva', defecto, columna, inicio, columna, fin
+    );
+    EXECUTE format('DROP TABLE %I', defecto);
+    EXECUTE format('ALTER TABLE %I RENAME TO %I', defecto || '_nueva', defecto);
+
+    -- Al adjuntarlas heredan los índices y triggers de la tabla principal
+    EXECUTE format(
+        'ALTER TABLE %I ATTACH PARTITION %I FOR VALUES FROM (%L) TO (%L)',
+        tabla, nombre, inicio, fin
+    );
+    EXECUTE format('ALTER TABLE %I ATTACH PARTITION %I DEFAULT', tabla, defecto);
+END;
+$$ LANGUAGE plpgsql;
+
+-- Separa al esquema archivo las particiones anteriores a los últimos
+-- meses_calientes meses que ya no tienen registros activos: incidencias sin
+-- atender o paradas de rutas planeadas/en ejecución. Devuelve las archivadas.
+CREATE OR REPLACE FUNCTION archivar_particiones(tabla TEXT, meses_calientes INTEGER)
+RETURNS SETOF TEXT AS $$
+DECLARE
+    limite DATE := (date_trunc('month', CURRENT_DATE) - make_interval(months => meses_calientes))::date;
+    particion TEXT;
+    activa BOOLEAN;
+BEGIN
+    FOR particion IN
+        SELECT c.relname
+        FROM pg_inherits i
+        JOIN pg_class c ON c.oid = i.inhrelid
+        WHERE i.inhparent = tabla::regclass
+          AND c.relname ~ ('^' || tabla || '_p[0-9]{6}$')
+          AND to_date(right(c.relname, 6), 'YYYYMM') < limite
+        ORDER BY c.relname
+    LOOP
+        IF tabla = 'incidencias' THEN
+            EXECUTE format(
+                'SELECT EXISTS (SELECT 1 FROM %I WHERE estado IN (''pendiente'', ''validada'', ''asignada''))',
+                particion
+            ) INTO activa;
+        ELSE
+            EXECUTE format(
+                'SELECT EXISTS (SELECT 1 FROM %I d JOIN rutas_generadas r ON r.id = d.ruta_id
+                                WHERE r.estado IN (''planeada'', ''en_ejecucion''))',
+                particion
+            ) INTO activa;
+        END IF;
+
+        IF activa THEN
+            RAISE NOTICE 'Partición % con registros activos: se mantiene', particion;
+            CONTINUE;
+        END IF;
+
+        EXECUTE format('ALTER TABLE %I DETACH PARTITION %I', tabla, particion);
+        EXECUTE format('ALTER TABLE %I SET SCHEMA archivo', particion);
+        RETURN NEXT particion;
+    END LOOP;
+END;
+$$ LANGUAGE plpgsql;
+
+-- ============================================================================
+-- 2. INCIDENCIAS (por reportado_en)
+-- ============================================================================
+DROP VIEW IF EXISTS v_incidencias_pendientes_por_zona;
+
+ALTER TABLE rutas_detalle DROP CONSTRAINT IF EXISTS rutas_detalle_incidencia_id_fkey;
+ALTER TABLE notificaciones_outbox DROP CONSTRAINT IF EXISTS notificaciones_outbox_incidencia_id_fkey;
+
+ALTER TABLE incidencias RENAME TO incidencias_legado;
+ALTER TABLE incidencias_legado RENAME CONSTRAINT incidencias_pkey TO incidencias_legado_pkey;
+
+UPDATE incidencias_legado
+SET reportado_en = COALESCE(created_at, CURRENT_TIMESTAMP)
+WHERE reportado_en IS NULL;
+
+CREATE TABLE incidencias (
+    LIKE incidencias_legado INCLUDING DEFAULTS INCLUDING CONSTRAINTS INCLUDING COMMENTS,
+    PRIMARY KEY (id, reportado_en)
+) PARTITION BY RANGE (reportado_en);
+
+ALTER TABLE incidencias ALTER COLUMN reportado_en SET NOT NULL;
+
+-- Fechas fuera de las particiones creadas
+CREATE TABLE incidencias_default PARTITION OF incidencias DEFAULT;
+
+-- Un mes por partición desde el reporte más antiguo hasta 3 meses adelante
+SELECT crear_particion_mensual('incidencias', m::date)
+FROM generate_series(
+    date_trunc('month', (SELECT COALESCE(MIN(reportado_en), CURRENT_TIMESTAMP) FROM incidencias_legado)),
+    date_trunc('month', CURRENT_DATE) + interval '3 months',
+    interval '1 month'
+) AS m;
+
+INSERT INTO incidencias SELECT * FROM incidencias_legado;
+
+ALTER SEQUENCE incidencias_id_seq OWNED BY incidencias.id;
+DROP TABLE incidencias_legado;
+
+CREATE INDEX IF NOT EXISTS idx_incidencias_geom ON incidencias USING GIST (geom);
+CREATE INDEX IF NOT EXISTS idx_incidencias_zona ON incidencias (zona);
+CREATE INDEX IF NOT EXISTS idx_incidencias_estado ON incidencias (estado);
+CREATE INDEX IF NOT EXISTS idx_incidencias_tipo ON incidencias (tipo);
+CREATE INDEX IF NOT EXISTS idx_incidencias_reportado_en ON incidencias (reportado_en);
+CREATE INDEX IF NOT EXISTS idx_incidencias_updated_at ON incidencias (updated_at);
+
+CREATE TRIGGER trigger_incidencias_updated_at
+    BEFORE UPDATE ON incidencias
+    FOR EACH ROW
+    EXECUTE FUNCTION update_incidencias_updated_at();
+
+CREATE TRIGGER trigger_sync_incidencias
+    AFTER UPDATE OF estado ON incidencias
+    FOR EACH ROW
+    WHEN (OLD.estado IS DISTINCT FROM NEW.estado)
+    EXECUTE FUNCTION registrar_cambio_incidencia();
+
+-- Reemplaza el ON DELETE SET NULL de las FKs eliminadas
+CREATE OR REPLACE FUNCTION desvincular_incidencia_eliminada()
+RETURNS TRIGGER AS $$
+BEGIN
+    UPDATE rutas_detalle SET incidencia_id = NULL WHERE incidencia_id = OLD.id;
+    UPDATE notificaciones_outbox SET incidencia_id = NULL WHERE incidencia_id = OLD.id;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE TRIGGER trigger_incidencias_desvincular
+    AFTER DELETE ON incidencias
+    FOR EACH ROW
+    EXECUTE FUNCTION desvincular_incidencia_eliminada();
+
+CREATE OR REPLACE VIEW v_incidencias_pendientes_por_zona AS
+SELECT
+    zona,
+    COUNT(*) AS total_incidencias,
+    SUM(gravedad) AS suma_gravedad,
+    COUNT(CASE WHEN tipo = 'animal_muerto' THEN 1 END) AS animales_muertos,
+    COUNT(CASE WHEN tipo = 'zona_critica' THEN 1 END) AS zonas_criticas,
+    COUNT(CASE WHEN tipo = 'acopio' THEN 1 END) AS acopios,
+    MIN(reportado_en) AS reporte_mas_antiguo,
+    MAX(reportado_en) AS reporte_mas_reciente
+FROM incidencias
+WHERE estado = 'pendiente'
+GROUP BY zona;
+
+-- ============================================================================
+-- 3. RUTAS_DETALLE (por created_at)
+-- ============================================================================
+ALTER TABLE rutas_detalle RENAME TO rutas_detalle_legado;
+ALTER TABLE rutas_detalle_legado RENAME CONSTRAINT rutas_detalle_pkey TO rutas_detalle_legado_pkey;
+
+UPDATE rutas_detalle_legado d
+SET created_at = COALESCE(r.fecha_generacion, CURRENT_TIMESTAMP)
+FROM rutas_generadas r
+WHERE d.created_at IS NULL AND r.id = d.ruta_id;
+UPDATE rutas_detalle_legado SET created_at = CURRENT_TIMESTAMP WHERE created_at IS NULL;
+
+CREATE TABLE rutas_detalle (
+    LIKE rutas_detalle_legado INCLUDING DEFAULTS INCLUDING CONSTRAINTS INCLUDING COMMENTS,
+    PRIMARY KEY (id, created_at),
+    FOREIGN KEY (ruta_id) REFERENCES rutas_generadas(id) ON DELETE CASCADE
+) PARTITION BY RANGE (created_at);
+
+ALTER TABLE rutas_detalle ALTER COLUMN created_at SET NOT NULL;
+
+CREATE TABLE rutas_detalle_default PARTITION OF rutas_detalle DEFAULT;
+
+SELECT crear_particion_mensual('rutas_detalle', m::date)
+FROM generate_series(
+    date_trunc('month', (SELECT COALESCE(MIN(created_at), CURRENT_TIMESTAMP) FROM rutas_detalle_legado)),
+    date_trunc('month', CURRENT_DATE) + interval '3 months',
+    interval '1 month'
+) AS m;
+
+INSERT INTO rutas_detalle SELECT * FROM rutas_detalle_legado;
+
+ALTER SEQUENCE rutas_detalle_id_seq OWNED BY rutas_detalle.id;
+DROP TABLE rutas_detalle_legado;
+
+CREATE INDEX IF NOT EXISTS idx_rutas_detalle_ruta_id ON rutas_detalle (ruta_id);
+CREATE INDEX IF NOT EXISTS idx_rutas_detalle_incidencia_id ON rutas_detalle (incidencia_id);
+CREATE INDEX IF NOT EXISTS idx_rutas_detalle_orden ON rutas_detalle (ruta_id, orden);
+CREATE INDEX IF NOT EXISTS idx_rutas_detalle_camion ON rutas_detalle (ruta_id, camion_tipo, camion_id);
+
+CREATE TRIGGER update_rutas_detalle_updated_at
+    BEFORE UPDATE ON rutas_detalle
+    FOR EACH ROW
+    EXECUTE FUNCTION update_updated_at_column();
+
+CREATE TRIGGER trigger_sync_rutas_detalle
+    AFTER INSERT OR UPDATE OR DELETE ON rutas_detalle
+    FOR EACH ROW
+    EXECUTE FUNCTION registrar_cambio_parada();
+
+COMMENT ON TABLE incidencias IS 'Reportes de ciudadanos, particionados por mes de reporte (archivo.incidencias_pYYYYMM: meses archivados)';
+COMMENT ON TABLE rutas_detalle IS 'Paradas de cada ruta y camión, particionadas por mes de creación (archivo.rutas_detalle_pYYYYMM: meses archivados)';
+
+COMMIT;
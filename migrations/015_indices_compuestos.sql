@@ -0,0 +1,67 @@
+-- Migración: Índices compuestos y parciales según las consultas frecuentes
+-- Descripción: Reemplaza índices de una columna por índices que cubren los
+--              filtros reales (zona+estado, conductor+estado, ruta+estado) e
+--              índices parciales para los estados que se consultan en cada
+--              validación o generación de ruta. verificar_indices.py comprueba
+--              con EXPLAIN que cada consulta los usa.
+-- Fecha: 2026-10-18
+
+-- ============================================================================
+-- 1. INCIDENCIAS (particionada: los índices se crean en cada partición)
+-- ============================================================================
+-- Listados y conteos por zona y estado; gravedad incluida para sumar sin
+-- leer la tabla
+CREATE INDEX IF NOT EXISTS idx_incidencias_zona_estado
+    ON incidencias (zona, estado) INCLUDE (gravedad);
+
+-- Umbral y generación de rutas: solo incidencias validadas (validar_incidencia,
+-- generar_ruta_automatica)
+CREATE INDEX IF NOT EXISTS idx_incidencias_validadas
+    ON incidencias (zona) INCLUDE (gravedad)
+    WHERE estado = 'validada';
+
+-- Cola de validación del administrador
+CREATE INDEX IF NOT EXISTS idx_incidencias_pendientes
+    ON incidencias (zona, reportado_en)
+    WHERE estado = 'pendiente';
+
+-- zona es prefijo de idx_incidencias_zona_estado
+DROP INDEX IF EXISTS idx_incidencias_zona;
+
+-- ============================================================================
+-- 2. RUTAS_GENERADAS
+-- ============================================================================
+CREATE INDEX IF NOT EXISTS idx_rutas_generadas_zona_estado_fecha
+    ON rutas_generadas (zona, estado, fecha_generacion DESC);
+
+-- Rutas vigentes de una zona (verificar_rutas_planeadas_zona, recálculo)
+CREATE INDEX IF NOT EXISTS idx_rutas_generadas_activas
+    ON rutas_generadas (zona, fecha_generacion DESC)
+    WHERE estado IN ('planeada', 'en_ejecucion');
+
+DROP INDEX IF EXISTS idx_rutas_generadas_zona;
+
+-- ============================================================================
+-- 3. ASIGNACIONES_CONDUCTORES
+-- ============================================================================
+-- Asignaciones activas de un conductor (mis-rutas, iniciar/finalizar ruta, sync)
+CREATE INDEX IF NOT EXISTS idx_asignaciones_conductor_estado
+    ON asignaciones_conductores (conductor_id, estado);
+
+-- Asignaciones activas de una ruta (asignar conductor, cancelar ruta)
+CREATE INDEX IF NOT EXISTS idx_asignaciones_ruta_estado
+    ON asignaciones_conductores (ruta_id, estado);
+
+DROP INDEX IF EXISTS idx_asignaciones_conductor;
+DROP INDEX IF EXISTS idx_asignaciones_ruta;
+
+-- ============================================================================
+-- 4. RUTAS_DETALLE
+-- ============================================================================
+-- idx_rutas_detalle_orden (ruta_id, orden) ya cubre las búsquedas por ruta
+DROP INDEX IF EXISTS idx_rutas_detalle_ruta_id;
+
+ANALYZE incidencias;
+ANALYZE rutas_generadas;
+ANALYZE asignaciones_conductores;
+ANALYZE rutas_detalle;
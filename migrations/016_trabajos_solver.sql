@@ -0,0 +1,29 @@
+-- Migración: Estado de los trabajos del solver
+-- Descripción: Cada worker de uvicorn tiene su propio pool del solver; el
+--              estado de los trabajos se guarda aquí para que
+--              GET/DELETE /rutas/solver/trabajos/{id} respondan desde
+--              cualquier worker. Un trabajo cancelado desde otro worker no
+--              se persiste al terminar.
+-- Fecha: 2026-10-18
+
+CREATE TABLE IF NOT EXISTS trabajos_solver (
+    id                  VARCHAR(32) PRIMARY KEY,
+    zona                VARCHAR(10) NOT NULL,
+    estado              VARCHAR(15) NOT NULL DEFAULT 'en_curso',
+    error               TEXT,
+    ruta_id             INTEGER REFERENCES rutas_generadas(id) ON DELETE SET NULL,
+    costo               FLOAT,
+    costo_inicial       FLOAT,
+    segundos_solver     FLOAT,
+    plazo_agotado       BOOLEAN,
+    creado_en           TIMESTAMP NOT NULL,
+    vence_en            TIMESTAMP NOT NULL,
+    terminado_en        TIMESTAMP,
+    CONSTRAINT check_trabajo_solver_estado
+        CHECK (estado IN ('en_curso', 'completado', 'cancelado', 'vencido', 'error'))
+);
+
+-- Listado de trabajos recientes y purga de los terminados
+CREATE INDEX IF NOT EXISTS idx_trabajos_solver_creado ON trabajos_solver (creado_en DESC);
+
+COMMENT ON TABLE trabajos_solver IS 'Trabajos del pool del solver de todos los workers (se purgan pasada una hora)';
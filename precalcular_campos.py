@@ -0,0 +1,38 @@
+#!/usr/bin/env python3
+"""
+Precalcula los campos de tiempo de viaje de depósitos y botaderos
+Genera data/campos_puntos_fijos.npz, que la API carga al arrancar
+
+Ejecutar tras cambiar puntos fijos o al actualizar el mapa de OSRM:
+    python precalcular_campos.py
+"""
+import logging
+
+from app.database import SessionLocal
+from app.models import PuntoFijo
+from app.campos_distancia import generar_campos, generar_grilla, RUTA_CAMPOS
+
+logging.basicConfig(level=logging.INFO)
+
+db = SessionLocal()
+
+print("=" * 60)
+print("PRECÁLCULO DE CAMPOS DE DISTANCIA")
+print("=" * 60)
+
+puntos = db.query(PuntoFijo).filter(PuntoFijo.activo == True).all()
+db.close()
+
+if not puntos:
+    print("\n  ✗ No hay puntos fijos activos")
+else:
+    latitudes, longitudes = generar_grilla()
+    print(f"\n  Grilla: {len(latitudes)}x{len(longitudes)} celdas")
+    for punto in puntos:
+        print(f"  - {punto.tipo:9} #{punto.id}: {punto.nombre} ({punto.lon}, {punto.lat})")
+
+    registro = generar_campos(puntos)
+    registro.guardar(RUTA_CAMPOS)
+    print(f"\n  ✓ Campos guardados en {RUTA_CAMPOS}")
+
+print("\n" + "=" * 60)
@@ -0,0 +1,167 @@
+#!/usr/bin/env python3
+"""
+Verifica con EXPLAIN que las consultas frecuentes usan índices
+Cada consulta se arma igual que en los servicios y se explica con
+enable_seqscan=off: con pocas filas Postgres prefiere un seq scan aunque el
+índice exista, así se comprueba que hay un índice aplicable. Falla (código 1)
+si alguna consulta recorre una tabla completa o no usa el índice que se
+creó para ella (en tablas particionadas, el índice de cada partición se
+identifica por su índice padre).
+
+Ejecutar tras aplicar migraciones o al cambiar una consulta:
+    python verificar_indices.py
+    python verificar_indices.py --analyze   # con tiempos reales
+"""
+import sys
+import json
+import argparse
+
+from sqlalchemy import func, text
+from sqlalchemy.dialects import postgresql
+
+from app.database import SessionLocal
+from app.models import AsignacionConductor, Incidencia, RutaDetalle, RutaGenerada
+
+parser = argparse.ArgumentParser(description="Regresión de planes de consultas frecuentes")
+parser.add_argument("--analyze", action="store_true", help="EXPLAIN ANALYZE (ejecuta las consultas)")
+parser.add_argument("--zona", default="oriental")
+args = parser.parse_args()
+
+db = SessionLocal()
+
+# Ids reales para que las consultas sean representativas
+ruta_id = db.query(func.max(RutaGenerada.id)).scalar() or 1
+conductor_id = db.query(func.max(AsignacionConductor.conductor_id)).scalar() or 1
+asignacion_id = db.query(func.max(AsignacionConductor.id)).scalar() or 1
+incidencia_id = db.query(func.max(Incidencia.id)).scalar() or 1
+
+# (nombre, índice que debe usar, consulta)
+CONSULTAS = [
+    (
+        "validar_incidencia: buscar incidencia",
+        "incidencias_pkey",
+        db.query(Incidencia).filter(Incidencia.id == incidencia_id)
+    ),
+    (
+        "validar_incidencia: suma de gravedad validada (umbral)",
+        "idx_incidencias_validadas",
+        db.query(func.coalesce(func.sum(Incidencia.gravedad), 0)).filter(
+            Incidencia.zona == args.zona, Incidencia.estado == 'validada'
+        )
+    ),
+    (
+        "generar_ruta_automatica: incidencias validadas",
+        "idx_incidencias_validadas",
+        db.query(Incidencia).filter(Incidencia.zona == args.zona, Incidencia.estado == 'validada')
+    ),
+    (
+        "calcular_gravedad_total_zona: validadas y asignadas",
+        "idx_incidencias_zona_estado",
+        db.query(func.coalesce(func.sum(Incidencia.gravedad), 0)).filter(
+            Incidencia.zona == args.zona, Incidencia.estado.in_(['validada', 'asignada'])
+        )
+    ),
+    (
+        "listar_incidencias: pendientes de la zona",
+        "idx_incidencias_pendientes",
+        db.query(Incidencia.id, Incidencia.tipo, Incidencia.reportado_en).filter(
+            Incidencia.zona == args.zona, Incidencia.estado == 'pendiente'
+        ).order_by(Incidencia.reportado_en)
+    ),
+    (
+        "verificar_rutas_planeadas_zona",
+        "idx_rutas_generadas_activas",
+        db.query(RutaGenerada).filter(RutaGenerada.zona == args.zona, RutaGenerada.estado == 'planeada')
+    ),
+    (
+        "listar_rutas: por zona y estado, más recientes",
+        "idx_rutas_generadas_zona_estado_fecha",
+        db.query(RutaGenerada).filter(
+            RutaGenerada.zona == args.zona, RutaGenerada.estado == 'completada'
+        ).order_by(RutaGenerada.fecha_generacion.desc()).limit(20)
+    ),
+    (
+        "iniciar_ruta: asignación",
+        "asignaciones_conductores_pkey",
+        db.query(AsignacionConductor).filter(AsignacionConductor.id == asignacion_id)
+    ),
+    (
+        "mis-rutas: asignaciones activas del conductor",
+        "idx_asignaciones_conductor_estado",
+        db.query(AsignacionConductor).filter(
+            AsignacionConductor.conductor_id == conductor_id,
+            AsignacionConductor.estado.in_(['asignado', 'iniciado'])
+        )
+    ),
+    (
+        "asignar_conductor: asignaciones activas de la ruta",
+        "idx_asignaciones_ruta_estado",
+        db.query(AsignacionConductor).filter(
+            AsignacionConductor.ruta_id == ruta_id,
+            AsignacionConductor.estado.in_(['asignado', 'iniciado'])
+        )
+    ),
+    (
+        "obtener_ruta: paradas en orden",
+        "idx_rutas_detalle_orden",
+        db.query(RutaDetalle).filter(RutaDetalle.ruta_id == ruta_id).order_by(RutaDetalle.orden)
+    ),
+]
+
+
+def nodos_escaneo(plan):
+    """(tipo de nodo, relación, índice) de cada escaneo del plan"""
+    if "Relation Name" in plan:
+        yield plan["Node Type"], plan["Relation Name"], plan.get("Index Name")
+    for hijo in plan.get("Plans", []):
+        yield from nodos_escaneo(hijo)
+
+
+def indice_raiz(indice):
+    """Índice de la tabla principal del que hereda el índice de una partición"""
+    return db.execute(
+        text("SELECT pg_partition_root(CAST(:indice AS regclass))::text"),
+        {"indice": indice}
+    ).scalar() or indice
+
+
+print("=" * 60)
+print("VERIFICACIÓN DE ÍNDICES (EXPLAIN)")
+print("=" * 60)
+
+fallidas = 0
+try:
+    db.execute(text("SET enable_seqscan = off"))
+    for nombre, esperado, consulta in CONSULTAS:
+        sql = str(consulta.statement.compile(
+            dialect=postgresql.dialect(), compile_kwargs={"literal_binds": True}
+        ))
+        opciones = "ANALYZE, BUFFERS, FORMAT JSON" if args.analyze else "FORMAT JSON"
+        resultado = db.execute(text(f"EXPLAIN ({opciones}) {sql}")).scalar()
+        plan = (json.loads(resultado) if isinstance(resultado, str) else resultado)[0]
+
+        escaneos = list(nodos_escaneo(plan["Plan"]))
+        secuenciales = [r for tipo, r, _ in escaneos if tipo == "Seq Scan"]
+        indices = sorted({indice_raiz(i) for _, _, i in escaneos if i})
+        sin_esperado = esperado not in indices
+
+        estado = "✗" if secuenciales or sin_esperado else "✓"
+        print(f"\n  {estado} {nombre}")
+        print(f"    Índices: {', '.join(indices) or '-'}")
+        if secuenciales or sin_esperado:
+            fallidas += 1
+        if secuenciales:
+            print(f"    Seq Scan en: {', '.join(sorted(set(secuenciales)))}")
+        if sin_esperado:
+            print(f"    No usa {esperado}")
+        if args.analyze:
+            print(f"    Tiempo: {plan['Execution Time']:.2f} ms")
+finally:
+    db.rollback()
+    db.close()
+
+print("\n" + "=" * 60)
+print(f"  {len(CONSULTAS) - fallidas}/{len(CONSULTAS)} consultas usan su índice")
+print("=" * 60)
+
+sys.exit(1 if fallidas else 0)